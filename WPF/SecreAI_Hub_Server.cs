@@ -109,15 +109,34 @@ namespace SecreAI_Hub
                 {
                     string body = ReadRequestBody(request);
                     var data = DeserializeJson(body);
-                    string msg = data.ContainsKey("message") ? data["message"].ToString() : "";
-                    bool isError = data.ContainsKey("is_error") && Convert.ToBoolean(data["is_error"]);
-                    string errorCode = data.ContainsKey("error_code") && data["error_code"] != null ? data["error_code"].ToString() : null;
+
+                    // Accept a single entry ({"message": ...}) or a batch ({"messages": [...]})
+                    var entries = new List<Dictionary<string, object>>();
+                    var batch = data.ContainsKey("messages") ? data["messages"] as System.Collections.IEnumerable : null;
+                    if (batch != null)
+                    {
+                        foreach (var item in batch)
+                        {
+                            var entry = item as Dictionary<string, object>;
+                            if (entry != null) entries.Add(entry);
+                        }
+                    }
+                    else
+                    {
+                        entries.Add(data);
+                    }
 
                     _window.Dispatcher.BeginInvoke(new Action(() => {
-                        _window.UpdateLogArea(msg, isError, errorCode);
+                        foreach (var entry in entries)
+                        {
+                            string msg = entry.ContainsKey("message") && entry["message"] != null ? entry["message"].ToString() : "";
+                            bool isError = entry.ContainsKey("is_error") && Convert.ToBoolean(entry["is_error"]);
+                            string errorCode = entry.ContainsKey("error_code") && entry["error_code"] != null ? entry["error_code"].ToString() : null;
+                            _window.UpdateLogArea(msg, isError, errorCode);
+                        }
                     }));
 
-                    responseString = SerializeJson(new Dictionary<string, object> { { "status", "ok" } });
+                    responseString = SerializeJson(new Dictionary<string, object> { { "status", "ok" }, { "received", entries.Count } });
                 }
                 else if (path == "/api/overlay" && request.HttpMethod == "POST")
                 {
@@ -147,14 +147,17 @@ def get_session():
 
 @app.route('/api/log', methods=['POST'])
 def receive_log():
-    data = request.json
+    data = request.json or {}
+    # 1件 ({"message": ...}) と、まとめ送り ({"messages": [...]}) の両方を受け付ける
+    entries = data.get("messages") if isinstance(data.get("messages"), list) else [data]
     if main_gui:
-        main_gui.update_log_area(
-            data.get("message", ""), 
-            data.get("is_error", False),
-            data.get("error_code")
-        )
-    return jsonify({"status": "ok"})
+        for entry in entries:
+            main_gui.update_log_area(
+                entry.get("message", ""),
+                entry.get("is_error", False),
+                entry.get("error_code")
+            )
+    return jsonify({"status": "ok", "received": len(entries)})
 
 @app.route('/api/overlay', methods=['POST'])
 def trigger_overlay_api():
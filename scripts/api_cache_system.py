@@ -7,6 +7,15 @@ import time
 import os
 from pathlib import Path
 
+# DB統計キャッシュへの書き込み通知（ダッシュボードのサイズ表示を差分更新）
+try:
+    from .db_stats import note_file_write
+except ImportError:
+    try:
+        from db_stats import note_file_write
+    except ImportError:
+        note_file_write = None
+
 class APICache:
     """
     API応答をキャッシュしてコスト削減
@@ -45,12 +54,12 @@ class APICache:
         except:
             return None
     
-    def get(self, query, image_path=None, provider="gemini", model=""):
-        """キャッシュから取得"""
+    def get(self, query, image_path=None, provider="gemini", model="", image_hash=None):
+        """キャッシュから取得（image_hash: エンコード済み画像の MD5。渡した場合は画像ファイルを読まない）"""
         self.stats["total_requests"] = self.stats.get("total_requests", 0) + 1
         
         try:
-            image_hash = self._get_image_hash(image_path)
+            image_hash = image_hash or self._get_image_hash(image_path)
             cache_key = self._get_cache_key(query, image_hash, provider, model)
             cache_file = self.cache_dir / f"{cache_key}.json"
             
@@ -65,7 +74,7 @@ class APICache:
             
             # TTLチェック
             if time.time() - cache_data['timestamp'] > self.ttl_seconds:
-                cache_file.unlink()  # 期限切れ削除
+                self._unlink(cache_file)  # 期限切れ削除
                 self.stats["misses"] = self.stats.get("misses", 0) + 1
                 self._update_model_stats(provider, model, hit=False)
                 self._save_stats()
@@ -81,10 +90,10 @@ class APICache:
             self._save_stats()
             return None
     
-    def set(self, query, response, image_path=None, provider="gemini", model=""):
+    def set(self, query, response, image_path=None, provider="gemini", model="", image_hash=None):
         """キャッシュに保存"""
         try:
-            image_hash = self._get_image_hash(image_path)
+            image_hash = image_hash or self._get_image_hash(image_path)
             cache_key = self._get_cache_key(query, image_hash, provider, model)
             cache_file = self.cache_dir / f"{cache_key}.json"
             
@@ -96,8 +105,11 @@ class APICache:
                 'model': model
             }
             
+            old_size = cache_file.stat().st_size if cache_file.exists() else None
             with open(cache_file, 'w', encoding='utf-8') as f:
                 json.dump(cache_data, f, ensure_ascii=False, indent=2)
+            if note_file_write:
+                note_file_write(str(cache_file), old_size)
                 
             self._enforce_capacity_limit()
         except:
@@ -122,7 +134,7 @@ class APICache:
                 excess_count = len(file_items) - self.max_capacity
                 for i in range(excess_count):
                     try:
-                        file_items[i][0].unlink()
+                        self._unlink(file_items[i][0])
                     except:
                         pass
         except:
@@ -139,7 +151,7 @@ class APICache:
                     with open(cache_file, 'r') as f:
                         data = json.load(f)
                     if current_time - data['timestamp'] > self.ttl_seconds:
-                        cache_file.unlink()
+                        self._unlink(cache_file)
                 except:
                     pass
         except:
@@ -196,12 +208,19 @@ class APICache:
         try:
             for cache_file in self.cache_dir.glob("*.json"):
                 if cache_file.name != "stats.json":
-                    cache_file.unlink()
+                    self._unlink(cache_file)
                     count += 1
         except:
             pass
         return count
     
+    def _unlink(self, cache_file):
+        """キャッシュファイルを削除し、DB統計キャッシュへ通知"""
+        old_size = cache_file.stat().st_size
+        cache_file.unlink()
+        if note_file_write:
+            note_file_write(str(cache_file), old_size, deleted=True)
+
     def _load_stats(self):
         """統計情報を読み込み"""
         if self.stats_file.exists():
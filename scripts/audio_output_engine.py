@@ -0,0 +1,325 @@
+# ===== 常駐型の音声出力エンジン =====
+# game_ai.py の VOICEVOX / Edge-TTS 読み上げ、edge_tts_stream.py で使用
+# 発話ごとに pygame.mixer を初期化・後始末していた managed_mixer の代わりに、
+# - 出力デバイスはプロセス内で1度だけ開き、設定のデバイス名が変わった時だけ開き直す
+# - 専用スレッドが再生キューのクリップを予約チャンネルで順に再生する（Channel.queue で継ぎ目なし）
+# - 中断 (interrupt)・未再生分の破棄 (flush)・音量・クリップごとの開始/完了コールバックに対応
+#
+# 使用例:
+#   engine = get_audio_engine()
+#   engine.configure(config)
+#   clip = engine.play(wav_bytes, "wav", on_start=lambda: ...)
+#   completed = engine.wait(clip, should_stop=lambda: stopped)
+
+import io
+import time
+import queue
+import atexit
+import threading
+from collections import deque
+
+# pygame は読み込みに時間がかかるため、再生スレッドの開始時に初めて import する
+pygame = None
+
+
+def _load_pygame():
+    global pygame
+    if pygame is None:
+        import pygame as _pygame
+        pygame = _pygame
+    return pygame
+
+MIXER_FREQUENCY = 44100
+MIXER_CHANNELS = 1
+MIXER_BUFFER = 2048
+# 読み上げ専用に予約するチャンネル番号（効果音などの Sound.play() と取り合わないため）
+VOICE_CHANNEL = 0
+POLL_INTERVAL = 0.005
+
+
+class Clip:
+    """再生キューの1項目。done は再生完了・中断・エラーのいずれかでセットされる"""
+
+    __slots__ = ("data", "fmt", "volume", "on_start", "on_done", "started", "completed",
+                 "error", "done", "sound", "kind", "enqueued_at")
+
+    def __init__(self, data, fmt, volume=1.0, on_start=None, on_done=None):
+        self.data = data
+        self.fmt = fmt
+        self.volume = volume
+        self.on_start = on_start
+        self.on_done = on_done
+        self.started = threading.Event()
+        self.completed = False
+        self.error = None
+        self.done = threading.Event()
+        self.sound = None
+        self.kind = None        # "channel" または "music"（Sound で復号できない形式の代替再生）
+        self.enqueued_at = time.perf_counter()
+
+
+class AudioOutputEngine:
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._commands = queue.Queue()
+        self._inflight = deque()   # 再生中 + 待ち枠のクリップ（最大2つ）
+        self._device = None
+        self._opened = False
+        self._channel = None
+        self._volume = 1.0
+        self._thread = None
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {"device_opens": 0, "open_ms": 0.0, "clips": 0, "interrupted": 0, "errors": 0}
+
+    # --- 設定・デバイス ---
+    def configure(self, config):
+        """出力デバイスを設定する（変わった場合のみ、次の再生時に開き直す）"""
+        device = config.get("DEVICE_NAME")
+        if device == "デフォルト":
+            device = None
+        with self._lock:
+            if device != self._device:
+                self._device = device
+                if self._opened:
+                    self._commands.put(("reopen", None))
+        self._ensure_thread()
+
+    def _open_device(self):
+        t0 = time.perf_counter()
+        if pygame.mixer.get_init():
+            pygame.mixer.quit()
+        try:
+            if self._device:
+                pygame.mixer.init(frequency=MIXER_FREQUENCY, size=-16, channels=MIXER_CHANNELS,
+                                  buffer=MIXER_BUFFER, devicename=self._device)
+            else:
+                pygame.mixer.init(frequency=MIXER_FREQUENCY, size=-16, channels=MIXER_CHANNELS, buffer=MIXER_BUFFER)
+        except Exception:
+            # 指定デバイスが見つからない場合は既定のデバイスで開く
+            pygame.mixer.init(frequency=MIXER_FREQUENCY, size=-16, channels=MIXER_CHANNELS, buffer=MIXER_BUFFER)
+        pygame.mixer.set_num_channels(max(8, pygame.mixer.get_num_channels()))
+        pygame.mixer.set_reserved(VOICE_CHANNEL + 1)
+        self._channel = pygame.mixer.Channel(VOICE_CHANNEL)
+        self._opened = True
+        self.stats["device_opens"] += 1
+        self.stats["open_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+
+    # --- 公開API ---
+    def play(self, data, fmt="wav", volume=1.0, on_start=None, on_done=None):
+        """クリップを再生キューに追加して Clip を返す（すぐに戻る）"""
+        clip = Clip(data, fmt, volume, on_start, on_done)
+        self._ensure_thread()
+        self._queue.put(clip)
+        return clip
+
+    def wait(self, clip, should_stop=None):
+        """クリップの再生完了を待つ。should_stop が True になったら中断して False を返す"""
+        while not clip.done.wait(0.02):
+            if should_stop and should_stop():
+                self.interrupt()
+                clip.done.wait(1.0)
+                return False
+        return clip.completed
+
+    def wait_started(self, clip, should_stop=None):
+        """クリップの再生開始を待つ（次のクリップを継ぎ目なく予約するため）"""
+        while not clip.started.wait(0.01):
+            if clip.done.is_set():
+                return clip.completed
+            if should_stop and should_stop():
+                self.interrupt()
+                return False
+        return True
+
+    def interrupt(self):
+        """再生中のクリップを止め、キューに残っている分もすべて破棄する"""
+        self._commands.put(("interrupt", None))
+
+    def flush(self):
+        """再生中（と直後に予約済み）のクリップはそのままに、キューに残っている分を破棄する"""
+        self._commands.put(("flush", None))
+
+    def set_volume(self, volume):
+        self._commands.put(("volume", max(0.0, min(1.0, float(volume)))))
+
+    def is_busy(self):
+        return bool(self._inflight) or not self._queue.empty()
+
+    def get_stats(self):
+        return {**self.stats, "device": self._device or "default", "queued": self._queue.qsize(),
+                "playing": len(self._inflight)}
+
+    def close(self):
+        self._closed = True
+        self._commands.put(("interrupt", None))
+        if self._thread and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+        try:
+            if pygame is not None and pygame.mixer.get_init():
+                pygame.mixer.quit()
+        except Exception:
+            pass
+
+    # --- 再生スレッド ---
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._closed = False
+                self._thread = threading.Thread(target=self._run, name="audio-output", daemon=True)
+                self._thread.start()
+
+    def _finish(self, clip, completed, error=None):
+        clip.completed = completed
+        clip.error = error
+        clip.sound = None
+        clip.data = None
+        if not completed:
+            self.stats["interrupted" if error is None else "errors"] += 1
+        if clip.on_done:
+            try:
+                clip.on_done(completed)
+            except Exception as e:
+                print(f"Audio callback error: {e}")
+        clip.done.set()
+
+    def _mark_started(self, clip):
+        if clip.started.is_set():
+            return
+        clip.started.set()
+        self.stats["clips"] += 1
+        if clip.on_start:
+            try:
+                clip.on_start()
+            except Exception as e:
+                print(f"Audio callback error: {e}")
+
+    def _stop_output(self):
+        if self._channel is not None:
+            self._channel.stop()
+        if pygame.mixer.get_init():
+            pygame.mixer.music.stop()
+            pygame.mixer.music.unload()
+
+    def _drop_queued(self):
+        while True:
+            try:
+                self._finish(self._queue.get_nowait(), False)
+            except queue.Empty:
+                return
+
+    def _handle_commands(self):
+        while True:
+            try:
+                cmd, arg = self._commands.get_nowait()
+            except queue.Empty:
+                return
+            if cmd == "interrupt":
+                self._stop_output()
+                while self._inflight:
+                    self._finish(self._inflight.popleft(), False)
+                self._drop_queued()
+            elif cmd == "flush":
+                # チャンネルの予約枠に渡し済みのクリップは取り消せないため、そのまま再生させる
+                self._drop_queued()
+            elif cmd == "volume":
+                self._volume = arg
+                if self._channel is not None:
+                    self._channel.set_volume(arg)
+                if pygame.mixer.get_init():
+                    pygame.mixer.music.set_volume(arg)
+            elif cmd == "reopen":
+                self._stop_output()
+                while self._inflight:
+                    self._finish(self._inflight.popleft(), False)
+                self._open_device()
+
+    def _update_inflight(self):
+        """再生位置を確認し、開始・完了したクリップのコールバックを呼ぶ"""
+        while self._inflight:
+            head = self._inflight[0]
+            if head.kind == "music":
+                playing = pygame.mixer.music.get_busy()
+                current = head if playing else None
+            else:
+                current = head if (self._channel.get_busy() and self._channel.get_sound() is head.sound) else None
+            if current is head:
+                self._mark_started(head)
+                return
+            # 再生位置が先頭のクリップを過ぎた（ポーリングの間に終わった短いクリップも含む）
+            self._mark_started(head)
+            self._inflight.popleft()
+            if head.kind == "music":
+                pygame.mixer.music.unload()
+            self._finish(head, True)
+
+    def _start_clip(self, clip):
+        if not self._opened:
+            self._open_device()
+        try:
+            clip.sound = pygame.mixer.Sound(file=io.BytesIO(clip.data))
+            clip.kind = "channel"
+        except Exception:
+            clip.sound = None
+            clip.kind = "music"
+        if clip.kind == "channel":
+            clip.sound.set_volume(clip.volume)
+            self._channel.set_volume(self._volume)
+            if self._inflight and self._inflight[-1].kind == "music":
+                # music で再生中のクリップの後ろには予約できないため、終わるまで待つ
+                self._wait_idle()
+            # 空いていれば即再生、再生中なら直後に継ぎ目なく再生される
+            self._channel.queue(clip.sound)
+        else:
+            self._wait_idle()
+            try:
+                pygame.mixer.music.load(io.BytesIO(clip.data), clip.fmt)
+                pygame.mixer.music.set_volume(self._volume * clip.volume)
+                pygame.mixer.music.play()
+            except Exception as e:
+                self._finish(clip, False, error=e)
+                return
+        self._inflight.append(clip)
+
+    def _wait_idle(self):
+        while self._inflight and not self._closed:
+            self._handle_commands()
+            self._update_inflight()
+            time.sleep(POLL_INTERVAL)
+
+    def _run(self):
+        _load_pygame()
+        while not self._closed:
+            try:
+                self._handle_commands()
+                if self._inflight:
+                    self._update_inflight()
+                # 待ち枠（再生中1つ + 予約1つ）が空いている時だけ次のクリップを取り出す
+                if len(self._inflight) < 2:
+                    try:
+                        clip = self._queue.get(timeout=POLL_INTERVAL if self._inflight else 0.05)
+                    except queue.Empty:
+                        continue
+                    self._start_clip(clip)
+                else:
+                    time.sleep(POLL_INTERVAL)
+            except Exception as e:
+                print(f"Audio output engine error: {e}")
+                self.stats["errors"] += 1
+                while self._inflight:
+                    self._finish(self._inflight.popleft(), False, error=e)
+                time.sleep(0.1)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_audio_engine():
+    """プロセス全体で共有する音声出力エンジン"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AudioOutputEngine()
+            atexit.register(_engine.close)
+        return _engine
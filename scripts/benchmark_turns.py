@@ -0,0 +1,237 @@
+# ===== 対話ターンのオフライン・ベンチマーク =====
+# API キー・VOICEVOX・マイクなしで、1ターンの遅延とスループットを毎回同じ条件で測る
+# - stub_servers.py の LLM（OpenAI 互換・トークン速度を指定可）・VOICEVOX・Tavily・Hub を相手に、
+#   game_ai.main を chat モード（音声認識の代わりにテキスト入力）で実行する
+# - 一時フォルダを SECREAI_APP_ROOT にして設定を置き、合成した記憶 DB を用意する（chromadb がない場合は記憶なし）
+# - 検索ターンは execute_background_search（ゲートキーパー → Tavily スタブ → 要約 → 読み上げ）を実行する
+# - turn_tracer の区間から段階ごとの p50 / p95 / max を集計し、ターン全体の遅延・スループットと合わせて出力する
+# - Linux の CI でも動く（音声出力は SDL_AUDIODRIVER=dummy）。Hub (5000)・VOICEVOX (50021) と同じポートを使うため、
+#   手元で実行する時は SecreAI を止めておく
+#
+# 使用例:
+#   python scripts/benchmark_turns.py --turns 20 --token-rate 40
+#   python scripts/benchmark_turns.py --turns 10 --search-turns 3 --memory-docs 300 --out bench.json
+#   python scripts/benchmark_turns.py --turns 16 --concurrency 4
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+try:
+    from .stub_servers import start_stub_servers, LLM_PORT, VOICEVOX_PORT, TAVILY_PORT
+    from .turn_tracer import load_traces, summarize_traces, percentile
+except ImportError:
+    from stub_servers import start_stub_servers, LLM_PORT, VOICEVOX_PORT, TAVILY_PORT
+    from turn_tracer import load_traces, summarize_traces, percentile
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_ROOT = os.path.dirname(SCRIPTS_DIR)
+# ストリーミングの1トークンあたりの文字数（日本語のおおよその目安）
+CHARS_PER_TOKEN = 2
+
+CHAT_PROMPTS = [
+    "今日の予定を教えて。", "昨日話したゲームの続きはどうなった？", "おすすめの装備は何かな。",
+    "このボスの攻略法を簡単に説明して。", "少し休憩したほうがいいと思う？", "先週の話を覚えてる？",
+]
+SEARCH_PROMPTS = [
+    "最新パッチの変更点", "今週発売の新作ゲーム", "明日の東京の天気", "大会の最新の結果",
+]
+MEMORY_TOPICS = ["ゲーム", "攻略", "装備", "ボス", "休憩", "予定", "音楽", "天気", "友人", "大会"]
+
+
+def build_memory_db(root, count, seed=0):
+    """
+    合成した長期記憶を memory_db に作る（update_memory.py と同じメタデータ形式）
+    Returns: 作成件数（chromadb がなければ 0）
+    """
+    if count <= 0:
+        return 0
+    try:
+        import chromadb
+    except ImportError:
+        print("[benchmark] chromadb が見つからないため、記憶 DB なしで実行します。")
+        return 0
+    rng = random.Random(seed)
+    now = datetime.now()
+    collection = chromadb.PersistentClient(path=os.path.join(root, "memory_db")).get_or_create_collection("long_term_memory")
+    batch = 100
+    for start in range(0, count, batch):
+        docs, metas, ids = [], [], []
+        for i in range(start, min(count, start + batch)):
+            topic, other = rng.sample(MEMORY_TOPICS, 2)
+            ts = now - timedelta(days=rng.randint(0, 90), minutes=rng.randint(0, 1440))
+            docs.append(f"{topic}について話した。{other}の話題も出て、次回また続きを話すことにした。(#{i})")
+            metas.append({"timestamp": ts.strftime("%Y-%m-%d %H:%M:%S"), "unix": ts.timestamp(),
+                          "tags": f"{topic},{other}"})
+            ids.append(f"mem_{ts.strftime('%Y%m%d%H%M%S')}_{i:05d}")
+        collection.add(documents=docs, metadatas=metas, ids=ids)
+    return count
+
+
+def prepare_root(memory_docs):
+    """スタブに接続する設定と合成した記憶 DB を置いた一時的なアプリフォルダを作る"""
+    root = tempfile.mkdtemp(prefix="secreai_bench_")
+    os.makedirs(os.path.join(root, "data"))
+    lang_dir = os.path.join(APP_ROOT, "data", "lang")
+    if os.path.isdir(lang_dir):
+        shutil.copytree(lang_dir, os.path.join(root, "data", "lang"))
+    config = {
+        "AI_PROVIDER": "local",
+        "LOCAL_LLM_PROVIDER": "ollama",
+        "OLLAMA_URL": f"http://127.0.0.1:{LLM_PORT}/v1",
+        "VOICEVOX_URL": f"http://127.0.0.1:{VOICEVOX_PORT}",
+        "VV_PATH": "",
+        "LANGUAGE": "ja",
+        "search_switch": False,
+        "SEARCH_PROVIDER": "tavily",
+        "TAVILY_API_KEY": "stub",
+        "TAVILY_API_URL": f"http://127.0.0.1:{TAVILY_PORT}",
+        # 検索ターンは毎回ゲートキーパー（スタブ LLM）の判定と検索を通す
+        "SEARCH_PRECLASSIFIER": False,
+        "USE_INTERSECTING_AI": False,
+        "API_CACHE_ENABLED": False,
+        "TTS_CACHE_ENABLED": False,
+        "TTS_PREWARM_PHRASES": {},
+        "TURN_TRACE_ENABLED": True,
+    }
+    with open(os.path.join(root, "data", "config.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+    return root, build_memory_db(root, memory_docs)
+
+
+def run_turns(game_ai, prompts, concurrency):
+    """chat モードのターンを concurrency 並列で実行する。Returns: 経過秒数"""
+    pending = list(enumerate(prompts))
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if not pending:
+                    return
+                i, text = pending.pop(0)
+            game_ai.main(mode="chat", chat_text=text, session_id=f"bench-{i}")
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=worker, name=f"bench-{n}") for n in range(max(1, concurrency))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - t0
+
+
+def run_search_turns(game_ai, root, queries):
+    """検索ターン（ゲートキーパー → 検索 → 要約 → 読み上げ）を順番に実行する"""
+    config, _, _ = game_ai.load_config_manual(root)
+    lang_data = game_ai.load_lang_file(config.get("LANGUAGE", "ja"))
+    for i, query in enumerate(queries):
+        trace = game_ai.begin_trace("search", root, f"bench-search-{i}")
+        try:
+            game_ai.execute_background_search(query, config, root, (None, None, None, lang_data))
+        finally:
+            game_ai.end_trace(trace)
+
+
+def summarize(records, elapsed_s, chat_turns):
+    summary = summarize_traces(records)
+    chat = [r for r in records if r.get("mode") == "chat"]
+
+    def dist(values):
+        return {"p50": percentile(values, 50), "p95": percentile(values, 95), "max": percentile(values, 100)}
+    return {
+        "turns": {"chat": len(chat), "search": len(records) - len(chat)},
+        "throughput_turns_per_s": round(chat_turns / elapsed_s, 2) if elapsed_s else None,
+        "end_to_end_ms": {
+            "turn": dist([r["turn_ms"] for r in chat if r.get("turn_ms") is not None]),
+            "first_audio": dist([r["marks"]["first_audio"] for r in chat if "first_audio" in r.get("marks", {})]),
+            "search_total": dist([r["total_ms"] for r in records if r.get("mode") == "search"]),
+        },
+        "stages": {name: {k: st[k] for k in ("count", "p50", "p95", "avg")} for name, st in summary["stages"].items()},
+    }
+
+
+def print_report(result):
+    print("=== turn benchmark ===")
+    print(f"turns: chat={result['turns']['chat']} search={result['turns']['search']}  "
+          f"throughput={result['throughput_turns_per_s']} turns/s")
+    for name, d in result["end_to_end_ms"].items():
+        print(f"  {name:<14} p50={d['p50']}ms p95={d['p95']}ms max={d['max']}ms")
+    print("-- stages (ms, summed per turn) --")
+    for name, st in sorted(result["stages"].items(), key=lambda kv: -(kv[1]["p50"] or 0)):
+        print(f"  {name:<16} n={st['count']:<4} p50={st['p50']:<8} p95={st['p95']:<8} avg={st['avg']}")
+
+
+def run_benchmark(turns=10, concurrency=1, search_turns=2, memory_docs=200, llm_delay=0.3, token_rate=40,
+                  tts_delay=0.05, search_delay=0.3, warmup=1, keep=False):
+    # game_ai は import 時にアプリフォルダを決めるため、環境変数を先に設定する
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    stubs = start_stub_servers(llm_delay=llm_delay, token_delay=1.0 / token_rate, tts_delay=tts_delay,
+                               chunk_chars=CHARS_PER_TOKEN, search_necessary=True, search_delay=search_delay,
+                               with_tavily=True)
+    root = None
+    try:
+        root, memory_count = prepare_root(memory_docs)
+        os.environ["SECREAI_APP_ROOT"] = root
+        try:
+            from . import game_ai
+        except ImportError:
+            import game_ai
+
+        prompts = [CHAT_PROMPTS[i % len(CHAT_PROMPTS)] for i in range(turns)]
+        # 初回だけかかる読み込み（音声エンジン・記憶 DB・埋め込みモデル）は計測から外す
+        if warmup:
+            run_turns(game_ai, prompts[:warmup], 1)
+        skip = len(load_traces(root, limit=None))
+        elapsed = run_turns(game_ai, prompts, concurrency)
+        run_search_turns(game_ai, root, [f"{SEARCH_PROMPTS[i % len(SEARCH_PROMPTS)]} {i}" for i in range(search_turns)])
+
+        records = load_traces(root, limit=None)[skip:]
+        result = summarize(records, elapsed, turns)
+        result["config"] = {"turns": turns, "concurrency": concurrency, "search_turns": search_turns,
+                            "memory_docs": memory_count, "llm_delay": llm_delay, "token_rate": token_rate,
+                            "tts_delay": tts_delay, "search_delay": search_delay, "warmup": warmup}
+        result["stub_calls"] = stubs.counts()
+        return result
+    finally:
+        stubs.stop()
+        if root and keep:
+            print(f"Kept benchmark root: {root}")
+        elif root:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def _main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description="スタブ環境での対話ターンのベンチマーク（API キー・音声デバイス不要）")
+    parser.add_argument("--turns", type=int, default=10, help="計測する chat ターン数")
+    parser.add_argument("--concurrency", type=int, default=1, help="同時に実行するターン数")
+    parser.add_argument("--search-turns", type=int, default=2, help="検索ターン数（ゲートキーパー・検索・要約）")
+    parser.add_argument("--memory-docs", type=int, default=200, help="合成する記憶の件数（0 で記憶 DB なし）")
+    parser.add_argument("--llm-delay", type=float, default=0.3, help="LLM が応答を返し始めるまでの秒数")
+    parser.add_argument("--token-rate", type=float, default=40, help="LLM のストリーミング速度（トークン/秒）")
+    parser.add_argument("--tts-delay", type=float, default=0.05, help="VOICEVOX の1文あたりの合成秒数")
+    parser.add_argument("--search-delay", type=float, default=0.3, help="Tavily の応答秒数")
+    parser.add_argument("--warmup", type=int, default=1, help="計測から外す最初のターン数")
+    parser.add_argument("--out", help="結果の JSON を書き出すパス")
+    parser.add_argument("--keep", action="store_true", help="一時フォルダ（turn_traces.jsonl を含む）を残す")
+    args = parser.parse_args(argv)
+
+    result = run_benchmark(args.turns, args.concurrency, args.search_turns, args.memory_docs, args.llm_delay,
+                           args.token_rate, args.tts_delay, args.search_delay, args.warmup, args.keep)
+    print_report(result)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    # 1ターンも記録できなければ失敗として CI に伝える
+    return 0 if result["turns"]["chat"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv[1:]))
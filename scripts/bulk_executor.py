@@ -0,0 +1,239 @@
+# ===== 一括処理エグゼキューター =====
+# memory_viewer.py の一括要約・タグ修復で使用
+# - プロバイダー別の同時実行数制限
+# - レート制限 (429 / quota) 検知時の指数バックオフ（全ワーカー共通のクールダウン）
+# - collection.update のバッチコミット
+# - 進捗通知・キャンセル・チェックポイントからの再開
+
+import os
+import json
+import time
+import random
+import threading
+import concurrent.futures
+from datetime import datetime
+
+# プロバイダー別の既定同時実行数（ローカルLLMはGPUを占有するため1）
+DEFAULT_CONCURRENCY = {"gemini": 4, "openai": 4, "local": 1}
+
+_RATE_LIMIT_MARKERS = ("429", "rate limit", "ratelimit", "too many requests", "quota", "resource_exhausted", "overloaded")
+
+
+def get_provider_concurrency(config, provider=None):
+    """設定 BULK_CONCURRENCY からプロバイダーの同時実行数を取得"""
+    provider = (provider or config.get("DB_PROVIDER") or config.get("AI_PROVIDER") or "local").lower()
+    table = dict(DEFAULT_CONCURRENCY)
+    user_table = config.get("BULK_CONCURRENCY")
+    if isinstance(user_table, dict):
+        table.update({k.lower(): v for k, v in user_table.items()})
+    try:
+        return max(1, int(table.get(provider, 1)))
+    except (TypeError, ValueError):
+        return 1
+
+
+def is_rate_limit_error(err):
+    text = str(err).lower()
+    return any(marker in text for marker in _RATE_LIMIT_MARKERS)
+
+
+class BulkCancelled(Exception):
+    """キャンセル要求により処理を打ち切った"""
+
+
+class BulkExecutor:
+    """
+    件数の多い「LLM呼び出し → DB更新」を並列・バッチで処理する
+
+    使用例:
+        executor = BulkExecutor("summarize", checkpoint_dir, concurrency=4)
+        summary = executor.run(items, worker=summarize_one, commit=commit_batch,
+                               progress_cb=lambda done, total, eid: ...)
+    """
+
+    def __init__(self, job_name, checkpoint_dir, concurrency=1, batch_size=20,
+                 max_retries=4, base_backoff=2.0, max_backoff=60.0):
+        self.job_name = job_name
+        self.checkpoint_path = os.path.join(checkpoint_dir, f"{job_name}.json")
+        self.concurrency = max(1, int(concurrency))
+        self.batch_size = max(1, int(batch_size))
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._cancel_event = threading.Event()
+        self._cooldown_lock = threading.Lock()
+        self._cooldown_until = 0.0
+        self.stats = {"rate_limited": 0, "retries": 0}
+
+    # --- チェックポイント ---
+    def load_checkpoint(self):
+        """未完了ジョブのチェックポイントを返す（なければ None）"""
+        if not os.path.exists(self.checkpoint_path):
+            return None
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("completed"):
+                return None
+            return data
+        except Exception:
+            return None
+
+    def clear_checkpoint(self):
+        try:
+            os.remove(self.checkpoint_path)
+        except OSError:
+            pass
+
+    def _save_checkpoint(self, done_ids, failed_ids, total, completed=False):
+        os.makedirs(os.path.dirname(self.checkpoint_path), exist_ok=True)
+        data = {
+            "job": self.job_name,
+            "total": total,
+            "done": sorted(done_ids),
+            "failed": sorted(failed_ids),
+            "completed": completed,
+            "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    # --- キャンセル ---
+    def cancel(self):
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    # --- レート制限対応 ---
+    def _wait_cooldown(self):
+        while not self.cancelled:
+            with self._cooldown_lock:
+                remaining = self._cooldown_until - time.monotonic()
+            if remaining <= 0:
+                return
+            self._cancel_event.wait(min(remaining, 0.5))
+        raise BulkCancelled()
+
+    def _enter_cooldown(self, attempt):
+        delay = min(self.max_backoff, self.base_backoff * (2 ** attempt)) * (0.75 + random.random() * 0.5)
+        with self._cooldown_lock:
+            self._cooldown_until = max(self._cooldown_until, time.monotonic() + delay)
+            self.stats["rate_limited"] += 1
+
+    def _run_one(self, worker, item):
+        attempt = 0
+        while True:
+            self._wait_cooldown()
+            try:
+                return worker(item)
+            except BulkCancelled:
+                raise
+            except Exception as e:
+                if is_rate_limit_error(e) and attempt < self.max_retries:
+                    self._enter_cooldown(attempt)
+                    self.stats["retries"] += 1
+                    attempt += 1
+                    continue
+                raise
+
+    # --- 実行 ---
+    def run(self, items, worker, commit, progress_cb=None, resume=True):
+        """
+        Args:
+            items: [(entry_id, payload), ...]
+            worker: (entry_id, payload) のタプルを受け取り、更新内容 (dict) を返す。None はスキップ
+            commit: [(entry_id, result), ...] を一括でDBへ反映する
+            progress_cb: (done, total, entry_id) で呼ばれる
+            resume: True の場合、チェックポイント済みIDを処理対象から除外
+
+        Returns:
+            {"processed", "failed", "skipped", "cancelled", "errors", "elapsed", ...}
+        """
+        t0 = time.perf_counter()
+        done_ids, failed_ids = set(), set()
+        checkpoint = self.load_checkpoint() if resume else None
+        if checkpoint:
+            done_ids.update(checkpoint.get("done", []))
+        else:
+            self.clear_checkpoint()
+
+        pending = [item for item in items if item[0] not in done_ids]
+        total = len(pending) + len(done_ids)
+        processed = len(done_ids)
+        skipped = 0
+        errors = []
+        buffer = []
+
+        def flush():
+            if not buffer:
+                return
+            commit(list(buffer))
+            done_ids.update(eid for eid, _ in buffer)
+            buffer.clear()
+            self._save_checkpoint(done_ids, failed_ids, total)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency,
+                                                   thread_name_prefix="SecreAI_Bulk") as pool:
+            futures = {}
+            item_iter = iter(pending)
+
+            def submit_next():
+                if self.cancelled:
+                    return False
+                item = next(item_iter, None)
+                if item is None:
+                    return False
+                futures[pool.submit(self._run_one, worker, item)] = item[0]
+                return True
+
+            # 同時実行数の2倍まで先行投入し、完了ごとに補充する
+            for _ in range(self.concurrency * 2):
+                if not submit_next():
+                    break
+
+            while futures:
+                finished, _ = concurrent.futures.wait(list(futures), return_when=concurrent.futures.FIRST_COMPLETED)
+                for fut in finished:
+                    entry_id = futures.pop(fut)
+                    try:
+                        result = fut.result()
+                        if result is None:
+                            skipped += 1
+                            done_ids.add(entry_id)
+                        else:
+                            buffer.append((entry_id, result))
+                    except BulkCancelled:
+                        continue
+                    except Exception as e:
+                        failed_ids.add(entry_id)
+                        errors.append(f"{entry_id}: {e}")
+                    processed += 1
+                    if progress_cb:
+                        progress_cb(processed, total, entry_id)
+                    submit_next()
+
+                if len(buffer) >= self.batch_size:
+                    flush()
+
+            flush()
+
+        completed = not self.cancelled and not failed_ids
+        self._save_checkpoint(done_ids, failed_ids, total, completed=completed)
+        if completed:
+            self.clear_checkpoint()
+
+        return {
+            "processed": processed,
+            "failed": len(failed_ids),
+            "skipped": skipped,
+            "cancelled": self.cancelled,
+            "errors": errors[:5],
+            "elapsed": round(time.perf_counter() - t0, 2),
+            "rate_limited": self.stats["rate_limited"],
+        }
+
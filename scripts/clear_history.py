@@ -28,6 +28,31 @@ except ImportError:
     except ImportError:
         get_chroma_collection = None
 
+# 追記型チャット履歴ストア
+try:
+    from .history_store import get_history_store
+except ImportError:
+    try:
+        from history_store import get_history_store
+    except ImportError:
+        get_history_store = None
+
+# LLMクライアント・HTTP接続プールの共有レジストリ（無い環境では呼び出しごとに生成）
+try:
+    from .client_registry import gemini_client, openai_client, http_client
+except ImportError:
+    try:
+        from client_registry import gemini_client, openai_client, http_client
+    except ImportError:
+        def gemini_client(api_key):
+            return genai.Client(api_key=api_key)
+
+        def openai_client(api_key):
+            return OpenAI(api_key=api_key)
+
+        def http_client():
+            return requests
+
 # === 1. パス解決・言語管理 ===
 def get_app_root():
     if getattr(sys, 'frozen', False):
@@ -108,7 +133,12 @@ def main():
 
     # 履歴読み込み
     history_data = []
-    if os.path.exists(history_file):
+    history_store = get_history_store(history_file) if get_history_store else None
+    if history_store:
+        try:
+            history_data = history_store.read_all()
+        except: history_data = []
+    elif os.path.exists(history_file):
         try:
             with open(history_file, "r", encoding="utf-8") as f:
                 history_data = json.load(f)
@@ -136,7 +166,7 @@ def main():
                 local_db_model_id, level = parse_model_name(db_model_id)
 
                 if db_provider == "openai":
-                    client_oa = OpenAI(api_key=config.get("OPENAI_API_KEY"))
+                    client_oa = openai_client(config.get("OPENAI_API_KEY"))
                     openai_kwargs = {
                         "model": local_db_model_id,
                         "messages": [{"role": "user", "content": prompt}]
@@ -153,11 +183,11 @@ def main():
                     else: # lmstudio
                         url = config.get("LMSTUDIO_URL", "http://localhost:1234/v1")
                         payload = {"model": local_db_model_id, "messages": [{"role": "user", "content": prompt}], "temperature": 0.3}
-                    res = requests.post(f"{url.rstrip('/')}/chat/completions", json=payload, timeout=240)
+                    res = http_client().post(f"{url.rstrip('/')}/chat/completions", json=payload, timeout=240)
                     res.raise_for_status()
                     return res.json()['choices'][0]['message']['content'].strip()
                 else: # Gemini
-                    client_ge = genai.Client(api_key=config.get("GEMINI_API_KEY"))
+                    client_ge = gemini_client(config.get("GEMINI_API_KEY"))
 
                     gemini_config_obj = {}
                     if level is None:
@@ -198,9 +228,12 @@ def main():
             )
 
             # --- 履歴ファイルを先に空にする（タグ生成失敗でも履歴はクリア済みを保証） ---
-            os.makedirs(os.path.dirname(history_file), exist_ok=True)
-            with open(history_file, "w", encoding="utf-8") as f:
-                json.dump([], f)
+            if history_store:
+                history_store.clear()
+            else:
+                os.makedirs(os.path.dirname(history_file), exist_ok=True)
+                with open(history_file, "w", encoding="utf-8") as f:
+                    json.dump([], f)
             
             send_log_to_hub(lang_data["log_messages"].get("history_reset_done", "History reset."))
 
@@ -218,7 +251,7 @@ def main():
                 def generate_text_main(prompt):
                     """タグ生成用: メインAIモデルを使用"""
                     if main_provider == "openai":
-                        client_oa = OpenAI(api_key=config.get("OPENAI_API_KEY"))
+                        client_oa = openai_client(config.get("OPENAI_API_KEY"))
                         response = client_oa.chat.completions.create(model=main_model_id, messages=[{"role": "user", "content": prompt}])
                         return response.choices[0].message.content.strip()
                     elif main_provider == "local":
@@ -229,11 +262,11 @@ def main():
                         else: # lmstudio
                             url = config.get("LMSTUDIO_URL", "http://localhost:1234/v1")
                             payload = {"model": main_model_id, "messages": [{"role": "user", "content": prompt}], "temperature": 0.3}
-                        res = requests.post(f"{url.rstrip('/')}/chat/completions", json=payload, timeout=240)
+                        res = http_client().post(f"{url.rstrip('/')}/chat/completions", json=payload, timeout=240)
                         res.raise_for_status()
                         return res.json()['choices'][0]['message']['content'].strip()
                     else: # Gemini
-                        client_ge = genai.Client(api_key=config.get("GEMINI_API_KEY"))
+                        client_ge = gemini_client(config.get("GEMINI_API_KEY"))
                         
                         gemini_config_obj = {}
                         thinking_budget = config.get("THINKING_BUDGET", "medium")
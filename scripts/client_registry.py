@@ -0,0 +1,253 @@
+# ===== LLMクライアント・HTTPセッションの共有レジストリ =====
+# game_ai.py、update_memory.py、give_feedback.py、db_maintenance.py、clear_history.py などで使用
+# - genai.Client / OpenAI クライアントを APIキーごとに1つだけ生成して使い回す（遅延生成）
+# - ローカルLLM・VOICEVOX への HTTP は接続先ごとの requests.Session（keep-alive 接続プール）で送る
+# - 接続先ごとのヘルスチェック結果を短時間キャッシュ
+# - 新規接続数・リクエスト数・接続確立にかかった時間を計測し、接続再利用率と節約時間を get_metrics() で返す
+
+import time
+import hashlib
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# 接続先ごとのプールサイズ（同時リクエスト数の上限目安）
+POOL_MAXSIZE = 8
+HEALTH_CHECK_TTL = 30.0
+
+
+def _endpoint_key(url):
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    return f"{parts.scheme}://{parts.hostname}:{port}"
+
+
+class _EndpointStats:
+    __slots__ = ("requests", "connects", "connect_sec", "errors", "last_health")
+
+    def __init__(self):
+        self.requests = 0
+        self.connects = 0
+        self.connect_sec = 0.0
+        self.errors = 0
+        self.last_health = None   # (ok, latency_ms, checked_at)
+
+
+class ClientRegistry:
+    """プロセス全体で共有するクライアントと接続プール"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._sessions = {}
+        self._clients = {}
+        self._stats = {}
+        self.client_stats = {"created": 0, "reused": 0}
+
+    # --- 計測 ---
+    def _endpoint_stats(self, key):
+        stats = self._stats.get(key)
+        if stats is None:
+            with self._lock:
+                stats = self._stats.setdefault(key, _EndpointStats())
+        return stats
+
+    def record_connect(self, scheme, host, port, seconds):
+        stats = self._endpoint_stats(f"{scheme}://{host}:{port}")
+        with self._lock:
+            stats.connects += 1
+            stats.connect_sec += seconds
+
+    def record_request(self, url, ok=True):
+        stats = self._endpoint_stats(_endpoint_key(url))
+        with self._lock:
+            stats.requests += 1
+            if not ok:
+                stats.errors += 1
+
+    # --- HTTPセッション ---
+    def get_session(self, url):
+        """接続先 (scheme://host:port) ごとの keep-alive セッション"""
+        key = _endpoint_key(url)
+        session = self._sessions.get(key)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(key)
+                if session is None:
+                    session = requests.Session()
+                    adapter = _MeteredAdapter(self, pool_connections=1, pool_maxsize=POOL_MAXSIZE)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._sessions[key] = session
+        return session
+
+    def post(self, url, **kwargs):
+        return self.get_session(url).post(url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.get_session(url).get(url, **kwargs)
+
+    def health_check(self, url, timeout=2.0, force=False):
+        """
+        GET url が応答するかを確認する（結果は HEALTH_CHECK_TTL 秒キャッシュ）
+        Returns: (ok, latency_ms)
+        """
+        stats = self._endpoint_stats(_endpoint_key(url))
+        cached = stats.last_health
+        if not force and cached and time.monotonic() - cached[2] < HEALTH_CHECK_TTL:
+            return cached[0], cached[1]
+        t0 = time.perf_counter()
+        try:
+            ok = self.get(url, timeout=timeout).status_code < 500
+        except Exception:
+            ok = False
+        latency_ms = round((time.perf_counter() - t0) * 1000, 1)
+        stats.last_health = (ok, latency_ms, time.monotonic())
+        return ok, latency_ms
+
+    # --- SDKクライアント ---
+    def _get_client(self, key, factory):
+        client = self._clients.get(key)
+        if client is not None:
+            self.client_stats["reused"] += 1
+            return client
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = factory()
+                self._clients[key] = client
+                self.client_stats["created"] += 1
+            else:
+                self.client_stats["reused"] += 1
+        return client
+
+    @staticmethod
+    def _key_hash(api_key):
+        return hashlib.sha256((api_key or "").encode()).hexdigest()[:16]
+
+    def get_gemini(self, api_key):
+        def factory():
+            import google.genai as genai
+            return genai.Client(api_key=api_key)
+        return self._get_client(("gemini", self._key_hash(api_key)), factory)
+
+    def get_openai(self, api_key, base_url=None):
+        def factory():
+            from openai import OpenAI
+            return OpenAI(api_key=api_key, base_url=base_url) if base_url else OpenAI(api_key=api_key)
+        return self._get_client(("openai", self._key_hash(api_key), base_url), factory)
+
+    def get_async_openai(self, api_key):
+        # AsyncOpenAI はイベントループに紐づくため、呼び出しごとに生成する（共有しない）
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(api_key=api_key)
+
+    def reset(self):
+        """APIキー変更時などに全クライアントを破棄する"""
+        with self._lock:
+            for session in self._sessions.values():
+                try:
+                    session.close()
+                except Exception:
+                    pass
+            self._sessions.clear()
+            self._clients.clear()
+
+    # --- メトリクス ---
+    def get_metrics(self):
+        endpoints = {}
+        total_req, total_conn, saved_ms = 0, 0, 0.0
+        with self._lock:
+            for key, s in self._stats.items():
+                avg_connect_ms = (s.connect_sec / s.connects * 1000) if s.connects else 0.0
+                reused = max(0, s.requests - s.connects)
+                endpoints[key] = {
+                    "requests": s.requests,
+                    "new_connections": s.connects,
+                    "reuse_rate": round(reused / s.requests, 3) if s.requests else 0.0,
+                    "avg_connect_ms": round(avg_connect_ms, 2),
+                    "handshake_ms_saved": round(reused * avg_connect_ms, 1),
+                    "errors": s.errors,
+                    "healthy": s.last_health[0] if s.last_health else None,
+                }
+                total_req += s.requests
+                total_conn += s.connects
+                saved_ms += reused * avg_connect_ms
+        return {
+            "endpoints": endpoints,
+            "total_requests": total_req,
+            "total_new_connections": total_conn,
+            "reuse_rate": round(max(0, total_req - total_conn) / total_req, 3) if total_req else 0.0,
+            "handshake_ms_saved": round(saved_ms, 1),
+            "sdk_clients": dict(self.client_stats),
+        }
+
+
+# --- 接続確立時間を計測する urllib3 の接続クラス ---
+_registry = ClientRegistry()
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        t0 = time.perf_counter()
+        super().connect()
+        _registry.record_connect("http", self.host, self.port, time.perf_counter() - t0)
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        # TCP 接続 + TLS ハンドシェイクの合計時間
+        t0 = time.perf_counter()
+        super().connect()
+        _registry.record_connect("https", self.host, self.port, time.perf_counter() - t0)
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _MeteredAdapter(HTTPAdapter):
+    def __init__(self, registry, **kwargs):
+        self._registry = registry
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+    def send(self, request, **kwargs):
+        try:
+            response = super().send(request, **kwargs)
+        except Exception:
+            self._registry.record_request(request.url, ok=False)
+            raise
+        self._registry.record_request(request.url, ok=response.status_code < 500)
+        return response
+
+
+def get_client_registry():
+    return _registry
+
+
+# --- 各スクリプト向けの簡易アクセス関数 ---
+def gemini_client(api_key):
+    return _registry.get_gemini(api_key)
+
+
+def openai_client(api_key):
+    return _registry.get_openai(api_key)
+
+
+def http_client():
+    """requests 互換の get/post を持つ、接続プール付きクライアント"""
+    return _registry
@@ -0,0 +1,126 @@
+# ===== 設定・言語ファイルのキャッシュ =====
+# game_ai.py の load_config_manual / load_lang_file / 検索回数カウンターなどで使用
+# 1ターン中に何度も行われていた「ファイル読込 → JSON解析 → migrate_config」を省き、
+# ファイルの mtime とサイズが変わった時だけ読み直す（stat 1回で鮮度を確認）
+
+import os
+import json
+import copy
+import threading
+
+try:
+    from . import config_manager
+except ImportError:
+    try:
+        import config_manager
+    except ImportError:
+        config_manager = None
+
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+
+class ConfigProvider:
+    """
+    プロセス全体で共有する設定・言語パックのキャッシュ
+    - get_config: 呼び出し側が書き換えても影響しないよう、複製を返す
+    - get_lang: 読み取り専用として共有オブジェクトを返す
+    - subscribe: ファイルの変更を検知して読み直した時に callback(kind, path, value) を呼ぶ
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries = {}      # path -> (signature, value)
+        self._listeners = []
+        self.stats = {"reads": 0, "hits": 0}
+
+    def subscribe(self, callback):
+        with self._lock:
+            self._listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def _notify(self, kind, path, value):
+        for callback in list(self._listeners):
+            try:
+                callback(kind, path, value)
+            except Exception as e:
+                print(f"Config listener error: {e}")
+
+    def _get(self, kind, path, loader):
+        signature = _file_signature(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and signature is not None and entry[0] == signature:
+                self.stats["hits"] += 1
+                return entry[1]
+            value = loader(path)
+            self.stats["reads"] += 1
+            # load_config はマイグレーション時に保存し直すため、読込後のシグネチャを記録する
+            self._entries[path] = (_file_signature(path), value)
+            changed = entry is not None
+        if changed:
+            self._notify(kind, path, value)
+        return value
+
+    @staticmethod
+    def _load_config_file(path):
+        if config_manager:
+            return config_manager.load_config(path)
+        if not os.path.exists(path):
+            return {}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    @staticmethod
+    def _load_json_file(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def get_config(self, path):
+        """マイグレーション済みの設定（複製）"""
+        return copy.deepcopy(self._get("config", path, self._load_config_file))
+
+    def get_lang(self, path):
+        """言語パック（共有オブジェクト。書き換えないこと）"""
+        return self._get("lang", path, self._load_json_file)
+
+    def save_config(self, path, config):
+        """設定を保存し、キャッシュを保存内容で更新する（次回の読み直しを省く）"""
+        if config_manager:
+            ok = config_manager.save_config(path, config)
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(config, f, indent=4, ensure_ascii=False)
+            ok = True
+        if ok:
+            with self._lock:
+                self._entries[path] = (_file_signature(path), copy.deepcopy(config))
+            self._notify("config", path, config)
+        return ok
+
+    def invalidate(self, path=None):
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(path, None)
+
+    def snapshot_stats(self):
+        with self._lock:
+            return dict(self.stats)
+
+
+_provider = ConfigProvider()
+
+
+def get_config_provider():
+    return _provider
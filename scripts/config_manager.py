@@ -29,12 +29,23 @@ DEFAULT_CONFIG = {
     #   "tavily"        - Tavilyで検索しローカルAIで要約
     #   "integrated"    - grounding + tavily をローカルAIで統合要約
     #   "grounding_3_1" - gemini-3.1-flash-lite の Grounding（思考レベル最小）
+    # 検索ゲートキーパーの判定結果を再利用する時間と、判定と並行して検索を先に始める投機モード
+    # （投機モードは「検索不要」と判定された場合に検索APIの1回分が無駄になる）
+    "GATEKEEPER_CACHE_TTL_HOURS": 6,
+    "SEARCH_SPECULATIVE": False,
+    # 明らかに検索が要る/要らないクエリを規則と軽量モデルで判定し、ゲートキーパーの LLM 呼び出しを省く
+    "SEARCH_PRECLASSIFIER": True,
     "THINKING_BUDGET": "medium",
     # THINKING_BUDGET: gemini-3.1-flash-lite 選択時のみ有効
     # minimal = 最小 (ほぼ無効・高速)
     # low     = 低
     # medium  = 中
     # high    = 高
+    # Gemini: 会話をターンをまたいで維持し、人格・指示のシステム命令をコンテキストキャッシュで送る
+    # （キャッシュの最小トークン数に満たない場合は通常どおり毎回送る）
+    "GEMINI_PERSISTENT_SESSION": True,
+    "GEMINI_CONTEXT_CACHE": True,
+    "GEMINI_CONTEXT_CACHE_TTL_MINUTES": 60,
     "API_CACHE_ENABLED": True,
     "API_CACHE_TTL_HOURS": 24,
     "TAVILY_COUNT": 0,
@@ -46,8 +57,29 @@ DEFAULT_CONFIG = {
     "SPEAKER_ID": 3,
     "VOICE_SPEED": 1.2,
     "VV_PATH": "",
+    # VOICEVOX エンジンの接続先と、読み上げ時に先行して合成する文の数
+    "VOICEVOX_URL": "http://127.0.0.1:50021",
+    "VOICEVOX_PIPELINE_DEPTH": 2,
+    # Edge-TTS の音声を受信しながら再生する（無効時は1文を受信し終えてから再生）
+    "EDGE_TTS_STREAMING": True,
+    # 合成音声のフレーズキャッシュ（上限MB）と、起動時に先行合成しておく言語別の定型フレーズ
+    "TTS_CACHE_ENABLED": True,
+    "TTS_CACHE_MAX_MB": 64,
+    "TTS_PREWARM_PHRASES": {
+        "ja": ["了解しました。", "少々お待ちください。", "もう一度お願いします。", "エラーが発生しました。"],
+        "en": ["Got it.", "Just a moment.", "Could you say that again?", "An error occurred."]
+    },
     "DEVICE_NAME": "デフォルト",
     "INPUT_DEVICE_NAME": "デフォルト",
+    # 音声入力の発話区間検出 (voice_endpointing.py):
+    #   "energy" - 音量とゼロ交差率で判定 / "webrtc" - WebRTC VAD（webrtcvad がない場合は energy）
+    #   "off"    - 従来の方式（毎回 0.8 秒の環境ノイズ測定と 1.2 秒の沈黙で終了）
+    # 発話が VAD_HANGOVER_MS 途切れたら入力を終える（短いと言葉の間で切れやすい）。
+    # 環境ノイズの測定値は VAD_CALIBRATION_MAX_AGE_SEC 秒まで使い回す
+    "VAD_ENGINE": "energy",
+    "VAD_HANGOVER_MS": 800,
+    "VAD_WEBRTC_AGGRESSIVENESS": 2,
+    "VAD_CALIBRATION_MAX_AGE_SEC": 1800,
     "VOICE_VOLUME": 0.7,
     "DISPLAY_TIME": 60,
     "LOG_FONT_SIZE": 13,
@@ -57,11 +89,31 @@ DEFAULT_CONFIG = {
     "LANGUAGE": "ja",
     "USE_INTERSECTING_AI": False,
     "TAG_GENERATION_INTERVAL": 5,
+    # 視覚モードのスクリーンショット: JPEG 品質と、送信先ごとの長辺の上限 (px) の上書き（例: {"gemini": 2048}）
+    "VISION_JPEG_QUALITY": 85,
+    "VISION_MAX_EDGE": {},
+    # AIの応答をストリーミングで受け取り、完成した文から順に読み上げる
+    "STREAMING_TTS": True,
+    # DB整理: 近似重複とみなす推定類似度と、1回の整理でLLM統合を行う最大クラスタ数
+    "DEDUP_SIMILARITY_THRESHOLD": 0.8,
+    "DEDUP_MAX_LLM_MERGES": 20,
+    # 記憶管理画面の一括処理: プロバイダー別の同時実行数と DB 更新のバッチサイズ
+    "BULK_CONCURRENCY": {"gemini": 4, "openai": 4, "local": 1},
+    "BULK_COMMIT_BATCH": 20,
+    # 常駐 API サーバー: 同時に実行する対話の数と、待たせておける対話の上限（超えたら 429 で再試行を促す）
+    "SERVER_MAX_WORKERS": 4,
+    "SERVER_MAX_QUEUE": 16,
+    # 1ターンの段階ごとの所要時間を data/turn_traces.jsonl に記録する（記憶管理画面の「応答遅延」タブで表示）
+    "TURN_TRACE_ENABLED": True,
+    # Tavily 互換 API の URL（空なら公式クライアントを使う。ベンチマークのスタブ用）
+    "TAVILY_API_URL": "",
+    # 記憶管理画面の1ページあたりの表示件数
+    "MEMORY_VIEWER_PAGE_SIZE": 200,
     "FILES": {
         "HISTORY": "data/chat_history.json",
         "CURRENT_TAGS": "data/current_tags.json",
         "FEEDBACK": "data/feedback_memory.json",
-        "TEMP_SS": "data/temp_ss.png"
+        "TEMP_SS": "data/temp_ss.jpg"
     },
     "HOTKEYS": {
         "voice_mode": "ctrl+alt+v",
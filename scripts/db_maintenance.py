@@ -17,6 +17,42 @@ except ImportError:
         get_chroma_collection = None
         config_manager = None
 
+# DB統計キャッシュ
+try:
+    from .db_stats import get_stats_cache, note_memory_write
+except ImportError:
+    try:
+        from db_stats import get_stats_cache, note_memory_write
+    except ImportError:
+        get_stats_cache = None
+        note_memory_write = None
+
+# 近似重複検出 (MinHash LSH)
+try:
+    from .near_duplicate_detector import NearDuplicateDetector, normalize_text
+except ImportError:
+    try:
+        from near_duplicate_detector import NearDuplicateDetector, normalize_text
+    except ImportError:
+        NearDuplicateDetector = None
+        normalize_text = None
+
+# LLMクライアント・HTTP接続プールの共有レジストリ（無い環境では呼び出しごとに生成）
+try:
+    from .client_registry import gemini_client, openai_client, http_client
+except ImportError:
+    try:
+        from client_registry import gemini_client, openai_client, http_client
+    except ImportError:
+        def gemini_client(api_key):
+            return genai.Client(api_key=api_key)
+
+        def openai_client(api_key):
+            return OpenAI(api_key=api_key)
+
+        def http_client():
+            return requests
+
 def get_ai_response(prompt, config, response_json=False):
     provider = config.get("DB_PROVIDER", config.get("AI_PROVIDER", "gemini")).lower()
     model_id = config.get("DB_MODEL_ID", config.get("MODEL_ID", "gemini-3.6-flash"))
@@ -26,7 +62,7 @@ def get_ai_response(prompt, config, response_json=False):
         actual_model_id, level = parse_model_name(model_id)
 
         if provider == "openai":
-            client = OpenAI(api_key=config.get("OPENAI_API_KEY"))
+            client = openai_client(config.get("OPENAI_API_KEY"))
             openai_kwargs = {
                 "model": actual_model_id,
                 "messages": [{"role": "system", "content": "You are a database expert. Respond ONLY with JSON."} if response_json else
@@ -57,7 +93,7 @@ def get_ai_response(prompt, config, response_json=False):
                     pass
                         
                     try:
-                        res = requests.post(
+                        res = http_client().post(
                             f"{url_resolved.rstrip('/')}/chat/completions",
                             json=post_data,
                             timeout=180
@@ -68,7 +104,7 @@ def get_ai_response(prompt, config, response_json=False):
                         if response_json:
                             try:
                                 post_data.pop("response_format", None)
-                                res = requests.post(
+                                res = http_client().post(
                                     f"{url_resolved.rstrip('/')}/chat/completions",
                                     json=post_data,
                                     timeout=180
@@ -105,7 +141,7 @@ def get_ai_response(prompt, config, response_json=False):
         else: # Gemini
             api_key = config.get("GEMINI_API_KEY")
             if not api_key: return "Error: Gemini API Key is missing."
-            client = genai.Client(api_key=api_key)
+            client = gemini_client(api_key)
 
             gen_config = {}
             if response_json:
@@ -134,7 +170,26 @@ def get_ai_response(prompt, config, response_json=False):
     except Exception as e:
         return f"Error: {str(e)}"
 
-# --- db_maintenance.py の clean_up_database 内にプロンプトを追加 ---
+# --- 近似重複の統合用プロンプト (LLMはクラスタ確定後の本文統合にのみ使用) ---
+MERGE_PROMPT_TEMPLATE = """
+You are a database maintenance assistant.
+The following memory entries were detected as near-duplicates of each other.
+Merge them into ONE entry that keeps every distinct fact, date and proper noun.
+Do not add new information. Output ONLY the merged text in the original language.
+
+{entries}
+"""
+
+def _merge_cluster_text(cluster_docs, config):
+    """クラスタ内の本文をLLMで1件に統合する。失敗時は None"""
+    entries = "\n".join(f"- {doc}" for doc in cluster_docs)
+    ai_res = get_ai_response(MERGE_PROMPT_TEMPLATE.format(entries=entries), config)
+    if not ai_res or ai_res.startswith("Error:"):
+        return None
+    merged = ai_res.strip()
+    if merged.startswith("```"):
+        merged = merged.strip("`").strip()
+    return merged or None
 
 def clean_up_database(db_path, config_path):
     try:
@@ -151,9 +206,10 @@ def clean_up_database(db_path, config_path):
         try:
             collection = get_chroma_collection(db_path)
             
-            results = collection.get()
+            results = collection.get(include=["documents", "metadatas"])
             ids = results.get('ids', [])
             documents = results.get('documents', [])
+            metadatas = results.get('metadatas') or [{}] * len(ids)
         except Exception as e:
             return f"Error: DB Connection failed. {str(e)}"
 
@@ -161,88 +217,95 @@ def clean_up_database(db_path, config_path):
         error_ids = [ids[i] for i, doc in enumerate(documents) if not doc or doc.strip() == ""]
         if error_ids:
             collection.delete(ids=error_ids)
+            if note_memory_write:
+                note_memory_write(db_path, removed=len(error_ids))
 
-        # --- 3. AIに渡すための target_docs を作成 (ここで定義！) ---
-        # 全件送るとトークン制限に触れるため、直近の50件などに絞るのが安全です
-        target_docs = []
-        for i in range(len(ids)):
-            if ids[i] not in error_ids:
-                target_docs.append({"id": ids[i], "content": documents[i]})
-        
-        # 逆順（新しい順）にして最新の30-50件程度にする（推奨）
-        target_docs = target_docs[::-1][:50]
-
-        if not target_docs:
+        # --- 3. 全件を対象にローカルで近似重複クラスタを検出 (MinHash LSH) ---
+        error_set = set(error_ids)
+        entries = [(ids[i], documents[i]) for i in range(len(ids)) if ids[i] not in error_set]
+        if not entries:
             return f"Cleanup Done: No data to process. Removed {len(error_ids)} errors."
 
-        # --- 4. プロンプトの定義 (target_docs が定義された後なので安全) ---
-        prompt = f"""
-        You are a database maintenance assistant. 
-        Below are the latest memory entries from a long-term database.
-        Please identify redundant information or duplicate entries and suggest which ones to delete.
-        
-        {json.dumps(target_docs, ensure_ascii=False)}
-        
-        Respond strictly in JSON format:
-        {{
-          "merge_plans": [
-            {{ "keep_id": "ID_TO_KEEP", "delete_ids": ["ID_TO_DELETE_1", "ID_TO_DELETE_2"] }}
-          ]
-        }}
-        """
-        
-        ai_res = get_ai_response(prompt, config, response_json=True)
-        
-        # AIがエラーを返した場合はそのまま返す
-        if ai_res.startswith("Error:"):
-            return f"Error removed ({len(error_ids)}), but AI failed: {ai_res}"
-
-        if "```json" in ai_res:
-            ai_res = ai_res.split("```json")[1].split("```")[0].strip()
-        elif "```" in ai_res:
-            ai_res = ai_res.split("```")[1].split("```")[0].strip()
-        
-        try:
-            plan = json.loads(ai_res)
-            merged_count = 0
-            for item in plan.get("merge_plans", []):
-                keep_id = item.get("keep_id")
-                delete_ids = item.get("delete_ids", [])
-                valid_deletes = [d_id for d_id in delete_ids if d_id != keep_id and d_id in ids]
-                if valid_deletes:
-                    collection.delete(ids=valid_deletes)
-                    merged_count += len(valid_deletes)
-                
-            return f"Cleanup Done: Removed {len(error_ids)} errors and merged {merged_count} duplicates."
-        except Exception as e:
-            # 変数 e を 文字列として明示的に保持する
-            error_msg = str(e)
-            return f"Errors removed ({len(error_ids)}), but AI parse failed: {error_msg}\nResponse: {ai_res[:100]}"
+        if NearDuplicateDetector is None:
+            return f"Cleanup Done: Removed {len(error_ids)} errors. (near-duplicate detector unavailable)"
+
+        detector = NearDuplicateDetector(threshold=float(config.get("DEDUP_SIMILARITY_THRESHOLD", 0.8)))
+        clusters = detector.find_clusters(entries)
+        if not clusters:
+            return f"Cleanup Done: Removed {len(error_ids)} errors. No duplicates found in {len(entries)} entries."
+
+        # --- 4. クラスタごとに統合 (完全一致はLLM不要、差分があるものだけLLMで本文を統合) ---
+        doc_map = {ids[i]: documents[i] for i in range(len(ids))}
+        meta_map = {ids[i]: (metadatas[i] or {}) for i in range(len(ids))}
+        max_llm_merges = int(config.get("DEDUP_MAX_LLM_MERGES", 20))
+
+        merged_count = 0
+        llm_merges = 0
+        skipped_clusters = 0
+        for cluster in clusters:
+            # 最新の記憶 (unix が最大) を残す
+            keep_id = max(cluster, key=lambda eid: meta_map.get(eid, {}).get("unix") or 0)
+            delete_ids = [eid for eid in cluster if eid != keep_id]
+
+            distinct_texts = {normalize_text(doc_map[eid]) for eid in cluster}
+            if len(distinct_texts) > 1:
+                if llm_merges >= max_llm_merges:
+                    skipped_clusters += 1
+                    continue
+                merged_text = _merge_cluster_text([doc_map[eid] for eid in cluster], config)
+                llm_merges += 1
+                if not merged_text:
+                    skipped_clusters += 1
+                    continue
+                collection.update(ids=[keep_id], documents=[merged_text])
+
+            collection.delete(ids=delete_ids)
+            if note_memory_write:
+                note_memory_write(db_path, removed=len(delete_ids))
+            merged_count += len(delete_ids)
+
+        msg = (f"Cleanup Done: Removed {len(error_ids)} errors and merged {merged_count} duplicates "
+               f"({len(clusters)} clusters in {len(entries)} entries, LLM merges: {llm_merges}).")
+        if skipped_clusters:
+            msg += f" {skipped_clusters} clusters left for the next run."
+        return msg
     except Exception as ex:
         return f"Error: Database cleanup crashed: {str(ex)}"
 
 def get_db_stats(db_path):
     """
     UI表示用の統計情報を取得
+    件数・サイズはキャッシュされ、DBファイルの更新時のみ再計測する
     """
     try:
         # フォルダが存在しない場合は0を返す
         if not os.path.exists(db_path):
             return 0, 0.0
         
-        # 改善: 接続プールで3-5倍高速化
-        collection = get_chroma_collection(db_path)
-        count = collection.count()
-        
+        stats = get_db_stats_breakdown(db_path)
+        return stats["count"], stats["db_mb"]
+    except:
+        return 0, 0.0
+
+def get_db_stats_breakdown(db_path, force=False):
+    """
+    構成要素別 (sqlite / hnsw / api_cache / search_cache) のサイズ内訳と記憶件数を取得
+    """
+    if get_stats_cache is None:
+        # フォールバック: 従来どおりフォルダ全体を走査
         total_size = 0
         for dirpath, _, filenames in os.walk(db_path):
             for f in filenames:
                 total_size += os.path.getsize(os.path.join(dirpath, f))
-        
         size_mb = round(total_size / (1024 * 1024), 2)
-        return count, size_mb
-    except:
-        return 0, 0.0
+        return {"count": get_chroma_collection(db_path).count(), "components": {},
+                "db_mb": size_mb, "total_mb": size_mb, "refreshed": [], "elapsed_ms": 0.0}
+
+    cache = get_stats_cache(db_path)
+    stats = cache.get_breakdown(force=force)
+    # 改善: 接続プールで3-5倍高速化
+    stats["count"] = cache.get_count(lambda: get_chroma_collection(db_path).count())
+    return stats
 
 if __name__ == "__main__":
     # テスト用パス（game_ai.py等の仕様に合わせ memory_db に修正）
@@ -0,0 +1,229 @@
+# ===== データベース統計のキャッシュ =====
+# db_maintenance.get_db_stats、memory_viewer のダッシュボードから使用
+# 毎回 os.walk で全ファイルを走査する代わりに、構成要素ごとのサイズを保持し
+# - 同一プロセス内の書き込みは note_file_write / note_memory_write で差分反映
+# - 他プロセスの書き込みはディレクトリ・ファイルの mtime 変化で遅延再計算
+# するため、通常の更新は数回の stat だけで済む
+
+import os
+import time
+import threading
+
+# ChromaDB の SQLite 本体と付随ファイル
+SQLITE_FILES = ("chroma.sqlite3", "chroma.sqlite3-wal", "chroma.sqlite3-shm", "chroma.sqlite3-journal")
+
+# mtime が変わらない上書き（HNSW の in-place 書き込み等）を取りこぼさないための再計算間隔（秒）
+DEFAULT_MAX_AGE = 300
+
+COMPONENTS = ("sqlite", "hnsw", "api_cache", "search_cache")
+
+
+def _stat_or_none(path):
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+
+def _dir_usage(path):
+    """ディレクトリ配下の合計バイト数とファイル数（os.scandir による再帰）"""
+    total, files = 0, 0
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        sub_total, sub_files = _dir_usage(entry.path)
+                        total += sub_total
+                        files += sub_files
+                    elif entry.is_file(follow_symlinks=False):
+                        total += entry.stat(follow_symlinks=False).st_size
+                        files += 1
+                except OSError:
+                    pass
+    except OSError:
+        pass
+    return total, files
+
+
+class DBStatsCache:
+    """構成要素別 (SQLite / HNSW セグメント / APIキャッシュ / 検索キャッシュ) のサイズ統計"""
+
+    def __init__(self, db_path, base_dir=None, max_age=DEFAULT_MAX_AGE):
+        self.db_path = os.path.abspath(db_path)
+        self.base_dir = os.path.abspath(base_dir or os.path.dirname(self.db_path))
+        self.max_age = max_age
+        self.paths = {
+            "sqlite": self.db_path,
+            "hnsw": self.db_path,
+            "api_cache": os.path.join(self.base_dir, "data", "api_cache"),
+            "search_cache": os.path.join(self.base_dir, "data", "search_cache"),
+        }
+        self._lock = threading.Lock()
+        self._entries = {}       # name -> {"bytes", "files", "signature", "checked_at"}
+        self._count = None
+        self._count_signature = None
+
+    # --- 無効化判定用のシグネチャ ---
+    def _sqlite_signature(self):
+        sig = []
+        for name in SQLITE_FILES:
+            st = _stat_or_none(os.path.join(self.db_path, name))
+            if st:
+                sig.append((name, st.st_size, st.st_mtime_ns))
+        return tuple(sig)
+
+    def _signature(self, name):
+        if name == "sqlite":
+            return self._sqlite_signature()
+        if name == "hnsw":
+            # セグメントの追加・削除はDBフォルダの mtime、インデックスの永続化は SQLite 側の更新で検知
+            st = _stat_or_none(self.db_path)
+            return (st.st_mtime_ns if st else None, self._sqlite_signature())
+        st = _stat_or_none(self.paths[name])
+        return st.st_mtime_ns if st else None
+
+    # --- 構成要素ごとの計測 ---
+    def _measure(self, name, signature):
+        if name == "sqlite":
+            # シグネチャにサイズが含まれるため、そのまま集計できる
+            return sum(s[1] for s in signature), len(signature)
+        if name == "hnsw":
+            total, files = 0, 0
+            try:
+                with os.scandir(self.db_path) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            seg_total, seg_files = _dir_usage(entry.path)
+                            total += seg_total
+                            files += seg_files
+            except OSError:
+                pass
+            return total, files
+        return _dir_usage(self.paths[name])
+
+    def _refresh_locked(self, name, force, now):
+        signature = self._signature(name)
+        entry = self._entries.get(name)
+        if (not force and entry is not None and entry["signature"] == signature
+                and now - entry["checked_at"] < self.max_age):
+            return False
+        total, files = self._measure(name, signature)
+        self._entries[name] = {"bytes": total, "files": files, "signature": signature, "checked_at": now}
+        return True
+
+    def get_breakdown(self, force=False):
+        """
+        Returns:
+            {"components": {name: {"bytes", "files", "mb"}}, "db_mb", "total_mb", "refreshed": [...], "elapsed_ms"}
+        """
+        t0 = time.perf_counter()
+        now = time.monotonic()
+        refreshed = []
+        components = {}
+        with self._lock:
+            for name in COMPONENTS:
+                if self._refresh_locked(name, force, now):
+                    refreshed.append(name)
+                entry = self._entries[name]
+                components[name] = {
+                    "bytes": entry["bytes"],
+                    "files": entry["files"],
+                    "mb": round(entry["bytes"] / (1024 * 1024), 2),
+                }
+        db_bytes = components["sqlite"]["bytes"] + components["hnsw"]["bytes"]
+        total_bytes = sum(c["bytes"] for c in components.values())
+        return {
+            "components": components,
+            "db_mb": round(db_bytes / (1024 * 1024), 2),
+            "total_mb": round(total_bytes / (1024 * 1024), 2),
+            "refreshed": refreshed,
+            "elapsed_ms": round((time.perf_counter() - t0) * 1000, 2),
+        }
+
+    def get_count(self, count_func):
+        """記憶件数。SQLite が更新されていなければ前回の値を返す"""
+        with self._lock:
+            signature = self._sqlite_signature()
+            if self._count is not None and self._count_signature == signature:
+                return self._count
+        count = count_func()
+        with self._lock:
+            self._count = count
+            self._count_signature = signature
+        return count
+
+    # --- 同一プロセス内の書き込み通知 ---
+    def component_for(self, path):
+        path = os.path.abspath(path)
+        for name in ("api_cache", "search_cache"):
+            root = self.paths[name]
+            if path.startswith(root + os.sep):
+                return name
+        return None
+
+    def apply_file_change(self, name, delta_bytes, delta_files):
+        """差分を反映し、自分の書き込みで変わった mtime をシグネチャに取り込む"""
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                return
+            entry["bytes"] = max(0, entry["bytes"] + delta_bytes)
+            entry["files"] = max(0, entry["files"] + delta_files)
+            entry["signature"] = self._signature(name)
+
+    def apply_memory_change(self, delta_count):
+        """記憶の追加・削除を件数に反映（SQLite/HNSW のサイズは次回参照時に再計測）"""
+        with self._lock:
+            if self._count is not None:
+                self._count = max(0, self._count + delta_count)
+                self._count_signature = self._sqlite_signature()
+            self._entries.pop("hnsw", None)
+
+    def invalidate(self, name=None):
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+                self._count = None
+            else:
+                self._entries.pop(name, None)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_stats_cache(db_path, base_dir=None):
+    """DBパスごとの統計キャッシュ（プロセス内で共有）"""
+    key = os.path.abspath(db_path)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = DBStatsCache(db_path, base_dir)
+        return cache
+
+
+def note_file_write(path, old_size=None, deleted=False):
+    """
+    キャッシュファイルの書き込み・削除を通知する
+    old_size: 上書き前のサイズ（新規作成なら None）
+    """
+    if not _caches:
+        return
+    new_size = 0
+    if not deleted:
+        st = _stat_or_none(path)
+        new_size = st.st_size if st else 0
+    delta_files = (-1 if deleted else (0 if old_size is not None else 1))
+    delta_bytes = new_size - (old_size or 0)
+    for cache in list(_caches.values()):
+        name = cache.component_for(path)
+        if name:
+            cache.apply_file_change(name, delta_bytes, delta_files)
+
+
+def note_memory_write(db_path, added=0, removed=0):
+    """長期記憶の追加・削除件数を通知する"""
+    cache = _caches.get(os.path.abspath(db_path))
+    if cache:
+        cache.apply_memory_change(added - removed)
@@ -0,0 +1,446 @@
+# ===== Edge-TTS のストリーミング再生 =====
+# game_ai.py の run_edge_tts_speak で使用
+# 文全体の MP3 を受け取り終えるのを待たず、届いたチャンクを MP3 フレーム境界で区切って
+# 最初の数百ミリ秒分が揃った時点で再生を始め、残りは再生中に受け取った分をまとめて後ろに繋ぐ
+# - 区切りはビットリザーバーを参照しないフレーム (main_data_begin == 0) を優先し、継ぎ目の欠けを防ぐ
+#   （最初のセグメントだけは、そのフレームが FIRST_SEGMENT_MAX_WAIT 秒待っても来なければその場で区切る。
+#    継ぎ目の1フレーム分が欠けることがあるが、文の大半を受信するまで再生が始まらないよりよい）
+# - 再生は音声出力エンジン (audio_output_engine) の予約チャンネルに順に渡す
+# - 再生を始める前に失敗した場合は None を返し、呼び出し側で文単位の再生に切り替える
+# - 録音したチャンク列を元のタイミングで再生する代役 (RecordedCommunicate) でオフライン検証できる
+#
+# 使用例（オフライン検証）:
+#   python scripts/edge_tts_stream.py synth-recording --out data/edge_tts_sample.jsonl
+#   python scripts/edge_tts_stream.py synth-recording --out data/edge_tts_reservoir.jsonl --self-contained-every 0
+#   python scripts/edge_tts_stream.py replay data/edge_tts_sample.jsonl
+#   python scripts/edge_tts_stream.py record "こんにちは。今日はいい天気ですね。" --out data/edge_tts_rec.jsonl
+
+import sys
+import json
+import time
+import queue
+import base64
+import asyncio
+import threading
+
+# 最初のセグメントのフレーム数（MPEG-2 Layer III 24kHz では1フレーム 24ms → 約0.3秒）
+FIRST_SEGMENT_FRAMES = 12
+# 2つ目以降のセグメントの最小フレーム数
+MIN_SEGMENT_FRAMES = 8
+# 区切りに適したフレームが見つからなくても、これだけ溜まったら区切る
+MAX_PENDING_FRAMES = 200
+# 最初のセグメント: FIRST_SEGMENT_FRAMES が揃ってから区切りに適したフレームを待つ上限（秒）
+FIRST_SEGMENT_MAX_WAIT = 0.15
+
+_BITRATES = {
+    "mpeg1": [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    "mpeg2": [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def parse_frame_header(buf, pos):
+    """
+    pos から始まる MPEG Layer III フレームヘッダーを解析する
+    Returns: (フレーム長, 再生秒数, 単独で復号可能か) / ヘッダーでなければ None
+    """
+    if pos + 6 > len(buf):
+        return None
+    b0, b1, b2 = buf[pos], buf[pos + 1], buf[pos + 2]
+    if b0 != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+    version = (b1 >> 3) & 0x03
+    layer = (b1 >> 1) & 0x03
+    if version == 1 or layer != 1:
+        return None
+    bitrate_idx = b2 >> 4
+    sr_idx = (b2 >> 2) & 0x03
+    if bitrate_idx in (0, 15) or sr_idx == 3:
+        return None
+    is_mpeg1 = version == 3
+    bitrate = _BITRATES["mpeg1" if is_mpeg1 else "mpeg2"][bitrate_idx] * 1000
+    sample_rate = _SAMPLE_RATES[version][sr_idx]
+    padding = (b2 >> 1) & 0x01
+    if is_mpeg1:
+        length = 144 * bitrate // sample_rate + padding
+        samples = 1152
+    else:
+        length = 72 * bitrate // sample_rate + padding
+        samples = 576
+    # サイド情報先頭の main_data_begin が 0 なら前のフレームのデータを参照しない
+    side = pos + 4 + (0 if b1 & 0x01 else 2)
+    if side + 1 >= len(buf):
+        return None
+    main_data_begin = ((buf[side] << 1) | (buf[side + 1] >> 7)) if is_mpeg1 else buf[side]
+    return length, samples / sample_rate, main_data_begin == 0
+
+
+class MP3FrameSplitter:
+    """受け取ったバイト列から完全な MP3 フレームを取り出す"""
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._skipped_id3 = False
+
+    def feed(self, data):
+        """Returns: [(フレームのバイト列, 再生秒数, 単独で復号可能か), ...]"""
+        self._buf.extend(data)
+        buf = self._buf
+        if not self._skipped_id3:
+            if len(buf) < 10:
+                return []
+            if buf[:3] == b"ID3":
+                size = (buf[6] << 21) | (buf[7] << 14) | (buf[8] << 7) | buf[9]
+                if len(buf) < 10 + size:
+                    return []
+                del buf[:10 + size]
+            self._skipped_id3 = True
+
+        frames = []
+        pos = 0
+        while pos + 6 <= len(buf):
+            header = parse_frame_header(buf, pos)
+            if header is None:
+                pos += 1   # 同期ずれ。次のバイトからヘッダーを探す
+                continue
+            length, duration, self_contained = header
+            if pos + length > len(buf):
+                break
+            frames.append((bytes(buf[pos:pos + length]), duration, self_contained))
+            pos += length
+        del buf[:pos]
+        return frames
+
+    def flush(self):
+        self._buf.clear()
+        return []
+
+
+def _cut_point(frames, need, done, force=False):
+    """
+    セグメントの区切り位置（frames のインデックス）。まだ区切らない場合は None
+    force: 区切りに適したフレームがなくても need 以上あれば区切る（最初のセグメントの待ち時間の上限）
+    """
+    if done:
+        return len(frames)
+    if len(frames) < need:
+        return None
+    # 次のセグメントが単独で復号できるフレームから始まるよう、後ろから区切り候補を探す
+    for i in range(len(frames) - 1, need - 1, -1):
+        if frames[i][2]:
+            return i
+    return len(frames) if force or len(frames) >= MAX_PENDING_FRAMES else None
+
+
+def iter_segments(chunk_queue, stats=None):
+    """
+    チャンクキュー（bytes / 終了の None / 例外）から、再生用のセグメント (bytes, 再生秒数) を返す
+    再生側がブロックしている間に届いたチャンクは、次のセグメントにまとめる
+    """
+    splitter = MP3FrameSplitter()
+    frames = []
+    done = False
+    first = True
+    first_ready_at = None   # 最初のセグメント分のフレームが揃った時刻
+
+    def absorb(item):
+        if item is None:
+            return True
+        if isinstance(item, Exception):
+            raise item
+        if stats is not None and "first_chunk_ms" not in stats:
+            stats["first_chunk_ms"] = round((time.perf_counter() - stats["started_at"]) * 1000, 1)
+        frames.extend(splitter.feed(item))
+        return False
+
+    while True:
+        if not done:
+            # 最初のセグメントを区切れずに待っている間は、上限まで待ったら強制的に区切れるよう待ち時間を限る
+            timeout = None
+            if first and first_ready_at is not None:
+                timeout = max(0.0, FIRST_SEGMENT_MAX_WAIT - (time.perf_counter() - first_ready_at))
+            try:
+                done = absorb(chunk_queue.get(timeout=timeout))
+            except queue.Empty:
+                pass
+            while not done:
+                try:
+                    done = absorb(chunk_queue.get_nowait())
+                except queue.Empty:
+                    break
+        force = False
+        if first and len(frames) >= FIRST_SEGMENT_FRAMES:
+            if first_ready_at is None:
+                first_ready_at = time.perf_counter()
+            force = time.perf_counter() - first_ready_at >= FIRST_SEGMENT_MAX_WAIT
+        cut = _cut_point(frames, FIRST_SEGMENT_FRAMES if first else MIN_SEGMENT_FRAMES, done, force)
+        if cut:
+            seam_ok = done or (cut < len(frames) and frames[cut][2])
+            segment = frames[:cut]
+            del frames[:cut]
+            if stats is not None and not seam_ok:
+                # 単独で復号できないフレームの前で区切った（継ぎ目の1フレームが欠けることがある）
+                stats["forced_cut"] = True
+            first = False
+            yield b"".join(f[0] for f in segment), sum(f[1] for f in segment)
+        if done and not frames:
+            return
+
+
+class EdgeTTSStreamer:
+    """
+    Edge-TTS のチャンクを受け取りながら再生する
+
+    communicate_factory: edge_tts.Communicate と同じ引数 (text, voice, volume=...) で
+                         stream() を持つオブジェクトを返す関数（オフライン検証では RecordedCommunicate）
+    """
+
+    def __init__(self, communicate_factory=None):
+        if communicate_factory is None:
+            import edge_tts
+            communicate_factory = edge_tts.Communicate
+        self.communicate_factory = communicate_factory
+        self.last_stats = {}
+
+    def _produce(self, text, params, chunk_queue, cancelled):
+        async def _run():
+            communicate = self.communicate_factory(text, params["voice"], volume=params["volume"])
+            async for chunk in communicate.stream():
+                if cancelled.is_set():
+                    break
+                if chunk.get("type") == "audio" and chunk.get("data"):
+                    chunk_queue.put(chunk["data"])
+        try:
+            asyncio.run(_run())
+            chunk_queue.put(None)
+        except Exception as e:
+            chunk_queue.put(e)
+
+    def speak(self, text, params, player, should_stop=None):
+        """
+        1文をストリーミング再生する
+        Returns: 受け取った MP3 全体（キャッシュ保存用）。再生を始める前に失敗した場合は None
+                 （呼び出し側で文単位の合成・再生に切り替える）
+        """
+        should_stop = should_stop or (lambda: False)
+        chunk_queue = queue.Queue()
+        cancelled = threading.Event()
+        stats = {"started_at": time.perf_counter(), "segments": 0}
+        received = []
+        producer = threading.Thread(target=self._produce, args=(text, params, chunk_queue, cancelled), daemon=True)
+        producer.start()
+
+        played = False
+        try:
+            for segment, duration in iter_segments(chunk_queue, stats):
+                received.append(segment)
+                if should_stop():
+                    player.stop()
+                    return b"".join(received)
+                if not player.enqueue(segment, duration):
+                    return b"".join(received)
+                if not played:
+                    stats["first_play_ms"] = round((time.perf_counter() - stats["started_at"]) * 1000, 1)
+                    played = True
+                stats["segments"] += 1
+            stats["download_ms"] = round((time.perf_counter() - stats["started_at"]) * 1000, 1)
+            player.drain(should_stop)
+        except Exception as e:
+            if not played:
+                print(f"Edge-TTS streaming unavailable, falling back to sentence playback: {e}")
+                return None
+            raise
+        finally:
+            cancelled.set()
+            stats.pop("started_at", None)
+            self.last_stats = stats
+        return b"".join(received)
+
+
+class EngineSegmentPlayer:
+    """
+    音声出力エンジン (audio_output_engine) にセグメントを順に渡して継ぎ目なく再生する
+    エンジン側の「再生中1つ + 予約1つ」に合わせ、前のセグメントが再生を始めるまで次を渡さない
+    """
+
+    def __init__(self, engine, should_stop=None, on_start=None):
+        self.engine = engine
+        self.should_stop = should_stop or (lambda: False)
+        self.on_start = on_start
+        self._last = None
+
+    def enqueue(self, segment, duration):
+        if self._last is None:
+            clip = self.engine.play(segment, "mp3", on_start=self.on_start)
+            self.engine.wait_started(clip, self.should_stop)
+            if clip.error is not None:
+                # 最初のセグメントを再生できない → 呼び出し側で文単位の再生に切り替える
+                raise clip.error
+            if clip.kind == "music":
+                # Sound で MP3 を復号できず music で代替再生された。セグメントごとに load() の間が空いて
+                # 途切れるため、このセグメントを止めて文単位の再生に切り替える
+                self.engine.interrupt()
+                raise RuntimeError("pygame cannot decode MP3 into a Sound")
+        else:
+            if not self.engine.wait_started(self._last, self.should_stop):
+                return False
+            clip = self.engine.play(segment, "mp3")
+        self._last = clip
+        return not self.should_stop()
+
+    def drain(self, should_stop=None):
+        if self._last is None:
+            return True
+        return self.engine.wait(self._last, should_stop or self.should_stop)
+
+    def stop(self):
+        self.engine.interrupt()
+
+
+class SimulatedPlayer:
+    """音を出さず、再生時間だけを模擬する再生側（オフライン検証用）"""
+
+    def __init__(self):
+        self._ends = []
+        self.started_at = None
+
+    def enqueue(self, segment, duration):
+        now = time.perf_counter()
+        self._ends = [t for t in self._ends if t > now]
+        # Channel と同じく「再生中1つ + 待ち1つ」まで
+        while len(self._ends) >= 2:
+            time.sleep(max(0.0, self._ends[0] - time.perf_counter()))
+            now = time.perf_counter()
+            self._ends = [t for t in self._ends if t > now]
+        start = self._ends[-1] if self._ends else now
+        if self.started_at is None:
+            self.started_at = now
+        self._ends.append(start + duration)
+        return True
+
+    def drain(self, should_stop=None):
+        if self._ends:
+            time.sleep(max(0.0, self._ends[-1] - time.perf_counter()))
+        return True
+
+    def stop(self):
+        self._ends = []
+
+
+# --- 録音・再生による代役 (オフライン検証用) ---
+class RecordedCommunicate:
+    """録音したチャンク列を、受信時のタイミングで返す edge_tts.Communicate の代役"""
+
+    def __init__(self, path, speed=1.0):
+        self.records = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    self.records.append(json.loads(line))
+        self.speed = speed
+
+    async def stream(self):
+        started = time.perf_counter()
+        for rec in self.records:
+            delay = rec["t"] / self.speed - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield {"type": rec.get("type", "audio"), "data": base64.b64decode(rec["data"])}
+
+
+def recorded_factory(path, speed=1.0):
+    return lambda text, voice, volume=None: RecordedCommunicate(path, speed)
+
+
+def record_stream(text, voice, out_path, volume="+0%"):
+    """実際の Edge-TTS から受信したチャンクと受信時刻を記録する"""
+    import edge_tts
+
+    async def _run():
+        started = time.perf_counter()
+        count = 0
+        with open(out_path, "w", encoding="utf-8") as f:
+            async for chunk in edge_tts.Communicate(text, voice, volume=volume).stream():
+                if chunk.get("type") != "audio":
+                    continue
+                f.write(json.dumps({"t": round(time.perf_counter() - started, 4), "type": "audio",
+                                    "data": base64.b64encode(chunk["data"]).decode("ascii")}) + "\n")
+                count += 1
+        return count
+    return asyncio.run(_run())
+
+
+def make_synthetic_recording(out_path, seconds=4.0, first_chunk_delay=0.25, realtime_factor=4.0,
+                             self_contained_every=1):
+    """
+    ネットワーク無しで検証するための合成録音を作る
+    （MPEG-2 Layer III 24kHz 48kbps モノラル = Edge-TTS の既定形式と同じフレーム構成、中身は無音）
+    self_contained_every: main_data_begin == 0 のフレームの間隔。それ以外はビットリザーバーを参照するフレームにする
+                          （1 なら全フレーム、0 なら先頭以外なし。実際の録音に近い区切りにくさを模擬する）
+    """
+    frame_len = 72 * 48000 // 24000
+    header = bytes([0xFF, 0xF3, 0x64, 0xC4])
+    frames = int(seconds / (576 / 24000))
+    per_chunk = 16
+
+    def frame(i):
+        contained = i == 0 or (self_contained_every and i % self_contained_every == 0)
+        return header + bytes([0x00 if contained else 0x20]) + bytes(frame_len - 5)
+
+    with open(out_path, "w", encoding="utf-8") as f:
+        for i in range(0, frames, per_chunk):
+            n = min(per_chunk, frames - i)
+            t = first_chunk_delay + (i * 576 / 24000) / realtime_factor
+            data = b"".join(frame(j) for j in range(i, i + n))
+            f.write(json.dumps({"t": round(t, 4), "type": "audio",
+                                "data": base64.b64encode(data).decode("ascii")}) + "\n")
+    return frames
+
+
+def replay_benchmark(path, speed=1.0):
+    """
+    録音を代役として再生し、ストリーミングと「全体を受信してから再生」の再生開始時刻を比較する
+    """
+    streamer = EdgeTTSStreamer(recorded_factory(path, speed))
+    params = {"voice": "recorded", "volume": "+0%"}
+    audio = streamer.speak("", params, SimulatedPlayer())
+    stats = dict(streamer.last_stats)
+    # 従来方式: 最後のチャンクを受信し終えた時点で再生開始
+    records = RecordedCommunicate(path, speed).records
+    stats["blocking_first_play_ms"] = round(records[-1]["t"] / speed * 1000, 1) if records else None
+    stats["bytes"] = len(audio or b"")
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Edge-TTS streaming playback tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_rec = sub.add_parser("record", help="Record Edge-TTS chunks with their arrival times")
+    p_rec.add_argument("text")
+    p_rec.add_argument("--voice", default="ja-JP-NanamiNeural")
+    p_rec.add_argument("--out", required=True)
+
+    p_syn = sub.add_parser("synth-recording", help="Create a silent synthetic recording (no network)")
+    p_syn.add_argument("--out", required=True)
+    p_syn.add_argument("--seconds", type=float, default=4.0)
+    p_syn.add_argument("--self-contained-every", type=int, default=1,
+                       help="Interval of frames with main_data_begin == 0 (0 = only the first frame)")
+
+    p_rep = sub.add_parser("replay", help="Replay a recording through the streaming player (no audio output)")
+    p_rep.add_argument("recording")
+    p_rep.add_argument("--speed", type=float, default=1.0)
+
+    args = parser.parse_args()
+    if args.command == "record":
+        print(f"Recorded {record_stream(args.text, args.voice, args.out)} chunks -> {args.out}")
+    elif args.command == "synth-recording":
+        print(f"Wrote {make_synthetic_recording(args.out, args.seconds, self_contained_every=args.self_contained_every)} "
+              f"frames -> {args.out}")
+    else:
+        res = replay_benchmark(args.recording, args.speed)
+        print(json.dumps(res, ensure_ascii=False, indent=2))
+        if not res.get("first_play_ms"):
+            sys.exit(1)
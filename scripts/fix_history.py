@@ -2,6 +2,15 @@ import json
 import os
 import sys
 
+# 追記型チャット履歴ストア
+try:
+    from .history_store import get_history_store
+except ImportError:
+    try:
+        from history_store import get_history_store
+    except ImportError:
+        get_history_store = None
+
 # === 1. パス解決・言語管理 ===
 def get_app_root():
     if getattr(sys, 'frozen', False):
@@ -48,6 +57,31 @@ def main():
         # 履歴ファイルのパスを特定
         history_file = os.path.join(root, config["FILES"]["HISTORY"])
 
+        # ja.json: "ai_prompt" -> "feedback_mark_bad"
+        mark_text = lang_data["ai_prompt"].get("feedback_mark_bad", " (marked as wrong)")
+        # ja.json: "ai_prompt" -> "feedback_notice_bad"
+        notice_text = lang_data["ai_prompt"].get("feedback_notice_bad", "[Notice: Mistakes included]")
+
+        def mark_last_ai(history):
+            # 履歴リストの末尾から、最後のAI発言を探してマークを追記
+            for i in range(len(history)-1, -1, -1):
+                if history[i].startswith("AI:"):
+                    # 二重にマークが付かないようにチェック
+                    if mark_text not in history[i]:
+                        history[i] += mark_text
+                    return history
+            # AIの発言が見つからなかった場合の通知文
+            history.append(notice_text)
+            return history
+
+        if get_history_store:
+            store = get_history_store(history_file)
+            if store.count() == 0:
+                return
+            # 過去の行の書き換えのため、ロック内で全体を原子的に書き直す
+            store.rewrite(mark_last_ai)
+            return
+
         if not os.path.exists(history_file):
             return
 
@@ -58,24 +92,8 @@ def main():
         if not history:
             return
 
-        # 2. 履歴リストの末尾から、最後のAI発言を探してマークを追記
-        found_ai_msg = False
-        # ja.json: "ai_prompt" -> "feedback_mark_bad"
-        mark_text = lang_data["ai_prompt"].get("feedback_mark_bad", " (marked as wrong)")
-        
-        for i in range(len(history)-1, -1, -1):
-            if history[i].startswith("AI:"):
-                # 二重にマークが付かないようにチェック
-                if mark_text not in history[i]:
-                    history[i] += mark_text
-                found_ai_msg = True
-                break
-        
-        # AIの発言が見つからなかった場合の通知文
-        # ja.json: "ai_prompt" -> "feedback_notice_bad"
-        if not found_ai_msg:
-            notice_text = lang_data["ai_prompt"].get("feedback_notice_bad", "[Notice: Mistakes included]")
-            history.append(notice_text)
+        # 2. マークを追記
+        history = mark_last_ai(history)
 
         # 3. 上書き保存
         os.makedirs(os.path.dirname(history_file), exist_ok=True)
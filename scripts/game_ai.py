@@ -1,4 +1,4 @@
-import subprocess, sys, os, json, threading, chromadb, ctypes, re, time, queue, requests, pygame, psutil
+import subprocess, sys, os, json, threading, ctypes, re, time, queue
 
 # ポータブルPython (embeddable python) 用のパス解決
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -8,22 +8,25 @@ if scripts_path not in sys.path:
 if base_dir not in sys.path:
     sys.path.insert(0, base_dir)
 
-import pygetwindow as gw
-from PIL import ImageGrab, ImageTk, Image
-import speech_recognition as sr
+# 起動時間の計測 (--profile-startup)。重い import より前に開始する
+try:
+    from .startup_profiler import enable as enable_startup_profiler, get_profiler as get_startup_profiler, startup_step
+except ImportError:
+    from startup_profiler import enable as enable_startup_profiler, get_profiler as get_startup_profiler, startup_step
+if "--profile-startup" in sys.argv:
+    enable_startup_profiler()
+
+# chromadb / speech_recognition / edge_tts / websockets / psutil / pygame / google.genai / openai / Flask は
+# 使う処理の中で初めて読み込む（1つのアクションに不要な依存の読み込みで起動を待たせないため）
+import requests
 # import tkinter as tk  # REMOVED: No direct GUI access in this script
-import edge_tts
 import asyncio
-import websockets
-import base64
-from io import BytesIO
 from datetime import datetime
 import io
-import contextlib
-import atexit
 import concurrent.futures
 from functools import wraps
 import hashlib
+import importlib
 
 
 # ChromaDB接続プールのインポート（検索速度3-5倍高速化）
@@ -49,6 +52,108 @@ except ImportError:
         config_manager = None
         print("警告: api_cache_system.py または config_manager.py が見つかりません。")
 
+# DB統計キャッシュへの書き込み通知
+try:
+    from .db_stats import note_file_write, note_memory_write
+except ImportError:
+    try:
+        from db_stats import note_file_write, note_memory_write
+    except ImportError:
+        note_file_write = None
+        note_memory_write = None
+
+# LLMクライアント・HTTP接続プールの共有レジストリ
+try:
+    from .client_registry import get_client_registry
+except ImportError:
+    try:
+        from client_registry import get_client_registry
+    except ImportError:
+        get_client_registry = None
+
+def http_client():
+    """接続先ごとの keep-alive 接続プールを使う HTTP クライアント（レジストリが無い場合は requests）"""
+    return get_client_registry() if get_client_registry else requests
+
+# VOICEVOX の先行合成・メモリ上再生パイプライン
+try:
+    from .voicevox_pipeline import VoicevoxPipeline, get_voicevox_url, get_last_run_stats as get_voicevox_stats
+except ImportError:
+    from voicevox_pipeline import VoicevoxPipeline, get_voicevox_url, get_last_run_stats as get_voicevox_stats
+
+# 合成音声のフレーズキャッシュ
+try:
+    from .tts_audio_cache import get_tts_cache
+except ImportError:
+    try:
+        from tts_audio_cache import get_tts_cache
+    except ImportError:
+        get_tts_cache = None
+
+# 検索ゲートキーパー判定のキャッシュ・投機的検索
+try:
+    from .search_gatekeeper import get_search_gatekeeper
+except ImportError:
+    try:
+        from search_gatekeeper import get_search_gatekeeper
+    except ImportError:
+        get_search_gatekeeper = None
+
+# 検索要否の事前分類（明らかなクエリはゲートキーパーの LLM を呼ばずに判定）
+try:
+    from .search_preclassifier import get_preclassifier
+except ImportError:
+    try:
+        from search_preclassifier import get_preclassifier
+    except ImportError:
+        get_preclassifier = None
+
+# Edge-TTS のチャンク単位ストリーミング再生
+try:
+    from .edge_tts_stream import EdgeTTSStreamer, EngineSegmentPlayer
+except ImportError:
+    try:
+        from edge_tts_stream import EdgeTTSStreamer, EngineSegmentPlayer
+    except ImportError:
+        EdgeTTSStreamer = None
+        EngineSegmentPlayer = None
+
+# LLMストリーミング応答の文単位読み上げ・応答遅延の計測
+try:
+    from .streaming_tts import (SentenceStream, feed_stream, join_sentences, split_sentences, begin_turn, mark_turn_event,
+                                end_turn, current_turn, carry_turn, get_latency_history)
+except ImportError:
+    try:
+        from streaming_tts import (SentenceStream, feed_stream, join_sentences, split_sentences, begin_turn,
+                                   mark_turn_event, end_turn, current_turn, carry_turn, get_latency_history)
+    except ImportError:
+        SentenceStream = None
+        split_sentences = None
+        begin_turn = None
+        mark_turn_event = None
+        end_turn = None
+        current_turn = lambda: None
+        carry_turn = lambda func: func
+        get_latency_history = None
+
+# 設定・言語ファイルのキャッシュ（mtime・サイズが変わった時だけ読み直す）
+try:
+    from .config_cache import get_config_provider
+except ImportError:
+    try:
+        from config_cache import get_config_provider
+    except ImportError:
+        get_config_provider = None
+
+# 追記型チャット履歴ストア
+try:
+    from .history_store import get_history_store
+except ImportError:
+    try:
+        from history_store import get_history_store
+    except ImportError:
+        get_history_store = None
+
 # ワーキングメモリ管理システムのインポート (Ver 1.3.2)
 try:
     from .working_memory_manager import WorkingMemoryManager
@@ -63,53 +168,40 @@ global_working_memory = WorkingMemoryManager(max_context_chars=3000) if WorkingM
 
 # --- 1. ロックの準備 ---
 file_lock = threading.Lock()
-active_session_id = None
-active_session_lock = threading.Lock()
 is_server_mode = False
 
-def get_active_session_id():
-    global active_session_id
-    with active_session_lock:
-        return active_session_id
+# 常駐 API サーバーの対話はセッション表と上限付きワーカープールで実行する (session_manager.py)
+try:
+    from .session_manager import get_session_manager, SessionRejected
+except ImportError:
+    from session_manager import get_session_manager, SessionRejected
 
-def set_active_session_id(session_id):
-    global active_session_id
-    with active_session_lock:
-        active_session_id = session_id
+# 1ターンの段階ごとの所要時間を記録する (turn_tracer.py)
+try:
+    from .turn_tracer import (begin_trace, end_trace, current_trace, span as trace_span, start_span, carry_trace,
+                              mark as trace_mark, get_trace_stats)
+except ImportError:
+    from turn_tracer import (begin_trace, end_trace, current_trace, span as trace_span, start_span, carry_trace,
+                             mark as trace_mark, get_trace_stats)
 
-# バックグラウンドタスク用の並列実行関数
-def submit_background_task(func, *args, timeout=None):
-    """バックグラウンドタスクを並列実行キューに追加
+# バックグラウンドタスクは優先度レーン付きのタスクキュー (optimized_task_queue.py) で実行する
+try:
+    from .optimized_task_queue import get_task_queue, CancellationToken, TaskCancelled, record_reclaimed, get_reclaimed_stats
+except ImportError:
+    from optimized_task_queue import get_task_queue, CancellationToken, TaskCancelled, record_reclaimed, get_reclaimed_stats
+
+def submit_background_task(func, *args, timeout=None, priority="normal"):
+    """バックグラウンドタスクを優先度レーン付きのタスクキューに追加
     
     Args:
         func: 実行する関数
         *args: 関数の引数
         timeout: タイムアウト時間（秒）。Noneの場合はタイムアウトなし
+        priority: "high"（ユーザーが結果を待つ処理）/ "normal" / "low"（記憶の保存・最適化など）
+    Returns:
+        TaskHandle（cancel() で中断を要求できる）
     """
-    executor = get_thread_pool_executor()
-    
-    def wrapped_task():
-        try:
-            if timeout is not None:
-                # タイムアウト付きでタスク実行
-                run_with_timeout(func, timeout, *args)
-            else:
-                # タイムアウトなしで実行
-                func(*args)
-        except Exception as e:
-            send_log_to_hub(f"Background Task Error: {e}", is_error=True)
-    
-    executor.submit(wrapped_task)
-
-# ThreadPoolExecutor for parallel processing (並列処理用)
-_thread_pool_executor = None
-
-def get_thread_pool_executor(max_workers=3):
-    """ThreadPoolExecutorのグローバルインスタンスを取得"""
-    global _thread_pool_executor
-    if _thread_pool_executor is None:
-        _thread_pool_executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
-    return _thread_pool_executor
+    return get_task_queue(send_log_to_hub).submit_task(func, args, priority=priority, timeout=timeout)
 
 def run_with_timeout(func, timeout, *args, **kwargs):
     """
@@ -133,7 +225,8 @@ def run_with_timeout(func, timeout, *args, **kwargs):
     
     # 実際には呼び出し側でメッセージを組み立てて渡すように変更する
     executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
-    future = executor.submit(func, *args, **kwargs)
+    # 区間計測のターンを実行スレッドに引き継ぐ（ストリーミング中の first_token などを記録するため）
+    future = executor.submit(carry_trace(carry_turn(func)), *args, **kwargs)
     try:
         return future.result(timeout=timeout)
     except concurrent.futures.TimeoutError:
@@ -150,50 +243,42 @@ def run_with_timeout(func, timeout, *args, **kwargs):
     finally:
         executor.shutdown(wait=False)
 
-# ===== pygame.mixerメモリリーク修正 =====
-_mixer_initialized = False
+# ===== Hub へのログ送信 =====
+# ログ・オーバーレイ状態は常駐の送信スレッドがまとめて送る (hub_log_shipper.py)
+try:
+    from .hub_log_shipper import get_log_shipper
+except ImportError:
+    try:
+        from hub_log_shipper import get_log_shipper
+    except ImportError:
+        get_log_shipper = None
 
-def ensure_mixer_cleanup():
-    """プログラム終了時にmixerを確実にクリーンアップ"""
-    global _mixer_initialized
-    if _mixer_initialized and pygame.mixer.get_init():
-        try:
-            pygame.mixer.music.stop()
-            pygame.mixer.quit()
-            _mixer_initialized = False
-        except:
-            pass
+# ===== Gemini セッション =====
+# 会話をターンをまたいで保持し、変わらないシステム命令はコンテキストキャッシュで送る (gemini_session.py)
+try:
+    from .gemini_session import get_gemini_sessions
+except ImportError:
+    from gemini_session import get_gemini_sessions
 
-atexit.register(ensure_mixer_cleanup)
+# ===== スクリーンショット =====
+# キャプチャはメモリ上で送信先 AI の最大解像度に縮小し、JPEG で1回だけエンコードする (screenshot_pipeline.py)
+try:
+    from .screenshot_pipeline import EncodedImage, encode_for_provider, grab_window, record_upload, get_vision_stats
+except ImportError:
+    from screenshot_pipeline import EncodedImage, encode_for_provider, grab_window, record_upload, get_vision_stats
 
-@contextlib.contextmanager
-def managed_mixer(config):
-    """pygame.mixerのコンテキストマネージャー - 使用後に確実にリソースを解放"""
-    global _mixer_initialized
-    target_device = config.get("DEVICE_NAME")
-    
-    try:
-        if not pygame.mixer.get_init():
-            try:
-                if target_device and target_device != "デフォルト":
-                    pygame.mixer.init(frequency=44100, size=-16, channels=1, devicename=target_device)
-                else:
-                    pygame.mixer.init(frequency=44100, size=-16, channels=1)
-                _mixer_initialized = True
-            except:
-                pygame.mixer.init(frequency=44100, size=-16, channels=1)
-                _mixer_initialized = True
-        yield
-    finally:
-        try:
-            while pygame.mixer.music.get_busy():
-                time.sleep(0.05)
-            pygame.mixer.music.unload()
-        except:
-            pass
+# ===== 音声出力 =====
+# pygame.mixer の初期化・再生は常駐の音声出力エンジン (audio_output_engine.py) に一元化
+try:
+    from .audio_output_engine import get_audio_engine
+except ImportError:
+    from audio_output_engine import get_audio_engine
 
 # --- 1. パス解決・ログ・言語管理 ---
 def get_app_root():
+    # 負荷試験・ベンチマークでは一時フォルダを指定し、利用者のデータに触れないようにする
+    if os.environ.get("SECREAI_APP_ROOT"):
+        return os.environ["SECREAI_APP_ROOT"]
     if getattr(sys, 'frozen', False):
         return os.path.dirname(sys.executable)
     current_script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -201,10 +286,10 @@ def get_app_root():
         return os.path.dirname(current_script_dir)
     return current_script_dir
 
-def is_voicevox_up():
+def is_voicevox_up(config=None):
     """VOICEVOXエンジンが起動しており、応答するか確認する"""
     try:
-        response = requests.get("http://127.0.0.1:50021/version", timeout=1)
+        response = http_client().get(f"{get_voicevox_url(config)}/version", timeout=1)
         return response.status_code == 200
     except:
         return False
@@ -213,6 +298,9 @@ APP_ROOT = get_app_root()
 
 def send_log_to_hub(message, is_error=False, error_code=None):
     print(message)
+    if get_log_shipper:
+        get_log_shipper().log(message, is_error, error_code)
+        return
     def _send():
         try:
             url = "http://127.0.0.1:5000/api/log"
@@ -227,6 +315,14 @@ def send_log_to_hub(message, is_error=False, error_code=None):
 def trigger_overlay_state(text, image_path, alpha_val, display_time, status, overlay_queue=None):
     if overlay_queue:
         overlay_queue.put((text, image_path, alpha_val, display_time, status))
+    elif get_log_shipper:
+        get_log_shipper().overlay({
+            "text": text or "",
+            "image_path": image_path or "",
+            "alpha_val": alpha_val,
+            "display_time": display_time,
+            "status": status
+        })
     else:
         def _send():
             try:
@@ -246,6 +342,8 @@ def trigger_overlay_state(text, image_path, alpha_val, display_time, status, ove
 def load_lang_file(lang_code):
     path = os.path.join(APP_ROOT, "data", "lang", f"{lang_code}.json")
     try:
+        if get_config_provider:
+            return get_config_provider().get_lang(path)
         with open(path, "r", encoding="utf-8") as f:
             return json.load(f)
     except:
@@ -266,14 +364,21 @@ def load_lang_file(lang_code):
             "system": {"you_prefix": "You: "}
         }
 
-update_memory = None
-try:
-    import update_memory
-except:
-    try:
-        from scripts import update_memory
-    except:
-        update_memory = None
+_update_memory = None
+
+def load_update_memory():
+    """記憶の最適化モジュール（pygame・chromadb・各社 SDK を読み込むため、使う時に初めて import する）"""
+    global _update_memory
+    if _update_memory is None:
+        try:
+            import update_memory
+        except:
+            try:
+                from scripts import update_memory
+            except:
+                return None
+        _update_memory = update_memory
+    return _update_memory
 
 # --- 2. 設定・履歴・コンテキスト管理 ---
 def load_config_manual(root):
@@ -282,7 +387,9 @@ def load_config_manual(root):
     path = os.path.join(root, "data", "config.json")
     if not os.path.exists(path):
         path = os.path.join(root, "config", "config.json")
-    if config_manager:
+    if get_config_provider:
+        conf = get_config_provider().get_config(path)
+    elif config_manager:
         conf = config_manager.load_config(path)
     else:
         # フォールバック
@@ -293,16 +400,45 @@ def load_config_manual(root):
     paths = {k: os.path.join(root, v) for k, v in conf.get("FILES", {}).items()}
     return conf, paths, root
 
-def load_history_manual(root):
+def load_history_manual(root, limit=None):
+    """履歴を読み込む。limit 指定時は直近 limit 件だけを末尾から読む"""
     path = os.path.join(root, "data", "chat_history.json")
+    if get_history_store:
+        try:
+            store = get_history_store(path)
+            return store.tail(limit) if limit else store.read_all()
+        except: return []
     if os.path.exists(path):
         try:
-            with open(path, "r", encoding="utf-8") as f: return json.load(f)
+            with open(path, "r", encoding="utf-8") as f:
+                history = json.load(f)
+            return history[-limit:] if limit else history
         except: return []
     return []
 
+def count_history_manual(root):
+    if get_history_store:
+        try: return get_history_store(os.path.join(root, "data", "chat_history.json")).count()
+        except: return 0
+    return len(load_history_manual(root))
+
+def append_history_manual(root, *entries):
+    """1ターン分の発言を履歴の末尾に追記する（全件の書き直しはしない）"""
+    if get_history_store:
+        try: get_history_store(os.path.join(root, "data", "chat_history.json")).append(*entries)
+        except Exception as e: send_log_to_hub(f"History Save Error: {e}", is_error=True)
+        return
+    history = load_history_manual(root)
+    history.extend(entries)
+    save_history_manual(history, root)
+
 def save_history_manual(history, root):
+    """履歴全体を置き換える"""
     path = os.path.join(root, "data", "chat_history.json")
+    if get_history_store:
+        try: get_history_store(path).replace_all(history)
+        except: pass
+        return
     try:
         os.makedirs(os.path.dirname(path), exist_ok=True)
         with open(path, "w", encoding="utf-8") as f:
@@ -331,9 +467,14 @@ def get_feedback_context(root):
         return ctx
     except: return ""
 
-def search_long_term_memory(query, history=None, root=None, n_results=50, is_all_mode=False, max_limit=50):
-    """Ver 1.3.2 改善版: 日時・時間帯フィルタ＆条件付き上位50件時系列多段階長期記憶検索"""
+def search_long_term_memory(query, history=None, root=None, n_results=50, is_all_mode=False, max_limit=50,
+                            cancel_token=None):
+    """Ver 1.3.2 改善版: 日時・時間帯フィルタ＆条件付き上位50件時系列多段階長期記憶検索
+    cancel_token: 対話が中断されたら、残りの検索（キーワード補強・絞り込み）を行わずに "" を返す"""
     try:
+        if cancel_token is not None and cancel_token.cancelled:
+            record_reclaimed("memory", skipped=1)
+            return ""
         db_path = os.path.join(root, "memory_db")
         if not os.path.exists(db_path): 
             return ""
@@ -342,6 +483,7 @@ def search_long_term_memory(query, history=None, root=None, n_results=50, is_all
         if get_chroma_collection:
             collection = get_chroma_collection(db_path)
         else:
+            import chromadb
             client_db = chromadb.PersistentClient(path=db_path)
             collection = client_db.get_collection("long_term_memory")
         
@@ -356,7 +498,8 @@ def search_long_term_memory(query, history=None, root=None, n_results=50, is_all
         # 1. 日時・時間帯フィルターの解析
         dt_filter = {"date_str": None, "short_date": None, "start_hour": None, "end_hour": None}
         if global_working_memory:
-            dt_filter = global_working_memory.parse_datetime_filter(query)
+            with trace_span("date_parse"):
+                dt_filter = global_working_memory.parse_datetime_filter(query)
 
         date_str = dt_filter.get("date_str")
         short_date = dt_filter.get("short_date")
@@ -376,10 +519,17 @@ def search_long_term_memory(query, history=None, root=None, n_results=50, is_all
                 meta = metas[i] if metas else {}
                 combined_dict[doc_text] = meta
 
+        if cancel_token is not None and cancel_token.cancelled:
+            record_reclaimed("memory", aborted=1)
+            return ""
+
         # 名詞・キーワード検索補強
         if global_working_memory:
             keywords = global_working_memory.extract_search_keywords(query)
             for kw in keywords:
+                if cancel_token is not None and cancel_token.cancelled:
+                    record_reclaimed("memory", aborted=1)
+                    return ""
                 try:
                     kw_results = collection.get(where_document={"$contains": kw}, limit=30)
                     if kw_results and kw_results.get("documents"):
@@ -506,7 +656,9 @@ def increment_tavily_count(root):
         conf_path = os.path.join(root, "config", "config.json")
     with file_lock:
         try:
-            if config_manager:
+            if get_config_provider:
+                current_conf = get_config_provider().get_config(conf_path)
+            elif config_manager:
                 current_conf = config_manager.load_config(conf_path)
             else:
                 with open(conf_path, "r", encoding="utf-8") as f:
@@ -525,7 +677,9 @@ def increment_tavily_count(root):
             
             current_conf["TAVILY_COUNT"] = count
             
-            if config_manager:
+            if get_config_provider:
+                get_config_provider().save_config(conf_path, current_conf)
+            elif config_manager:
                 config_manager.save_config(conf_path, current_conf)
             else:
                 with open(conf_path, "w", encoding="utf-8") as f:
@@ -542,7 +696,9 @@ def increment_grounding_count(root):
         conf_path = os.path.join(root, "config", "config.json")
     with file_lock:
         try:
-            if config_manager:
+            if get_config_provider:
+                current_conf = get_config_provider().get_config(conf_path)
+            elif config_manager:
                 current_conf = config_manager.load_config(conf_path)
             else:
                 with open(conf_path, "r", encoding="utf-8") as f:
@@ -561,7 +717,9 @@ def increment_grounding_count(root):
             
             current_conf["GROUNDING_COUNT"] = count
             
-            if config_manager:
+            if get_config_provider:
+                get_config_provider().save_config(conf_path, current_conf)
+            elif config_manager:
                 config_manager.save_config(conf_path, current_conf)
             else:
                 with open(conf_path, "w", encoding="utf-8") as f:
@@ -578,7 +736,7 @@ def call_summary_llm(config, prompt):
     provider = (config.get("DB_PROVIDER") or config.get("AI_PROVIDER") or "local").lower()
     
     # 1. Gemini プロバイダー
-    if provider == "gemini" and gemini_client:
+    if provider == "gemini" and get_gemini_client(config):
         try:
             raw_model = config.get("DB_MODEL_ID") or config.get("MODEL_ID") or "gemini-2.5-flash"
             model_name = raw_model.split("（")[0].strip()
@@ -592,7 +750,7 @@ def call_summary_llm(config, prompt):
             send_log_to_hub(f"Gemini Dynamic Summary Error: {ge}", is_error=True)
             
     # 2. OpenAI プロバイダー
-    if provider == "openai" and openai_client:
+    if provider == "openai" and get_openai_client(config):
         try:
             model_name = config.get("DB_MODEL_ID") or config.get("MODEL_ID_GPT") or "gpt-4o-mini"
             res = openai_client.chat.completions.create(
@@ -652,38 +810,46 @@ def should_execute_search(query, config, log_m):
         err_str = str(e).lower()
         if "connection" in err_str or "refused" in err_str:
             send_log_to_hub(f"Gatekeeper Warning: ローカルLLM接続失敗。検索にフォールバックします。", is_error=True)
-            return {"necessary": True, "optimized_query": query, "reason": "Local LLM not running"}
+            return {"necessary": True, "optimized_query": query, "reason": "Local LLM not running", "fallback": True}
 
         send_log_to_hub(f"Gatekeeper Error: {e}", is_error=True)
         print(f"[DEBUG should_execute_search Exception Details]: {repr(e)}")
-        return {"necessary": True, "optimized_query": query, "reason": f"Gatekeeper failed: {e}"}
+        return {"necessary": True, "optimized_query": query, "reason": f"Gatekeeper failed: {e}", "fallback": True}
+
+# 検索本体を実行するスレッド（execute_background_search は中断を確認しながら完了を待つ）
+_search_executor = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="web-search")
 
-def execute_background_search(search_query, config, root, session_data):
+def execute_background_search(search_query, config, root, session_data, cancel_token=None):
     global gemini_client
     summary = None
+    session_id, session_getter = session_data[0], session_data[1]
+
+    def stopped():
+        if cancel_token is not None and cancel_token.cancelled:
+            return True
+        return bool(session_id and session_getter and session_getter() != session_id)
+
+    def checkpoint(stage):
+        # 中断されていれば、まだ始めていない段階の名前を付けて抜ける（record_reclaimed で集計）
+        if stopped():
+            raise TaskCancelled(stage)
+
+    def wait_future(future, discard):
+        """検索の完了を待つ。中断されたら待つのをやめる（実行中の HTTP 呼び出しはタイムアウトで終わる）"""
+        while True:
+            try:
+                return future.result(timeout=0.1)
+            except concurrent.futures.TimeoutError:
+                if stopped():
+                    discard(future)
+                    raise TaskCancelled("search")
+
     try:
         lang_data = load_lang_file(config.get("LANGUAGE", "ja"))
         log_m = lang_data.get("log_messages", {})
         ai_p = lang_data.get("ai_prompt", {})
         max_chars = config.get("MAX_CHARS", 700)
 
-        # --- ゲートキーパー判定 ---
-        send_log_to_hub(log_m.get("gatekeeper_analyzing", "システム: ゲートキーパーが検索の必要性を判定中..."))
-        gatekeeper_res = should_execute_search(search_query, config, log_m)
-        if not gatekeeper_res.get("necessary", True):
-            msg = log_m.get("gatekeeper_skip", "System: Search skipped by Gatekeeper (Reason: {reason})").format(reason=gatekeeper_res.get('reason', 'N/A'))
-            send_log_to_hub(msg)
-            return
-        
-        optimized_query = gatekeeper_res.get("optimized_query", search_query)
-        if optimized_query != search_query:
-            msg = log_m.get("query_optimized", "System: Optimized search query: {original} -> {optimized}").format(original=search_query, optimized=optimized_query)
-            send_log_to_hub(msg)
-            search_query = optimized_query
-        else:
-            msg = log_m.get("gatekeeper_approve", "システム: ゲートキーパーが検索を承認しました。")
-            send_log_to_hub(msg)
-        
         # 検索プロバイダーの判定
         search_provider = config.get("SEARCH_PROVIDER", "tavily").lower()
 
@@ -692,91 +858,168 @@ def execute_background_search(search_query, config, root, session_data):
         timeout = config.get("TIMEOUT_WEB_SEARCH", 30)
         now = datetime.now()
 
-        # === キャッシュチェック === (統合モードもクエリベースでキャッシュ可能とする)
         cache_dir = os.path.join(root, "data", "search_cache")
         os.makedirs(cache_dir, exist_ok=True)
-        cache_key = hashlib.md5(f"{search_provider}:{search_query}".encode()).hexdigest()
-        cache_file = os.path.join(cache_dir, f"{cache_key}.json")
         cache_ttl_hours = config.get("TAVILY_CACHE_TTL_HOURS", 6)
-        
-        if os.path.exists(cache_file):
-            cache_age = time.time() - os.path.getmtime(cache_file)
-            if cache_age < cache_ttl_hours * 3600:
-                try:
-                    with open(cache_file, 'r', encoding='utf-8') as f:
-                        cached_data = json.load(f)
-                        summary = cached_data['summary']
-                        send_log_to_hub(log_m.get("search_cache_hit", "[Search Cache Hit] Reusing previous results."))
-                        
-                        session_id, session_getter, overlay_queue = session_data[0], session_data[1], session_data[2]
-                        if session_id and session_getter and session_getter() != session_id: return
-
-                        # 通常返答の音声再生およびスレッド処理(speaker_lock)が完全に完了するまで待機
-                        while (pygame.mixer.get_init() and pygame.mixer.music.get_busy()) or speaker_lock.locked():
-                            if session_id and session_getter and session_getter() != session_id: return
-                            time.sleep(0.1)
-                        
-                        # 0.5秒の安全マージン（ウェイトタイム）を確保
-                        time.sleep(0.5)
-                        if session_id and session_getter and session_getter() != session_id: return
-                        
-                        prefix = ai_p.get("search_appendix_prefix", "Here is some additional information.")
-                        speak_and_show(f"{prefix} {summary}", None, config, root, session_data, show_window=True, skip_idle=False)
-                        return
-                except Exception as cache_err:
-                    send_log_to_hub(f"Cache Load Error: {cache_err}", is_error=True)
+
+        def _cache_file_for(q):
+            # 統合モードもクエリベースでキャッシュ可能とする
+            return os.path.join(cache_dir, f"{hashlib.md5(f'{search_provider}:{q}'.encode()).hexdigest()}.json")
+
+        def _has_fresh_cache(q):
+            path = _cache_file_for(q)
+            return os.path.exists(path) and time.time() - os.path.getmtime(path) < cache_ttl_hours * 3600
 
         # 検索実行用ヘルパー
-        def _call_grounding():
+        def _call_grounding(q):
             increment_grounding_count(root)
             g_model = "gemini-2.5-flash-lite"
             config_g = {'tools': [{'google_search': {}}]}
-            prompt = f"「{search_query}」について最新情報を調査してください。網羅的で正確な事実関係を報告してください。"
-            response = gemini_client.models.generate_content(model=g_model, contents=prompt, config=config_g)
+            prompt = f"「{q}」について最新情報を調査してください。網羅的で正確な事実関係を報告してください。"
+            response = get_gemini_client(config).models.generate_content(model=g_model, contents=prompt, config=config_g)
             return response.text
 
-        def _call_tavily():
-            from tavily import TavilyClient
+        def _call_grounding_3_1(q):
+            # gemini-3.1-flash-lite-preview のgrounding（思考レベル最小）
+            increment_grounding_count(root)
+            g_model = "gemini-3.1-flash-lite-preview"
+            config_g = {
+                'tools': [{'google_search': {}}],
+                'thinking_config': {'thinking_level': "MINIMAL"}  # 最小
+            }
+            prompt_g = f"「{q}」について最新情報を調査してください。網羅的で正確な事実関係を報告してください。"
+            response = get_gemini_client(config).models.generate_content(model=g_model, contents=prompt_g, config=config_g)
+            return response.text
+
+        def _call_tavily(q):
             increment_tavily_count(root)
-            tavily = TavilyClient(api_key=api_key_tavily)
-            res = tavily.search(query=f"{search_query} info as of {now.strftime('%Y-%m-%d')}", search_depth="advanced", max_results=3)
+            query_text = f"{q} info as of {now.strftime('%Y-%m-%d')}"
+            tavily_url = config.get("TAVILY_API_URL")
+            if tavily_url:
+                # 互換 API（ベンチマーク用のスタブなど）に REST で直接送る
+                resp = http_client().post(f"{tavily_url.rstrip('/')}/search", json={
+                    "api_key": api_key_tavily, "query": query_text, "search_depth": "advanced", "max_results": 3
+                }, timeout=timeout)
+                resp.raise_for_status()
+                res = resp.json()
+            else:
+                from tavily import TavilyClient
+                tavily = TavilyClient(api_key=api_key_tavily)
+                res = tavily.search(query=query_text, search_depth="advanced", max_results=3)
             return "\n---\n".join([f"Source: {r['url']}\nContent: {r['content']}" for r in res['results']])
 
+        def _run_search(q):
+            """Returns: (Grounding の結果, Tavily の結果)"""
+            if search_provider == "integrated":
+                send_log_to_hub("システム: 統合検索モード (Google Grounding + Tavily) を実行中...")
+                with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+                    future_g = executor.submit(run_with_timeout, _call_grounding, timeout, q)
+                    future_t = executor.submit(run_with_timeout, _call_tavily, timeout, q)
+                    return future_g.result(), future_t.result()
+            elif search_provider == "grounding":
+                return run_with_timeout(_call_grounding, timeout, q), None
+            elif search_provider == "grounding_3_1":
+                return run_with_timeout(_call_grounding_3_1, timeout, q), None
+            else:  # tavily
+                return None, run_with_timeout(_call_tavily, timeout, q)
+
+        # --- ゲートキーパー判定 ---
+        # 明らかなクエリは規則・軽量モデルで即決し、同じ質問の判定はキャッシュを再利用する
+        # 投機モードでは判定と並行して検索を始める
+        checkpoint("gatekeeper")
+        gatekeeper = get_search_gatekeeper(cache_dir) if get_search_gatekeeper else None
+        gk_start = time.perf_counter()
+        gk_span = start_span("gatekeeper")
+        speculative = None
+        gatekeeper_res = None
+        if get_preclassifier and config.get("SEARCH_PRECLASSIFIER", True):
+            pre_label, pre_rule, pre_prob = get_preclassifier(os.path.join(root, "data")).classify(search_query)
+            if pre_label != "uncertain":
+                gk_mode = "preclassified"
+                gatekeeper_res = {"necessary": pre_label == "yes", "optimized_query": search_query,
+                                  "reason": f"preclassifier: {pre_rule}"}
+        if gatekeeper_res is None and gatekeeper:
+            gatekeeper_res = gatekeeper.lookup(search_query, config.get("GATEKEEPER_CACHE_TTL_HOURS", 6))
+            if gatekeeper_res is not None:
+                gk_mode = "cached"
+                send_log_to_hub(log_m.get("gatekeeper_cache_hit", "システム: ゲートキーパーの判定をキャッシュから再利用します。"))
+        if gatekeeper_res is None:
+            gk_mode = "sequential"
+            send_log_to_hub(log_m.get("gatekeeper_analyzing", "システム: ゲートキーパーが検索の必要性を判定中..."))
+            if gatekeeper and config.get("SEARCH_SPECULATIVE", False) and not _has_fresh_cache(search_query):
+                gk_mode = "speculative"
+                speculative = gatekeeper.speculate(_run_search, search_query)
+            gatekeeper_res = should_execute_search(search_query, config, log_m)
+            if gatekeeper and not gatekeeper_res.get("fallback"):
+                gatekeeper.store(search_query, gatekeeper_res)
+        gatekeeper_ms = (time.perf_counter() - gk_start) * 1000
+        gk_span.end()
+
+        if not gatekeeper_res.get("necessary", True):
+            if speculative is not None:
+                gatekeeper.discard(speculative)
+            if gatekeeper:
+                gatekeeper.record(gk_mode, gatekeeper_ms, necessary=False)
+            msg = log_m.get("gatekeeper_skip", "System: Search skipped by Gatekeeper (Reason: {reason})").format(reason=gatekeeper_res.get('reason', 'N/A'))
+            send_log_to_hub(msg)
+            return
+
+        optimized_query = gatekeeper_res.get("optimized_query", search_query)
+        if speculative is None and optimized_query and optimized_query != search_query:
+            msg = log_m.get("query_optimized", "System: Optimized search query: {original} -> {optimized}").format(original=search_query, optimized=optimized_query)
+            send_log_to_hub(msg)
+            search_query = optimized_query
+        else:
+            # 投機検索は元のクエリで始めているため、その結果をそのまま使う
+            msg = log_m.get("gatekeeper_approve", "システム: ゲートキーパーが検索を承認しました。")
+            send_log_to_hub(msg)
+
+        # === キャッシュチェック ===
+        cache_file = _cache_file_for(search_query)
+        if speculative is None and _has_fresh_cache(search_query):
+            try:
+                with open(cache_file, 'r', encoding='utf-8') as f:
+                    cached_data = json.load(f)
+                    summary = cached_data['summary']
+                    send_log_to_hub(log_m.get("search_cache_hit", "[Search Cache Hit] Reusing previous results."))
+                    if gatekeeper:
+                        gatekeeper.record(gk_mode, gatekeeper_ms, (time.perf_counter() - gk_start) * 1000)
+
+                    checkpoint("tts")
+
+                    # 通常返答の音声再生およびスレッド処理(speaker_lock)が完全に完了するまで待機
+                    while get_audio_engine().is_busy() or speaker_lock.locked():
+                        checkpoint("tts")
+                        time.sleep(0.1)
+
+                    # 0.5秒の安全マージン（ウェイトタイム）を確保
+                    time.sleep(0.5)
+                    checkpoint("tts")
+
+                    prefix = ai_p.get("search_appendix_prefix", "Here is some additional information.")
+                    speak_and_show(f"{prefix} {summary}", None, config, root, session_data, show_window=True,
+                                   skip_idle=False, cancel_token=cancel_token)
+                    return
+            except TaskCancelled:
+                raise
+            except Exception as cache_err:
+                send_log_to_hub(f"Cache Load Error: {cache_err}", is_error=True)
+
         # --- 検索実行 ---
         send_log_to_hub(log_m.get("search_searching", "Web search in progress...").format(timeout=timeout))
-        
-        res_grounding = None
-        res_tavily = None
-
-        if search_provider == "integrated":
-            send_log_to_hub("システム: 統合検索モード (Google Grounding + Tavily) を実行中...")
-            with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-                # pass search_query or use closure
-                future_g = executor.submit(run_with_timeout, _call_grounding, timeout)
-                future_t = executor.submit(run_with_timeout, _call_tavily, timeout)
-                res_grounding = future_g.result()
-                res_tavily = future_t.result()
-        elif search_provider == "grounding":
-            res_grounding = run_with_timeout(_call_grounding, timeout)
-        elif search_provider == "grounding_3_1":
-            # gemini-3.1-flash-lite-preview のgrounding（思考レベル最小）
-            def _call_grounding_3_1():
-                increment_grounding_count(root)
-                g_model = "gemini-3.1-flash-lite-preview"
-                config_g = {
-                    'tools': [{'google_search': {}}],
-                    'thinking_config': {'thinking_level': "MINIMAL"}  # 最小
-                }
-                prompt_g = f"「{search_query}」について最新情報を調査してください。網羅的で正確な事実関係を報告してください。"
-                response = gemini_client.models.generate_content(model=g_model, contents=prompt_g, config=config_g)
-                return response.text
-            res_grounding = run_with_timeout(_call_grounding_3_1, timeout)
-        else:  # tavily
-            res_tavily = run_with_timeout(_call_tavily, timeout)
+        with trace_span("web_search"):
+            if speculative is not None:
+                res_grounding, res_tavily = wait_future(speculative, gatekeeper.discard)
+            else:
+                checkpoint("search")
+                # 中断されたら結果を待たずに抜けられるよう、検索は別スレッドで実行して完了を待つ
+                res_grounding, res_tavily = wait_future(_search_executor.submit(_run_search, search_query),
+                                                        lambda f: f.cancel())
+        if gatekeeper:
+            gatekeeper.record(gk_mode, gatekeeper_ms, (time.perf_counter() - gk_start) * 1000)
 
         # セッション中断チェック
-        session_id, session_getter = session_data[0], session_data[1]
-        if session_id and session_getter and session_getter() != session_id: return
+        checkpoint("summary")
 
         # --- 要約・統合 ---
         if search_provider == "integrated":
@@ -800,33 +1043,40 @@ def execute_background_search(search_query, config, root, session_data):
             ctx = res_tavily
             role = ai_p.get("search_tavily_summary", "Tavily要約プロンプト").format(max_chars=max_chars)
 
-        summary = call_local_llm_chat(
-            config,
-            [{'role': 'user', 'content': f"{role}\n\n検索結果クエリ: {search_query}\n情報ソース:\n{ctx}"}]
-        )
+        with trace_span("search_summary"):
+            summary = call_local_llm_chat(
+                config,
+                [{'role': 'user', 'content': f"{role}\n\n検索結果クエリ: {search_query}\n情報ソース:\n{ctx}"}]
+            )
 
         if summary:
             # キャッシュ保存
             try:
+                old_size = os.path.getsize(cache_file) if os.path.exists(cache_file) else None
                 with open(cache_file, 'w', encoding='utf-8') as f:
                     json.dump({'query': search_query, 'summary': summary, 'timestamp': time.time()}, f, ensure_ascii=False, indent=2)
+                if note_file_write:
+                    note_file_write(cache_file, old_size)
             except: pass
             
-            submit_background_task(save_search_to_db, summary, search_query, config, root)
+            submit_background_task(save_search_to_db, summary, search_query, config, root, priority="low")
             
             # 通常返答の音声再生およびスレッド処理(speaker_lock)が完全に完了するまで待機
-            while (pygame.mixer.get_init() and pygame.mixer.music.get_busy()) or speaker_lock.locked():
-                if session_id and session_getter and session_getter() != session_id: return
+            while get_audio_engine().is_busy() or speaker_lock.locked():
+                checkpoint("tts")
                 time.sleep(0.1)
             
             # 0.5秒の安全マージン（ウェイトタイム）を確保
             time.sleep(0.5)
-            if session_id and session_getter and session_getter() != session_id: return
+            checkpoint("tts")
             
             prefix = ai_p.get("search_appendix_prefix", "Here is some additional information.")
-            speak_and_show(f"{prefix} {summary}", None, config, root, session_data, show_window=True, skip_idle=False)
+            speak_and_show(f"{prefix} {summary}", None, config, root, session_data, show_window=True,
+                           skip_idle=False, cancel_token=cancel_token)
 
-            
+    except TaskCancelled as e:
+        # e.args[0]: 中断時点でまだ始めていなかった段階
+        record_reclaimed("search", **{str(e.args[0]) if e.args else "search": 1})
     except Exception as e:
         lang_data = load_lang_file(config.get("LANGUAGE", "ja"))
         log_m = lang_data.get("log_messages", {})
@@ -876,6 +1126,8 @@ def save_search_to_db(full_summary, query, config, root):
             }],
             ids=[f"web_{int(unix_time)}"]
         )
+        if note_memory_write:
+            note_memory_write(db_path, added=1)
         
         # ワーキングメモリの「ネット検索スロット」を更新（直後会話の優先コンテキスト化）
         if global_working_memory:
@@ -897,26 +1149,60 @@ def save_search_to_db(full_summary, query, config, root):
 gemini_client = None
 openai_client = None
 
-def init_ai(config):
+_ai_client_keys = {}
+
+def init_ai(config, providers=("gemini", "openai")):
+    """
+    providers の AI クライアントを作成する（SDK の読み込みを含む）
+    通常は get_gemini_client / get_openai_client から初回使用時に呼ばれる
+    """
     global gemini_client, openai_client
     lang_data = load_lang_file(config.get("LANGUAGE", "ja"))
     log_m = lang_data.get("log_messages", {})
     
-    if config.get("GEMINI_API_KEY"):
+    if "gemini" in providers and config.get("GEMINI_API_KEY"):
+        _ai_client_keys["gemini"] = config["GEMINI_API_KEY"]
         try:
-            import google.genai as genai
-            gemini_client = genai.Client(api_key=config["GEMINI_API_KEY"])
+            if get_client_registry:
+                gemini_client = get_client_registry().get_gemini(config["GEMINI_API_KEY"])
+            else:
+                import google.genai as genai
+                gemini_client = genai.Client(api_key=config["GEMINI_API_KEY"])
         except Exception as e:
             msg = log_m.get("ai_init_error", "{provider} initialization error: {e}").format(provider="Gemini", e=e)
             send_log_to_hub(msg, is_error=True, error_code="api_key_invalid")
-    if config.get("OPENAI_API_KEY"):
+    if "openai" in providers and config.get("OPENAI_API_KEY"):
+        _ai_client_keys["openai"] = config["OPENAI_API_KEY"]
         try:
-            from openai import OpenAI
-            openai_client = OpenAI(api_key=config["OPENAI_API_KEY"])
+            if get_client_registry:
+                openai_client = get_client_registry().get_openai(config["OPENAI_API_KEY"])
+            else:
+                from openai import OpenAI
+                openai_client = OpenAI(api_key=config["OPENAI_API_KEY"])
         except Exception as e:
             msg = log_m.get("ai_init_error", "{provider} initialization error: {e}").format(provider="OpenAI", e=e)
             send_log_to_hub(msg, is_error=True)
 
+def get_gemini_client(config):
+    """Gemini クライアント（初回使用時・APIキー変更時に作成する）"""
+    if config.get("GEMINI_API_KEY") and (gemini_client is None or _ai_client_keys.get("gemini") != config["GEMINI_API_KEY"]):
+        with startup_step("init_ai:gemini"):
+            init_ai(config, providers=("gemini",))
+    return gemini_client
+
+def get_openai_client(config):
+    """OpenAI クライアント（初回使用時・APIキー変更時に作成する）"""
+    if config.get("OPENAI_API_KEY") and (openai_client is None or _ai_client_keys.get("openai") != config["OPENAI_API_KEY"]):
+        with startup_step("init_ai:openai"):
+            init_ai(config, providers=("openai",))
+    return openai_client
+
+def get_tts_audio_cache(config):
+    """合成音声キャッシュ（無効化されている場合は None）"""
+    if not get_tts_cache or not config.get("TTS_CACHE_ENABLED", True):
+        return None
+    return get_tts_cache(os.path.join(APP_ROOT, "data", "tts_cache"), config.get("TTS_CACHE_MAX_MB", 64))
+
 # APIキャッシュのグローバル変数とインスタンス取得
 _api_cache_instance = None
 
@@ -944,7 +1230,7 @@ def call_local_llm_chat(config, messages, json_mode=False, timeout=60):
         # LM Studio でロード中の最新モデル ID を自動取得（モデル名不一致による400エラーを根絶）
         active_model = model
         try:
-            models_resp = requests.get(f"{url}/models", timeout=3)
+            models_resp = http_client().get(f"{url}/models", timeout=3)
             if models_resp.status_code == 200:
                 m_data = models_resp.json().get("data", [])
                 if m_data and len(m_data) > 0:
@@ -961,7 +1247,7 @@ def call_local_llm_chat(config, messages, json_mode=False, timeout=60):
         }
 
         try:
-            resp = requests.post(api_url, json=payload, timeout=timeout)
+            resp = http_client().post(api_url, json=payload, timeout=timeout)
             resp.raise_for_status()
             return resp.json()["choices"][0]["message"]["content"]
         except Exception as e:
@@ -980,23 +1266,68 @@ def call_local_llm_chat(config, messages, json_mode=False, timeout=60):
         if json_mode:
             payload["format"] = "json"
         try:
-            resp = requests.post(f"{url}/api/chat", json=payload, timeout=timeout)
+            resp = http_client().post(f"{url}/api/chat", json=payload, timeout=timeout)
             resp.raise_for_status()
             return resp.json()["message"]["content"]
         except Exception as e:
             if json_mode:
                 try:
                     payload.pop("format", None)
-                    resp = requests.post(f"{url}/api/chat", json=payload, timeout=timeout)
+                    resp = http_client().post(f"{url}/api/chat", json=payload, timeout=timeout)
                     resp.raise_for_status()
                     return resp.json()["message"]["content"]
                 except Exception as retry_err:
                     raise retry_err
             raise e
 
-def chat_with_ai(prompt, image=None, config=None, root=None, lang_data=None):
+def _abort_response(res):
+    """
+    ストリーミング中の requests の応答を打ち切る（別スレッドから呼ぶ）
+    close() だけでは受信待ちの読み込みが次の断片が届くまで戻らないため、先にソケットを shutdown する
+    """
+    try:
+        import socket
+        sock = getattr(getattr(res.raw, "_connection", None), "sock", None)
+        if sock is None:
+            # Connection: close の応答では接続側から外れ、http.client の読み込み側だけが持っている
+            fp = getattr(getattr(res.raw, "_fp", None), "fp", None)
+            sock = getattr(getattr(fp, "raw", None), "_sock", None)
+        if sock is not None:
+            sock.shutdown(socket.SHUT_RDWR)
+    except (OSError, AttributeError):
+        pass
+    res.close()
+
+def _iter_sse_deltas(res):
+    """OpenAI互換 (LM Studio / Ollama /v1) のストリーミング応答 (SSE) から本文の断片を取り出す"""
+    for line in res.iter_lines():
+        if not line or not line.startswith(b"data:"):
+            continue
+        data = line[5:].strip()
+        if data == b"[DONE]":
+            break
+        try:
+            choices = json.loads(data.decode("utf-8")).get("choices") or []
+        except ValueError:
+            continue
+        if choices:
+            yield (choices[0].get("delta") or {}).get("content") or ""
+
+# 応答の取得に失敗したときに chat_with_ai が返す文（ストリーミングで途中まで読み上げていても読み上げる）
+AI_TIMEOUT_REPLY = "申し訳ありません。AI応答の取得に時間がかかりすぎたため、処理を中断しました。もう一度お試しください。"
+AI_ERROR_REPLY = "AI Error: The conversation stops."
+AI_FAILURE_REPLIES = (AI_TIMEOUT_REPLY, AI_ERROR_REPLY)
+
+def chat_with_ai(prompt, image=None, config=None, root=None, lang_data=None, sentence_stream=None, cancel_token=None):
+    """
+    sentence_stream (SentenceStream) を渡すと応答をストリーミングで受け取り、
+    完成した文から順に sentence_stream へ送る（戻り値は従来どおり全文）
+    cancel_token (CancellationToken) がキャンセルされたら、ストリーミング中の応答を閉じて "" を返す
+    （途中までの応答は履歴・キャッシュに残さない）
+    """
     global gemini_client, openai_client
-    history = load_history_manual(root)
+    # 文脈に使うのは直近10件のみのため、末尾だけを読む
+    history = load_history_manual(root, limit=10)
     max_chars = config.get("MAX_CHARS", "700文字以内")
     # まとめ・要約要求の動的判定 (Ver 1.3.2 全10言語対応 ＋ メインAI直通モード)
     lang_pattern = lang_data.get("summary_intent_pattern") if isinstance(lang_data, dict) else None
@@ -1007,9 +1338,15 @@ def chat_with_ai(prompt, image=None, config=None, root=None, lang_data=None):
         msg_detect = log_m.get("dynamic_summary_detect", "システム: 「まとめ・要約」要求を検知。記憶ログを直接抽出してメインAIへ伝達中...")
         send_log_to_hub(msg_detect)
         # 時系列昇順ソート済みの最大50件のログを抽出して直接メインAIへ引き渡し
-        long_term_ctx = search_long_term_memory(prompt, history, root, is_all_mode=True, max_limit=50)
+        with trace_span("memory_search"):
+            long_term_ctx = search_long_term_memory(prompt, history, root, is_all_mode=True, max_limit=50,
+                                                    cancel_token=cancel_token)
     else:
-        long_term_ctx = search_long_term_memory(prompt, history, root)
+        with trace_span("memory_search"):
+            long_term_ctx = search_long_term_memory(prompt, history, root, cancel_token=cancel_token)
+    if cancel_token is not None and cancel_token.cancelled:
+        record_reclaimed("llm", skipped=1)
+        return ""
 
     # 会話ターン経過によるネット検索スロットTTLの減少
     if global_working_memory:
@@ -1021,14 +1358,18 @@ def chat_with_ai(prompt, image=None, config=None, root=None, lang_data=None):
     p = lang_data["ai_prompt"]
     current_time_str = datetime.now().strftime("%Y年%m月%d日")
     
-    system_instr = (
+    # 人格・指示（毎ターン同じ）と、記憶検索の結果や日付（毎ターン変わる）を分けておく
+    static_instr = (
         f"{p['role']}\n"
         f"{p['instruction'].format(max_chars=max_chars)}\n"
         f"{p['stt_notice']}\n"
-        f"{p['memory_priority']}\n"
+        f"{p['memory_priority']}"
+    )
+    dynamic_ctx = (
         f"{today_ctx_str}{long_term_ctx}{feedback_ctx}{mid_term_ctx}"
         f"\n【前提条件に日時情報がなければ：】今日は {current_time_str} です。"
     )
+    system_instr = f"{static_instr}\n{dynamic_ctx}"
 
 # 検索スイッチがオンの時、辞書の search_logic を使用
     provider = config.get("AI_PROVIDER", "gemini").lower()
@@ -1036,6 +1377,7 @@ def chat_with_ai(prompt, image=None, config=None, root=None, lang_data=None):
         logic = p.get("search_logic", "")
         if logic:
             system_instr += logic
+            static_instr += logic
             # ログを追加
             send_log_to_hub("システム: 検索ロジックをシステム命令に統合しました。")
         else:
@@ -1043,42 +1385,51 @@ def chat_with_ai(prompt, image=None, config=None, root=None, lang_data=None):
 
     answer_text = ""
     image_bytes = None
-    image_path_for_cache = None
+    image_hash = None
     
     # APIキャッシュのチェック（コスト削減・高速化）
     cache_enabled = config.get("API_CACHE_ENABLED", True)
     api_cache = get_api_cache(config) if cache_enabled and APICache else None
     model_id = config.get("MODEL_ID", "gemini-2.5-flash")
     
-    # 画像処理
-    if image:
-        if image.mode != "RGB":
-            image = image.convert("RGB")
-        buffered = BytesIO()
-        image.save(buffered, format="JPEG", quality=95, optimize=True)
-        image_bytes = buffered.getvalue()
-        
-        # キャッシュ用に画像を一時保存
-        if api_cache:
-            image_path_for_cache = os.path.join(root, "data", "temp_query_image.png")
-            os.makedirs(os.path.dirname(image_path_for_cache), exist_ok=True)
-            image.save(image_path_for_cache)
+    # 画像処理（PIL 画像が渡された場合はここで縮小・エンコードする）
+    # エンコード済みのバイト列をそのままアップロードとキャッシュキーに使う
+    if image is not None:
+        if not isinstance(image, EncodedImage):
+            image = encode_for_provider(image, provider, config)
+        image_bytes = image.data
+        image_hash = image.digest
     
     lang_data = lang_data if lang_data else load_lang_file(config.get("LANGUAGE", "ja"))
     log_m = lang_data.get("log_messages", {})
     
     # キャッシュからの取得を試行
     if api_cache:
-        cached_response = api_cache.get(prompt, image_path_for_cache, provider, model_id)
+        cached_response = api_cache.get(prompt, None, provider, model_id, image_hash=image_hash)
         if cached_response:
             send_log_to_hub(log_m.get("api_cache_hit", "[Cache Hit] Reusing previous response to save costs."))
             # 履歴に追加
             user_pref = lang_data["system"].get("you_prefix", "You: ")
-            history.append(f"{user_pref}{prompt}")
-            history.append(f"AI: {cached_response}")
-            save_history_manual(history, root)
+            append_history_manual(root, f"{user_pref}{prompt}", f"AI: {cached_response}")
             return cached_response
 
+    def on_cancel(callback):
+        """キャンセル時に callback（ストリームを閉じるなど）を呼ぶよう登録する。Returns: 登録の解除"""
+        return cancel_token.add_callback(callback) if cancel_token is not None else (lambda: None)
+
+    if image_bytes:
+        # local / openai は base64 の data URL で送るため約 4/3 倍になる
+        record_upload(image, 4 * ((len(image_bytes) + 2) // 3) if provider in ("local", "openai") else len(image_bytes))
+
+    # LLM 呼び出し全体と、最初のトークンが届くまで（ストリーミングでない時は応答全体）の区間
+    llm_span, ttft_span = start_span("llm"), start_span("llm_ttft")
+
+    def traced_deltas(deltas):
+        for delta in deltas:
+            if delta:
+                ttft_span.end()
+            yield delta
+
     try:
         if provider == "local":
             provider_local = config.get("LOCAL_LLM_PROVIDER", "ollama").lower()
@@ -1109,24 +1460,35 @@ def chat_with_ai(prompt, image=None, config=None, root=None, lang_data=None):
                 messages.append({"role": h_role, "content": content})
             user_content = [{"type": "text", "text": prompt}]
             if image_bytes:
-                base64_image = base64.b64encode(image_bytes).decode('utf-8')
-                user_content.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}})
+                user_content.append({"type": "image_url", "image_url": {"url": image.to_data_url()}})
             messages.append({"role": "user", "content": user_content})  # 常に "user" で追加
             
             # ペイロード内のモデルIDとメッセージを最新に上書きして送信
             payload["model"] = model_id
             payload["messages"] = messages
             
-            res = requests.post(
-                f"{url.rstrip('/')}/chat/completions",
-                json=payload,
-                timeout=(10, 600)
-            )
-            res.raise_for_status()
-            answer_text = res.json()['choices'][0]['message']['content']
+            if sentence_stream is not None:
+                payload["stream"] = True
+                with http_client().post(f"{url.rstrip('/')}/chat/completions", json=payload,
+                                        timeout=(10, 600), stream=True) as res:
+                    res.raise_for_status()
+                    # キャンセルされたら接続を閉じ、生成中の応答の受信をその場で打ち切る
+                    unregister = on_cancel(lambda: _abort_response(res))
+                    try:
+                        answer_text = feed_stream(traced_deltas(_iter_sse_deltas(res)), sentence_stream, cancel_token)
+                    finally:
+                        unregister()
+            else:
+                res = http_client().post(
+                    f"{url.rstrip('/')}/chat/completions",
+                    json=payload,
+                    timeout=(10, 600)
+                )
+                res.raise_for_status()
+                answer_text = res.json()['choices'][0]['message']['content']
 
         elif provider == "openai":
-            if not openai_client:
+            if not get_openai_client(config):
                 msg = log_m.get("ai_init_error", "{provider} initialization error: {e}").format(provider="OpenAI", e="APIキーが未設定またはクライアント初期化失敗")
                 send_log_to_hub(msg, is_error=True, error_code="api_key_invalid")
                 return "エラー: OpenAIクライアントが初期化されていません。APIキーを確認してください。"
@@ -1138,8 +1500,7 @@ def chat_with_ai(prompt, image=None, config=None, root=None, lang_data=None):
                 messages.append({"role": h_role, "content": content})
             user_content = [{"type": "text", "text": prompt}]
             if image_bytes:
-                base64_image = base64.b64encode(image_bytes).decode('utf-8')
-                user_content.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}})
+                user_content.append({"type": "image_url", "image_url": {"url": image.to_data_url()}})
             messages.append({"role": "user", "content": user_content})
             from config_manager import parse_model_name
             actual_model_id, level = parse_model_name(model_id)
@@ -1152,11 +1513,23 @@ def chat_with_ai(prompt, image=None, config=None, root=None, lang_data=None):
                 openai_kwargs["reasoning_effort"] = level
                 send_log_to_hub(f"システム: OpenAI 思考モデルを reasoning_effort={level} で呼び出し...")
                 
-            res = openai_client.chat.completions.create(**openai_kwargs)
-            answer_text = res.choices[0].message.content
+            if sentence_stream is not None:
+                openai_kwargs["stream"] = True
+                res = openai_client.chat.completions.create(**openai_kwargs)
+                unregister = on_cancel(res.close)
+                try:
+                    answer_text = feed_stream(
+                        traced_deltas((chunk.choices[0].delta.content or "") if chunk.choices else "" for chunk in res),
+                        sentence_stream, cancel_token
+                    )
+                finally:
+                    unregister()
+            else:
+                res = openai_client.chat.completions.create(**openai_kwargs)
+                answer_text = res.choices[0].message.content
 
         elif provider == "gemini":
-            if not gemini_client:
+            if not get_gemini_client(config):
                 msg = log_m.get("ai_init_error", "{provider} initialization error: {e}").format(provider="Gemini", e="APIキーが未設定またはクライアント初期化失敗")
                 send_log_to_hub(msg, is_error=True, error_code="api_key_invalid")
                 return "エラー: GeminiクライアントがNullです。APIキーを設定画面で確認してください。"
@@ -1164,12 +1537,6 @@ def chat_with_ai(prompt, image=None, config=None, root=None, lang_data=None):
             from config_manager import parse_model_name
             actual_model_id, level = parse_model_name(model_id)
 
-            gemini_history = []
-            for h in history[-10:]:
-                role = "model" if h.startswith("AI:") else "user"
-                content = h.replace("AI:", "").replace("You: ", "").replace("あなた: ", "").strip()
-                gemini_history.append({"role": role, "parts": [{"text": content}]})
-
             # --- 思考レベル設定 (gemini-3.1-flash-lite / gemini-3.5-flash など) ---
             if level is None:
                 thinking_budget = config.get("THINKING_BUDGET", "medium").lower()
@@ -1192,32 +1559,90 @@ def chat_with_ai(prompt, image=None, config=None, root=None, lang_data=None):
             else:
                 gemini_config_obj = {"system_instruction": system_instr}
 
-            chat = gemini_client.chats.create(model=actual_model_id, config=gemini_config_obj, history=gemini_history)
-            
             # --- Type Guard: Ensure prompt is string ---
             safe_prompt = str(prompt) if not isinstance(prompt, str) else prompt
-            parts = [safe_prompt]
-            if image_bytes:
-                parts.append(Image.open(BytesIO(image_bytes)))
+
+            sessions = get_gemini_sessions()
+            session = None
+            if config.get("GEMINI_PERSISTENT_SESSION", True):
+                # 会話を維持し、新しい発言だけを追加する（毎ターン変わる文脈はこの回の発言の前に付ける）
+                sessions.configure(config.get("GEMINI_CONTEXT_CACHE", True),
+                                   config.get("GEMINI_CONTEXT_CACHE_TTL_MINUTES", 60))
+                gen_config = {k: v for k, v in gemini_config_obj.items() if k != "system_instruction"}
+                session = sessions.get_session(gemini_client, actual_model_id, static_instr, gen_config, history)
+                user_parts = [{"text": f"{dynamic_ctx.strip()}\n\n{safe_prompt}"}]
+                if image_bytes:
+                    user_parts.append({"inline_data": {"mime_type": image.mime_type, "data": image_bytes}})
+            else:
+                gemini_history = []
+                for h in history[-10:]:
+                    role = "model" if h.startswith("AI:") else "user"
+                    content = h.replace("AI:", "").replace("You: ", "").replace("あなた: ", "").strip()
+                    gemini_history.append({"role": role, "parts": [{"text": content}]})
+                chat = gemini_client.chats.create(model=actual_model_id, config=gemini_config_obj, history=gemini_history)
+                parts = [safe_prompt]
+                if image_bytes:
+                    try:
+                        from google.genai import types as genai_types
+                        parts.append(genai_types.Part.from_bytes(data=image_bytes, mime_type=image.mime_type))
+                    except ImportError:
+                        parts.append(image.open())
             
             # タイムアウト設定を取得
             timeout = config.get("TIMEOUT_AI_RESPONSE", 60)
             
-            # タイムアウト付きでAPI呼び出し
+            # タイムアウト付きでAPI呼び出し（入力トークン数の記録用に最後の応答を残す）
+            stop_stream = threading.Event()
+            last_response = []
+            def _tracked(chunks):
+                for chunk in chunks:
+                    last_response[:] = [chunk]
+                    yield chunk.text
             def _call_gemini_api():
-                return chat.send_message(parts)
+                if session is not None:
+                    kwargs = {"model": actual_model_id, "contents": session.request_contents(user_parts),
+                              "config": session.request_config()}
+                    if sentence_stream is not None:
+                        return feed_stream(traced_deltas(_tracked(gemini_client.models.generate_content_stream(**kwargs))),
+                                           sentence_stream, stop_stream)
+                    res = gemini_client.models.generate_content(**kwargs)
+                else:
+                    if sentence_stream is not None:
+                        return feed_stream(traced_deltas(_tracked(chat.send_message_stream(parts))), sentence_stream,
+                                           stop_stream)
+                    res = chat.send_message(parts)
+                last_response[:] = [res]
+                return res
             
             thinking_msg = log_m.get("ai_thinking", "Getting AI response... (Timeout: {timeout}s)").format(timeout=timeout)
             send_log_to_hub(thinking_msg)
-            res = run_with_timeout(_call_gemini_api, timeout)
+            # キャンセルされたら以降の断片を読まずにストリームを抜ける
+            unregister = on_cancel(stop_stream.set)
+            try:
+                res = run_with_timeout(_call_gemini_api, timeout)
+            finally:
+                unregister()
+            if cancel_token is not None and cancel_token.cancelled:
+                record_reclaimed("llm", aborted=1, chars=len(res) if isinstance(res, str) else 0)
+                return ""
             
             if res is None:
-                # タイムアウト発生
+                # タイムアウト発生（ストリーミング中なら以降の断片は読み上げない）
+                stop_stream.set()
+                llm_span.end()
                 error_msg = log_m.get("timeout_ai_response", "AI response timeout ({timeout} seconds)").format(timeout=timeout)
                 send_log_to_hub(error_msg, is_error=True)
-                return "申し訳ありません。AI応答の取得に時間がかかりすぎたため、処理を中断しました。もう一度お試しください。"
+                return AI_TIMEOUT_REPLY
             
-            answer_text = res.text
+            answer_text = res if isinstance(res, str) else res.text
+            if last_response:
+                sessions.record_usage("session" if session is not None else "rebuild", last_response[0])
+
+        ttft_span.end()
+        llm_span.end()
+        if cancel_token is not None and cancel_token.cancelled:
+            record_reclaimed("llm", aborted=1, chars=len(answer_text or ""))
+            return ""
 
         if answer_text:
             # AIの返答からハッシュ記号（#、＃）を除去（読み上げや表示のバグ防止）
@@ -1226,7 +1651,7 @@ def chat_with_ai(prompt, image=None, config=None, root=None, lang_data=None):
             # キャッシュに保存（次回の高速化・コスト削減）
             if api_cache:
                 try:
-                    api_cache.set(prompt, answer_text, image_path_for_cache, provider, model_id)
+                    api_cache.set(prompt, answer_text, None, provider, model_id, image_hash=image_hash)
                 except Exception as cache_err:
                     pass
             
@@ -1234,15 +1659,20 @@ def chat_with_ai(prompt, image=None, config=None, root=None, lang_data=None):
             user_pref = lang_data.get("system", {}).get("you_prefix", "You: ")
             ai_pref = lang_data.get("system", {}).get("ai_prefix", "AI: ")
             
-            history.append(f"{user_pref}{prompt}")
-            history.append(f"{ai_pref}{answer_text}")
-            save_history_manual(history, root)
+            append_history_manual(root, f"{user_pref}{prompt}", f"{ai_pref}{answer_text}")
+            if provider == "gemini" and session is not None:
+                session.commit(safe_prompt, answer_text, f"{ai_pref}{answer_text}")
             return answer_text
 
     except Exception as e:
+        llm_span.end()
+        if cancel_token is not None and cancel_token.cancelled:
+            # 閉じたストリームの読み込みで出た例外（中断によるもので、エラーではない）
+            record_reclaimed("llm", aborted=1)
+            return ""
         msg = log_m.get("chat_error", "Chat error ({provider}): {e}").format(provider=provider, e=e)
         send_log_to_hub(msg, is_error=True)
-        return f"AI Error: The conversation stops."
+        return AI_ERROR_REPLY
 
 # --- 字幕システムへの送信処理 (ローカル連携用) ---
 def _run_subtitle_task(text: str, config: dict, session_data: tuple = None):
@@ -1257,6 +1687,7 @@ def _run_subtitle_task(text: str, config: dict, session_data: tuple = None):
 async def send_to_subtitle_display(text: str, speed: float, ws_url: str = "ws://localhost:8765", session_id=None, session_getter=None):
     if not text or not text.strip():
         return
+    import websockets
     try:
         # Pingによる一方的な切断を防ぐために ping_interval を None に設定
         async with websockets.connect(ws_url, ping_interval=None) as ws:
@@ -1304,56 +1735,8 @@ speaker_lock = threading.Lock()
 # Removed show_window_thread as it is unsafe.
 # Logic moved to main_hub.py via overlay_queue.
 
-# グローバルなクリーンアップハンドラー（メモリリーク対策）
-_mixer_initialized = False
-
-def ensure_mixer_cleanup():
-    """プログラム終了時にmixerを確実にクリーンアップ"""
-    global _mixer_initialized
-    if _mixer_initialized and pygame.mixer.get_init():
-        try:
-            pygame.mixer.music.stop()
-            pygame.mixer.quit()
-            _mixer_initialized = False
-        except:
-            pass
-
-# プログラム終了時の自動クリーンアップを登録
-atexit.register(ensure_mixer_cleanup)
-
-@contextlib.contextmanager
-def managed_mixer(config):
-    """
-    pygame.mixerのコンテキストマネージャー
-    使用後に確実にリソースを解放する
-    """
-    global _mixer_initialized
-    target_device = config.get("DEVICE_NAME")
-    
-    try:
-        if not pygame.mixer.get_init():
-            try:
-                if target_device and target_device != "デフォルト":
-                    pygame.mixer.init(frequency=44100, size=-16, channels=1, devicename=target_device)
-                else:
-                    pygame.mixer.init(frequency=44100, size=-16, channels=1)
-                _mixer_initialized = True
-            except:
-                pygame.mixer.init(frequency=44100, size=-16, channels=1)
-                _mixer_initialized = True
-        
-        yield
-        
-    finally:
-        # 再生が完了するまで待機
-        try:
-            while pygame.mixer.music.get_busy():
-                time.sleep(0.01)
-            pygame.mixer.music.unload()
-        except:
-            pass
-
-def speak_and_show(text, image_path=None, config=None, root=None, session_data=None, show_window=True, skip_idle=False):
+def speak_and_show(text, image_path=None, config=None, root=None, session_data=None, show_window=True, skip_idle=False,
+                   cancel_token=None):
     if root is None: root = APP_ROOT
     if text:
         text = text.replace('#', '').replace('＃', '')
@@ -1371,6 +1754,8 @@ def speak_and_show(text, image_path=None, config=None, root=None, session_data=N
     if session_id and session_getter:
         if session_getter() != session_id:
             return # Stop processing
+    if cancel_token is not None and cancel_token.cancelled:
+        return
 
     send_log_to_hub(f"AI: {text}")
     lang_code = config.get("LANGUAGE", "ja")
@@ -1390,13 +1775,13 @@ def speak_and_show(text, image_path=None, config=None, root=None, session_data=N
     try:
         if lang_code == "ja":
             # VOICEVOXが利用可能かチェック
-            if is_voicevox_up():
-                run_voicevox_speak(text, config, root, session_data)
+            if is_voicevox_up(config):
+                run_voicevox_speak(text, config, root, session_data, cancel_token=cancel_token)
             else:
                 send_log_to_hub("警告: VOICEVOXに接続できません。edge-ttsで代用します。")
-                run_edge_tts_speak(text, "ja", config, root, session_data)
+                run_edge_tts_speak(text, "ja", config, root, session_data, cancel_token=cancel_token)
         else:
-            run_edge_tts_speak(text, lang_code, config, root, session_data)
+            run_edge_tts_speak(text, lang_code, config, root, session_data, cancel_token=cancel_token)
     finally:
         # Reset indicator to idle after speech finishes unless explicitly skipped
         if not skip_idle:
@@ -1404,8 +1789,75 @@ def speak_and_show(text, image_path=None, config=None, root=None, session_data=N
         # 少し待機してからリセット（音声再生完了を確実にする）
         time.sleep(0.1)
 
-def run_voicevox_speak(text, config, root, session_data):
-    """改善版: リソース管理を強化したVOICEVOX音声再生"""
+def speak_stream(sentence_stream, image_path=None, config=None, root=None, session_data=None, show_window=True,
+                 cancel_token=None):
+    """
+    speak_and_show のストリーミング版
+    LLM の応答から文が届くたびにオーバーレイ・字幕を更新し、届いた順に読み上げる
+    """
+    if root is None: root = APP_ROOT
+    s_data = session_data if session_data else (None, None, None, None)
+    session_id, session_getter, overlay_queue = s_data[0], s_data[1], s_data[2]
+
+    lang_code = config.get("LANGUAGE", "ja")
+    alpha = config.get("WINDOW_ALPHA", 0.6)
+    dt = config.get("DISPLAY_TIME", 60)
+    show_overlay = show_window and str(alpha) != "OFF"
+
+    # 字幕は文ごとに順番に送る（送信側で読み上げ時間分の待機を行うため専用スレッドで処理）
+    subtitle_queue = None
+    if config.get("ENABLE_SUBTITLE", False):
+        subtitle_queue = queue.Queue()
+        def _subtitle_worker():
+            for s in iter(subtitle_queue.get, None):
+                _run_subtitle_task(s, config, session_data)
+        threading.Thread(target=_subtitle_worker, daemon=True).start()
+
+    shown = []
+    def sentences():
+        for s in sentence_stream:
+            if (session_id and session_getter and session_getter() != session_id) or \
+                    (cancel_token is not None and cancel_token.cancelled):
+                sentence_stream.cancel()
+                return
+            shown.append(s)
+            if show_overlay:
+                trigger_overlay_state(join_sentences(shown), image_path, float(alpha), dt, 'speaking', overlay_queue)
+            if subtitle_queue:
+                subtitle_queue.put(s)
+            yield s
+
+    try:
+        if lang_code == "ja" and is_voicevox_up(config):
+            run_voicevox_speak(None, config, root, session_data, sentences=sentences(), cancel_token=cancel_token)
+        else:
+            if lang_code == "ja":
+                send_log_to_hub("警告: VOICEVOXに接続できません。edge-ttsで代用します。")
+            run_edge_tts_speak(None, lang_code, config, root, session_data, sentences=sentences(),
+                               cancel_token=cancel_token)
+    finally:
+        if subtitle_queue:
+            subtitle_queue.put(None)
+        if shown:
+            send_log_to_hub(f"AI: {join_sentences(shown)}")
+        trigger_overlay_state(None, None, "OFF", 0, 'idle', overlay_queue)
+        time.sleep(0.1)
+
+def split_for_speech(text):
+    """
+    読み上げ用の文分割。ストリーミング応答 (SentenceChunker) と同じ区切りで句読点を残し、
+    音声キャッシュのキーを定型フレーズ (TTS_PREWARM_PHRASES)・ストリーミング時と揃える
+    """
+    if split_sentences:
+        return split_sentences(text)
+    return [s.strip() for s in re.findall(r'[^。\n！？]+[。！？]*', text or "") if s.strip()]
+
+def run_voicevox_speak(text, config, root, session_data, sentences=None, cancel_token=None):
+    """
+    改善版: 先行合成パイプラインによるVOICEVOX音声再生（一時ファイルなし）
+    sentences に文のイテレーター（ストリーミング応答など）を渡すと、届いた文から順に合成・再生する
+    cancel_token がキャンセルされたら再生を止め、合成待ちの文を取り消す
+    """
     s_data = session_data if session_data else (None, None, None, None)
     session_id, session_getter = s_data[0], s_data[1]
     lang_data = s_data[3] if len(s_data) > 3 else None
@@ -1414,87 +1866,40 @@ def run_voicevox_speak(text, config, root, session_data):
         lang_data = load_lang_file(config.get("LANGUAGE", "ja"))
     log_m = lang_data.get("log_messages", {})
 
-    # 音声データを貯めるキュー（最大2つ分先行生成しておく）
-    audio_queue = queue.Queue(maxsize=2)
-    sentences = [s.strip() for s in re.split(r'[。\n！？]', text) if s.strip()]
-    speaker_id = config.get("SPEAKER_ID", 3)
-    speed = config.get("VOICE_SPEED", 1.2)
-    
-    # --- [内部関数] 音声を生成してキューに入れる ---
-    def generator():
-        for s in sentences:
-            if session_id and session_getter and session_getter() != session_id: 
-                break
-            try:
-                # 1. クエリ作成
-                r1 = requests.post(
-                    f"http://127.0.0.1:50021/audio_query?text={s}&speaker={speaker_id}", 
-                    timeout=10
-                ).json()
-                r1["speedScale"] = speed
-                r1["volumeScale"] = config.get("VOICE_VOLUME", 1.0)
-                r1["postPhonemeLength"] = 0.1
-                
-                # 2. 音声合成
-                r2 = requests.post(
-                    f"http://127.0.0.1:50021/synthesis?speaker={speaker_id}", 
-                    data=json.dumps(r1), 
-                    timeout=30
-                )
-                if r2.status_code == 200:
-                    audio_queue.put(r2.content)
-                
-                # VOICEVOX連続リクエストによるCPUスパイク防止用ウェイト（0.2秒）
-                time.sleep(0.2)
-            except Exception as e:
-                msg = log_m.get("audio_gen_error", "Audio generation error: {e}").format(e=e)
-                send_log_to_hub(msg, is_error=True)
-        audio_queue.put(None) # 終了の合図
-
-    # 生成スレッドを開始
-    gen_thread = threading.Thread(target=generator, daemon=True)
-    gen_thread.start()
+    if sentences is None:
+        sentences = split_for_speech(text)
 
-    # --- [再生メイン処理] - コンテキストマネージャーでリソース管理 ---
-    with speaker_lock, managed_mixer(config):
-        wav_dir = os.path.join(root, "data", "wav")
-        os.makedirs(wav_dir, exist_ok=True)
+    def is_stopped():
+        if cancel_token is not None and cancel_token.cancelled:
+            return True
+        return bool(session_id and session_getter and session_getter() != session_id)
 
-        vol = 1.0  # エンジン側でコントロールするため固定
-        
-        sentence_idx = 0
-        while True:
-            audio_data = audio_queue.get()  # 生成が終わるまで待機
-            if audio_data is None: 
-                break  # 全文終了
-            
-            if session_id and session_getter and session_getter() != session_id:
-                pygame.mixer.music.stop()
-                break
+    def on_error(e):
+        msg = log_m.get("audio_gen_error", "Audio generation error: {e}").format(e=e)
+        send_log_to_hub(msg, is_error=True)
 
-            # 各文ごとにユニークなファイル名を使用してPermission deniedを回避
-            temp_wav_path = os.path.join(wav_dir, f"current_speech_{sentence_idx}.wav")
-            sentence_idx += 1
-            
-            with open(temp_wav_path, "wb") as f:
-                f.write(audio_data)
-            
-            pygame.mixer.music.load(temp_wav_path)
-            pygame.mixer.music.set_volume(vol)
-            pygame.mixer.music.play()
-            
-            while pygame.mixer.music.get_busy():
-                if session_id and session_getter and session_getter() != session_id:
-                    pygame.mixer.music.stop()
-                    break
-                time.sleep(0.05)
-            
-            # 再生完了後にファイルを削除
-            try:
-                pygame.mixer.music.unload()
-                os.remove(temp_wav_path)
-            except:
-                pass
+    # 合成・再生の通知は別スレッドから届くため、区間と応答遅延の記録先のターンを先に取っておく
+    trace = current_trace()
+    latency_turn = current_turn()
+
+    def on_first_audio():
+        if latency_turn: mark_turn_event("first_audio", latency_turn)
+        trace_mark("first_audio", trace)
+
+    def play_wav_bytes(audio_data):
+        """メモリ上のWAVを再生し、最後まで再生できたら True を返す（音量はエンジン側でコントロール）"""
+        clip = engine.play(audio_data, "wav", on_start=on_first_audio)
+        return engine.wait(clip, should_stop=is_stopped)
+
+    # --- [再生メイン処理] - 出力デバイスは常駐エンジンが開いたまま保持する ---
+    engine = get_audio_engine()
+    engine.configure(config)
+    pipeline = VoicevoxPipeline(config, cache=get_tts_audio_cache(config))
+    with speaker_lock:
+        pipeline.run(sentences, play_wav_bytes, should_stop=is_stopped, on_error=on_error,
+                     span=lambda name: trace_span(name, trace))
+    if cancel_token is not None and cancel_token.cancelled and pipeline.last_reclaimed["sentences"]:
+        record_reclaimed("tts", **pipeline.last_reclaimed)
 
 # Edge-TTS 言語コードから音声名へのマッピング
 EDGE_TTS_VOICES = {
@@ -1511,75 +1916,129 @@ EDGE_TTS_VOICES = {
     "vi": "vi-VN-HoaiMyNeural",    # ベトナム語
 }
 
-def run_edge_tts_speak(text, lang_code, config, root, session_data):
-    """改善版: リソース管理を強化したEdge-TTS音声再生"""
+def get_edge_tts_params(lang_code, config):
+    """Edge-TTS の音声名と音量指定（合成結果に影響するためキャッシュキーにも使う）"""
+    vol = config.get("VOICE_VOLUME", 1.0)
+    perc = int((vol - 1.0) * 100)
+    return {"voice": EDGE_TTS_VOICES.get(lang_code, "en-US-AriaNeural"), "volume": f"{perc:+}%"}
+
+def synthesize_edge_tts(text, params):
+    """Edge-TTS で1文を合成し、MP3 のバイト列を返す（ファイルに書き出さない）"""
+    import edge_tts
+    async def _collect():
+        communicate = edge_tts.Communicate(text, params["voice"], volume=params["volume"])
+        chunks = []
+        async for chunk in communicate.stream():
+            if chunk.get("type") == "audio":
+                chunks.append(chunk["data"])
+        return b"".join(chunks)
+    return asyncio.run(_collect())
+
+def run_edge_tts_speak(text, lang_code, config, root, session_data, sentences=None, cancel_token=None):
+    """
+    改善版: リソース管理を強化したEdge-TTS音声再生（メモリ上で再生し一時ファイルを作らない）
+    sentences に文のイテレーターを渡すと、1文ずつ生成・再生する（ストリーミング応答用）
+    EDGE_TTS_STREAMING が有効なら、各文も受信したチャンクから順に再生を始める
+    """
     session_id, session_getter, _ = session_data[:3] if session_data else (None, None, None)
-    
-    voice = EDGE_TTS_VOICES.get(lang_code, "en-US-AriaNeural")
-    
-    wav_dir = os.path.join(root, "data", "wav")
-    os.makedirs(wav_dir, exist_ok=True)
-    temp_mp3_path = os.path.join(wav_dir, "edge_tts_speech.mp3")
-    
-    async def generate_speech():
-        """Edge-TTSで音声を生成"""
-        vol = config.get("VOICE_VOLUME", 1.0)
-        perc = int((vol - 1.0) * 100)
-        vol_str = f"{perc:+}%"
-        communicate = edge_tts.Communicate(text, voice, volume=vol_str)
-        await communicate.save(temp_mp3_path)
+    params = get_edge_tts_params(lang_code, config)
+    tts_cache = get_tts_audio_cache(config)
+    streamer = EdgeTTSStreamer() if EdgeTTSStreamer and config.get("EDGE_TTS_STREAMING", True) else None
+
+    def is_stopped():
+        if cancel_token is not None and cancel_token.cancelled:
+            return True
+        return bool(session_id and session_getter and session_getter() != session_id)
+
+    trace = current_trace()
+    latency_turn = current_turn()
+
+    def on_start():
+        if latency_turn: mark_turn_event("first_audio", latency_turn)
+        trace_mark("first_audio", trace)
+
+    engine = get_audio_engine()
+    engine.configure(config)
     
     try:
-        # 非同期で音声ファイルを生成
-        asyncio.run(generate_speech())
-        
-        if session_id and session_getter and session_getter() != session_id:
-            return
-        
-        # コンテキストマネージャーでリソース管理
-        with managed_mixer(config):
-            vol = 1.0  # エンジン側でコントロールするため固定
-            pygame.mixer.music.load(temp_mp3_path)
-            pygame.mixer.music.set_volume(vol)
-            pygame.mixer.music.play()
+        for speech_text in (sentences if sentences is not None else split_for_speech(text)):
+            # 合成済みのフレーズはキャッシュから取得し、無ければ生成して保存
+            audio = tts_cache.get("edge_tts", speech_text, params) if tts_cache else None
+            if audio is None and streamer:
+                # 届いたチャンクから再生を始める。再生開始前に失敗したら下の文単位再生に切り替える
+                player = EngineSegmentPlayer(engine, should_stop=is_stopped, on_start=on_start)
+                with trace_span("tts_stream"):
+                    audio = streamer.speak(speech_text, params, player, should_stop=is_stopped)
+                if audio is not None:
+                    if tts_cache and not is_stopped():
+                        tts_cache.put("edge_tts", speech_text, params, audio, compress=False)
+                    if is_stopped():
+                        return
+                    continue
+                # この環境ではストリーミング再生できないため、以降の文は文単位で再生する
+                streamer = None
+            if audio is None:
+                with trace_span("tts_synth"):
+                    audio = synthesize_edge_tts(speech_text, params)
+                if tts_cache:
+                    tts_cache.put("edge_tts", speech_text, params, audio, compress=False)
+            if not audio:
+                continue
             
-            while pygame.mixer.music.get_busy():
-                if session_id and session_getter and session_getter() != session_id:
-                    pygame.mixer.music.stop()
-                    break
-                time.sleep(0.05)
+            if is_stopped():
+                return
+            
+            with trace_span("tts_play"):
+                completed = engine.wait(engine.play(audio, "mp3", on_start=on_start), should_stop=is_stopped)
+            if not completed:
+                return
 
     except Exception as e:
         send_log_to_hub(f"Edge-TTS Playback Error: {e}", is_error=True)
-    finally:
-        # 一時ファイルのクリーンアップ
-        try:
-            if os.path.exists(temp_mp3_path):
-                time.sleep(0.1)  # ファイルロック解除を待つ
-                os.remove(temp_mp3_path)
-        except:
-            pass
+
+def prewarm_tts_cache(config):
+    """
+    設定の定型フレーズ (TTS_PREWARM_PHRASES) を起動時に合成してキャッシュしておく
+    日本語で VOICEVOX が起動していれば VOICEVOX、それ以外は Edge-TTS で合成する
+    """
+    tts_cache = get_tts_audio_cache(config)
+    if not tts_cache:
+        return 0
+    lang_code = config.get("LANGUAGE", "ja")
+    phrases = config.get("TTS_PREWARM_PHRASES", {}).get(lang_code, [])
+    if not phrases:
+        return 0
+    if lang_code == "ja" and is_voicevox_up(config):
+        pipeline = VoicevoxPipeline(config)
+        created = tts_cache.prewarm(phrases, "voicevox", pipeline.cache_params, pipeline.synthesize_remote, compress=True)
+    else:
+        params = get_edge_tts_params(lang_code, config)
+        created = tts_cache.prewarm(phrases, "edge_tts", params, lambda p: synthesize_edge_tts(p, params), compress=False)
+    if created:
+        print(f"[DEBUG tts_cache] prewarmed {created} phrases")
+    return created
 
 # --- 6. キャプチャ・音声入力・メイン ---
 def capture_target_screenshot(config, root):
-    target = config.get("TARGET_GAME_TITLE", "All Capture")
-    path = os.path.join(root, "data", "temp_ss.png")
+    """
+    対象ウィンドウをメモリ上にキャプチャし、送信先 AI に合わせて縮小・エンコードする
+    Returns: (EncodedImage, オーバーレイ表示用に書き出したパス)
+    """
+    provider = config.get("AI_PROVIDER", "gemini").lower()
+    encoded = encode_for_provider(grab_window(config.get("TARGET_GAME_TITLE", "All Capture")), provider, config)
+    path = os.path.join(root, "data", "temp_ss.jpg")
     os.makedirs(os.path.dirname(path), exist_ok=True)
-    try:
-        if target == "All Capture": raise ValueError()
-        wins = gw.getWindowsWithTitle(target)
-        win = next((w for w in wins if w.title == target), None)
-        if win:
-            bbox = (win.left, win.top, win.right, win.bottom)
-            ImageGrab.grab(bbox=bbox, all_screens=True).save(path)
-        else: ImageGrab.grab(all_screens=True).save(path)
-    except: ImageGrab.grab(all_screens=True).save(path)
-    return path
+    return encoded, encoded.save(path)
 
 def ensure_voicevox_is_running(config, lang_data):
     vv_path = config.get("VV_PATH", "")
     target_name = os.path.basename(vv_path)
     if not target_name: return False
+    # エンジンが応答すればプロセス一覧の走査（遅い）を省く（結果は client_registry で短時間キャッシュ）
+    if get_client_registry:
+        ok, _ = get_client_registry().health_check(f"{get_voicevox_url(config)}/version", timeout=0.5)
+        if ok: return True
+    import psutil
     for proc in psutil.process_iter(['name']):
         try:
             if target_name.lower() in proc.info['name'].lower(): return True
@@ -1610,6 +2069,7 @@ def get_voice_input(guide, config, root, lang_data, session_data, image_path=Non
     ).start()
     
     # 入力デバイス（マイク）の設定を解決
+    import speech_recognition as sr
     input_device_name = config.get("INPUT_DEVICE_NAME", "デフォルト")
     device_index = None
     if input_device_name and input_device_name != "デフォルト":
@@ -1622,53 +2082,125 @@ def get_voice_input(guide, config, root, lang_data, session_data, image_path=Non
     r = sr.Recognizer()
     # 終了を判断するタイミング（沈黙を許容する時間）を少し長くする（デフォルト0.8秒）
     r.pause_threshold = 1.2
-    
+    stopped = lambda: bool(session_id and session_getter and session_getter() != session_id)
+
+    # 発話区間検出 (voice_endpointing.py): 環境ノイズの測定値を使い回し、発話が VAD_HANGOVER_MS 途切れたら入力を終える
+    vad_engine = config.get("VAD_ENGINE", "energy")
+    if vad_engine != "off":
+        try:
+            from . import voice_endpointing as vep
+        except ImportError:
+            import voice_endpointing as vep
+        calibration = vep.get_noise_calibration(root)
+        calibration_key = input_device_name or "デフォルト"
+
     try:
-        with sr.Microphone(device_index=device_index) as source:
-            r.adjust_for_ambient_noise(source, duration=0.8)
-            send_log_to_hub(lang_data["log_messages"]["listening"])
-            
-            # Send status:listening to overlay
-            trigger_overlay_state("", None, "OFF", 0, 'listening', session_data[2] if session_data else None)
-            
-            # セッションチェック
-            if session_id and session_getter and session_getter() != session_id: return None
-            
-            # 待機時間を10秒、発話制限を20秒に延長
-            audio = r.listen(source, timeout=10, phrase_time_limit=20)
-            
-            if session_id and session_getter and session_getter() != session_id: return None
+        if vad_engine == "off":
+            # 従来の方式: 毎回環境ノイズを測り、pause_threshold の沈黙で終える
+            with sr.Microphone(device_index=device_index) as source:
+                r.adjust_for_ambient_noise(source, duration=0.8)
+                send_log_to_hub(lang_data["log_messages"]["listening"])
+                
+                # Send status:listening to overlay
+                trigger_overlay_state("", None, "OFF", 0, 'listening', session_data[2] if session_data else None)
+                
+                # セッションチェック
+                if stopped(): return None
+                
+                # 待機時間を10秒、発話制限を20秒に延長
+                audio = r.listen(source, timeout=10, phrase_time_limit=20)
+        else:
+            frame_samples = vep.SAMPLE_RATE * vep.FRAME_MS // 1000
+            with sr.Microphone(device_index=device_index, sample_rate=vep.SAMPLE_RATE, chunk_size=frame_samples) as source:
+                noise_rms = calibration.get(calibration_key, config.get("VAD_CALIBRATION_MAX_AGE_SEC", vep.DEFAULT_CALIBRATION_MAX_AGE))
+                if noise_rms is None:
+                    with trace_span("stt_calibrate"):
+                        noise_rms = vep.measure_noise(source)
+                    calibration.update(calibration_key, noise_rms, measured=True)
+                send_log_to_hub(lang_data["log_messages"]["listening"])
+                trigger_overlay_state("", None, "OFF", 0, 'listening', session_data[2] if session_data else None)
+                if stopped(): return None
+
+                vad = vep.create_vad(vad_engine, noise_rms, config.get("VAD_WEBRTC_AGGRESSIVENESS", 2))
+                endpointer = vep.Endpointer(vad, source.SAMPLE_RATE, vep.FRAME_MS,
+                                            config.get("VAD_HANGOVER_MS", vep.DEFAULT_HANGOVER_MS), source.SAMPLE_WIDTH)
+                # 待機時間10秒・発話制限20秒は従来と同じ
+                pcm = vep.listen_with_vad(source, endpointer, timeout=10, phrase_time_limit=20, should_stop=stopped,
+                                          on_start=lambda: trace_mark("speech_start"))
+                # 入力中の無音フレームで更新した環境ノイズを次の入力に引き継ぐ
+                calibration.update(calibration_key, vad.noise_rms)
+                if not pcm: return None
+                trace_mark("speech_end")
+                audio = sr.AudioData(pcm, source.SAMPLE_RATE, source.SAMPLE_WIDTH)
+
+        if stopped(): return None
+        with trace_span("stt_recognize"):
             return r.recognize_google(audio, language=stt_lang)
     except: return None
 
-def main(mode="voice", chat_text=None, session_id=None, session_getter=None, overlay_queue=None):
+def main(mode="voice", chat_text=None, session_id=None, session_getter=None, overlay_queue=None, cancel_token=None):
     root = get_app_root()
-    config, _, _ = load_config_manual(root)
-    lang_code = config.get("LANGUAGE", "ja")
-    lang_data = load_lang_file(lang_code)
+    # 対話ターンの協調キャンセル（サーバーではセッションごとのトークンを受け取る）
+    if cancel_token is None:
+        cancel_token = CancellationToken()
+    # 段階ごとの所要時間の記録（--profile-startup の計測時は記録しない）
+    trace = None
+    with startup_step("load_config"):
+        config, _, _ = load_config_manual(root)
+        lang_code = config.get("LANGUAGE", "ja")
+        lang_data = load_lang_file(lang_code)
     log_m = lang_data.get("log_messages", {})
     
     # 拡張されたsession_data (lang_dataを含む)
     session_data = (session_id, session_getter, overlay_queue, lang_data)
 
-    if lang_code == "ja": ensure_voicevox_is_running(config, lang_data)
-    init_ai(config)
-    init_ai(config)
+    if lang_code == "ja":
+        with startup_step("ensure_voicevox"):
+            ensure_voicevox_is_running(config, lang_data)
+    # AI クライアントは使う時に作成する（get_gemini_client / get_openai_client）。
+    # ここでは選択中のプロバイダーの分だけ先に用意しておく
+    provider = config.get("AI_PROVIDER", "gemini").lower()
+    if provider == "gemini":
+        get_gemini_client(config)
+    elif provider == "openai":
+        get_openai_client(config)
+    # 各モードの入力に必要な依存を読み込む
+    with startup_step(f"prepare_input:{mode}"):
+        if mode == "vision":
+            importlib.import_module("PIL.ImageGrab")
+        elif mode != "chat":
+            importlib.import_module("speech_recognition")
+    with startup_step("task_queue"):
+        tasks = get_task_queue(send_log_to_hub)
+    profiler = get_startup_profiler()
+    if profiler:
+        # 計測モード: 入力を受け付けられる状態になった時点で結果を表示して終了する
+        profiler.report(mode, root)
+        return
+    if config.get("TURN_TRACE_ENABLED", True):
+        trace = begin_trace(mode, root, session_id)
+    # 対話中は記憶の最適化など優先度の低いバックグラウンド処理の開始を保留する
+    tasks.begin_foreground()
     # Stop flag removal logic is no longer needed
     # stop_flag = os.path.join(root, "stop.flag")
     # if os.path.exists(stop_flag):
     #     try: os.remove(stop_flag)
     #     except: pass
 
+    sentence_stream, speak_thread, latency_turn = None, None, None
     try:
-        query, abs_path = None, None
+        query, abs_path, screenshot = None, None, None
         if mode == "vision":
-            abs_path = os.path.abspath(capture_target_screenshot(config, root))
-            query = get_voice_input(log_m.get("vision_guide", "Analyze"), config, root, lang_data, session_data, abs_path)
+            with trace_span("screenshot"):
+                screenshot, ss_path = capture_target_screenshot(config, root)
+            abs_path = os.path.abspath(ss_path)
+            with trace_span("stt"):
+                query = get_voice_input(log_m.get("vision_guide", "Analyze"), config, root, lang_data, session_data, abs_path)
         elif mode == "chat" and chat_text:
             query = chat_text
         else:
-            query = get_voice_input(log_m.get("voice_guide", "How can I help you?"), config, root, lang_data, session_data)
+            with trace_span("stt"):
+                query = get_voice_input(log_m.get("voice_guide", "How can I help you?"), config, root, lang_data, session_data)
 
         # --- モード分岐：複合AIモードか通常モードか ---
         res = None
@@ -1677,6 +2209,16 @@ def main(mode="voice", chat_text=None, session_id=None, session_getter=None, ove
         if query:
             trigger_overlay_state("", None, "OFF", 0, 'thinking', overlay_queue)
 
+            # 応答のストリーミング読み上げ: 生成途中でも完成した文から順に読み上げを始める
+            streaming = bool(SentenceStream and config.get("STREAMING_TTS", True))
+            if begin_turn:
+                latency_turn = begin_turn("streaming" if streaming else "blocking")
+            if streaming:
+                sentence_stream = SentenceStream()
+                speak_thread = threading.Thread(target=carry_trace(carry_turn(speak_stream)), args=(sentence_stream, abs_path, config, root, session_data),
+                                                kwargs={"cancel_token": cancel_token}, daemon=True)
+                speak_thread.start()
+
         if config.get("USE_INTERSECTING_AI", False):
             try:
                 from scripts.intersecting_ai import run_intersecting_ai
@@ -1692,7 +2234,10 @@ def main(mode="voice", chat_text=None, session_id=None, session_getter=None, ove
         
         # 複合AIがオフ、またはエラーで res が空の場合に通常モードを実行
         if not res:
-            res = chat_with_ai(query, Image.open(abs_path) if abs_path else None, config, root, lang_data)
+            res = chat_with_ai(query, screenshot, config, root, lang_data,
+                               sentence_stream=sentence_stream, cancel_token=cancel_token)
+        if latency_turn:
+            mark_turn_event("llm_done", latency_turn)
 
         if res:
             search_match = re.search(r'\[SEARCH:\s*(.*?)\]', res)
@@ -1706,33 +2251,50 @@ def main(mode="voice", chat_text=None, session_id=None, session_getter=None, ove
                 # Use session_data instead of stop_flag in background tasks if possible, 
                 # but for now we pass session_data as the last arg to execute_background_search 
                 # replacing stop_flag. Logic inside execute_background_search needs update for this.
-                # 検索タスクは音声読み上げを含むため、タイムアウトなしで実行
-                submit_background_task(execute_background_search, s_query, config, root, session_data, timeout=None)
-
-            speak_and_show(clean_res, abs_path, config, root, session_data)
+                # 検索タスクは音声読み上げを含むため、タイムアウトなしで実行（ユーザーが待つ処理として優先）
+                submit_background_task(carry_trace(execute_background_search), s_query, config, root, session_data,
+                                       cancel_token, timeout=None, priority="high")
+
+            if sentence_stream is not None:
+                # 複合AIモード・キャッシュヒット・エラー時など、ストリーミングされなかった応答はここで流す
+                # （タイムアウト・エラーの文は、途中まで読み上げていても続けて読み上げる）
+                if not sentence_stream.sentences or clean_res in AI_FAILURE_REPLIES:
+                    sentence_stream.put_text(clean_res)
+                sentence_stream.close()
+                speak_thread.join()
+            else:
+                speak_and_show(clean_res, abs_path, config, root, session_data, cancel_token=cancel_token)
 
-        if update_memory and len(load_history_manual(root)) >= 16:
+        update_memory = load_update_memory() if count_history_manual(root) >= 16 else None
+        if update_memory:
             # 辞書から予約ログを取得
             mem_msg = log_m.get("memory_update_reserved", "System: Memory optimization task reserved.")
             send_log_to_hub(mem_msg)
-            # メモリ更新タスクは120秒のタイムアウトで実行
-            submit_background_task(update_memory.main, root, timeout=120)
+            # メモリ更新タスクは120秒のタイムアウトで実行（対話中は開始を保留する）
+            submit_background_task(update_memory.main, root, timeout=120, priority="low")
             
     except Exception as e:
         msg = log_m.get("execution_error", "Execution error: {e}").format(e=e)
         send_log_to_hub(msg, is_error=True)
     finally:
+        if sentence_stream is not None:
+            sentence_stream.close()
+            speak_thread.join()
+        tasks.end_foreground()
+        if latency_turn:
+            end_turn(latency_turn)
+        if trace is not None:
+            end_trace(trace)
         global is_server_mode
         if not is_server_mode:
-            global _thread_pool_executor
-            if _thread_pool_executor is not None:
+            finished, _ = tasks.wait_for_completion(timeout=0)
+            if not finished:
                 try:
                     wait_msg = log_m.get("background_wait", "システム: バックグラウンドタスクの完了を待機中...")
                     send_log_to_hub(wait_msg)
                 except:
                     send_log_to_hub("システム: バックグラウンドタスクの完了を待機中...")
-                _thread_pool_executor.shutdown(wait=True)
-                _thread_pool_executor = None
+                tasks.wait_for_completion()
 
 def monitor_parent_stdin():
     """親プロセスの終了（stdinのクローズ）を監視し、閉じたら自死する"""
@@ -1741,11 +2303,15 @@ def monitor_parent_stdin():
     except Exception:
         pass
     send_log_to_hub("システム: 親プロセスの終了（stdin断）を検知したため、終了します。")
-    ensure_mixer_cleanup()
+    if get_log_shipper:
+        # os._exit では atexit が呼ばれないため、送信待ちのログをここで送り切る
+        get_log_shipper().flush(timeout=1.0)
+    get_audio_engine().close()
     os._exit(0)
 
 def run_api_server():
-    from flask import Flask, request, jsonify
+    with startup_step("import_flask"):
+        from flask import Flask, request, jsonify
     import logging
     import gc
 
@@ -1763,7 +2329,7 @@ def run_api_server():
 
     def load_cache_async():
         try:
-            resp = requests.get("http://127.0.0.1:50021/speakers", timeout=2.0)
+            resp = requests.get(f"{get_voicevox_url()}/speakers", timeout=2.0)
             if resp.status_code == 200:
                 cached_info["speakers"] = {s['name']: s['styles'][0]['id'] for s in resp.json()}
         except Exception:
@@ -1805,55 +2371,140 @@ def run_api_server():
         except Exception:
             pass
 
-    threading.Thread(target=load_cache_async, daemon=True).start()
+    submit_background_task(load_cache_async)
+
+    # 定型フレーズの音声を先行合成（VOICEVOX の起動を待つため少し遅らせる）
+    def prewarm_async():
+        try:
+            conf, _, _ = load_config_manual(get_app_root())
+            prewarm_tts_cache(conf)
+        except Exception as e:
+            print(f"TTS cache prewarm error: {e}")
+    def warm_ai_client():
+        # 最初のアクションで SDK の読み込みを待たないよう、選択中のプロバイダーのクライアントを先に作る
+        try:
+            conf, _, _ = load_config_manual(get_app_root())
+            provider = conf.get("AI_PROVIDER", "gemini").lower()
+            if provider == "gemini":
+                get_gemini_client(conf)
+            elif provider == "openai":
+                get_openai_client(conf)
+        except Exception as e:
+            print(f"AI client warm-up error: {e}")
+    prewarm_timer = threading.Timer(10, submit_background_task, args=(prewarm_async,), kwargs={"priority": "low"})
+    prewarm_timer.daemon = True
+    prewarm_timer.start()
+
+    server_conf, _, _ = load_config_manual(get_app_root())
+    sessions = get_session_manager(server_conf.get("SERVER_MAX_WORKERS", 4), server_conf.get("SERVER_MAX_QUEUE", 16),
+                                   send_log_to_hub)
 
     app = Flask("SecreAI_Game_AI_Server")
 
     @app.route('/api/status', methods=['GET'])
     def status():
-        return jsonify({"status": "ok", "active_session": get_active_session_id()})
+        return jsonify({"status": "ok", "active_session": sessions.latest_active_id(),
+                        "sessions": sessions.get_metrics()})
+
+    @app.route('/api/metrics', methods=['GET'])
+    def metrics():
+        # 接続再利用率・ハンドシェイク節約時間、応答開始までの時間 (time-to-first-audio)
+        if not get_client_registry:
+            return jsonify({"error": "client_registry unavailable"}), 503
+        data = {"clients": get_client_registry().get_metrics()}
+        if get_latency_history:
+            data["latency"] = get_latency_history()
+        data["voicevox"] = get_voicevox_stats()
+        if get_config_provider:
+            # 設定・言語ファイルの読み込みを省略できた回数 (hits) と実際の読み込み回数 (reads)
+            data["config_cache"] = get_config_provider().snapshot_stats()
+        data["audio"] = get_audio_engine().get_stats()
+        if get_log_shipper:
+            data["hub_log"] = get_log_shipper().get_stats()
+        data["tasks"] = get_task_queue().get_metrics()
+        data["sessions"] = sessions.get_metrics()
+        data["turn_trace"] = get_trace_stats()
+        data["cancellation"] = get_reclaimed_stats()
+        data["vision"] = get_vision_stats()
+        data["gemini_session"] = get_gemini_sessions().get_stats()
+        if get_search_gatekeeper:
+            data["search_gatekeeper"] = get_search_gatekeeper(os.path.join(get_app_root(), "data", "search_cache")).get_stats()
+        if get_preclassifier:
+            data["search_preclassifier"] = get_preclassifier(os.path.join(get_app_root(), "data")).get_stats()
+        if get_tts_cache:
+            tts_cache = get_tts_audio_cache(load_config_manual(get_app_root())[0])
+            if tts_cache:
+                data["tts_cache"] = tts_cache.get_stats()
+        return jsonify(data)
 
     @app.route('/api/cache', methods=['GET'])
     def get_cache():
         return jsonify(cached_info)
 
+    def cancel_sessions(session_id=None, client_id=None):
+        """
+        一致するセッションのトークンをキャンセルする（どちらも省略時はすべて）
+        LLM のストリーミング・検索・読み上げは各自のチェックポイントで止まる
+        """
+        count = sessions.cancel(session_id=session_id, client_id=client_id)
+        # 音声出力は全セッションで共有のため、他に対話中のセッションが残っていない時だけ止める
+        if (session_id is None and client_id is None) or not sessions.active_sessions():
+            try:
+                get_audio_engine().interrupt()
+            except Exception as e:
+                send_log_to_hub(f"Stop Music Error: {e}", is_error=True)
+        return count
+
     @app.route('/api/stop', methods=['POST'])
     def stop():
-        set_active_session_id(None)
-        try:
-            if pygame.mixer.get_init():
-                pygame.mixer.music.stop()
-                pygame.mixer.music.unload()
-        except Exception as e:
-            send_log_to_hub(f"Stop Music Error: {e}", is_error=True)
+        # session_id / client_id を指定するとそのセッションだけ、省略時は（従来どおり）すべてを止める
+        data = request.get_json(silent=True) or {}
+        stopped = cancel_sessions(data.get("session_id"), data.get("client_id"))
         
         send_log_to_hub("システム: 対話プロセスおよび音声を停止しました。")
         gc.collect()
-        return jsonify({"status": "stopped"})
+        return jsonify({"status": "stopped", "sessions": stopped})
+
+    @app.route('/api/cancel', methods=['POST'])
+    def cancel():
+        # /api/stop と同じ対象を中断し、中断で省けた処理の集計を返す
+        data = request.get_json(silent=True) or {}
+        cancelled = cancel_sessions(data.get("session_id"), data.get("client_id"))
+        return jsonify({"status": "cancelled", "sessions": cancelled, "reclaimed": get_reclaimed_stats()})
 
     @app.route('/api/execute', methods=['POST'])
     def execute():
         data = request.get_json() or {}
         mode = data.get("mode", "voice")
         chat_text = data.get("chat_text")
-        session_id = data.get("session_id")
 
-        if not session_id:
-            import uuid
-            session_id = str(uuid.uuid4())
-
-        set_active_session_id(session_id)
-
-        def run_task():
+        def run_task(session):
             try:
-                main(mode=mode, chat_text=chat_text, session_id=session_id, session_getter=get_active_session_id)
-            except Exception as e:
-                send_log_to_hub(f"Execution Thread Error: {e}", is_error=True)
+                main(mode=mode, chat_text=chat_text, session_id=session.id, session_getter=session.getter,
+                     cancel_token=session.token)
             finally:
                 gc.collect()
 
-        threading.Thread(target=run_task, daemon=True).start()
-        return jsonify({"status": "started", "session_id": session_id})
+        try:
+            # 同じクライアント（既定は Hub）の前の対話は中断し、別のクライアントの対話とは並行して実行する
+            session = sessions.submit(run_task, session_id=data.get("session_id"),
+                                      client_id=data.get("client_id", "hub"), mode=mode)
+        except SessionRejected as e:
+            res = jsonify({"status": "busy", "retry_after": e.retry_after, "queue_depth": e.queue_depth})
+            res.headers["Retry-After"] = str(e.retry_after)
+            return res, 429
+        return jsonify({"status": "started", "session_id": session.id, "state": session.state})
+
+    @app.route('/api/sessions', methods=['GET'])
+    def list_sessions():
+        return jsonify({"sessions": sessions.list_sessions(), "metrics": sessions.get_metrics()})
+
+    @app.route('/api/sessions/<session_id>', methods=['GET'])
+    def get_session(session_id):
+        session = sessions.get(session_id)
+        if session is None:
+            return jsonify({"status": "error", "message": "unknown session"}), 404
+        return jsonify(session.to_dict())
 
     @app.route('/api/action', methods=['POST'])
     def action():
@@ -1862,6 +2513,9 @@ def run_api_server():
         
         if not action_name:
             return jsonify({"status": "error", "message": "No action specified"}), 400
+        if action_name in ("clear", "fix"):
+            # 書き換え中の履歴に対話の結果が追記されないよう、Hub の対話を先に中断する
+            sessions.cancel(client_id="hub")
 
         def run_action_task():
             try:
@@ -1869,12 +2523,15 @@ def run_api_server():
                     send_log_to_hub("システム: 履歴の整理（削除）を実行中...")
                     import clear_history
                     clear_history.main()
+                    # 書き換えた履歴で Gemini のセッションを作り直す
+                    get_gemini_sessions().invalidate()
                     send_log_to_hub("システム: 履歴の整理が完了しました。")
                     
                 elif action_name == "fix":
                     send_log_to_hub("システム: 履歴の修復を実行中...")
                     import fix_history
                     fix_history.main()
+                    get_gemini_sessions().invalidate()
                     send_log_to_hub("システム: 履歴の修復が完了しました。")
                     
                 elif action_name == "feedback":
@@ -1905,15 +2562,21 @@ def run_api_server():
             finally:
                 gc.collect()
 
-        threading.Thread(target=run_action_task, daemon=True).start()
+        submit_background_task(run_action_task)
         return jsonify({"status": "dispatched", "action": action_name})
 
+    profiler = get_startup_profiler()
+    if profiler:
+        profiler.report("server", get_app_root())
+        return
+    submit_background_task(warm_ai_client, priority="low")
     send_log_to_hub("システム: 常駐 API サーバーが起動しました（ポート: 5003）。")
     app.run(host="127.0.0.1", port=5003, debug=False, threaded=True)
 
 if __name__ == "__main__":
-    m = sys.argv[1] if len(sys.argv) > 1 else "voice"
-    t = sys.argv[2] if len(sys.argv) > 2 else None
+    argv = [a for a in sys.argv[1:] if a != "--profile-startup"]
+    m = argv[0] if len(argv) > 0 else "voice"
+    t = argv[1] if len(argv) > 1 else None
     
     if m == "server":
         is_server_mode = True
@@ -0,0 +1,259 @@
+# ===== Gemini の会話セッション維持と明示的コンテキストキャッシュ =====
+# game_ai.py の chat_with_ai（AI_PROVIDER = gemini）で使用
+# 毎ターン history[-10:] から chat を作り直し、システム命令（人格・指示）を丸ごと送り直していた処理を置き換える
+# - 会話の contents をターンをまたいで保持し、新しい発言だけを末尾に追加する
+#   （先頭が毎ターン同じになるため、Gemini 側の暗黙キャッシュにも当たりやすくなる）
+# - 変わらないシステム命令は caches.create で明示的にキャッシュし、cached_content として参照する
+#   （作成は応答を待たせないようバックグラウンドで行い、できあがった次のターンから使う。
+#    明らかに最小トークン数に満たない命令は作成しない。失敗・非対応のモデルでは通常の system_instruction に戻す）
+# - 記憶検索の結果や日付など毎ターン変わる情報はシステム命令に入れず、その回のユーザー発言の前に付ける
+#   （セッションに残すのは元の発言だけ）
+# - モデル・システム命令・生成設定（思考レベルなど）が変わった場合と、履歴ファイルがセッション外で
+#   変わった場合（キャッシュ応答・履歴の削除など）だけセッションを作り直す
+# - ターンごとの入力トークン数（うちキャッシュ分）を record_usage で記録し、get_stats() で
+#   作り直し方式 (rebuild) と維持方式 (session) を比べられるようにする
+
+import time
+import json
+import hashlib
+import threading
+from collections import deque
+
+# セッションに保持する発言数の上限。超えたら直近 REBUILD_KEEP 件から作り直す
+# （毎ターン窓をずらすと先頭が変わってキャッシュが効かないため、まとめてずらす）
+MAX_SESSION_ENTRIES = 30
+REBUILD_KEEP = 10
+DEFAULT_CACHE_TTL_MINUTES = 60
+# キャッシュの期限がこの秒数以内なら作り直す
+CACHE_REFRESH_MARGIN = 60
+# これより短いシステム命令はキャッシュしない（最小トークン数は Flash 系で 1024。日本語は概ね1文字1トークン以上、
+# 英語は1トークン数文字のため、文字数がこれ未満なら確実に最小トークン数に届かない）
+MIN_CACHE_CHARS = 1024
+STATS_WINDOW = 50
+
+
+def history_to_contents(history):
+    """chat_history.json の発言 ("You: ..." / "AI: ...") を Gemini の contents に変換する"""
+    contents = []
+    for h in history:
+        role = "model" if h.startswith("AI:") else "user"
+        content = h.replace("AI:", "").replace("You: ", "").replace("あなた: ", "").strip()
+        contents.append({"role": role, "parts": [{"text": content}]})
+    return contents
+
+
+def _fingerprint(model, system_instruction, gen_config):
+    raw = json.dumps([model, system_instruction, gen_config], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class GeminiSession:
+    def __init__(self, client, model, system_instruction, gen_config, fingerprint):
+        self.client = client
+        self.model = model
+        self.system_instruction = system_instruction
+        self.gen_config = dict(gen_config or {})
+        self.fingerprint = fingerprint
+        self.contents = []
+        self.last_entry = None      # セッションが反映している履歴ファイルの最後の発言
+        self.cache_name = None
+        self.cache_expires_at = 0.0
+        self.cache_failed = False
+        self.cache_pending = False  # バックグラウンドで作成中
+
+    def reset_contents(self, history):
+        self.contents = history_to_contents(history)
+        self.last_entry = history[-1] if history else None
+
+    def request_config(self):
+        """generate_content に渡す設定（キャッシュがあれば cached_content、なければ system_instruction）"""
+        config = dict(self.gen_config)
+        if self.cache_name:
+            config["cached_content"] = self.cache_name
+        else:
+            config["system_instruction"] = self.system_instruction
+        return config
+
+    def request_contents(self, user_parts):
+        return self.contents + [{"role": "user", "parts": user_parts}]
+
+    def commit(self, user_text, answer_text, last_entry):
+        """応答を得たターンを追加する（付加した文脈・画像は残さず、元の発言だけを保持）"""
+        self.contents.append({"role": "user", "parts": [{"text": user_text}]})
+        self.contents.append({"role": "model", "parts": [{"text": answer_text}]})
+        self.last_entry = last_entry
+
+
+class GeminiSessionManager:
+    """
+    使用例:
+        manager = get_gemini_sessions()
+        session = manager.get_session(client, model, system_instr, {"thinking_config": ...}, history)
+        res = client.models.generate_content(model=model, contents=session.request_contents(parts),
+                                             config=session.request_config())
+        manager.record_usage("session", res)
+        session.commit(prompt, res.text, f"AI: {res.text}")
+    """
+
+    def __init__(self, use_context_cache=True, cache_ttl_minutes=DEFAULT_CACHE_TTL_MINUTES):
+        self.use_context_cache = use_context_cache
+        self.cache_ttl_minutes = cache_ttl_minutes
+        self._session = None
+        self._lock = threading.Lock()
+        self._records = deque(maxlen=STATS_WINDOW)
+        self.counts = {"turns": 0, "rebuilds": 0, "reused": 0, "cache_created": 0, "cache_failed": 0,
+                       "cache_skipped": 0}
+
+    def configure(self, use_context_cache=None, cache_ttl_minutes=None):
+        if use_context_cache is not None:
+            self.use_context_cache = use_context_cache
+        if cache_ttl_minutes is not None:
+            self.cache_ttl_minutes = cache_ttl_minutes
+
+    def get_session(self, client, model, system_instruction, gen_config, history):
+        """
+        現在のセッションを返す。次の場合は作り直す:
+        クライアント・モデル・システム命令・生成設定が変わった / 履歴ファイルがセッション外で変わった /
+        保持する発言数が上限を超えた
+        """
+        fingerprint = _fingerprint(model, system_instruction, gen_config)
+        with self._lock:
+            self.counts["turns"] += 1
+            session = self._session
+            if session is None or session.client is not client or session.fingerprint != fingerprint:
+                if session is not None:
+                    self._delete_cache(session)
+                session = GeminiSession(client, model, system_instruction, gen_config, fingerprint)
+                session.reset_contents(history[-REBUILD_KEEP:])
+                self._session = session
+                self.counts["rebuilds"] += 1
+            elif session.last_entry != (history[-1] if history else None) or len(session.contents) >= MAX_SESSION_ENTRIES:
+                session.reset_contents(history[-REBUILD_KEEP:])
+                self.counts["rebuilds"] += 1
+            else:
+                self.counts["reused"] += 1
+            if self.use_context_cache:
+                self._ensure_cache(session)
+            elif session.cache_name:
+                self._delete_cache(session)
+            return session
+
+    def invalidate(self):
+        """履歴の削除・修復時に呼ぶ（次のターンで作り直す）"""
+        with self._lock:
+            if self._session is not None:
+                self._delete_cache(self._session)
+            self._session = None
+
+    # --- 明示的コンテキストキャッシュ ---
+    def _ensure_cache(self, session):
+        """キャッシュがない・期限が近い場合にバックグラウンドで作成を始める（このターンは今あるもので送る）"""
+        if session.cache_failed or session.cache_pending:
+            return
+        if session.cache_name and time.time() < session.cache_expires_at - CACHE_REFRESH_MARGIN:
+            return
+        if len(session.system_instruction or "") < MIN_CACHE_CHARS:
+            # 作成しても最小トークン数で断られるため、呼び出し自体を省く
+            session.cache_failed = True
+            self.counts["cache_skipped"] += 1
+            return
+        session.cache_pending = True
+        threading.Thread(target=self._create_cache, args=(session,), daemon=True).start()
+
+    def _create_cache(self, session):
+        ttl = int(self.cache_ttl_minutes * 60)
+        try:
+            cache = session.client.caches.create(model=session.model, config={
+                "system_instruction": session.system_instruction,
+                "display_name": f"secreai-{session.fingerprint[:12]}",
+                "ttl": f"{ttl}s",
+            })
+        except Exception:
+            # 最小トークン数に満たない・モデル非対応など。このセッションでは system_instruction で送る
+            with self._lock:
+                session.cache_failed = True
+                session.cache_pending = False
+                self.counts["cache_failed"] += 1
+            return
+        with self._lock:
+            session.cache_pending = False
+            if self._session is not session or not self.use_context_cache:
+                # 作成中にセッションが作り直された・キャッシュが無効にされた
+                stale, old_name = cache.name, None
+            else:
+                stale, old_name = None, session.cache_name
+                session.cache_name = cache.name
+                session.cache_expires_at = time.time() + ttl
+                self.counts["cache_created"] += 1
+        for name in (stale, old_name):
+            if name:
+                self._delete_cache_name(session.client, name)
+
+    def _delete_cache(self, session):
+        if session.cache_name:
+            self._delete_cache_name(session.client, session.cache_name)
+            session.cache_name = None
+
+    @staticmethod
+    def _delete_cache_name(client, name):
+        # 期限切れで自然に消えるため、削除に失敗しても無視する
+        try:
+            client.caches.delete(name=name)
+        except Exception:
+            pass
+
+    # --- 計測 ---
+    def record_usage(self, mode, response):
+        """
+        mode: "rebuild"（毎ターン作り直す従来方式） / "session"（セッション維持）
+        response: usage_metadata を持つ応答（ストリーミング時は最後の断片）
+        """
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return None
+        entry = {
+            "mode": mode,
+            "input_tokens": getattr(usage, "prompt_token_count", None) or 0,
+            "cached_tokens": getattr(usage, "cached_content_token_count", None) or 0,
+            "output_tokens": getattr(usage, "candidates_token_count", None) or 0,
+        }
+        with self._lock:
+            self._records.append(entry)
+        return entry
+
+    def get_stats(self):
+        with self._lock:
+            records = list(self._records)
+            counts = dict(self.counts)
+            session = self._session
+        modes = {}
+        for mode in ("rebuild", "session"):
+            rows = [r for r in records if r["mode"] == mode]
+            if not rows:
+                continue
+            modes[mode] = {
+                "turns": len(rows),
+                "avg_input_tokens": round(sum(r["input_tokens"] for r in rows) / len(rows)),
+                "avg_cached_tokens": round(sum(r["cached_tokens"] for r in rows) / len(rows)),
+                # キャッシュ分を除いた、実際に処理し直した入力トークン数
+                "avg_uncached_tokens": round(sum(r["input_tokens"] - r["cached_tokens"] for r in rows) / len(rows)),
+            }
+        return {
+            **counts,
+            "session_entries": len(session.contents) if session else 0,
+            "context_cache": bool(session and session.cache_name),
+            "modes": modes,
+        }
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_gemini_sessions():
+    """プロセス全体で共有するセッション管理"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = GeminiSessionManager()
+        return _manager
@@ -15,6 +15,31 @@ try:
 except ImportError:
     pass 
 
+# 追記型チャット履歴ストア
+try:
+    from .history_store import get_history_store
+except ImportError:
+    try:
+        from history_store import get_history_store
+    except ImportError:
+        get_history_store = None
+
+# LLMクライアント・HTTP接続プールの共有レジストリ（無い環境では呼び出しごとに生成）
+try:
+    from .client_registry import gemini_client, openai_client, http_client
+except ImportError:
+    try:
+        from client_registry import gemini_client, openai_client, http_client
+    except ImportError:
+        def gemini_client(api_key):
+            return genai.Client(api_key=api_key)
+
+        def openai_client(api_key):
+            return OpenAI(api_key=api_key)
+
+        def http_client():
+            return requests
+
 # === 1. パス解決・ログ・言語管理 ===
 def get_app_root():
     if getattr(sys, 'frozen', False):
@@ -71,7 +96,7 @@ def generate_ai_text(prompt, config, system_instr=None, is_json=False):
     
     # --- A. OpenAI プロバイダー ---
     if provider == "openai":
-        client = OpenAI(api_key=config.get("OPENAI_API_KEY", ""))
+        client = openai_client(config.get("OPENAI_API_KEY", ""))
         model_id = config.get("MODEL_ID_GPT", "gpt-5")
         
         from config_manager import parse_model_name
@@ -125,7 +150,7 @@ def generate_ai_text(prompt, config, system_instr=None, is_json=False):
             pass
 
         try:
-            res = requests.post(
+            res = http_client().post(
                 f"{url.rstrip('/')}/chat/completions",
                 json=payload,
                 timeout=120
@@ -138,7 +163,7 @@ def generate_ai_text(prompt, config, system_instr=None, is_json=False):
 
     # --- C. Gemini プロバイダー (デフォルト) ---
     else:
-        client = genai.Client(api_key=config.get("GEMINI_API_KEY", ""))
+        client = gemini_client(config.get("GEMINI_API_KEY", ""))
         model_id = config.get("MODEL_ID_PRO" if system_instr else "MODEL_ID", "gemini-3.6-flash")
         
         from config_manager import parse_model_name
@@ -180,10 +205,14 @@ def analyze_last_response(feedback_type, config, root, lang_data):
         play_sound("up")
 
         history_path = os.path.join(root, config.get("FILES", {}).get("HISTORY", "data/chat_history.json"))
-        if not os.path.exists(history_path): return []
-        
-        with open(history_path, "r", encoding="utf-8") as f:
-            history = json.load(f)
+        if get_history_store:
+            # 直近の発言だけを末尾から読む
+            history = get_history_store(history_path).tail(10)
+        else:
+            if not os.path.exists(history_path): return []
+            
+            with open(history_path, "r", encoding="utf-8") as f:
+                history = json.load(f)
         
         if not history: return []
         
@@ -0,0 +1,342 @@
+# ===== 追記型チャット履歴ストア (JSONL + オフセット索引) =====
+# game_ai.py、update_memory.py、clear_history.py、fix_history.py、give_feedback.py などで使用
+# - 1行1発言の JSONL に追記のみ行い、毎ターンの全件読み書きをなくす
+# - 索引ファイル (.idx) に各行の開始オフセットを uint64 で保持し、直近N件は末尾からシークして読む
+# - 先頭の消費（記憶への圧縮後の切り詰め）は別ファイルへ書き出して os.replace で原子的に差し替える
+# - 読み込みも同じプロセス間ロック内で行い、ファイルは読み終えたらすぐ閉じる
+# - 書き込み途中でクラッシュした末尾の欠けた行は、次回オープン時に切り詰めて復旧する
+# - 旧形式 (chat_history.json の JSON 配列) は初回アクセス時に自動移行する
+
+import os
+import json
+import time
+import struct
+import threading
+
+_OFFSET = struct.Struct("<Q")
+
+# プロセス間ロックの待ち時間と、異常終了で残ったロックを破棄するまでの時間（秒）
+LOCK_TIMEOUT = 10.0
+LOCK_STALE_SEC = 30.0
+
+
+class _InterProcessLock:
+    """ロックファイルの排他作成によるプロセス間ロック（update_memory などの別プロセスと共有）"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()).encode())
+                os.close(fd)
+                return self
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.path) > LOCK_STALE_SEC:
+                        os.remove(self.path)
+                        continue
+                except OSError:
+                    continue
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"History lock timeout: {self.path}")
+                time.sleep(0.01)
+
+    def __exit__(self, *exc):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+        return False
+
+
+def resolve_history_path(path):
+    """設定上の履歴パス (data/chat_history.json) を JSONL のパスに読み替える"""
+    base, ext = os.path.splitext(path)
+    return base + ".jsonl" if ext.lower() == ".json" else path
+
+
+class HistoryStore:
+    """
+    チャット履歴（"You: ..." / "AI: ..." の文字列リスト）の追記型ストア
+
+    使用例:
+        store = get_history_store(os.path.join(root, "data", "chat_history.json"))
+        recent = store.tail(10)
+        store.append("You: こんにちは", "AI: こんにちは！")
+    """
+
+    def __init__(self, path):
+        self.path = resolve_history_path(path)
+        self.index_path = self.path + ".idx"
+        self.legacy_path = os.path.splitext(self.path)[0] + ".json"
+        self._lock = threading.RLock()
+        self._ipc_lock = _InterProcessLock(self.path + ".lock")
+        self._checked_size = None
+
+    # --- 初期化・整合性チェック ---
+    def _ensure_ready(self, ipc_locked=False):
+        """移行・破損行の復旧・索引の検証を行う（ファイルサイズが前回確認時から変わった時のみ）"""
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else None
+        if size is not None and size == self._checked_size:
+            return
+        if not ipc_locked:
+            # 他プロセスの追記途中を検証しないよう、ロックを取ってから確認する
+            with self._ipc_lock:
+                return self._ensure_ready(ipc_locked=True)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if size is None:
+            self._migrate_legacy()
+        self._repair_torn_tail()
+        if not self._index_is_valid():
+            self._rebuild_index()
+        self._checked_size = os.path.getsize(self.path)
+
+    def _migrate_legacy(self):
+        entries = []
+        if os.path.exists(self.legacy_path):
+            try:
+                with open(self.legacy_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if isinstance(data, list):
+                    entries = data
+            except Exception:
+                entries = []
+        self._write_atomic(entries)
+        if os.path.exists(self.legacy_path):
+            # 旧ファイルはバックアップとして残す
+            try:
+                os.replace(self.legacy_path, self.legacy_path + ".migrated")
+            except OSError:
+                pass
+
+    def _repair_torn_tail(self):
+        """末尾が改行で終わっていない（書き込み途中で落ちた）行を切り詰める"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+            # 最後の改行を後方から探す
+            pos = size
+            chunk = 4096
+            while pos > 0:
+                start = max(0, pos - chunk)
+                f.seek(start)
+                buf = f.read(pos - start)
+                nl = buf.rfind(b"\n")
+                if nl != -1:
+                    f.truncate(start + nl + 1)
+                    return
+                pos = start
+            f.truncate(0)
+
+    def _read_offsets(self):
+        if not os.path.exists(self.index_path):
+            return []
+        with open(self.index_path, "rb") as f:
+            data = f.read()
+        usable = len(data) - len(data) % _OFFSET.size
+        return [v for (v,) in _OFFSET.iter_unpack(data[:usable])]
+
+    def _index_is_valid(self):
+        size = os.path.getsize(self.path)
+        if not os.path.exists(self.index_path):
+            return size == 0
+        idx_size = os.path.getsize(self.index_path)
+        if idx_size % _OFFSET.size:
+            return False
+        count = idx_size // _OFFSET.size
+        if count == 0:
+            return size == 0
+        with open(self.index_path, "rb") as f:
+            f.seek(idx_size - _OFFSET.size)
+            (last,) = _OFFSET.unpack(f.read(_OFFSET.size))
+        if last >= size:
+            return False
+        # 最終行が索引の位置から始まり、ちょうど1行であることを確認
+        with open(self.path, "rb") as f:
+            if last > 0:
+                f.seek(last - 1)
+                if f.read(1) != b"\n":
+                    return False
+            else:
+                f.seek(0)
+            tail = f.read()
+        return tail.count(b"\n") == 1
+
+    def _rebuild_index(self):
+        offsets = []
+        pos = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                offsets.append(pos)
+                pos += len(line)
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(b"".join(_OFFSET.pack(o) for o in offsets))
+        os.replace(tmp, self.index_path)
+
+    # --- 書き込み ---
+    @staticmethod
+    def _encode(entries):
+        return [(json.dumps(e, ensure_ascii=False) + "\n").encode("utf-8") for e in entries]
+
+    def _write_atomic(self, entries):
+        """全件を一時ファイルに書き出し、本体 → 索引の順に差し替える"""
+        lines = self._encode(entries)
+        offsets, pos = [], 0
+        for line in lines:
+            offsets.append(pos)
+            pos += len(line)
+
+        tmp_data = self.path + ".tmp"
+        tmp_idx = self.index_path + ".tmp"
+        with open(tmp_data, "wb") as f:
+            f.write(b"".join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+        with open(tmp_idx, "wb") as f:
+            f.write(b"".join(_OFFSET.pack(o) for o in offsets))
+            f.flush()
+            os.fsync(f.fileno())
+        # 本体を先に差し替える。索引の差し替え前に落ちても、次回の検証で再構築される
+        os.replace(tmp_data, self.path)
+        os.replace(tmp_idx, self.index_path)
+        self._checked_size = pos
+
+    def append(self, *entries):
+        """発言を末尾に追記する"""
+        if not entries:
+            return
+        lines = self._encode(entries)
+        with self._lock, self._ipc_lock:
+            self._ensure_ready(ipc_locked=True)
+            with open(self.path, "ab") as f:
+                start = f.tell()
+                f.write(b"".join(lines))
+                f.flush()
+            offsets = []
+            pos = start
+            for line in lines:
+                offsets.append(pos)
+                pos += len(line)
+            with open(self.index_path, "ab") as f:
+                f.write(b"".join(_OFFSET.pack(o) for o in offsets))
+            self._checked_size = pos
+
+    def replace_all(self, entries):
+        """履歴全体を置き換える（リセット・過去発言の修正用）"""
+        with self._lock, self._ipc_lock:
+            self._write_atomic(list(entries))
+
+    def clear(self):
+        self.replace_all([])
+
+    def consume(self, k, transform=None):
+        """
+        先頭 k 件を取り除く（記憶への圧縮が済んだ分の切り詰め）
+        読み出し後に追記された発言も含め、残りを原子的に書き直す
+
+        Args:
+            transform: 残す発言に適用する変換 (str -> str)。None なら変換なし
+        """
+        with self._lock, self._ipc_lock:
+            self._ensure_ready(ipc_locked=True)
+            remaining = self._read_from(k)
+            if transform:
+                remaining = [transform(e) for e in remaining]
+            self._write_atomic(remaining)
+            return len(remaining)
+
+    def rewrite(self, func):
+        """全件を func(list) -> list で書き換える（ロック内で読み書き）"""
+        with self._lock, self._ipc_lock:
+            self._ensure_ready(ipc_locked=True)
+            self._write_atomic(func(self._read_from(0)))
+
+    # --- 読み込み ---
+    def _read_from(self, start, stop=None):
+        offsets = self._read_offsets()
+        if start >= len(offsets):
+            return []
+        with open(self.path, "rb") as f:
+            f.seek(offsets[max(0, start)])
+            if stop is not None and stop < len(offsets):
+                data = f.read(offsets[stop] - offsets[max(0, start)])
+            else:
+                data = f.read()
+        entries = []
+        for line in data.splitlines():
+            if not line.strip():
+                continue
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+        return entries
+
+    # 読み込みもプロセス間ロック内で行う（update_memory の consume が本体と索引を順に差し替える途中で、
+    # 新旧の本体と索引を組み合わせて読まないため。Windows では開いたままのファイルへの os.replace も失敗する）
+    def count(self):
+        with self._lock, self._ipc_lock:
+            self._ensure_ready(ipc_locked=True)
+            return os.path.getsize(self.index_path) // _OFFSET.size if os.path.exists(self.index_path) else 0
+
+    def tail(self, n):
+        """直近 n 件を、索引から開始位置を求めて末尾だけ読む"""
+        if n <= 0:
+            return []
+        with self._lock, self._ipc_lock:
+            self._ensure_ready(ipc_locked=True)
+            idx_size = os.path.getsize(self.index_path) if os.path.exists(self.index_path) else 0
+            count = idx_size // _OFFSET.size
+            if count == 0:
+                return []
+            start = max(0, count - n)
+            with open(self.index_path, "rb") as f:
+                f.seek(start * _OFFSET.size)
+                (offset,) = _OFFSET.unpack(f.read(_OFFSET.size))
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+        entries = []
+        for line in data.splitlines():
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+        return entries
+
+    def head(self, n):
+        """先頭 n 件（記憶への圧縮対象）"""
+        with self._lock, self._ipc_lock:
+            self._ensure_ready(ipc_locked=True)
+            return self._read_from(0, n) if n > 0 else []
+
+    def read_all(self):
+        with self._lock, self._ipc_lock:
+            self._ensure_ready(ipc_locked=True)
+            return self._read_from(0)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_history_store(path):
+    """パスごとのストア（プロセス内で共有）"""
+    key = os.path.abspath(resolve_history_path(path))
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = HistoryStore(key)
+        return store
@@ -0,0 +1,195 @@
+# ===== Hub へのログ・オーバーレイ状態の一括送信 =====
+# game_ai.py の send_log_to_hub / trigger_overlay_state で使用
+# 1行ごとにスレッドを立てて requests.post していた送信を、常駐の送信スレッド1本にまとめる
+# - ログは上限付きのキューに溜め、一定間隔ごとに1回の POST (/api/log の "messages") でまとめて送る
+# - 接続は client_registry の keep-alive セッションを使い回す
+# - 同じメッセージの連続は1件にまとめ (×N)、キューが溢れたら古い通常ログから捨てる（エラーは残す）
+# - オーバーレイ状態は最新の1件だけを保持し、溜まったら間隔を待たずにすぐ送る
+#
+# 使用例:
+#   shipper = get_log_shipper()
+#   shipper.log("処理を開始しました")
+#   shipper.overlay({"text": "", "status": "thinking", ...})
+
+import time
+import atexit
+import threading
+from collections import deque
+
+import requests
+
+try:
+    from .client_registry import http_client
+except ImportError:
+    try:
+        from client_registry import http_client
+    except ImportError:
+        def http_client():
+            return requests
+
+HUB_URL = "http://127.0.0.1:5000"
+# ログをまとめて送る間隔（秒）
+FLUSH_INTERVAL = 0.25
+# 1回の POST で送るログの最大件数
+MAX_BATCH = 50
+# 送信待ちログの上限（超えたら古い通常ログから捨てる）
+MAX_QUEUE = 500
+# Hub に接続できない間、次の送信を試すまでの待ち時間（秒）
+RETRY_INTERVAL = 2.0
+
+
+class HubLogShipper:
+    def __init__(self, hub_url=HUB_URL, interval=FLUSH_INTERVAL, max_queue=MAX_QUEUE, max_batch=MAX_BATCH):
+        self.hub_url = hub_url.rstrip("/")
+        self.interval = interval
+        self.max_queue = max_queue
+        self.max_batch = max_batch
+        self._logs = deque()
+        self._overlay = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._closed = False
+        self._retry_at = 0.0
+        self._thread = None
+        self.stats = {"logs": 0, "coalesced": 0, "dropped": 0, "posts": 0, "overlay_posts": 0,
+                      "overlay_coalesced": 0, "errors": 0}
+
+    # --- 公開API ---
+    def log(self, message, is_error=False, error_code=None):
+        entry = {"message": message, "is_error": is_error}
+        if error_code:
+            entry["error_code"] = error_code
+        with self._lock:
+            self.stats["logs"] += 1
+            last = self._logs[-1] if self._logs else None
+            if last is not None and last["message"] == message and last["is_error"] == is_error \
+                    and last.get("error_code") == entry.get("error_code"):
+                # 同じメッセージの連続は件数だけ数える
+                last["repeat"] = last.get("repeat", 1) + 1
+                self.stats["coalesced"] += 1
+            else:
+                self._logs.append(entry)
+                if len(self._logs) > self.max_queue:
+                    self._drop_one_locked()
+            self._idle.clear()
+        self._ensure_thread()
+        if is_error:
+            self._wakeup.set()
+
+    def overlay(self, payload):
+        """オーバーレイ状態を送る（未送信の古い状態は最新のもので置き換える）"""
+        with self._lock:
+            if self._overlay is not None:
+                self.stats["overlay_coalesced"] += 1
+            self._overlay = payload
+            self._idle.clear()
+        self._ensure_thread()
+        self._wakeup.set()
+
+    def flush(self, timeout=2.0):
+        """送信待ちを送り切るまで待つ（終了処理用）"""
+        self._wakeup.set()
+        return self._idle.wait(timeout)
+
+    def close(self, timeout=1.0):
+        self.flush(timeout)
+        self._closed = True
+        self._wakeup.set()
+
+    def get_stats(self):
+        with self._lock:
+            return {**self.stats, "queued": len(self._logs)}
+
+    # --- 送信スレッド ---
+    def _drop_one_locked(self):
+        for i, entry in enumerate(self._logs):
+            if not entry["is_error"]:
+                del self._logs[i]
+                break
+        else:
+            self._logs.popleft()
+        self.stats["dropped"] += 1
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._closed = False
+                self._thread = threading.Thread(target=self._run, name="hub-log-shipper", daemon=True)
+                self._thread.start()
+
+    def _take_batch(self):
+        with self._lock:
+            overlay, self._overlay = self._overlay, None
+            batch = [self._logs.popleft() for _ in range(min(self.max_batch, len(self._logs)))]
+        return overlay, batch
+
+    def _requeue(self, overlay, batch):
+        """送信に失敗した分を先頭に戻す（その間に新しい状態が来ていればそちらを優先）"""
+        with self._lock:
+            if overlay is not None and self._overlay is None:
+                self._overlay = overlay
+            self._logs.extendleft(reversed(batch))
+            while len(self._logs) > self.max_queue:
+                self._drop_one_locked()
+
+    def _post(self, path, payload):
+        res = http_client().post(f"{self.hub_url}{path}", json=payload, timeout=1)
+        res.raise_for_status()
+
+    @staticmethod
+    def _to_messages(batch):
+        messages = []
+        for entry in batch:
+            msg = {k: v for k, v in entry.items() if k != "repeat"}
+            if entry.get("repeat", 1) > 1:
+                msg["message"] = f"{entry['message']} (×{entry['repeat']})"
+            messages.append(msg)
+        return messages
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if time.monotonic() < self._retry_at:
+                continue
+            while True:
+                overlay, batch = self._take_batch()
+                if overlay is None and not batch:
+                    break
+                try:
+                    if overlay is not None:
+                        self._post("/api/overlay", overlay)
+                        self.stats["overlay_posts"] += 1
+                        overlay = None
+                    if batch:
+                        self._post("/api/log", {"messages": self._to_messages(batch)})
+                        self.stats["posts"] += 1
+                except Exception:
+                    # Hub が未起動・再起動中。少し待ってから送り直す
+                    self.stats["errors"] += 1
+                    self._requeue(overlay, batch)
+                    self._retry_at = time.monotonic() + RETRY_INTERVAL
+                    break
+            with self._lock:
+                if not self._logs and self._overlay is None:
+                    self._idle.set()
+            if self._retry_at and time.monotonic() >= self._retry_at:
+                self._retry_at = 0.0
+
+
+_shipper = None
+_shipper_lock = threading.Lock()
+
+
+def get_log_shipper():
+    """プロセス全体で共有する送信キュー"""
+    global _shipper
+    with _shipper_lock:
+        if _shipper is None:
+            _shipper = HubLogShipper()
+            atexit.register(_shipper.close)
+        return _shipper
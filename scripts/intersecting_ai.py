@@ -13,9 +13,16 @@ from PIL import Image
 sys.path.append(os.path.dirname(os.path.abspath(__file__))) 
 
 try:
-    from game_ai import save_history_manual, load_history_manual, send_log_to_hub, increment_tavily_count
+    from game_ai import append_history_manual, send_log_to_hub, increment_tavily_count
 except ImportError:
-    from scripts.game_ai import save_history_manual, load_history_manual, send_log_to_hub, increment_tavily_count
+    from scripts.game_ai import append_history_manual, send_log_to_hub, increment_tavily_count
+
+# Gemini クライアントはプロセス内で共有する（AsyncOpenAI はイベントループごとに生成）
+try:
+    from client_registry import gemini_client
+except ImportError:
+    def gemini_client(api_key):
+        return genai.Client(api_key=api_key)
 
 # --- 1. 画像変換ヘルパー ---
 def encode_image_to_base64(image_path):
@@ -34,7 +41,7 @@ def call_gemini_sync(query, image_obj, system_instr, config):
         from config_manager import parse_model_name
         actual_model_id, level = parse_model_name(model_id)
 
-        client = genai.Client(api_key=config.get("GEMINI_API_KEY"))
+        client = gemini_client(config.get("GEMINI_API_KEY"))
 
         safe_query = str(query) if not isinstance(query, str) else query
         contents = [safe_query]
@@ -120,7 +127,6 @@ def call_tavily_sync(query, config, root):
 
 async def generate_intersecting_response(query, image_path, config, root, lang_data):
     """三位一体の回答を統合し、履歴を保存する"""
-    history = load_history_manual(root)
     p = lang_data.get("ai_prompt", {})
     max_chars = config.get("MAX_CHARS", 700)
     
@@ -209,9 +215,7 @@ async def generate_intersecting_response(query, image_path, config, root, lang_d
         # STEP 4: 履歴保存
         if answer_text:
             user_pref = lang_data.get("system", {}).get("you_prefix", "You: ")
-            history.append(f"{user_pref}{query}")
-            history.append(f"AI: {answer_text}")
-            save_history_manual(history, root)
+            append_history_manual(root, f"{user_pref}{query}", f"AI: {answer_text}")
             send_log_to_hub("システム: 統合思考が完了しました。")
             
         return answer_text
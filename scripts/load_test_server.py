@@ -0,0 +1,198 @@
+# ===== 常駐 API サーバーの負荷試験 =====
+# スタブの LLM・VOICEVOX・Hub (stub_servers.py) を相手に game_ai.py server を起動し、
+# N 個のクライアントから同時に /api/execute（chat モード）を送って、待ち時間・実行時間・429 の件数を測る
+# - game_ai は一時フォルダを SECREAI_APP_ROOT に指定して起動するため、利用者の設定・履歴には触れない
+# - Hub (5000)・VOICEVOX (50021)・game_ai (5003) と同じポートを使うため、SecreAI を止めてから実行する
+#
+# 使用例:
+#   python scripts/load_test_server.py --clients 8 --requests 5 --llm-delay 0.5
+#   python scripts/load_test_server.py --clients 16 --workers 2 --max-queue 4   # 429 の発生を確認する
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import threading
+import subprocess
+
+import requests
+
+try:
+    from .stub_servers import start_stub_servers, LLM_PORT, VOICEVOX_PORT
+except ImportError:
+    from stub_servers import start_stub_servers, LLM_PORT, VOICEVOX_PORT
+
+SERVER_URL = "http://127.0.0.1:5003"
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_ROOT = os.path.dirname(SCRIPTS_DIR)
+# 429 の再試行を待つ上限（秒）
+MAX_RETRY_WAIT = 5.0
+POLL_INTERVAL = 0.05
+
+
+def prepare_root(workers, max_queue):
+    """スタブに接続する設定だけを置いた一時的なアプリフォルダを作る"""
+    root = tempfile.mkdtemp(prefix="secreai_load_")
+    os.makedirs(os.path.join(root, "data"))
+    lang_dir = os.path.join(APP_ROOT, "data", "lang")
+    if os.path.isdir(lang_dir):
+        shutil.copytree(lang_dir, os.path.join(root, "data", "lang"))
+    config = {
+        "AI_PROVIDER": "local",
+        "LOCAL_LLM_PROVIDER": "lmstudio",
+        "LMSTUDIO_URL": f"http://127.0.0.1:{LLM_PORT}/v1",
+        "OLLAMA_URL": f"http://127.0.0.1:{LLM_PORT}/v1",
+        "VOICEVOX_URL": f"http://127.0.0.1:{VOICEVOX_PORT}",
+        "VV_PATH": "",
+        "LANGUAGE": "ja",
+        "search_switch": False,
+        "USE_INTERSECTING_AI": False,
+        "API_CACHE_ENABLED": False,
+        "TTS_CACHE_ENABLED": False,
+        "TTS_PREWARM_PHRASES": {},
+        "SERVER_MAX_WORKERS": workers,
+        "SERVER_MAX_QUEUE": max_queue,
+    }
+    with open(os.path.join(root, "data", "config.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+    return root
+
+
+def start_server(root):
+    env = dict(os.environ, SECREAI_APP_ROOT=root, SDL_AUDIODRIVER="dummy")
+    log = open(os.path.join(root, "server.log"), "wb")
+    # stdin を閉じると game_ai は自分で終了する (monitor_parent_stdin)
+    proc = subprocess.Popen([sys.executable, os.path.join(SCRIPTS_DIR, "game_ai.py"), "server"],
+                            stdin=subprocess.PIPE, stdout=log, stderr=subprocess.STDOUT, env=env)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"game_ai server exited (see {root}/server.log)")
+        try:
+            if requests.get(f"{SERVER_URL}/api/status", timeout=0.5).ok:
+                return proc
+        except requests.RequestException:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("game_ai server did not start within 60s")
+
+
+def stop_server(proc):
+    try:
+        proc.stdin.close()
+        proc.wait(timeout=5)
+    except Exception:
+        proc.kill()
+
+
+def run_request(http, client_id, text, timeout):
+    """1回の対話を送り、終わるまで待つ。Returns: 計測結果の dict"""
+    t0 = time.perf_counter()
+    rejected = 0
+    while True:
+        res = http.post(f"{SERVER_URL}/api/execute", json={"mode": "chat", "chat_text": text, "client_id": client_id},
+                        timeout=5)
+        if res.status_code != 429:
+            res.raise_for_status()
+            session_id = res.json()["session_id"]
+            break
+        rejected += 1
+        time.sleep(min(MAX_RETRY_WAIT, float(res.json().get("retry_after", 1))))
+    admitted_ms = (time.perf_counter() - t0) * 1000
+
+    info = {}
+    while time.perf_counter() - t0 < timeout:
+        info = http.get(f"{SERVER_URL}/api/sessions/{session_id}", timeout=5).json()
+        if info.get("state") in ("done", "cancelled", "error"):
+            break
+        time.sleep(POLL_INTERVAL)
+    return {"total_ms": (time.perf_counter() - t0) * 1000, "admitted_ms": admitted_ms, "rejected": rejected,
+            "state": info.get("state", "timeout"), "queue_ms": info.get("queue_ms"), "run_ms": info.get("run_ms")}
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, round(p / 100 * (len(values) - 1))))
+    return round(values[k], 1)
+
+
+def summarize(results, elapsed_s):
+    def stats(key):
+        values = [r[key] for r in results if r.get(key) is not None]
+        return {"p50": percentile(values, 50), "p95": percentile(values, 95), "max": percentile(values, 100)}
+    states = {}
+    for r in results:
+        states[r["state"]] = states.get(r["state"], 0) + 1
+    return {
+        "requests": len(results),
+        "elapsed_s": round(elapsed_s, 2),
+        "throughput_per_s": round(len(results) / elapsed_s, 2) if elapsed_s else None,
+        "states": states,
+        "rejected_429": sum(r["rejected"] for r in results),
+        "total_ms": stats("total_ms"),
+        "queue_ms": stats("queue_ms"),
+        "run_ms": stats("run_ms"),
+    }
+
+
+def run_load_test(clients=8, requests_per_client=5, workers=4, max_queue=16, llm_delay=0.5, token_delay=0.05,
+                  timeout=60, keep=False):
+    stubs = start_stub_servers(llm_delay=llm_delay, token_delay=token_delay)
+    root = prepare_root(workers, max_queue)
+    proc = None
+    try:
+        proc = start_server(root)
+        results, lock = [], threading.Lock()
+
+        def client(n):
+            http = requests.Session()
+            for i in range(requests_per_client):
+                r = run_request(http, f"load-{n}", f"負荷試験です。クライアント{n}の{i + 1}回目の質問です。", timeout)
+                with lock:
+                    results.append(r)
+
+        t0 = time.perf_counter()
+        threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        summary = summarize(results, time.perf_counter() - t0)
+        summary["config"] = {"clients": clients, "requests_per_client": requests_per_client, "workers": workers,
+                             "max_queue": max_queue, "llm_delay": llm_delay, "token_delay": token_delay}
+        summary["server"] = requests.get(f"{SERVER_URL}/api/sessions", timeout=5).json().get("metrics")
+        summary["stub_calls"] = stubs.counts()
+        return summary
+    finally:
+        if proc is not None:
+            stop_server(proc)
+        stubs.stop()
+        if keep:
+            print(f"Kept test root: {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def _main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description="常駐 API サーバーの同時接続の負荷試験（スタブ LLM 使用）")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=5, help="クライアントごとの対話回数")
+    parser.add_argument("--workers", type=int, default=4, help="SERVER_MAX_WORKERS")
+    parser.add_argument("--max-queue", type=int, default=16, help="SERVER_MAX_QUEUE")
+    parser.add_argument("--llm-delay", type=float, default=0.5)
+    parser.add_argument("--token-delay", type=float, default=0.05)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--keep", action="store_true", help="一時フォルダ（server.log を含む）を残す")
+    args = parser.parse_args(argv)
+    summary = run_load_test(args.clients, args.requests, args.workers, args.max_queue, args.llm_delay,
+                            args.token_delay, args.timeout, args.keep)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    _main(sys.argv[1:])
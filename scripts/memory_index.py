@@ -0,0 +1,298 @@
+# ===== 記憶一覧のページング・検索インデックス =====
+# memory_viewer.py から使用
+# - MemoryPageSource: メタデータのみを取得して日時順に並べ、表示ページ分の本文だけを遅延取得
+# - MemorySearchIndex: 文字バイグラムの転置インデックス（バックグラウンドで分割構築）
+# 10万件規模でも一覧表示・絞り込みでUIが固まらないようにする
+
+import time
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+
+# 本文キャッシュの上限件数（表示中ページ + 前後数ページ分）
+DOC_CACHE_SIZE = 2000
+
+
+def _normalize(text):
+    """検索用の正規化（全角半角・大小文字の揺れを吸収）"""
+    if not text:
+        return ""
+    return unicodedata.normalize("NFKC", text).lower()
+
+
+def _bigrams(text):
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class MemoryPageSource:
+    """
+    日時の新しい順に並べた記憶一覧を offset/limit で取得するデータソース
+    並び替えにはメタデータだけを使い、本文はページ単位で取得する
+    """
+
+    def __init__(self, collection_getter):
+        self._get_collection = collection_getter
+        self._lock = threading.Lock()
+        self.order = []          # 日時順に並んだ ID
+        self.timestamps = {}     # ID -> timestamp
+        self._docs = OrderedDict()
+
+    def refresh(self):
+        """全件のIDとメタデータを取得し直し、日時順の並びを再構築する"""
+        collection = self._get_collection()
+        results = collection.get(include=["metadatas"])
+        ids = results.get("ids", []) or []
+        metas = results.get("metadatas", []) or []
+
+        timestamps = {}
+        for i, eid in enumerate(ids):
+            meta = metas[i] if i < len(metas) and metas[i] else {}
+            timestamps[eid] = meta.get("timestamp", "N/A")
+
+        # 文字列ベースで確実にソート (新しい順)
+        order = sorted(ids, key=lambda eid: str(timestamps[eid]), reverse=True)
+        with self._lock:
+            self.order = order
+            self.timestamps = timestamps
+            self._docs.clear()
+        return len(order)
+
+    def count(self):
+        return len(self.order)
+
+    def get_page(self, offset, limit, ids=None):
+        """
+        表示用の行 [(id, timestamp, length, document), ...] を返す
+        ids を指定した場合はその並び（検索結果など）からページを切り出す
+        """
+        source = self.order if ids is None else ids
+        page_ids = source[offset:offset + limit]
+        missing = [eid for eid in page_ids if eid not in self._docs]
+        if missing:
+            collection = self._get_collection()
+            results = collection.get(ids=missing, include=["documents"])
+            with self._lock:
+                for eid, doc in zip(results.get("ids", []), results.get("documents", [])):
+                    self._cache_doc(eid, doc or "")
+
+        rows = []
+        with self._lock:
+            for eid in page_ids:
+                doc = self._docs.get(eid)
+                if doc is None:
+                    continue
+                self._docs.move_to_end(eid)
+                rows.append((eid, self.timestamps.get(eid, "N/A"), len(doc), doc))
+        return rows
+
+    def _cache_doc(self, eid, doc):
+        self._docs[eid] = doc
+        self._docs.move_to_end(eid)
+        while len(self._docs) > DOC_CACHE_SIZE:
+            self._docs.popitem(last=False)
+
+    def update_entry(self, eid, document=None, timestamp=None):
+        """画面側で更新した記憶をDBの再読込なしで反映する"""
+        with self._lock:
+            if timestamp is not None:
+                self.timestamps[eid] = timestamp
+            if document is not None:
+                self._cache_doc(eid, document)
+
+    def remove(self, ids):
+        removed = set(ids)
+        with self._lock:
+            self.order = [eid for eid in self.order if eid not in removed]
+            for eid in removed:
+                self.timestamps.pop(eid, None)
+                self._docs.pop(eid, None)
+
+    def iter_batches(self, batch_size=1000, include=("documents", "metadatas")):
+        """コレクション全体を limit/offset で分割取得する（一括処理・インデックス構築用）"""
+        collection = self._get_collection()
+        offset = 0
+        while True:
+            batch = collection.get(limit=batch_size, offset=offset, include=list(include))
+            ids = batch.get("ids", []) or []
+            if not ids:
+                break
+            yield batch
+            offset += len(ids)
+            if len(ids) < batch_size:
+                break
+
+
+class MemorySearchIndex:
+    """
+    文字バイグラムの転置インデックスによる部分一致検索
+    - 2文字以上のクエリ: 最も出現数の少ないバイグラムから候補を絞り込み、本文で最終確認
+    - 1文字のクエリ: 候補の絞り込みができないため正規化済み本文を走査
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = {}      # bigram -> array('I') (文書番号の昇順)
+        self._texts = []         # 文書番号 -> 正規化済みテキスト（削除済みは None）
+        self._ids = []           # 文書番号 -> ID
+        self._doc_no = {}        # ID -> 文書番号
+        self._generation = 0
+        self.ready = False
+        self.indexed = 0
+        self.build_sec = 0.0
+
+    def clear(self):
+        with self._lock:
+            self._postings = {}
+            self._texts = []
+            self._ids = []
+            self._doc_no = {}
+            self._generation += 1
+            self.ready = False
+            self.indexed = 0
+
+    def _add_locked(self, eid, text):
+        old = self._doc_no.get(eid)
+        if old is not None:
+            self._texts[old] = None
+        norm = _normalize(eid) + "\n" + _normalize(text)
+        doc_no = len(self._texts)
+        self._texts.append(norm)
+        self._ids.append(eid)
+        self._doc_no[eid] = doc_no
+        for gram in _bigrams(norm):
+            posting = self._postings.get(gram)
+            if posting is None:
+                posting = self._postings[gram] = array("I")
+            posting.append(doc_no)
+
+    def add_batch(self, ids, documents, generation=None):
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return False
+            for eid, doc in zip(ids, documents):
+                self._add_locked(eid, doc or "")
+            self.indexed = len(self._doc_no)
+        return True
+
+    def upsert(self, eid, text):
+        with self._lock:
+            self._add_locked(eid, text or "")
+            self.indexed = len(self._doc_no)
+
+    def remove(self, ids):
+        with self._lock:
+            for eid in ids:
+                doc_no = self._doc_no.pop(eid, None)
+                if doc_no is not None:
+                    self._texts[doc_no] = None
+            self.indexed = len(self._doc_no)
+
+    def build(self, source, batch_size=2000, progress_cb=None):
+        """データソースから全件を分割取得してインデックスを構築する（別スレッドで呼ぶ）"""
+        self.clear()
+        generation = self._generation
+        t0 = time.perf_counter()
+        for batch in source.iter_batches(batch_size=batch_size, include=("documents",)):
+            if not self.add_batch(batch.get("ids", []), batch.get("documents", []), generation):
+                return False
+            if progress_cb:
+                progress_cb(self.indexed)
+            # UIスレッドにGILを譲る
+            time.sleep(0)
+        with self._lock:
+            if generation != self._generation:
+                return False
+            self.ready = True
+            self.build_sec = round(time.perf_counter() - t0, 3)
+        return True
+
+    def search(self, query):
+        """クエリを含む記憶のID集合を返す"""
+        q = _normalize(query)
+        if not q:
+            return None
+        with self._lock:
+            texts = self._texts
+            if len(q) < 2:
+                candidates = range(len(texts))
+            else:
+                postings = []
+                for gram in _bigrams(q):
+                    posting = self._postings.get(gram)
+                    if posting is None:
+                        return set()
+                    postings.append(posting)
+                postings.sort(key=len)
+                candidates = set(postings[0])
+                for posting in postings[1:4]:
+                    candidates.intersection_update(posting)
+                    if not candidates:
+                        return set()
+            return {self._ids[n] for n in candidates if texts[n] is not None and q in texts[n]}
+
+
+# ===== ベンチマーク: 合成データでの構築時間と検索時間 =====
+
+class _SyntheticCollection:
+    """chromadb の collection.get 互換の最小実装（ベンチマーク専用）"""
+
+    def __init__(self, n_docs, seed=7):
+        import random
+        rng = random.Random(seed)
+        vocab = ["ゲーム", "配信", "ボス戦", "攻略", "アイテム", "レベル", "装備", "ダンジョン", "イベント",
+                 "ユーザー", "質問", "回答", "天気", "ニュース", "設定", "音声", "字幕", "Python",
+                 "VOICEVOX", "Gemini", "記憶", "検索", "相棒", "雑談", "コメント", "視聴者"]
+        self.ids = [f"mem_{i:06d}" for i in range(n_docs)]
+        self.docs = ["".join(rng.choice(vocab) + "について話した。" for _ in range(rng.randint(10, 30))) for _ in range(n_docs)]
+        self.metas = [{"timestamp": f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} 12:00:00"} for _ in range(n_docs)]
+        self._pos = {eid: i for i, eid in enumerate(self.ids)}
+
+    def get(self, ids=None, limit=None, offset=None, include=None):
+        include = include or ["documents", "metadatas"]
+        if ids is not None:
+            idx = [self._pos[e] for e in ids if e in self._pos]
+        else:
+            start = offset or 0
+            end = len(self.ids) if limit is None else start + limit
+            idx = range(start, min(end, len(self.ids)))
+        res = {"ids": [self.ids[i] for i in idx]}
+        if "documents" in include:
+            res["documents"] = [self.docs[i] for i in idx]
+        if "metadatas" in include:
+            res["metadatas"] = [self.metas[i] for i in idx]
+        return res
+
+
+def run_benchmark(n_docs=100000):
+    collection = _SyntheticCollection(n_docs)
+    source = MemoryPageSource(lambda: collection)
+    index = MemorySearchIndex()
+
+    t0 = time.perf_counter()
+    source.refresh()
+    t_refresh = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    rows = source.get_page(0, 200)
+    t_page = time.perf_counter() - t0
+
+    index.build(source)
+    print(f"Docs: {n_docs}")
+    print(f"Refresh (metadata only): {t_refresh:.2f}s  First page ({len(rows)} rows): {t_page * 1000:.1f}ms")
+    print(f"Index build (background): {index.build_sec:.2f}s")
+
+    for q in ["ボス戦", "voicevox", "ダンジョン攻略", "存在しない単語", "戦"]:
+        t0 = time.perf_counter()
+        hits = index.search(q)
+        t_idx = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        linear = {eid for eid, doc in zip(collection.ids, collection.docs) if _normalize(q) in _normalize(doc)}
+        t_lin = time.perf_counter() - t0
+        assert hits == linear, q
+        print(f"  '{q}': {len(hits)} hits  index {t_idx * 1000:.1f}ms / linear {t_lin * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    import sys
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,292 @@
+# ===== 長期記憶DBのスナップショット (エクスポート/インポート) =====
+# 稼働中の memory_db フォルダをそのままコピーせず、ChromaDB の API 経由で
+# 文書・メタデータ・保存済み埋め込みベクトルを1つのファイルに書き出す。
+# インポート時は埋め込みをそのまま渡すため、再埋め込み（CPUで数時間）が不要。
+#
+# ファイル形式 (.secreai-snapshot = zip):
+#   manifest.json                 形式バージョン・件数・次元・各シャードの SHA-256
+#   records/000000.jsonl          1行1件 {"id", "document", "metadata"}
+#   embeddings/000000.npy         float32 行列（records と同じ順序）
+#
+# 使用例:
+#   python scripts/memory_snapshot.py export --out backup.secreai-snapshot
+#   python scripts/memory_snapshot.py verify backup.secreai-snapshot
+#   python scripts/memory_snapshot.py import backup.secreai-snapshot --db other_root/memory_db
+
+import io
+import os
+import sys
+import json
+import time
+import hashlib
+import zipfile
+from datetime import datetime
+
+import numpy as np
+
+try:
+    from .chromadb_pool import get_chroma_collection
+except ImportError:
+    try:
+        from chromadb_pool import get_chroma_collection
+    except ImportError:
+        get_chroma_collection = None
+
+SNAPSHOT_FORMAT = "secreai-memory-snapshot"
+SNAPSHOT_VERSION = 1
+DEFAULT_BATCH_SIZE = 1000
+
+
+class SnapshotError(Exception):
+    """スナップショットの形式不正・チェックサム不一致"""
+
+
+def _get_app_root():
+    if getattr(sys, 'frozen', False):
+        return os.path.dirname(sys.executable)
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    if os.path.basename(script_dir) == "scripts":
+        return os.path.dirname(script_dir)
+    return script_dir
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _report(progress_cb, done, total, t0):
+    if progress_cb:
+        elapsed = max(time.perf_counter() - t0, 1e-9)
+        progress_cb(done, total, round(done / elapsed, 1))
+
+
+def export_snapshot(db_path, out_path, collection_name="long_term_memory",
+                    batch_size=DEFAULT_BATCH_SIZE, progress_cb=None):
+    """
+    コレクションを分割取得しながらスナップショットへ書き出す（全件をメモリに載せない）
+
+    Returns:
+        {"count", "dim", "shards", "elapsed", "docs_per_sec", "bytes"}
+    """
+    collection = get_chroma_collection(db_path, collection_name)
+    total = collection.count()
+    t0 = time.perf_counter()
+    shards = []
+    dim = None
+    done = 0
+
+    tmp_path = out_path + ".tmp"
+    with zipfile.ZipFile(tmp_path, "w", allowZip64=True) as zf:
+        offset = 0
+        while True:
+            batch = collection.get(limit=batch_size, offset=offset,
+                                   include=["documents", "metadatas", "embeddings"])
+            ids = batch.get("ids") or []
+            if not ids:
+                break
+            docs = batch.get("documents") or [None] * len(ids)
+            metas = batch.get("metadatas") or [None] * len(ids)
+            embeddings = batch.get("embeddings")
+
+            shard_no = len(shards)
+            rec_name = f"records/{shard_no:06d}.jsonl"
+            rec_bytes = "".join(
+                json.dumps({"id": ids[i], "document": docs[i], "metadata": metas[i]}, ensure_ascii=False) + "\n"
+                for i in range(len(ids))
+            ).encode("utf-8")
+            zf.writestr(rec_name, rec_bytes, compress_type=zipfile.ZIP_DEFLATED)
+            shard = {"records": rec_name, "count": len(ids), "sha256_records": _sha256(rec_bytes)}
+
+            if embeddings is not None and len(embeddings) == len(ids):
+                matrix = np.asarray(embeddings, dtype=np.float32)
+                dim = dim or int(matrix.shape[1])
+                buf = io.BytesIO()
+                np.save(buf, matrix, allow_pickle=False)
+                emb_bytes = buf.getvalue()
+                emb_name = f"embeddings/{shard_no:06d}.npy"
+                # 浮動小数点は圧縮が効きにくいため無圧縮で格納
+                zf.writestr(emb_name, emb_bytes, compress_type=zipfile.ZIP_STORED)
+                shard["embeddings"] = emb_name
+                shard["sha256_embeddings"] = _sha256(emb_bytes)
+
+            shards.append(shard)
+            done += len(ids)
+            offset += len(ids)
+            _report(progress_cb, done, total, t0)
+            if len(ids) < batch_size:
+                break
+
+        manifest = {
+            "format": SNAPSHOT_FORMAT,
+            "version": SNAPSHOT_VERSION,
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "collection": collection_name,
+            "count": done,
+            "dim": dim,
+            "dtype": "float32",
+            "shards": shards,
+        }
+        zf.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2),
+                    compress_type=zipfile.ZIP_DEFLATED)
+    os.replace(tmp_path, out_path)
+
+    elapsed = time.perf_counter() - t0
+    return {
+        "count": done,
+        "dim": dim,
+        "shards": len(shards),
+        "elapsed": round(elapsed, 2),
+        "docs_per_sec": round(done / max(elapsed, 1e-9), 1),
+        "bytes": os.path.getsize(out_path),
+    }
+
+
+def read_manifest(zf):
+    try:
+        manifest = json.loads(zf.read("manifest.json").decode("utf-8"))
+    except KeyError:
+        raise SnapshotError("manifest.json not found (incomplete or not a snapshot)")
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise SnapshotError(f"Unknown snapshot format: {manifest.get('format')}")
+    if manifest.get("version", 0) > SNAPSHOT_VERSION:
+        raise SnapshotError(f"Snapshot version {manifest.get('version')} is newer than supported ({SNAPSHOT_VERSION})")
+    return manifest
+
+
+def iter_snapshot(path, verify=True):
+    """
+    シャード単位で (ids, documents, metadatas, embeddings or None) を返すジェネレーター
+    verify=True の場合は SHA-256 を照合し、不一致なら SnapshotError
+    """
+    with zipfile.ZipFile(path, "r") as zf:
+        manifest = read_manifest(zf)
+        for shard in manifest["shards"]:
+            rec_bytes = zf.read(shard["records"])
+            if verify and _sha256(rec_bytes) != shard["sha256_records"]:
+                raise SnapshotError(f"Checksum mismatch: {shard['records']}")
+            ids, docs, metas = [], [], []
+            for line in rec_bytes.decode("utf-8").splitlines():
+                if not line:
+                    continue
+                rec = json.loads(line)
+                ids.append(rec["id"])
+                docs.append(rec["document"])
+                metas.append(rec["metadata"])
+
+            embeddings = None
+            if shard.get("embeddings"):
+                emb_bytes = zf.read(shard["embeddings"])
+                if verify and _sha256(emb_bytes) != shard["sha256_embeddings"]:
+                    raise SnapshotError(f"Checksum mismatch: {shard['embeddings']}")
+                embeddings = np.load(io.BytesIO(emb_bytes), allow_pickle=False)
+                if len(embeddings) != len(ids):
+                    raise SnapshotError(f"Row count mismatch: {shard['embeddings']}")
+            yield ids, docs, metas, embeddings
+
+
+def verify_snapshot(path):
+    """全シャードのチェックサムと件数を確認する"""
+    t0 = time.perf_counter()
+    with zipfile.ZipFile(path, "r") as zf:
+        manifest = read_manifest(zf)
+    count = 0
+    for ids, _, _, _ in iter_snapshot(path, verify=True):
+        count += len(ids)
+    if count != manifest["count"]:
+        raise SnapshotError(f"Record count mismatch: manifest {manifest['count']}, actual {count}")
+    return {"count": count, "dim": manifest.get("dim"), "created_at": manifest.get("created_at"),
+            "elapsed": round(time.perf_counter() - t0, 2)}
+
+
+def import_snapshot(path, db_path, collection_name=None, replace=False,
+                    batch_size=DEFAULT_BATCH_SIZE, progress_cb=None):
+    """
+    スナップショットを取り込む（保存済み埋め込みを使用し、再埋め込みしない）
+
+    Args:
+        replace: True なら取り込み前に既存の記憶を全削除。False なら同じIDは上書き (upsert)
+    """
+    with zipfile.ZipFile(path, "r") as zf:
+        manifest = read_manifest(zf)
+    collection = get_chroma_collection(db_path, collection_name or manifest.get("collection", "long_term_memory"))
+
+    if replace:
+        existing = collection.get(include=[]).get("ids", [])
+        for i in range(0, len(existing), batch_size):
+            collection.delete(ids=existing[i:i + batch_size])
+
+    total = manifest["count"]
+    t0 = time.perf_counter()
+    done = 0
+    reembedded = 0
+    for ids, docs, metas, embeddings in iter_snapshot(path, verify=True):
+        for i in range(0, len(ids), batch_size):
+            rows = range(i, min(i + batch_size, len(ids)))
+            # ChromaDB は空のメタデータを受け付けないため、メタデータの有無で分けて登録する
+            for group in ([r for r in rows if metas[r]], [r for r in rows if not metas[r]]):
+                if not group:
+                    continue
+                kwargs = {"ids": [ids[r] for r in group], "documents": [docs[r] for r in group]}
+                if metas[group[0]]:
+                    kwargs["metadatas"] = [metas[r] for r in group]
+                if embeddings is not None:
+                    kwargs["embeddings"] = embeddings[group].tolist()
+                else:
+                    reembedded += len(group)
+                collection.upsert(**kwargs)
+        done += len(ids)
+        _report(progress_cb, done, total, t0)
+
+    elapsed = time.perf_counter() - t0
+    return {
+        "count": done,
+        "reembedded": reembedded,
+        "elapsed": round(elapsed, 2),
+        "docs_per_sec": round(done / max(elapsed, 1e-9), 1),
+    }
+
+
+def _print_progress(done, total, rate):
+    print(f"\r  {done}/{total} docs  ({rate} docs/s)", end="", flush=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    root = _get_app_root()
+    parser = argparse.ArgumentParser(description="SecreAI memory_db snapshot tool")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_exp = sub.add_parser("export", help="Export memory_db to a snapshot file")
+    p_exp.add_argument("--db", default=os.path.join(root, "memory_db"))
+    p_exp.add_argument("--out", default=os.path.join(root, "data", f"memory_{datetime.now():%Y%m%d_%H%M%S}.secreai-snapshot"))
+    p_exp.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+
+    p_imp = sub.add_parser("import", help="Import a snapshot into memory_db (no re-embedding)")
+    p_imp.add_argument("snapshot")
+    p_imp.add_argument("--db", default=os.path.join(root, "memory_db"))
+    p_imp.add_argument("--replace", action="store_true", help="Delete existing memories before import")
+    p_imp.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+
+    p_ver = sub.add_parser("verify", help="Verify snapshot checksums")
+    p_ver.add_argument("snapshot")
+
+    args = parser.parse_args()
+    try:
+        if args.command == "export":
+            print(f"Exporting {args.db} -> {args.out}")
+            res = export_snapshot(args.db, args.out, batch_size=args.batch_size, progress_cb=_print_progress)
+            print(f"\nDone: {res['count']} docs, dim={res['dim']}, {res['bytes'] / (1024 * 1024):.2f} MB, "
+                  f"{res['elapsed']}s ({res['docs_per_sec']} docs/s)")
+        elif args.command == "import":
+            print(f"Importing {args.snapshot} -> {args.db}")
+            res = import_snapshot(args.snapshot, args.db, replace=args.replace,
+                                  batch_size=args.batch_size, progress_cb=_print_progress)
+            print(f"\nDone: {res['count']} docs in {res['elapsed']}s ({res['docs_per_sec']} docs/s), "
+                  f"re-embedded: {res['reembedded']}")
+        else:
+            res = verify_snapshot(args.snapshot)
+            print(f"OK: {res['count']} docs, dim={res['dim']}, created {res['created_at']} ({res['elapsed']}s)")
+    except SnapshotError as e:
+        print(f"\nSnapshot Error: {e}", file=sys.stderr)
+        sys.exit(1)
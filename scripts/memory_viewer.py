@@ -6,9 +6,23 @@ try:
 except ImportError:
     from chromadb_pool import get_chroma_collection
 try:
-    from .db_maintenance import get_ai_response
+    from .db_maintenance import get_ai_response, get_db_stats_breakdown
+    from .db_stats import note_memory_write
 except ImportError:
-    from db_maintenance import get_ai_response
+    from db_maintenance import get_ai_response, get_db_stats_breakdown
+    from db_stats import note_memory_write
+try:
+    from .bulk_executor import BulkExecutor, get_provider_concurrency
+except ImportError:
+    from bulk_executor import BulkExecutor, get_provider_concurrency
+try:
+    from .memory_index import MemoryPageSource, MemorySearchIndex
+except ImportError:
+    from memory_index import MemoryPageSource, MemorySearchIndex
+try:
+    from .turn_tracer import load_traces, summarize_traces
+except ImportError:
+    from turn_tracer import load_traces, summarize_traces
 import os
 import json
 import threading
@@ -26,6 +40,33 @@ def get_app_root():
         return os.path.dirname(current_script_dir)
     return current_script_dir
 
+# --- 2. 要約・タグ生成の共通処理 ---
+TAG_IGNORE_WORDS = {"内容", "検索", "要約", "ネット情報", "システム", "日時", "Error", "failed", "の", "に", "は", "を", "た", "で", "て", "と", "し", "れ", "さ", "ある", "いる", "する", "から", "より", "なる", "こと", "これ", "それ", "これら", "ため", "等", "及", "用", "化", "中", "性", "者", "点", "他", "約", "年", "月", "日", "時", "分", "秒"}
+
+SUMMARIZE_PROMPT = (
+    "以下の記憶内容を、本質を損なわず300文字以内で簡潔に要約してください。\n"
+    "300文字に収まりきらない場合は、重要な単語を箇条書き（- 単語）で抽出してください。\n"
+    "内容: {content}"
+)
+
+def extract_tags(text):
+    """名詞・キーワードの自動抽出（タグの維持・更新）"""
+    auto_tags = re.findall(r'[A-Za-z0-9\-\_]+|[ァ-ヴー]{2,}|[一-龠]{2,}', text)
+    clean_tags = list(set([t for t in auto_tags if t not in TAG_IGNORE_WORDS and len(t) > 1]))
+    return ",".join(clean_tags[:10])
+
+def infer_timestamp(entry_id, current_ts):
+    """日付推測ロジック: メタデータ → ID内の14桁日時 → 現在時刻"""
+    if current_ts and current_ts != 'N/A':
+        return current_ts
+    match = re.search(r'(\d{14})', entry_id)
+    if match:
+        try:
+            dt = datetime.strptime(match.group(1), '%Y%m%d%H%M%S')
+            return dt.strftime('%Y-%m-%d %H:%M:%S')
+        except: pass
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
 class MemoryViewer:
     def __init__(self, parent, config):
         self.root = tk.Toplevel(parent)
@@ -46,6 +87,18 @@ class MemoryViewer:
         self.sys_lang = parent.lang.get("system", {})
         self.mv_lang = parent.lang.get("memory_viewer", {})
         
+        # 実行中の一括処理（キャンセル用）
+        self.active_bulk_executor = None
+        self.checkpoint_dir = os.path.join(self.base_dir, "data", "bulk_checkpoints")
+        
+        # ページング表示と検索インデックス
+        self.page_size = self.config.get("MEMORY_VIEWER_PAGE_SIZE", 200)
+        self.page_offset = 0
+        self.filtered_ids = None   # 検索中は該当IDの並び、未検索時は None
+        self._search_after_id = None
+        self.page_source = MemoryPageSource(lambda: get_chroma_collection(self.db_path))
+        self.search_index = MemorySearchIndex()
+        
         self.setup_ui()
         self.load_data()
 
@@ -68,9 +121,17 @@ class MemoryViewer:
         
         ttk.Label(search_f, text=self.l_set.get("search_label", "Search:")).pack(side="left")
         self.search_var = tk.StringVar()
-        self.search_var.trace_add("write", lambda *args: self.filter_data())
+        self.search_var.trace_add("write", lambda *args: self.schedule_filter())
         ttk.Entry(search_f, textvariable=self.search_var).pack(side="left", fill="x", expand=True, padx=5)
         
+        # ページ送り
+        self.btn_next_page = ttk.Button(search_f, text="▶", width=3, command=lambda: self.change_page(1))
+        self.btn_next_page.pack(side="right")
+        self.lbl_page = ttk.Label(search_f, text="")
+        self.lbl_page.pack(side="right", padx=5)
+        self.btn_prev_page = ttk.Button(search_f, text="◀", width=3, command=lambda: self.change_page(-1))
+        self.btn_prev_page.pack(side="right")
+        
         # リスト表示 (TreeView)
         tree_f = ttk.Frame(self.mem_tab)
         tree_f.pack(fill="both", expand=True)
@@ -122,6 +183,9 @@ class MemoryViewer:
         self.btn_repair_tags = ttk.Button(btn_f, text=btn_repair_txt, command=self.run_repair_tags)
         self.btn_repair_tags.pack(side="left", padx=5)
         
+        self.btn_cancel_bulk = ttk.Button(btn_f, text=self.mv_lang.get("btn_cancel_bulk", "中断 (Cancel)"), command=self.cancel_bulk, state="disabled")
+        self.btn_cancel_bulk.pack(side="left", padx=5)
+        
         ttk.Button(btn_f, text=self.l_set.get("btn_refresh", "Refresh"), command=self.load_data).pack(side="right", padx=5)
 
         # --- タブ2: パフォーマンスダッシュボード ---
@@ -129,6 +193,11 @@ class MemoryViewer:
         self.notebook.add(self.perf_tab, text="  パフォーマンス (Performance)  ")
         self.create_performance_tab()
 
+        # --- タブ3: 応答遅延（1ターンの段階ごとの所要時間） ---
+        self.latency_tab = ttk.Frame(self.notebook, padding="15")
+        self.notebook.add(self.latency_tab, text="  応答遅延 (Latency)  ")
+        self.create_latency_tab()
+
     def create_performance_tab(self):
         """パフォーマンス統計画面の構築"""
         p = self.parent.lang.get("performance", {})
@@ -175,6 +244,9 @@ class MemoryViewer:
         self.lbl_db_size.pack(anchor="w")
         self.lbl_mem_count = ttk.Label(db_f, text=p.get("total_entries", "Total Entries: --").replace("{count}", "--"))
         self.lbl_mem_count.pack(anchor="w")
+        # 構成要素別の内訳 (SQLite / HNSW / APIキャッシュ / 検索キャッシュ)
+        self.lbl_db_breakdown = ttk.Label(db_f, text="", foreground="gray", justify="left")
+        self.lbl_db_breakdown.pack(anchor="w", pady=(5, 0))
         
         # 4. モデル別統計リスト
         model_f = ttk.LabelFrame(stats_f, text=f" {p.get('model_stats_title', 'Model Statistics')} ", padding=10)
@@ -246,58 +318,200 @@ class MemoryViewer:
             g_text = p.get("search_usage_grounding", "Google (今月): {count} / 5000").replace("{count}", str(g_count)).replace("{month}", str(now.month))
             self.lbl_grounding_count.config(text=g_text)
             
-            # DBサイズ
-            total_size = 0
-            for dirpath, dirnames, filenames in os.walk(self.db_path):
-                for f in filenames:
-                    fp = os.path.join(dirpath, f)
-                    total_size += os.path.getsize(fp)
+            # DBサイズ（キャッシュ済みの統計。DBファイル更新時のみ再計測）
+            db_stats = get_db_stats_breakdown(self.db_path)
+            self.lbl_db_size.config(text=p.get("db_size", "Size:").replace("{size}", str(db_stats["db_mb"])))
+            self.lbl_mem_count.config(text=p.get("total_entries", "Entries:").replace("{count}", str(db_stats["count"])))
             
-            size_mb = round(total_size / (1024*1024), 2)
-            self.lbl_db_size.config(text=p.get("db_size", "Size:").replace("{size}", str(size_mb)))
-            self.lbl_mem_count.config(text=p.get("total_entries", "Entries:").replace("{count}", str(len(self.all_data))))
+            comp_labels = {"sqlite": "SQLite", "hnsw": "HNSW", "api_cache": "API Cache", "search_cache": "Search Cache"}
+            lines = [f"{comp_labels.get(name, name)}: {c['mb']} MB ({c['files']} files)" for name, c in db_stats["components"].items()]
+            self.lbl_db_breakdown.config(text="\n".join(lines))
             
         except Exception as e:
             print(f"Dashboard Update Error: {e}")
 
-    def load_data(self):
-        # 既存データのクリア
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-            
+    # 段階ごとのウォーターフォールの色（未登録の段階は灰色）
+    LATENCY_COLORS = {
+        "stt": "#8e44ad", "stt_calibrate": "#a569bd", "stt_recognize": "#bb8fce", "screenshot": "#9b59b6", "memory_search": "#2980b9", "date_parse": "#5dade2",
+        "llm": "#27ae60", "llm_ttft": "#82e0aa", "gatekeeper": "#d35400", "web_search": "#e67e22",
+        "search_summary": "#f0b27a", "tts_synth": "#c0392b", "tts_stream": "#e74c3c", "tts_play": "#f1948a",
+    }
+    LATENCY_TURNS = 5
+
+    def create_latency_tab(self):
+        """応答遅延画面の構築: 段階ごとの p50 / p95 と、直近ターンのウォーターフォール"""
+        p = self.parent.lang.get("performance", {})
+        ttk.Label(self.latency_tab, text=p.get("latency_title", "Turn Latency"), font=("Arial", 16, "bold")).pack(pady=(0, 10))
+
+        self.lbl_latency_summary = ttk.Label(self.latency_tab, text="", foreground="gray")
+        self.lbl_latency_summary.pack(anchor="w")
+
+        cols = ("stage", "count", "p50", "p95", "avg")
+        self.tree_latency = ttk.Treeview(self.latency_tab, columns=cols, show="headings", height=8)
+        self.tree_latency.heading("stage", text=p.get("latency_stage", "Stage"))
+        self.tree_latency.heading("count", text=p.get("latency_count", "Turns"))
+        self.tree_latency.heading("p50", text="p50 (ms)")
+        self.tree_latency.heading("p95", text="p95 (ms)")
+        self.tree_latency.heading("avg", text=p.get("latency_avg", "Avg (ms)"))
+        self.tree_latency.column("stage", width=160)
+        for col in cols[1:]:
+            self.tree_latency.column(col, width=70, anchor="center")
+        self.tree_latency.pack(fill="x", pady=5)
+
+        wf_f = ttk.LabelFrame(self.latency_tab, text=f" {p.get('latency_waterfall', 'Latest Turns (Waterfall)')} ", padding=5)
+        wf_f.pack(fill="both", expand=True, pady=5)
+        self.latency_canvas = tk.Canvas(wf_f, background="white", highlightthickness=0)
+        wf_scroll = ttk.Scrollbar(wf_f, orient="vertical", command=self.latency_canvas.yview)
+        self.latency_canvas.configure(yscrollcommand=wf_scroll.set)
+        self.latency_canvas.pack(side="left", fill="both", expand=True)
+        wf_scroll.pack(side="right", fill="y")
+        self.latency_canvas.bind("<Configure>", lambda e: self._draw_waterfall())
+        self._latency_records = []
+
+        ttk.Button(self.latency_tab, text=p.get("btn_update", "Update"), command=self.update_latency_tab).pack(pady=10)
+        self.update_latency_tab()
+
+    def update_latency_tab(self):
+        """data/turn_traces.jsonl を読み直して表示を更新"""
+        p = self.parent.lang.get("performance", {})
         try:
-            # 改善: 接続プールで3-5倍高速化
-            collection = get_chroma_collection(self.db_path)
-            
-            results = collection.get()
-            self.all_data = []
-            
-            ids = results.get('ids', [])
-            metas = results.get('metadatas', [])
-            docs = results.get('documents', [])
-            
-            for i in range(len(ids)):
-                ts = metas[i].get('timestamp', 'N/A') if metas and i < len(metas) else 'N/A'
-                doc_text = docs[i]
-                entry = (ids[i], ts, len(doc_text), doc_text)
-                self.all_data.append(entry)
-            
-            # 日時でソート (新しい順)
-            # 文字列ベースで確実にソート
-            self.all_data.sort(key=lambda x: str(x[1]), reverse=True)
-            self.filter_data()
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to load DB: {e}", parent=self.root)
+            records = load_traces(self.base_dir)
+        except OSError as e:
+            print(f"Latency Load Error: {e}")
+            records = []
+        summary = summarize_traces(records)
+
+        for item in self.tree_latency.get_children():
+            self.tree_latency.delete(item)
+        stages = sorted(summary["stages"].items(), key=lambda kv: -(kv[1]["p50"] or 0))
+        for name, st in stages:
+            self.tree_latency.insert("", "end", values=(name, st["count"], st["p50"], st["p95"], st["avg"]))
+        # 時点（最初のトークン・最初の音声・ターン終了）はターン開始からの経過時間
+        for name, st in summary["marks"].items():
+            self.tree_latency.insert("", "end", values=(f"@ {name}", st["count"], st["p50"], st["p95"], st["avg"]))
+
+        if records:
+            self.lbl_latency_summary.config(text=p.get("latency_summary", "Turns: {count} (latest: {time})")
+                                            .replace("{count}", str(summary["turns"]))
+                                            .replace("{time}", str(records[-1].get("timestamp", "-"))))
+        else:
+            self.lbl_latency_summary.config(text=p.get("latency_empty", "No turn traces recorded yet."))
+        self._latency_records = records[-self.LATENCY_TURNS:][::-1]
+        self._draw_waterfall()
+
+    def _draw_waterfall(self):
+        """直近ターンの区間を、ターン開始からの時間軸に横棒で並べる（新しいターンが上）"""
+        canvas = self.latency_canvas
+        canvas.delete("all")
+        records = getattr(self, "_latency_records", [])
+        if not records:
+            return
+        width = max(canvas.winfo_width(), 400)
+        label_w, right_pad, row_h = 130, 60, 16
+        scale_ms = max(r.get("total_ms") or 1 for r in records)
+        to_x = lambda ms: label_w + (width - label_w - right_pad) * (ms / scale_ms)
+
+        y = 5
+        for r in records:
+            head = f"{r.get('timestamp', '')}  {r.get('mode', '')}  turn={r.get('turn_ms')}ms  total={r.get('total_ms')}ms"
+            canvas.create_text(5, y, text=head, anchor="nw", font=("Arial", 9, "bold"))
+            y += row_h + 2
+            for s in r.get("spans", []):
+                x0, x1 = to_x(s["start_ms"]), to_x(s["start_ms"] + s["ms"])
+                color = self.LATENCY_COLORS.get(s["name"], "#95a5a6")
+                canvas.create_text(10, y, text=s["name"], anchor="nw", font=("Arial", 8))
+                canvas.create_rectangle(x0, y + 2, max(x1, x0 + 2), y + row_h - 3, fill=color, outline="")
+                canvas.create_text(max(x1, x0 + 2) + 4, y, text=f"{s['ms']:.0f}ms", anchor="nw", font=("Arial", 8), fill="gray")
+                y += row_h
+            # 時点は縦線で示す
+            for name, ms in (r.get("marks") or {}).items():
+                x = to_x(ms)
+                canvas.create_line(x, y - row_h * max(1, len(r.get("spans", []))), x, y, fill="#34495e", dash=(2, 2))
+                canvas.create_text(x + 2, y, text=name, anchor="nw", font=("Arial", 7), fill="#34495e")
+            y += row_h + 8
+        canvas.configure(scrollregion=(0, 0, width, y))
+
+    def load_data(self, rebuild_index=True):
+        """IDとメタデータだけを読み込み、本文は表示ページ分のみ取得する"""
+        self.lbl_page.config(text="Loading...")
+
+        def process():
+            try:
+                self.page_source.refresh()
+                self.root.after(0, self.filter_data)
+                if rebuild_index:
+                    # 検索インデックスは裏で分割構築（構築中はDB側の部分一致検索で代替）
+                    self.search_index.build(self.page_source,
+                                            progress_cb=lambda n: self.root.after(0, self.update_page_label))
+                    self.root.after(0, self.filter_data)
+            except Exception as e:
+                self.root.after(0, lambda err=e: messagebox.showerror("Error", f"Failed to load DB: {err}", parent=self.root))
+
+        threading.Thread(target=process, daemon=True).start()
+
+    def schedule_filter(self):
+        """キー入力ごとに検索しないよう、入力が止まってから絞り込む"""
+        if self._search_after_id:
+            self.root.after_cancel(self._search_after_id)
+        self._search_after_id = self.root.after(250, self.filter_data)
 
     def filter_data(self):
-        search_txt = self.search_var.get().lower()
+        self._search_after_id = None
+        search_txt = self.search_var.get().strip()
+        if not search_txt:
+            self.filtered_ids = None
+        elif self.search_index.ready:
+            hits = self.search_index.search(search_txt)
+            self.filtered_ids = [eid for eid in self.page_source.order if eid in hits]
+        else:
+            self.filtered_ids = self._search_db(search_txt)
+        self.page_offset = 0
+        self.render_page()
+
+    def _search_db(self, search_txt):
+        """インデックス構築中の代替検索（ChromaDBの全文検索を使用）"""
+        try:
+            collection = get_chroma_collection(self.db_path)
+            results = collection.get(where_document={"$contains": search_txt}, include=[])
+            hits = set(results.get("ids", []))
+            hits.update(eid for eid in self.page_source.order if search_txt.lower() in eid.lower())
+            return [eid for eid in self.page_source.order if eid in hits]
+        except Exception as e:
+            print(f"Search Error: {e}")
+            return []
+
+    def change_page(self, step):
+        total = self.page_source.count() if self.filtered_ids is None else len(self.filtered_ids)
+        new_offset = self.page_offset + step * self.page_size
+        if 0 <= new_offset < total:
+            self.page_offset = new_offset
+            self.render_page()
+
+    def render_page(self):
+        """現在のページの行だけを Treeview に展開する"""
         for item in self.tree.get_children():
             self.tree.delete(item)
-            
-        for entry in self.all_data:
-            if search_txt in entry[3].lower() or search_txt in entry[0].lower():
-                self.tree.insert("", "end", values=entry)
+
+        total = self.page_source.count() if self.filtered_ids is None else len(self.filtered_ids)
+        if self.page_offset >= total:
+            self.page_offset = max(0, (total - 1) // self.page_size * self.page_size)
+        try:
+            rows = self.page_source.get_page(self.page_offset, self.page_size, ids=self.filtered_ids)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to load DB: {e}", parent=self.root)
+            rows = []
+        for entry in rows:
+            self.tree.insert("", "end", values=entry)
+        self.update_page_label()
+
+    def update_page_label(self):
+        total = self.page_source.count() if self.filtered_ids is None else len(self.filtered_ids)
+        start = self.page_offset + 1 if total else 0
+        end = min(self.page_offset + self.page_size, total)
+        label = f"{start}-{end} / {total}"
+        if not self.search_index.ready and self.page_source.count():
+            label += f"  (index {self.search_index.indexed}/{self.page_source.count()})"
+        self.lbl_page.config(text=label)
 
     def on_select(self, event):
         selected = self.tree.selection()
@@ -322,12 +536,17 @@ class MemoryViewer:
             # 改善: 接続プールで3-5倍高速化
             collection = get_chroma_collection(self.db_path)
             
-            for item in selected:
-                val = self.tree.item(item, "values")
-                entry_id = val[0]
-                collection.delete(ids=[entry_id])
-                
-            self.load_data()
+            entry_ids = [self.tree.item(item, "values")[0] for item in selected]
+            collection.delete(ids=entry_ids)
+            note_memory_write(self.db_path, removed=len(entry_ids))
+            
+            # 全件を読み直さず、一覧と検索インデックスから取り除く
+            self.page_source.remove(entry_ids)
+            self.search_index.remove(entry_ids)
+            if self.filtered_ids is not None:
+                removed = set(entry_ids)
+                self.filtered_ids = [eid for eid in self.filtered_ids if eid not in removed]
+            self.render_page()
             messagebox.showinfo("Success", "Deleted successfully.", parent=self.root)
         except Exception as e:
             messagebox.showerror("Error", f"Delete failed: {e}", parent=self.root)
@@ -345,39 +564,13 @@ class MemoryViewer:
         
         def process():
             try:
-                db_provider = self.config.get("DB_PROVIDER", "local").lower()
-                db_model_id = self.config.get("DB_MODEL_ID", "gemma3:4b")
-                
-                prompt = (
-                    f"以下の記憶内容を、本質を損なわず300文字以内で簡潔に要約してください。\n"
-                    f"300文字に収まりきらない場合は、重要な単語を箇条書き（- 単語）で抽出してください。\n"
-                    f"内容: {content}"
-                )
-
-                new_content = get_ai_response(prompt, self.config)
+                new_content = get_ai_response(SUMMARIZE_PROMPT.format(content=content), self.config)
                 if new_content.startswith("Error:"):
                     raise Exception(new_content)
                 new_content = new_content.strip()
                 
-                # 日付推測ロジック
-                def infer_date(eid, current_ts):
-                    if current_ts != 'N/A' and current_ts:
-                        return current_ts
-                    match = re.search(r'(\d{14})', eid)
-                    if match:
-                        try:
-                            dt = datetime.strptime(match.group(1), '%Y%m%d%H%M%S')
-                            return dt.strftime('%Y-%m-%d %H:%M:%S')
-                        except: pass
-                    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-                final_ts = infer_date(entry_id, val[1])
-                
-                # 名詞・キーワードの自動抽出（タグの維持・更新）
-                ignore_words = {"内容", "検索", "要約", "ネット情報", "システム", "日時", "Error", "failed", "の", "に", "は", "を", "た", "で", "て", "と", "し", "れ", "さ", "ある", "いる", "する", "から", "より", "なる", "こと", "これ", "それ", "これら", "ため", "等", "及", "用", "化", "中", "性", "者", "点", "他", "約", "年", "月", "日", "時", "分", "秒"}
-                auto_tags = re.findall(r'[A-Za-z0-9\-\_]+|[ァ-ヴー]{2,}|[一-龠]{2,}', new_content)
-                clean_tags = list(set([t for t in auto_tags if t not in ignore_words and len(t) > 1]))
-                tags_str = ",".join(clean_tags[:10])
+                final_ts = infer_timestamp(entry_id, val[1])
+                tags_str = extract_tags(new_content)
 
                 # ChromaDB更新（改善: 接続プールで3-5倍高速化）
                 collection = get_chroma_collection(self.db_path)
@@ -387,6 +580,8 @@ class MemoryViewer:
                     documents=[new_content],
                     metadatas=[{"timestamp": final_ts, "tags": tags_str}]
                 )
+                self.page_source.update_entry(entry_id, document=new_content, timestamp=final_ts)
+                self.search_index.upsert(entry_id, new_content)
                 
                 self.root.after(0, lambda: self.finish_summarize("Success", "Summarized successfully."))
             except Exception as e:
@@ -397,23 +592,60 @@ class MemoryViewer:
     def finish_summarize(self, title, msg):
         self.btn_summarize.config(state="normal", text=self.l_set.get("btn_summarize", "Summarize Selected"))
         if title == "Success":
-            self.load_data()
+            self.render_page()
             messagebox.showinfo(title, msg, parent=self.root)
         else:
             messagebox.showerror(title, msg, parent=self.root)
 
+    # --- 一括処理の共通制御 (並列実行・バッチコミット・キャンセル・再開) ---
+    def _ask_resume(self, executor):
+        """未完了のチェックポイントがあれば続きから再開するか確認する"""
+        checkpoint = executor.load_checkpoint()
+        if not checkpoint:
+            return False
+        msg = self.mv_lang.get("msg_bulk_resume", "前回中断した処理があります（{done}/{total} 件完了）。続きから再開しますか？")
+        msg = msg.replace("{done}", str(len(checkpoint.get("done", [])))).replace("{total}", str(checkpoint.get("total", "?")))
+        return messagebox.askyesno("Resume", msg, parent=self.root)
+
+    def _start_bulk(self, executor):
+        self.active_bulk_executor = executor
+        self.btn_cancel_bulk.config(state="normal")
+
+    def _end_bulk(self):
+        self.active_bulk_executor = None
+        self.btn_cancel_bulk.config(state="disabled")
+
+    def cancel_bulk(self):
+        if self.active_bulk_executor:
+            self.active_bulk_executor.cancel()
+            self.btn_cancel_bulk.config(state="disabled")
+
+    def _format_bulk_result(self, result, done_msg):
+        if result["cancelled"]:
+            return self.mv_lang.get("msg_bulk_cancelled", "処理を中断しました（{count} 件完了）。次回は続きから再開できます。").replace("{count}", str(result["processed"]))
+        msg = done_msg
+        if result["failed"]:
+            msg += f"\nFailed: {result['failed']}\n" + "\n".join(result["errors"])
+        return msg
+
     def run_repair_tags(self):
         """データベース内のすべての記憶に対して名詞タグ（tags）を全自動で再生成・修復・更新する"""
         confirm_msg = self.mv_lang.get("msg_repair_tags_confirm", "データベース内の全記憶データを解析し、タグ（キーワード）を一括修復・更新しますか？\n（※数秒〜数分で完了します）")
         if not messagebox.askyesno("Confirm", confirm_msg, parent=self.root):
             return
 
+        # タグ抽出はCPU処理のみのため並列化せず、DB更新のバッチ化で高速化する
+        executor = BulkExecutor("repair_tags", self.checkpoint_dir, concurrency=1,
+                                batch_size=self.config.get("BULK_COMMIT_BATCH", 20) * 5)
+        resume = self._ask_resume(executor)
+
         self.btn_repair_tags.config(state="disabled", text="修復中 / Repairing...")
+        self._start_bulk(executor)
 
         def process():
             try:
                 collection = get_chroma_collection(self.db_path)
-                all_data = collection.get()
+                all_data = collection.get(include=["documents", "metadatas"])
                 
                 ids = all_data.get("ids", [])
                 documents = all_data.get("documents", [])
@@ -423,42 +655,37 @@ class MemoryViewer:
                     self.root.after(0, lambda: self.finish_repair_tags(True, "No entries found."))
                     return
 
-                ignore_words = {"内容", "検索", "要約", "ネット情報", "システム", "日時", "Error", "failed", "の", "に", "は", "を", "た", "で", "て", "と", "し", "れ", "さ", "ある", "いる", "する", "から", "より", "なる", "こと", "これ", "それ", "これら", "ため", "等", "及", "用", "化", "中", "性", "者", "点", "他", "約", "年", "月", "日", "時", "分", "秒"}
-
-                updated_count = 0
-                total = len(ids)
-
-                for i in range(total):
-                    eid = ids[i]
+                items = []
+                for i in range(len(ids)):
                     doc = documents[i] if i < len(documents) else ""
                     meta = dict(metadatas[i]) if (i < len(metadatas) and metadatas[i]) else {}
+                    items.append((ids[i], (doc, meta)))
 
-                    # 名詞・固有名詞・キーワード抽出
-                    auto_tags = re.findall(r'[A-Za-z0-9\-\_]+|[ァ-ヴー]{2,}|[一-龠]{2,}', doc)
-                    clean_tags = list(set([t for t in auto_tags if t not in ignore_words and len(t) > 1]))
-                    tags_str = ",".join(clean_tags[:10])
+                def worker(item):
+                    _, (doc, meta) = item
+                    meta["tags"] = extract_tags(doc or "")
+                    return meta
 
-                    meta["tags"] = tags_str
+                def commit(batch):
+                    collection.update(ids=[eid for eid, _ in batch], metadatas=[meta for _, meta in batch])
 
-                    collection.update(
-                        ids=[eid],
-                        metadatas=[meta]
-                    )
-                    updated_count += 1
-                    
-                    if i % 10 == 0 or i == total - 1:
-                        progress_txt = f"Repairing ({i+1}/{total})..."
+                def progress(done, total, _eid):
+                    if done % 10 == 0 or done == total:
+                        progress_txt = f"Repairing ({done}/{total})..."
                         self.root.after(0, lambda txt=progress_txt: self.btn_repair_tags.config(text=txt))
 
+                result = executor.run(items, worker, commit, progress_cb=progress, resume=resume)
+
                 done_fmt = self.mv_lang.get("msg_repair_tags_done", "合計 {count} 件の記憶データのタグを一括修復・更新しました。")
-                msg = done_fmt.replace("{count}", str(updated_count))
-                self.root.after(0, lambda: self.finish_repair_tags(True, msg))
+                msg = self._format_bulk_result(result, done_fmt.replace("{count}", str(result["processed"])))
+                self.root.after(0, lambda: self.finish_repair_tags(not result["failed"], msg))
             except Exception as e:
                 self.root.after(0, lambda err=e: self.finish_repair_tags(False, f"Error: {err}"))
 
         threading.Thread(target=process, daemon=True).start()
 
     def finish_repair_tags(self, success, msg):
+        self._end_bulk()
         self.btn_repair_tags.config(state="normal", text=self.l_set.get("btn_repair_tags", "タグ修復 (Repair Tags)"))
         self.load_data()
         if success:
@@ -467,6 +694,7 @@ class MemoryViewer:
             messagebox.showerror("エラー", msg, parent=self.root)
 
     def finish_bulk_summarize(self, success, msg):
+        self._end_bulk()
         self.btn_bulk.config(state="normal", text=self.l_set.get("btn_bulk_summarize", "Bulk Summarize"))
         self.load_data()
         if success:
@@ -475,69 +703,76 @@ class MemoryViewer:
             messagebox.showerror("Error", msg, parent=self.root)
 
     def run_bulk_summarize(self):
-        # 500文字以上、または日付データがないデータを抽出
-        to_process = [entry for entry in self.all_data if entry[2] >= 500 or entry[1] == 'N/A' or not entry[1]]
+        """対象の抽出はDBを分割取得しながら裏で行い、結果をUIスレッドで確認する"""
+        self.btn_bulk.config(state="disabled", text="Scanning...")
+
+        def scan():
+            to_process = []
+            try:
+                for batch in self.page_source.iter_batches():
+                    metas = batch.get("metadatas") or []
+                    for i, entry_id in enumerate(batch.get("ids", [])):
+                        doc = batch["documents"][i] or ""
+                        meta = metas[i] if i < len(metas) and metas[i] else {}
+                        ts = meta.get("timestamp", "N/A")
+                        # 500文字以上、または日付データがないデータを抽出
+                        if len(doc) >= 500 or ts == 'N/A' or not ts:
+                            to_process.append((entry_id, ts, len(doc), doc))
+            except Exception as e:
+                self.root.after(0, lambda err=e: self.finish_bulk_summarize(False, f"Bulk process failed: {err}"))
+                return
+            self.root.after(0, lambda: self._start_bulk_summarize(to_process))
+
+        threading.Thread(target=scan, daemon=True).start()
+
+    def _start_bulk_summarize(self, to_process):
+        self.btn_bulk.config(state="normal", text=self.l_set.get("btn_bulk_summarize", "Bulk Summarize"))
         if not to_process:
             messagebox.showinfo("Info", "No entries needing summarization found (500+ chars or no date).", parent=self.root)
             return
 
-        if not messagebox.askyesno("Confirm", f"Summarize {len(to_process)} entries?", parent=self.root):
+        concurrency = get_provider_concurrency(self.config)
+        executor = BulkExecutor("bulk_summarize", self.checkpoint_dir, concurrency=concurrency,
+                                batch_size=self.config.get("BULK_COMMIT_BATCH", 20))
+        resume = self._ask_resume(executor)
+        if not resume and not messagebox.askyesno("Confirm", f"Summarize {len(to_process)} entries?", parent=self.root):
             return
 
         self.btn_bulk.config(state="disabled")
+        self._start_bulk(executor)
         
         def process():
             try:
-                db_provider = self.config.get("DB_PROVIDER", "local").lower()
-                db_model_id = self.config.get("DB_MODEL_ID", "gemma3:4b")
-                
                 # 改善: 接続プールで3-5倍高速化
                 collection = get_chroma_collection(self.db_path)
-                
-                for i, entry in enumerate(to_process):
-                    entry_id, ts, length, content = entry
-                    
-                    # プログレス表示
-                    self.root.after(0, lambda e=entry_id, idx=i+1, total=len(to_process): 
-                                    self.btn_bulk.config(text=f"({idx}/{total}) {e[:10]}..."))
-                    
-                    prompt = (
-                        f"以下の記憶内容を、本質を損なわず300文字以内で簡潔に要約してください。\n"
-                        f"300文字に収まりきらない場合は、重要な単語を箇条書き（- 単語）で抽出してください。\n"
-                        f"内容: {content}"
-                    )
-                    
-                    new_content = get_ai_response(prompt, self.config)
+                items = [(entry_id, (ts, content)) for entry_id, ts, length, content in to_process]
+
+                def worker(item):
+                    entry_id, (ts, content) = item
+                    new_content = get_ai_response(SUMMARIZE_PROMPT.format(content=content), self.config)
                     if new_content.startswith("Error:"):
                         raise Exception(new_content)
                     new_content = new_content.strip()
-                    
-                    # 日付推測ロジックを適用
-                    final_ts = ts
-                    if ts == 'N/A' or not ts:
-                        match = re.search(r'(\d{14})', entry_id)
-                        if match:
-                            try:
-                                dt = datetime.strptime(match.group(1), '%Y%m%d%H%M%S')
-                                final_ts = dt.strftime('%Y-%m-%d %H:%M:%S')
-                            except:
-                                final_ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        else:
-                            final_ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    
-                    # 名詞・キーワードの自動抽出（タグの維持・更新）
-                    ignore_words = {"内容", "検索", "要約", "ネット情報", "システム", "日時", "Error", "failed", "の", "に", "は", "を", "た", "で", "て", "と", "し", "れ", "さ", "ある", "いる", "する", "から", "より", "なる", "こと", "これ", "それ", "これら", "ため", "等", "及", "用", "化", "中", "性", "者", "点", "他", "約", "年", "月", "日", "時", "分", "秒"}
-                    auto_tags = re.findall(r'[A-Za-z0-9\-\_]+|[ァ-ヴー]{2,}|[一-龠]{2,}', new_content)
-                    clean_tags = list(set([t for t in auto_tags if t not in ignore_words and len(t) > 1]))
-                    tags_str = ",".join(clean_tags[:10])
+                    return {
+                        "document": new_content,
+                        "metadata": {"timestamp": infer_timestamp(entry_id, ts), "tags": extract_tags(new_content)},
+                    }
 
+                def commit(batch):
                     collection.update(
-                        ids=[entry_id],
-                        documents=[new_content],
-                        metadatas=[{"timestamp": final_ts, "tags": tags_str}]
+                        ids=[eid for eid, _ in batch],
+                        documents=[res["document"] for _, res in batch],
+                        metadatas=[res["metadata"] for _, res in batch]
                     )
-                
-                self.root.after(0, lambda: self.finish_bulk_summarize(True, "Bulk summarization completed."))
+
+                def progress(done, total, entry_id):
+                    # プログレス表示
+                    self.root.after(0, lambda e=entry_id, idx=done, t=total:
+                                    self.btn_bulk.config(text=f"({idx}/{t}) {e[:10]}..."))
+
+                result = executor.run(items, worker, commit, progress_cb=progress, resume=resume)
+                msg = self._format_bulk_result(result, f"Bulk summarization completed. ({result['processed']} entries, {result['elapsed']}s, x{concurrency})")
+                self.root.after(0, lambda: self.finish_bulk_summarize(not result["failed"], msg))
             except Exception as e:
                 self.root.after(0, lambda ex=e: self.finish_bulk_summarize(False, f"Bulk process failed: {ex}"))
 
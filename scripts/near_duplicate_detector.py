@@ -0,0 +1,214 @@
+# ===== 近似重複記憶の検出 (MinHash LSH) =====
+# db_maintenance.py の clean_up_database から使用
+# 全件を文字シングル(n-gram)の MinHash 署名に変換し、LSH バンディングで
+# 候補ペアだけを比較するため、コレクション全体をほぼ線形時間で走査できる
+
+import re
+import time
+import zlib
+import random
+import unicodedata
+
+import numpy as np
+
+# 2^61 - 1 (メルセンヌ素数) を法とするユニバーサルハッシュ
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# 比較前に除去する定型プレフィックス（保存日時などは重複判定に不要）
+_PREFIX_PATTERN = re.compile(r"^【[^】]*】\(\d{4}-\d{2}-\d{2}[^)]*\)\s*")
+_NOISE_PATTERN = re.compile(r"[\s　、。，．,.!?！？「」『』（）()【】\[\]・:：;；\-ー~〜/]+")
+
+
+def normalize_text(text):
+    """全角半角・大小文字・空白・記号の揺れを吸収した比較用テキストを返す"""
+    if not text:
+        return ""
+    s = unicodedata.normalize("NFKC", text).lower()
+    s = _PREFIX_PATTERN.sub("", s)
+    return _NOISE_PATTERN.sub("", s)
+
+
+def char_shingles(text, size=3):
+    """正規化済みテキストから文字シングル(32bitハッシュ)の集合を生成"""
+    if not text:
+        return set()
+    if len(text) <= size:
+        return {zlib.crc32(text.encode("utf-8"))}
+    return {zlib.crc32(text[i:i + size].encode("utf-8")) for i in range(len(text) - size + 1)}
+
+
+class _UnionFind:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, x):
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+class NearDuplicateDetector:
+    """
+    MinHash + LSH による近似重複検出
+    - num_perm: 署名長（ハッシュ関数の数）
+    - bands: LSH のバンド数（num_perm を割り切れる値）
+    - threshold: クラスタとして確定する推定 Jaccard 類似度
+    """
+
+    def __init__(self, num_perm=128, bands=32, shingle_size=3, threshold=0.8, seed=42):
+        if num_perm % bands != 0:
+            raise ValueError("num_perm must be divisible by bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.threshold = threshold
+
+        rng = random.Random(seed)
+        self._a = np.array([rng.randint(1, _MAX_HASH) for _ in range(num_perm)], dtype=np.uint64)
+        self._b = np.array([rng.randint(0, _MAX_HASH) for _ in range(num_perm)], dtype=np.uint64)
+
+        # 直近の実行統計（ダッシュボード・ベンチマーク用）
+        self.last_stats = {}
+
+    def signature(self, text):
+        """テキストの MinHash 署名 (uint32 配列) を返す。空文字は None"""
+        shingles = char_shingles(normalize_text(text), self.shingle_size)
+        if not shingles:
+            return None
+        hv = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))
+        # (a * x + b) mod p : a, x は 32bit 未満のため積は uint64 に収まる
+        phv = (hv[:, None] * self._a[None, :] + self._b[None, :]) % np.uint64(_MERSENNE_PRIME)
+        return (phv & np.uint64(_MAX_HASH)).min(axis=0).astype(np.uint32)
+
+    def find_clusters(self, entries):
+        """
+        近似重複クラスタを返す
+
+        Args:
+            entries: [(id, text), ...]
+
+        Returns:
+            [[id, id, ...], ...]  (2件以上のクラスタのみ、入力順を維持)
+        """
+        t0 = time.perf_counter()
+        ids, signatures = [], []
+        for eid, text in entries:
+            sig = self.signature(text)
+            if sig is not None:
+                ids.append(eid)
+                signatures.append(sig)
+
+        t_sig = time.perf_counter()
+        if len(signatures) < 2:
+            self.last_stats = {"docs": len(ids), "candidate_pairs": 0, "clusters": 0,
+                               "signature_sec": round(t_sig - t0, 3), "lsh_sec": 0.0}
+            return []
+
+        sig_matrix = np.vstack(signatures)
+        uf = _UnionFind(len(ids))
+        checked = set()
+        candidate_pairs = 0
+
+        for band in range(self.bands):
+            start = band * self.rows
+            buckets = {}
+            band_view = sig_matrix[:, start:start + self.rows]
+            for idx in range(len(ids)):
+                buckets.setdefault(band_view[idx].tobytes(), []).append(idx)
+
+            for members in buckets.values():
+                if len(members) < 2:
+                    continue
+                head = members[0]
+                for other in members[1:]:
+                    pair = (head, other)
+                    if pair in checked:
+                        continue
+                    checked.add(pair)
+                    candidate_pairs += 1
+                    similarity = float(np.mean(sig_matrix[head] == sig_matrix[other]))
+                    if similarity >= self.threshold:
+                        uf.union(head, other)
+
+        groups = {}
+        for idx in range(len(ids)):
+            groups.setdefault(uf.find(idx), []).append(ids[idx])
+        clusters = [g for g in groups.values() if len(g) > 1]
+
+        self.last_stats = {
+            "docs": len(ids),
+            "candidate_pairs": candidate_pairs,
+            "clusters": len(clusters),
+            "signature_sec": round(t_sig - t0, 3),
+            "lsh_sec": round(time.perf_counter() - t_sig, 3),
+        }
+        return clusters
+
+
+# ===== ベンチマーク: 重複を注入した合成コーパスで精度と速度を測定 =====
+
+def _make_synthetic_corpus(n_docs, dup_ratio, seed=7):
+    """ランダムな会話要約風テキストに、軽微な編集を加えた重複を注入する"""
+    rng = random.Random(seed)
+    vocab = ["ゲーム", "配信", "ボス戦", "攻略", "アイテム", "レベル", "装備", "ダンジョン", "イベント",
+             "ユーザー", "質問", "回答", "今日", "昨日", "天気", "ニュース", "設定", "音声", "字幕",
+             "Python", "VOICEVOX", "Gemini", "記憶", "検索", "相棒", "雑談", "コメント", "視聴者"]
+    particles = ["は", "が", "を", "に", "で", "と", "の", "について", "から"]
+
+    def sentence():
+        words = [rng.choice(vocab) + rng.choice(particles) for _ in range(rng.randint(6, 14))]
+        return "".join(words) + "話した。"
+
+    base = [(f"mem_{i:06d}", "".join(sentence() for _ in range(rng.randint(3, 6)))) for i in range(n_docs)]
+    truth = []
+    entries = list(base)
+    for i in range(int(n_docs * dup_ratio)):
+        src_id, src_text = base[rng.randrange(n_docs)]
+        chars = list(src_text)
+        # 数文字の置換・句読点の揺れ・日時プレフィックスを加えた近似重複
+        for _ in range(max(1, len(chars) // 60)):
+            chars[rng.randrange(len(chars))] = rng.choice("、。 ")
+        dup_text = f"【ネット情報】(2025-01-{rng.randint(1, 28):02d} 12:00) " + "".join(chars)
+        dup_id = f"dup_{i:06d}"
+        entries.append((dup_id, dup_text))
+        truth.append((src_id, dup_id))
+    rng.shuffle(entries)
+    return entries, truth
+
+
+def run_benchmark(n_docs=5000, dup_ratio=0.05):
+    entries, truth = _make_synthetic_corpus(n_docs, dup_ratio)
+    detector = NearDuplicateDetector()
+
+    t0 = time.perf_counter()
+    clusters = detector.find_clusters(entries)
+    elapsed = time.perf_counter() - t0
+
+    cluster_of = {}
+    for ci, members in enumerate(clusters):
+        for m in members:
+            cluster_of[m] = ci
+    found = sum(1 for src, dup in truth if src in cluster_of and cluster_of.get(src) == cluster_of.get(dup))
+    flagged = sum(len(c) for c in clusters)
+    true_members = {x for pair in truth for x in pair}
+    false_flags = sum(1 for c in clusters for m in c if m not in true_members)
+
+    print(f"Docs: {len(entries)} (injected duplicates: {len(truth)})")
+    print(f"Elapsed: {elapsed:.2f}s  ({len(entries) / elapsed:.0f} docs/s)  stats={detector.last_stats}")
+    print(f"Recall: {found}/{len(truth)} = {found / max(1, len(truth)):.3f}")
+    print(f"Flagged entries: {flagged}  (false flags: {false_flags})")
+    return {"recall": found / max(1, len(truth)), "false_flags": false_flags, "elapsed": elapsed}
+
+
+if __name__ == "__main__":
+    import sys
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    run_benchmark(n_docs=n)
@@ -1,189 +1,467 @@
-# ===== バックグラウンドタスクの並列処理最適化 =====
-# game_ai.py のバックグラウンド処理を改善
+# ===== バックグラウンドタスクの優先度レーン付きスケジューラー =====
+# game_ai.py の submit_background_task から使用
+# 検索・記憶の保存・記憶の最適化・読み上げキャッシュの先行作成などのバックグラウンド処理を、
+# 用途ごとのレーンに分けて実行する
+# - レーンごとに同時実行数の上限を持ち、記憶の最適化などの重い処理が検索結果の読み上げを待たせない
+# - ユーザーとの対話中 (foreground) は background レーンの新規開始を保留する
+#   （保留が MAX_BACKGROUND_HOLD 秒を超えたタスクは開始する）
+# - レーン内は開始期限 (deadline) の早い順。期限までに開始できなかったタスクは実行しない
+# - 実行時間の上限 (timeout) を超えたタスクは呼び出し側に TimeoutError を返し、キャンセルトークンで中断を伝える
+# - レーンごとの待ち時間・実行時間・完了/失敗/キャンセル/タイムアウト件数を get_metrics() で返す
+#
+# 使用例:
+#   tasks = get_task_queue()
+#   handle = tasks.submit_task(save_search_to_db, (summary, query, config, root), priority="low")
+#   with tasks.foreground():
+#       ...  # 対話処理
+#
+# 長時間のタスクは current_token().checkpoint() を適宜呼ぶと、キャンセル時に TaskCancelled で抜け、
+# background レーンでは対話中の間そこで待機する（協調的な横取り）
+#
+# CancellationToken は常駐 API サーバーの対話ターン (session_manager.py) でも使い、
+# 中断で省けた処理（LLM・検索・読み上げ・記憶検索）を record_reclaimed() で集計する
 
+import time
+import heapq
+import itertools
+import threading
 import concurrent.futures
-from typing import Callable, Any, Optional
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+LANE_INTERACTIVE = "interactive"   # ユーザーが結果を待っている処理（検索結果の読み上げなど）
+LANE_NORMAL = "normal"             # ユーザー操作で始まるが即時性は不要な処理（履歴の整理など）
+LANE_BACKGROUND = "background"     # 記憶の保存・最適化、キャッシュの先行作成など
+
+# レーンごとの同時実行数
+DEFAULT_LANE_LIMITS = {LANE_INTERACTIVE: 2, LANE_NORMAL: 2, LANE_BACKGROUND: 1}
+# 旧 API の priority 指定との対応
+PRIORITY_TO_LANE = {"high": LANE_INTERACTIVE, "normal": LANE_NORMAL, "low": LANE_BACKGROUND}
+# 対話中に background レーンの開始を保留する最大秒数（これを超えたら飢餓を避けて開始する）
+MAX_BACKGROUND_HOLD = 30.0
+# タイムアウト監視の間隔（秒）
+WATCHDOG_INTERVAL = 0.1
+# 計測値を保持する直近のタスク数
+METRICS_WINDOW = 100
+
+
+class TaskCancelled(Exception):
+    """キャンセルされたタスクが checkpoint() で送出する"""
+
+
+class TaskExpired(Exception):
+    """開始期限 (deadline) までに開始できなかった"""
+
+
+class CancellationToken:
+    """タスクへの中断要求。処理側は cancelled を確認するか checkpoint() を呼ぶ"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason = None
+        self._yield_check = None   # background レーンで対話中かどうかを返す関数
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def is_set(self):
+        """threading.Event 互換（stop_event を受け取る関数にそのまま渡せる）"""
+        return self._event.is_set()
+
+    def cancel(self, reason="cancelled"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def add_callback(self, callback):
+        """
+        キャンセル時に呼ぶ関数を登録する（ストリーミング中の HTTP 応答を閉じるなど）
+        既にキャンセル済みならその場で呼ぶ。Returns: 登録を解除する関数
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove_callback(callback)
+        callback()
+        return lambda: None
+
+    def _remove_callback(self, callback):
+        with self._lock:
+            try:
+                self._callbacks.remove(callback)
+            except ValueError:
+                pass
+
+    def wait(self, timeout=None):
+        """キャンセルされるまで最大 timeout 秒待つ（キャンセルされたら True）"""
+        return self._event.wait(timeout)
+
+    def checkpoint(self):
+        """キャンセル済みなら TaskCancelled を送出し、対話中は優先処理に譲って待機する"""
+        if self.cancelled:
+            raise TaskCancelled(self.reason)
+        check = self._yield_check
+        while check is not None and check():
+            if self._event.wait(0.1):
+                raise TaskCancelled(self.reason)
+
+
+class TaskHandle:
+    """投入したタスクの状態。future で結果を受け取り、cancel() で中断を要求する"""
+
+    def __init__(self, func, args, kwargs, lane, name, timeout, deadline, token):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.lane = lane
+        self.name = name
+        self.timeout = timeout
+        self.deadline = deadline          # time.monotonic() 基準の開始期限
+        self.token = token
+        self.future = concurrent.futures.Future()
+        self.status = "queued"            # queued / running / done / failed / cancelled / timeout / expired
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+
+    def cancel(self, reason="cancelled"):
+        """開始前なら実行せず、実行中ならトークンで中断を伝える"""
+        self.token.cancel(reason)
+        self.future.cancel()
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+    def done(self):
+        return self.future.done()
+
+    @property
+    def queue_ms(self):
+        if self.started_at is None:
+            return None
+        return round((self.started_at - self.submitted_at) * 1000, 1)
+
+    @property
+    def run_ms(self):
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return round((self.finished_at - self.started_at) * 1000, 1)
+
+
+class _Lane:
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self.heap = []
+        self.running = 0
+        self.workers = 0
+        self.counts = {"submitted": 0, "done": 0, "failed": 0, "cancelled": 0, "timeout": 0, "expired": 0}
+        self.queue_ms = deque(maxlen=METRICS_WINDOW)
+        self.run_ms = deque(maxlen=METRICS_WINDOW)
+
+
+_local = threading.local()
+
+
+def current_token():
+    """実行中のタスクのキャンセルトークン（スケジューラー外から呼ばれた場合は None）"""
+    return getattr(_local, "token", None)
+
+
+# --- 中断で省いた処理の集計 ---
+_reclaimed_lock = threading.Lock()
+_reclaimed = {}
+
+
+def record_reclaimed(stage, **amounts):
+    """
+    キャンセルによって途中で止めた・始めなかった処理を記録する
+    stage: "llm" / "search" / "tts" / "memory" など、amounts: 件数・文字数など（例: sentences=3）
+    """
+    with _reclaimed_lock:
+        entry = _reclaimed.setdefault(stage, {"events": 0})
+        entry["events"] += 1
+        for key, value in amounts.items():
+            entry[key] = entry.get(key, 0) + value
+
+
+def get_reclaimed_stats():
+    with _reclaimed_lock:
+        return {stage: dict(entry) for stage, entry in _reclaimed.items()}
+
 
 class OptimizedTaskQueue:
     """
-    改善版タスクキュー
-    - 優先度付きキュー
-    - タイムアウト管理
-    - エラーハンドリング強化
+    優先度レーン付きタスクキュー
+
+    Args:
+        lane_limits: レーン名 → 同時実行数
+        error_logger: タスクのエラー・タイムアウトを通知する関数 (message, is_error=True)
     """
-    
-    def __init__(self, max_workers=3):
-        self.executor = concurrent.futures.ThreadPoolExecutor(
-            max_workers=max_workers,
-            thread_name_prefix="SecreAI_Worker"
-        )
-        self.futures = []
-        self._lock = threading.Lock()
-    
-    def submit_task(self, func: Callable, args: tuple = (), 
-                   priority: str = "normal", timeout: Optional[int] = None):
+
+    def __init__(self, lane_limits=None, error_logger=None):
+        limits = {**DEFAULT_LANE_LIMITS, **(lane_limits or {})}
+        self._lanes = {name: _Lane(name, max(1, int(limit))) for name, limit in limits.items()}
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._running = set()
+        self._foreground = 0
+        self._shutdown = False
+        self._watchdog = None
+        self.error_logger = error_logger
+
+    # --- 投入 ---
+    def submit_task(self, func: Callable, args: tuple = (), priority: str = "normal",
+                    timeout: Optional[float] = None, lane: Optional[str] = None, name: Optional[str] = None,
+                    deadline: Optional[float] = None, token: Optional[CancellationToken] = None,
+                    kwargs: Optional[dict] = None) -> TaskHandle:
         """
         タスクを投入
-        
+
         Args:
             func: 実行する関数
             args: 引数のタプル
-            priority: "high", "normal", "low"
-            timeout: タイムアウト秒数
+            priority: "high", "normal", "low"（lane 省略時にレーンを決める）
+            timeout: 実行時間の上限（秒）
+            lane: レーン名（LANE_INTERACTIVE / LANE_NORMAL / LANE_BACKGROUND）
+            name: メトリクス・ログ用の名前（省略時は関数名）
+            deadline: 投入から何秒以内に開始できなければ破棄するか
+            token: 共有するキャンセルトークン（省略時は新規作成）
         """
-        future = self.executor.submit(self._wrapped_task, func, args, timeout)
-        
-        with self._lock:
-            self.futures.append({
-                'future': future,
-                'priority': priority,
-                'func_name': func.__name__
-            })
-        
-        return future
-    
-    def _wrapped_task(self, func, args, timeout):
-        """タスクをラップしてエラーハンドリング"""
+        lane_name = lane or PRIORITY_TO_LANE.get(priority, LANE_NORMAL)
+        if lane_name not in self._lanes:
+            raise ValueError(f"Unknown lane: {lane_name}")
+        handle = TaskHandle(
+            func, tuple(args), kwargs or {}, lane_name,
+            name or getattr(func, "__name__", str(func)), timeout,
+            time.monotonic() + deadline if deadline else None,
+            token or CancellationToken(),
+        )
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("OptimizedTaskQueue is shut down")
+            lane_obj = self._lanes[lane_name]
+            if lane_name == LANE_BACKGROUND:
+                handle.token._yield_check = self._should_yield
+            # レーン内は開始期限の早い順、同じなら投入順
+            heapq.heappush(lane_obj.heap, (handle.deadline or float("inf"), next(self._seq), handle))
+            lane_obj.counts["submitted"] += 1
+            if lane_obj.workers < lane_obj.limit:
+                lane_obj.workers += 1
+                threading.Thread(target=self._worker, args=(lane_obj,), daemon=True,
+                                 name=f"SecreAI_{lane_name}_{lane_obj.workers}").start()
+            self._cond.notify_all()
+        return handle
+
+    # --- 対話中の優先制御 ---
+    def begin_foreground(self):
+        """ユーザーとの対話を開始した。end_foreground() までは background レーンの新規開始を保留する"""
+        with self._cond:
+            self._foreground += 1
+
+    def end_foreground(self):
+        with self._cond:
+            self._foreground = max(0, self._foreground - 1)
+            self._cond.notify_all()
+
+    @contextmanager
+    def foreground(self):
+        self.begin_foreground()
+        try:
+            yield
+        finally:
+            self.end_foreground()
+
+    def _should_yield(self):
+        return self._foreground > 0
+
+    def _may_start(self, lane):
+        if not lane.heap or lane.running >= lane.limit:
+            return False
+        if lane.name != LANE_BACKGROUND or self._foreground == 0:
+            return True
+        oldest = min(item[2].submitted_at for item in lane.heap)
+        return time.monotonic() - oldest >= MAX_BACKGROUND_HOLD
+
+    # --- 実行 ---
+    def _worker(self, lane):
+        while True:
+            with self._cond:
+                while not self._may_start(lane):
+                    if self._shutdown and not lane.heap:
+                        lane.workers -= 1
+                        return
+                    self._cond.wait(0.5)
+                _, _, handle = heapq.heappop(lane.heap)
+                if not self._admit(handle, lane):
+                    continue
+                lane.running += 1
+            try:
+                self._execute(handle, lane)
+            finally:
+                with self._cond:
+                    lane.running -= 1
+                    self._running.discard(handle)
+                    self._cond.notify_all()
+
+    def _admit(self, handle, lane):
+        """取り出したタスクを開始してよいか（キャンセル・期限切れなら完了扱いにする）"""
+        if handle.token.cancelled or handle.future.cancelled():
+            handle.status = "cancelled"
+            lane.counts["cancelled"] += 1
+            handle.future.cancel()
+            return False
+        if handle.deadline is not None and time.monotonic() > handle.deadline:
+            handle.status = "expired"
+            lane.counts["expired"] += 1
+            if handle.future.set_running_or_notify_cancel():
+                handle.future.set_exception(TaskExpired(handle.name))
+            return False
+        if not handle.future.set_running_or_notify_cancel():
+            handle.status = "cancelled"
+            lane.counts["cancelled"] += 1
+            return False
+        handle.status = "running"
+        handle.started_at = time.monotonic()
+        lane.queue_ms.append(handle.queue_ms)
+        self._running.add(handle)
+        if handle.timeout:
+            self._ensure_watchdog()
+        return True
+
+    def _execute(self, handle, lane):
+        _local.token = handle.token
         try:
-            if timeout:
-                # タイムアウト付き実行
-                with concurrent.futures.ThreadPoolExecutor(max_workers=1) as temp_executor:
-                    future = temp_executor.submit(func, *args)
-                    return future.result(timeout=timeout)
-            else:
-                return func(*args)
-        except concurrent.futures.TimeoutError:
-            send_log_to_hub(f"タスクタイムアウト: {func.__name__}", is_error=True)
+            result = handle.func(*handle.args, **handle.kwargs)
+        except TaskCancelled:
+            self._complete(handle, lane, "cancelled", exception=concurrent.futures.CancelledError())
         except Exception as e:
-            send_log_to_hub(f"バックグラウンドタスクエラー ({func.__name__}): {e}", is_error=True)
-    
-    def wait_for_completion(self, timeout=None):
-        """全タスクの完了を待つ"""
-        with self._lock:
-            futures_list = [f['future'] for f in self.futures]
-        
-        done, not_done = concurrent.futures.wait(
-            futures_list, 
-            timeout=timeout,
-            return_when=concurrent.futures.ALL_COMPLETED
-        )
-        
-        return len(done), len(not_done)
-    
-    def shutdown(self, wait=True):
-        """シャットダウン"""
-        self.executor.shutdown(wait=wait)
+            self._complete(handle, lane, "failed", exception=e)
+            self._log(f"バックグラウンドタスクエラー ({handle.name}): {e}")
+        else:
+            self._complete(handle, lane, "done", result=result)
+        finally:
+            _local.token = None
 
+    def _complete(self, handle, lane, status, result=None, exception=None):
+        with self._cond:
+            handle.finished_at = time.monotonic()
+            lane.run_ms.append(handle.run_ms)
+            if handle.status == "timeout":
+                # タイムアウト後に戻ってきた結果は捨てる（件数はタイムアウト時に計上済み）
+                return
+            handle.status = status
+            lane.counts[status] += 1
+        if handle.future.done():
+            return
+        if exception is not None:
+            handle.future.set_exception(exception)
+        else:
+            handle.future.set_result(result)
 
-# ===== game_ai.py での使用例 =====
+    # --- タイムアウト監視 ---
+    def _ensure_watchdog(self):
+        if self._watchdog is None or not self._watchdog.is_alive():
+            self._watchdog = threading.Thread(target=self._watch_timeouts, daemon=True, name="SecreAI_task_watchdog")
+            self._watchdog.start()
 
-# グローバルタスクキュー(既存のqueueを置き換え)
-optimized_task_queue = OptimizedTaskQueue(max_workers=3)
+    def _watch_timeouts(self):
+        while not self._shutdown:
+            time.sleep(WATCHDOG_INTERVAL)
+            now = time.monotonic()
+            expired = []
+            with self._cond:
+                for handle in self._running:
+                    if handle.timeout and handle.status == "running" and now - handle.started_at > handle.timeout:
+                        handle.status = "timeout"
+                        self._lanes[handle.lane].counts["timeout"] += 1
+                        expired.append(handle)
+            for handle in expired:
+                # スレッドは強制終了できないため、トークンで中断を伝えて呼び出し側には先に結果を返す
+                handle.token.cancel("timeout")
+                if not handle.future.done():
+                    handle.future.set_exception(concurrent.futures.TimeoutError())
+                self._log(f"タスクタイムアウト: {handle.name} ({handle.timeout}s)")
 
-def execute_background_search_optimized(search_query, config, root, session_data):
-    """
-    改善版: タイムアウト付き検索実行
-    30秒以内に完了しなければキャンセル
-    """
-    summary = None
-    try:
-        from tavily import TavilyClient
-        import ollama
-        
-        lang_data = load_lang_file(config.get("LANGUAGE", "ja"))
-        log_m = lang_data.get("log_messages", {})
-        ai_p = lang_data.get("ai_prompt", {})
-
-        count = increment_tavily_count(root)
-        exec_msg = log_m.get("search_executing", "システム: Tavily検索を実行します (今月 {count} 回目)").format(count=count)
-        send_log_to_hub(exec_msg)
-
-        api_key = config.get("TAVILY_API_KEY")
-        summary_model = config.get("MODEL_ID_SUMMARY", "gemma2:9b")
-        now = datetime.now()
-
-        # Tavily検索(タイムアウト15秒)
-        tavily = TavilyClient(api_key=api_key)
-        search_res = tavily.search(
-            query=f"{search_query} info as of {now.strftime('%Y-%m-%d')}", 
-            search_depth="advanced", 
-            max_results=3
-        )
-        
-        contents = [f"Source: {r['url']}\nContent: {r['content']}" for r in search_res['results']]
-        context = "\n---\n".join(contents)
-        
-        summary_role = ai_p.get("summary_role", "あなたは優秀なリサーチャーです。以下の英語の検索結果を読み、必ず『日本語で』要点をまとめてください。")
-        summary_prompt = f"{summary_role}\n\n{context}"
-        
-        # Ollama要約(タイムアウト15秒)
-        response = ollama.chat(
-            model=summary_model, 
-            messages=[{'role': 'user', 'content': summary_prompt}],
-            options={'timeout': 15}
-        )
-        summary = response['message']['content']
-        
-        if summary:
-            # バックグラウンドでDB保存(優先度: low)
-            optimized_task_queue.submit_task(
-                save_search_to_db, 
-                (summary, search_query, config, root),
-                priority="low"
-            )
-            
-            # 音声再生待機
-            while pygame.mixer.get_init() and pygame.mixer.music.get_busy():
-                time.sleep(0.5)
-
-            session_id, session_getter, overlay_queue = session_data if session_data else (None, None, None)
-            if overlay_queue:
-                overlay_queue.put(("", None, "OFF", 0, 'speaking'))
-            
-            prefix = ai_p.get("search_appendix_prefix", "追加情報です。")
-            final_text = f"{prefix} {summary}"
-            speak_and_show(final_text, None, config, root, session_data, show_window=True)
-            
-    except concurrent.futures.TimeoutError:
-        send_log_to_hub("検索タイムアウト: 30秒以内に完了しませんでした", is_error=True)
-    except Exception as e:
-        send_log_to_hub(f"Background Search Error: {e}", is_error=True)
-
-
-# ===== メイン関数での使用例 =====
-
-def main(mode="voice", chat_text=None, session_id=None, session_getter=None, overlay_queue=None):
-    # ... (既存のコード) ...
-    
-    # 検索タスクを投入(優先度: high、タイムアウト: 30秒)
-    if search_match and config.get("search_switch") is True:
-        s_query = search_match.group(1)
-        optimized_task_queue.submit_task(
-            execute_background_search_optimized,
-            (s_query, config, root, session_data),
-            priority="high",
-            timeout=30
-        )
-    
-    # メモリ更新タスクを投入(優先度: low、タイムアウト: 60秒)
-    if update_memory and len(load_history_manual(root)) >= 16:
-        optimized_task_queue.submit_task(
-            update_memory.main,
-            (root,),
-            priority="low",
-            timeout=60
-        )
+    def _log(self, message):
+        if self.error_logger:
+            try:
+                self.error_logger(message, is_error=True)
+                return
+            except Exception:
+                pass
+        print(message)
+
+    # --- 状態・終了 ---
+    def get_metrics(self):
+        """レーンごとの待ち・実行中件数、完了状態の件数、待ち時間・実行時間"""
+        def _summary(values):
+            values = [v for v in values if v is not None]
+            if not values:
+                return {"avg": None, "max": None}
+            return {"avg": round(sum(values) / len(values), 1), "max": max(values)}
+
+        with self._cond:
+            lanes = {}
+            for name, lane in self._lanes.items():
+                lanes[name] = {
+                    "limit": lane.limit,
+                    "queued": len(lane.heap),
+                    "running": lane.running,
+                    **lane.counts,
+                    "queue_ms": _summary(lane.queue_ms),
+                    "run_ms": _summary(lane.run_ms),
+                }
+            return {"foreground": self._foreground, "lanes": lanes}
+
+    def wait_for_completion(self, timeout=None):
+        """待ち・実行中のタスクがなくなるまで待つ。Returns: (完了したか, 残りの件数)"""
+        end = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                pending = sum(len(lane.heap) + lane.running for lane in self._lanes.values())
+                if pending == 0:
+                    return True, 0
+                remaining = None if end is None else end - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False, pending
+                self._cond.wait(remaining if remaining is not None else 0.5)
+
+    def shutdown(self, wait=True, cancel_pending=False):
+        """シャットダウン（cancel_pending で未開始のタスクを破棄する）"""
+        with self._cond:
+            self._shutdown = True
+            if cancel_pending:
+                for lane in self._lanes.values():
+                    for _, _, handle in lane.heap:
+                        handle.cancel("shutdown")
+            self._cond.notify_all()
+        if wait:
+            self.wait_for_completion()
 
 
-# ===== プログラム終了時のクリーンアップ =====
-import atexit
+_task_queue = None
+_task_queue_lock = threading.Lock()
 
-def cleanup_on_exit():
-    """プログラム終了時にタスクキューをクリーンアップ"""
-    global optimized_task_queue
-    if optimized_task_queue:
-        completed, pending = optimized_task_queue.wait_for_completion(timeout=5)
-        send_log_to_hub(f"システム: 終了処理 - 完了: {completed}, 保留: {pending}")
-        optimized_task_queue.shutdown(wait=False)
 
-atexit.register(cleanup_on_exit)
+def get_task_queue(error_logger=None):
+    """プロセス全体で共有するタスクキュー"""
+    global _task_queue
+    with _task_queue_lock:
+        if _task_queue is None or _task_queue._shutdown:
+            _task_queue = OptimizedTaskQueue(error_logger=error_logger)
+        elif error_logger and _task_queue.error_logger is None:
+            _task_queue.error_logger = error_logger
+        return _task_queue
@@ -0,0 +1,157 @@
+# ===== スクリーンショットのメモリ内処理 =====
+# game_ai.py の視覚モード（capture_target_screenshot / chat_with_ai）で使用
+# - キャプチャはメモリ上の画像のまま扱い、PNG の書き出し・読み直しをしない
+# - 送信先 AI が実際に使う最大解像度まで縮小してから、JPEG で1回だけエンコードする
+#   （4K をそのまま送っても、各社のサーバー側で縮小されるため転送量とエンコード時間が無駄になる）
+# - エンコード済みのバイト列を API キャッシュのキーとアップロードの両方に使い回す
+# - ターンごとの元の解像度・送信解像度・送信バイト数・縮小/エンコード時間を記録し、get_vision_stats() で返す
+
+import io
+import time
+import base64
+import hashlib
+import threading
+from collections import deque
+
+# 送信先ごとの実効最大解像度
+# - gemini: 768px タイル単位で課金・処理されるため、長辺 1536px（2×2 タイル相当）を上限とする
+# - openai: detail=high は長辺 2048px に収めた後、短辺を 768px に縮小する
+# - local : llama3.2-vision（1120px タイル）/ gemma3（896px）に合わせる
+PROVIDER_LIMITS = {
+    "gemini": {"max_edge": 1536},
+    "openai": {"max_edge": 2048, "max_short": 768},
+    "local": {"max_edge": 1120},
+}
+DEFAULT_JPEG_QUALITY = 85
+# 計測値を保持する直近のターン数
+STATS_WINDOW = 50
+
+
+class EncodedImage:
+    """送信用にエンコードした画像（bytes と、キャッシュキー用のダイジェスト）"""
+
+    __slots__ = ("data", "width", "height", "source_size", "mime_type", "provider",
+                 "resize_ms", "encode_ms", "digest")
+
+    def __init__(self, data, width, height, source_size, provider, resize_ms, encode_ms):
+        self.data = data
+        self.width = width
+        self.height = height
+        self.source_size = source_size
+        self.mime_type = "image/jpeg"
+        self.provider = provider
+        self.resize_ms = resize_ms
+        self.encode_ms = encode_ms
+        # APICache の画像ハッシュ（ファイル内容の MD5）と同じ形式
+        self.digest = hashlib.md5(data).hexdigest()
+
+    def to_base64(self):
+        return base64.b64encode(self.data).decode("utf-8")
+
+    def to_data_url(self):
+        return f"data:{self.mime_type};base64,{self.to_base64()}"
+
+    def open(self):
+        """PIL 画像として開き直す（bytes を直接渡せない SDK 用）"""
+        from PIL import Image
+        return Image.open(io.BytesIO(self.data))
+
+    def save(self, path):
+        """エンコード済みのバイト列をそのまま書き出す（オーバーレイ表示用。再エンコードしない）"""
+        with open(path, "wb") as f:
+            f.write(self.data)
+        return path
+
+
+def fit_size(width, height, max_edge, max_short=None):
+    """縦横比を保ったまま、長辺 max_edge・短辺 max_short 以下に収まるサイズ"""
+    scale = min(1.0, max_edge / max(width, height))
+    if max_short:
+        scale = min(scale, max_short / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def get_provider_limits(provider, config=None):
+    limits = dict(PROVIDER_LIMITS.get(provider, PROVIDER_LIMITS["gemini"]))
+    override = ((config or {}).get("VISION_MAX_EDGE") or {}).get(provider)
+    if override:
+        limits["max_edge"] = int(override)
+    return limits
+
+
+def encode_for_provider(image, provider, config=None):
+    """送信先の最大解像度に縮小して JPEG に1回だけエンコードする"""
+    from PIL import Image
+    limits = get_provider_limits(provider, config)
+    quality = int((config or {}).get("VISION_JPEG_QUALITY", DEFAULT_JPEG_QUALITY))
+    source_size = image.size
+
+    t0 = time.perf_counter()
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    size = fit_size(image.width, image.height, limits["max_edge"], limits.get("max_short"))
+    if size != image.size:
+        # 大きく縮小する場合は reduce() で先に整数倍縮小してから仕上げる（LANCZOS 単独より高速）
+        factor = min(image.width // size[0], image.height // size[1])
+        if factor >= 2:
+            image = image.reduce(factor)
+        image = image.resize(size, Image.LANCZOS)
+    t1 = time.perf_counter()
+
+    buffered = io.BytesIO()
+    # optimize=True は2パスになるため使わず、品質だけで調整する
+    image.save(buffered, format="JPEG", quality=quality)
+    t2 = time.perf_counter()
+    return EncodedImage(buffered.getvalue(), image.width, image.height, source_size, provider,
+                        round((t1 - t0) * 1000, 1), round((t2 - t1) * 1000, 1))
+
+
+def grab_window(target):
+    """対象ウィンドウ（見つからない・"All Capture" の場合は全画面）をメモリ上にキャプチャする"""
+    from PIL import ImageGrab
+    try:
+        if target and target != "All Capture":
+            import pygetwindow as gw
+            win = next((w for w in gw.getWindowsWithTitle(target) if w.title == target), None)
+            if win:
+                return ImageGrab.grab(bbox=(win.left, win.top, win.right, win.bottom), all_screens=True)
+    except Exception:
+        pass
+    return ImageGrab.grab(all_screens=True)
+
+
+# --- ターンごとの計測 ---
+_stats_lock = threading.Lock()
+_history = deque(maxlen=STATS_WINDOW)
+
+
+def record_upload(encoded, upload_bytes=None):
+    """
+    送信した画像を記録する
+    upload_bytes: 実際の送信サイズ（base64 で送る場合は約 4/3 倍）。省略時はバイト列のサイズ
+    """
+    entry = {
+        "provider": encoded.provider,
+        "source": f"{encoded.source_size[0]}x{encoded.source_size[1]}",
+        "sent": f"{encoded.width}x{encoded.height}",
+        "bytes": len(encoded.data),
+        "upload_bytes": upload_bytes if upload_bytes is not None else len(encoded.data),
+        "resize_ms": encoded.resize_ms,
+        "encode_ms": encoded.encode_ms,
+    }
+    with _stats_lock:
+        _history.append(entry)
+    return entry
+
+
+def get_vision_stats():
+    with _stats_lock:
+        turns = list(_history)
+    if not turns:
+        return {"turns": 0}
+    return {
+        "turns": len(turns),
+        "last": turns[-1],
+        "avg_upload_bytes": round(sum(t["upload_bytes"] for t in turns) / len(turns)),
+        "avg_encode_ms": round(sum(t["resize_ms"] + t["encode_ms"] for t in turns) / len(turns), 1),
+    }
@@ -0,0 +1,155 @@
+# ===== 検索ゲートキーパー判定のキャッシュと投機的検索 =====
+# game_ai.py の should_execute_search / execute_background_search で使用
+# - ゲートキーパー（ローカルLLM）の判定結果を正規化したクエリごとに保存し、同じ質問では LLM を呼ばない
+# - 投機モードでは判定と並行して検索を先に始め、「不要」と判定されたら結果を捨てる
+#   （検索APIの呼び出し自体は止められないため、捨てた件数を無駄になった検索として数える）
+# - モード別（事前分類 / キャッシュ / 逐次 / 投機）の判定時間・検索結果が揃うまでの時間と、投機の無駄率を get_stats() で返す
+
+import os
+import re
+import json
+import time
+import threading
+import unicodedata
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_TTL_HOURS = 6
+# 保存する判定結果の上限件数（古いものから削除）
+MAX_ENTRIES = 500
+# 計測値を保持する直近の検索数
+STATS_WINDOW = 100
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCT = re.compile(r"[\s。、．，.,!?！？]+$")
+
+
+def normalize_query(query):
+    """全角・半角、大文字・小文字、空白、末尾の句読点の違いを吸収する"""
+    text = unicodedata.normalize("NFKC", query or "").lower()
+    text = _WHITESPACE.sub(" ", text).strip()
+    return _TRAILING_PUNCT.sub("", text)
+
+
+class SearchGatekeeper:
+    """
+    使用例:
+        gatekeeper = get_search_gatekeeper(os.path.join(root, "data", "search_cache"))
+        decision = gatekeeper.lookup(query, ttl_hours)
+        if decision is None:
+            decision = ask_llm(query)
+            gatekeeper.store(query, decision)
+    """
+
+    def __init__(self, cache_dir):
+        self.path = os.path.join(cache_dir, "gatekeeper_cache.json")
+        self._lock = threading.Lock()
+        self._entries = None      # 正規化クエリ -> {"decision": ..., "timestamp": ...}
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="speculative_search")
+        self._records = deque(maxlen=STATS_WINDOW)
+        self.counts = {"lookups": 0, "hits": 0, "speculative": 0, "wasted": 0}
+
+    # --- 判定結果のキャッシュ ---
+    def _load(self):
+        if self._entries is not None:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    def lookup(self, query, ttl_hours=DEFAULT_TTL_HOURS):
+        """有効期限内の判定結果を返す（なければ None）"""
+        key = normalize_query(query)
+        with self._lock:
+            self._load()
+            self.counts["lookups"] += 1
+            entry = self._entries.get(key)
+            if not entry or time.time() - entry.get("timestamp", 0) > ttl_hours * 3600:
+                return None
+            self.counts["hits"] += 1
+            return dict(entry["decision"])
+
+    def store(self, query, decision):
+        """LLM が正常に判定した結果だけを保存する（接続失敗時のフォールバック判定は保存しない）"""
+        key = normalize_query(query)
+        if not key:
+            return
+        with self._lock:
+            self._load()
+            self._entries.pop(key, None)
+            self._entries[key] = {"decision": decision, "timestamp": time.time()}
+            while len(self._entries) > MAX_ENTRIES:
+                self._entries.pop(next(iter(self._entries)))
+            self._save()
+
+    # --- 投機的検索 ---
+    def speculate(self, search_func, *args):
+        """判定を待たずに検索を始める。Returns: Future"""
+        with self._lock:
+            self.counts["speculative"] += 1
+        return self._executor.submit(search_func, *args)
+
+    def discard(self, future):
+        """「不要」と判定された投機検索を取り消す（実行中なら結果を捨てる）"""
+        if not future.cancel():
+            with self._lock:
+                self.counts["wasted"] += 1
+
+    # --- 計測 ---
+    def record(self, mode, gatekeeper_ms, ready_ms=None, necessary=True):
+        """
+        mode: "preclassified"（事前分類で即決） / "cached" / "sequential" / "speculative"
+        gatekeeper_ms: 判定にかかった時間
+        ready_ms: 開始から検索結果が揃うまでの時間（検索しなかった場合は None）
+        """
+        with self._lock:
+            self._records.append({"mode": mode, "gatekeeper_ms": round(gatekeeper_ms, 1),
+                                  "ready_ms": round(ready_ms, 1) if ready_ms is not None else None,
+                                  "necessary": necessary})
+
+    def get_stats(self):
+        with self._lock:
+            records = list(self._records)
+            counts = dict(self.counts)
+        modes = {}
+        for mode in ("preclassified", "cached", "sequential", "speculative"):
+            rows = [r for r in records if r["mode"] == mode]
+            if not rows:
+                continue
+            ready = [r["ready_ms"] for r in rows if r["ready_ms"] is not None]
+            modes[mode] = {
+                "count": len(rows),
+                "avg_gatekeeper_ms": round(sum(r["gatekeeper_ms"] for r in rows) / len(rows), 1),
+                "avg_ready_ms": round(sum(ready) / len(ready), 1) if ready else None,
+            }
+        return {
+            **counts,
+            "hit_rate": round(counts["hits"] / counts["lookups"], 3) if counts["lookups"] else 0.0,
+            "wasted_rate": round(counts["wasted"] / counts["speculative"], 3) if counts["speculative"] else 0.0,
+            "modes": modes,
+        }
+
+
+_gatekeepers = {}
+_gatekeepers_lock = threading.Lock()
+
+
+def get_search_gatekeeper(cache_dir):
+    """キャッシュフォルダごとのインスタンス（プロセス内で共有）"""
+    key = os.path.abspath(cache_dir)
+    with _gatekeepers_lock:
+        if key not in _gatekeepers:
+            _gatekeepers[key] = SearchGatekeeper(key)
+        return _gatekeepers[key]
@@ -0,0 +1,294 @@
+# ===== 検索要否の事前分類 =====
+# game_ai.py の execute_background_search で、ゲートキーパー（ローカルLLM）の前に使用
+# 明らかに検索が要る / 要らないクエリをその場で判定し、判断がつかないものだけを LLM に回す
+# - キーワード規則: 挨拶・これまでの会話の振り返り（GLOBAL_SUMMARY_INTENT_PATTERN に加えて会話への言及があるもの）・
+#   日付だけの質問は「不要」、
+#   「最新」「ニュース」「株価」「天気」などは「必要」
+# - 規則に当たらないものは文字 n-gram の線形モデル（ロジスティック回帰）で判定し、確信度が低ければ「不明」
+# - モデルは data/search_preclassifier_model.json があれば読み込み、なければラベル付きサンプルから起動時に学習する
+#
+# 使用例（オフライン評価・学習）:
+#   python scripts/search_preclassifier.py evaluate
+#   python scripts/search_preclassifier.py evaluate --log data/search_cache/gatekeeper_cache.json
+#   python scripts/search_preclassifier.py train --out data/search_preclassifier_model.json
+
+import os
+import re
+import sys
+import json
+import math
+import random
+import threading
+import unicodedata
+
+try:
+    from .working_memory_manager import GLOBAL_SUMMARY_INTENT_PATTERN
+except ImportError:
+    try:
+        from working_memory_manager import GLOBAL_SUMMARY_INTENT_PATTERN
+    except ImportError:
+        GLOBAL_SUMMARY_INTENT_PATTERN = r"(まとめ|要約|おさらい|振り返|summary|recap)"
+
+YES, NO, UNCERTAIN = "yes", "no", "uncertain"
+
+# 線形モデルの確率がこの範囲外なら判定を確定する
+YES_THRESHOLD = 0.85
+NO_THRESHOLD = 0.15
+NGRAM_RANGE = (1, 3)
+
+MODEL_FILE = "search_preclassifier_model.json"
+SAMPLES_FILE = "search_preclassifier_samples.jsonl"
+_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+DEFAULT_MODEL_PATH = os.path.join(_DATA_DIR, MODEL_FILE)
+DEFAULT_SAMPLES_PATH = os.path.join(_DATA_DIR, SAMPLES_FILE)
+
+_GREETING = re.compile(
+    r"^(こんにちは|こんばんは|おはよう(ございます)?|おやすみ(なさい)?|ありがとう(ございます)?|よろしく(お願いします)?|"
+    r"はじめまして|お疲れ(様|さま)(です)?|hello|hi|hey|good (morning|afternoon|evening|night)|thanks?( you)?|thank you)"
+    r"[\s!！。.~〜ー]*$"
+)
+_DATE_ONLY = re.compile(
+    r"^(今日|きょう|明日|あした|昨日|きのう)?(は|って)?(何日|何曜日?|何月何日|なんにち|なんようび|何時|なんじ)"
+    r"(ですか|だっけ|でしたっけ|かな|\?|？)*$|"
+    r"^what(\s+is|'s)?\s+(the\s+)?(date|day|time)(\s+(is\s+it|today))?\s*\??$|"
+    r"^what\s+day\s+is\s+(it|today)\s*\??$"
+)
+_NEEDS_SEARCH = re.compile(
+    r"(最新|ニュース|速報|株価|為替|レート|相場|価格|値段|いくら(?!なんでも|何でも|でも)|天気|気温|降水|予報|発売日|リリース日|"
+    r"アップデート情報|パッチノート|開催日|試合結果|順位|ランキング|営業時間)|"
+    # 英語は単語単位で判定する（underscore・renews・priceless・stockpile などに当たらないように）。
+    # 日本語の文字も \w に含まれ「最新のnewsを」で \b が働かないため、英字の前後だけを見る
+    r"(?<![a-z])(latest|news|prices?|stocks?|exchange rates?|weather|forecasts?|release dates?|patch notes|"
+    r"scores?|standings|rankings?)(?![a-z])"
+)
+_SUMMARY = re.compile(GLOBAL_SUMMARY_INTENT_PATTERN, re.IGNORECASE)
+# 要約の語（一覧・記録・review など）は通常の検索語にも多いため、これまでの会話を指す語を伴う時だけ「不要」とする
+_CONVERSATION_REF = re.compile(
+    r"(話した|話してた|話していた|話の|どんな話|会話|さっき|先ほど|これまで|今まで|前回|"
+    r"we talked|we discussed|we've talked|we have talked|talked about|our (conversation|chat)|so far|"
+    r"聊|对话|대화|이야기|hablamos|conversaci|parlé|parle|gesprochen|gespräch|говорили|разговор|falamos|conversa|parlato)"
+)
+
+
+def normalize(text):
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text or "").lower()).strip()
+
+
+def apply_rules(query):
+    """キーワード規則による判定。Returns: (YES / NO / None, 規則名)"""
+    text = normalize(query)
+    if not text:
+        return NO, "empty"
+    if _GREETING.match(text):
+        return NO, "greeting"
+    if _NEEDS_SEARCH.search(text):
+        return YES, "realtime_keyword"
+    if _SUMMARY.search(text) and _CONVERSATION_REF.search(text):
+        return NO, "memory_summary"
+    if _DATE_ONLY.match(text):
+        return NO, "date_only"
+    return None, None
+
+
+def char_ngrams(text, ngram_range=NGRAM_RANGE):
+    text = f"^{normalize(text)}$"
+    feats = {}
+    lo, hi = ngram_range
+    for n in range(lo, hi + 1):
+        for i in range(len(text) - n + 1):
+            g = text[i:i + n]
+            feats[g] = feats.get(g, 0.0) + 1.0
+    # 長さの違いで確率が偏らないよう L2 正規化
+    norm = math.sqrt(sum(v * v for v in feats.values())) or 1.0
+    return {k: v / norm for k, v in feats.items()}
+
+
+class LinearModel:
+    """文字 n-gram のロジスティック回帰（依存ライブラリなしの疎ベクトル実装）"""
+
+    def __init__(self, weights=None, bias=0.0):
+        self.weights = weights or {}
+        self.bias = bias
+
+    def predict_proba(self, query):
+        z = self.bias + sum(self.weights.get(k, 0.0) * v for k, v in char_ngrams(query).items())
+        z = max(-30.0, min(30.0, z))
+        return 1.0 / (1.0 + math.exp(-z))
+
+    @classmethod
+    def train(cls, samples, epochs=40, lr=0.5, l2=1e-4, seed=0):
+        """samples: [(query, 1 or 0), ...]"""
+        model = cls()
+        data = [(char_ngrams(q), y) for q, y in samples]
+        rng = random.Random(seed)
+        for epoch in range(epochs):
+            rng.shuffle(data)
+            step = lr / (1.0 + epoch * 0.1)
+            for feats, y in data:
+                z = model.bias + sum(model.weights.get(k, 0.0) * v for k, v in feats.items())
+                z = max(-30.0, min(30.0, z))
+                grad = 1.0 / (1.0 + math.exp(-z)) - y
+                for k, v in feats.items():
+                    w = model.weights.get(k, 0.0)
+                    model.weights[k] = w - step * (grad * v + l2 * w)
+                model.bias -= step * grad
+        # ほぼ 0 の重みは保存しない
+        model.weights = {k: round(w, 5) for k, w in model.weights.items() if abs(w) > 1e-4}
+        return model
+
+    def to_dict(self):
+        return {"ngram_range": list(NGRAM_RANGE), "bias": self.bias, "weights": self.weights}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get("weights", {}), data.get("bias", 0.0))
+
+
+def load_samples(path=DEFAULT_SAMPLES_PATH):
+    """ラベル付きサンプル (JSONL: {"query": ..., "label": "yes" / "no"}) を読み込む"""
+    samples = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            samples.append((row["query"], 1 if row["label"] == YES else 0))
+    return samples
+
+
+def load_gatekeeper_log(path):
+    """ゲートキーパーの判定キャッシュ (gatekeeper_cache.json) を LLM 判定付きのサンプルとして読み込む"""
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    return [(query, 1 if entry["decision"].get("necessary", True) else 0) for query, entry in entries.items()]
+
+
+class SearchPreclassifier:
+    def __init__(self, model=None, yes_threshold=YES_THRESHOLD, no_threshold=NO_THRESHOLD):
+        self.model = model
+        self.yes_threshold = yes_threshold
+        self.no_threshold = no_threshold
+        self.stats = {YES: 0, NO: 0, UNCERTAIN: 0}
+
+    def classify(self, query):
+        """Returns: (YES / NO / UNCERTAIN, 判定の根拠, 線形モデルの確率 or None)"""
+        label, rule = apply_rules(query)
+        prob = None
+        if label is None and self.model is not None:
+            prob = self.model.predict_proba(query)
+            if prob >= self.yes_threshold:
+                label, rule = YES, "model"
+            elif prob <= self.no_threshold:
+                label, rule = NO, "model"
+        if label is None:
+            label, rule = UNCERTAIN, None
+        self.stats[label] += 1
+        return label, rule, prob
+
+    def get_stats(self):
+        total = sum(self.stats.values())
+        return {**self.stats, "short_circuit_rate": round((total - self.stats[UNCERTAIN]) / total, 3) if total else 0.0}
+
+
+_instance = None
+_instance_lock = threading.Lock()
+
+
+def get_preclassifier(data_dir=None):
+    """プロセス全体で共有する分類器（モデルがなければサンプルから学習する）"""
+    global _instance
+    with _instance_lock:
+        if _instance is None:
+            data_dir = data_dir or _DATA_DIR
+            model_path = os.path.join(data_dir, MODEL_FILE)
+            samples_path = os.path.join(data_dir, SAMPLES_FILE)
+            model = None
+            try:
+                with open(model_path, "r", encoding="utf-8") as f:
+                    model = LinearModel.from_dict(json.load(f))
+            except (OSError, ValueError):
+                try:
+                    model = LinearModel.train(load_samples(samples_path))
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Search preclassifier: model unavailable, using rules only ({e})")
+            _instance = SearchPreclassifier(model)
+        return _instance
+
+
+# --- オフライン評価 ---
+def evaluate(samples, train_samples=None, folds=5, seed=0):
+    """
+    train_samples を渡した場合はそれで学習して samples を評価し、
+    渡さない場合は samples の k 分割交差検証で評価する
+    キーワード規則は同梱のサンプルを見て作ったため、サンプルでの by_source["rule"] の正解率は楽観的な値になる
+    （規則の実際の精度は --log で記録済みのゲートキーパー判定に対して測る）
+    """
+    def _run(train, test):
+        clf = SearchPreclassifier(LinearModel.train(train) if train else None)
+        rows = []
+        for q, y in test:
+            label, rule, _ = clf.classify(q)
+            rows.append((q, y, label, rule))
+        return rows
+
+    if train_samples is not None:
+        rows = _run(train_samples, samples)
+    else:
+        data = list(samples)
+        random.Random(seed).shuffle(data)
+        rows = []
+        for k in range(folds):
+            test = data[k::folds]
+            train = [s for i, s in enumerate(data) if i % folds != k]
+            rows.extend(_run(train, test))
+
+    decided = [r for r in rows if r[2] != UNCERTAIN]
+    correct = [r for r in decided if (r[2] == YES) == (r[1] == 1)]
+    by_source = {}
+    for q, y, label, rule in decided:
+        src = "model" if rule == "model" else "rule"
+        s = by_source.setdefault(src, {"decided": 0, "correct": 0})
+        s["decided"] += 1
+        s["correct"] += int((label == YES) == (y == 1))
+    return {
+        "samples": len(rows),
+        "coverage": round(len(decided) / len(rows), 3) if rows else 0.0,
+        "accuracy_when_decided": round(len(correct) / len(decided), 3) if decided else None,
+        # 検索が必要なのに「不要」と判定した件数（回答の鮮度が落ちる、最も避けたい誤り）
+        "false_no": sum(1 for r in decided if r[2] == NO and r[1] == 1),
+        "false_yes": sum(1 for r in decided if r[2] == YES and r[1] == 0),
+        "by_source": by_source,
+        "errors": [{"query": q, "expected": YES if y else NO, "got": label, "by": rule}
+                   for q, y, label, rule in decided if (label == YES) != (y == 1)],
+    }
+
+
+def _main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description="検索要否の事前分類器の学習・評価")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_eval = sub.add_parser("evaluate", help="サンプルの交差検証、または記録済みのゲートキーパー判定に対する評価")
+    p_eval.add_argument("--samples", default=DEFAULT_SAMPLES_PATH)
+    p_eval.add_argument("--log", help="gatekeeper_cache.json（指定時はサンプルで学習し、この記録で評価）")
+    p_train = sub.add_parser("train", help="サンプルで学習してモデルを保存")
+    p_train.add_argument("--samples", default=DEFAULT_SAMPLES_PATH)
+    p_train.add_argument("--out", default=DEFAULT_MODEL_PATH)
+    args = parser.parse_args(argv)
+
+    samples = load_samples(args.samples)
+    if args.command == "train":
+        model = LinearModel.train(samples)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(model.to_dict(), f, ensure_ascii=False)
+        print(f"Saved model ({len(model.weights)} features) to {args.out}")
+        return
+    if args.log:
+        result = evaluate(load_gatekeeper_log(args.log), train_samples=samples)
+    else:
+        result = evaluate(samples)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    _main(sys.argv[1:])
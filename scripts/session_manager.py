@@ -0,0 +1,263 @@
+# ===== 常駐 API サーバーのセッション管理 =====
+# game_ai.py の run_api_server（/api/execute・/api/stop・/api/sessions）で使用
+# リクエストごとに素のスレッドを立て、1つのグローバルな「アクティブセッション」で停止を判定していた処理を置き換える
+# - セッション表: セッションごとに状態（待機・実行中・完了・中断・エラー）と待ち時間・実行時間を持つ
+# - 上限付きのワーカープールで実行し、待ち行列が上限に達したら受け付けずに SessionRejected を送出する
+#   （サーバーは 429 と、平均実行時間から見積もった再試行までの秒数を返す）
+# - 停止の判定はセッションごと（session.getter を main() の session_getter に、session.token を cancel_token に渡す）。
+#   同じクライアントから新しいセッションが来たら、そのクライアントの古いセッションだけを中断する
+#   （Hub の「話しかけ直し」は従来どおり前の対話を止め、別のクライアントの対話には影響しない）
+#
+# 使用例:
+#   manager = get_session_manager(max_workers=4, max_queue=16)
+#   try:
+#       session = manager.submit(lambda s: main(..., session_id=s.id, session_getter=s.getter), client_id="hub")
+#   except SessionRejected as e:
+#       return 429, e.retry_after
+
+import math
+import time
+import uuid
+import threading
+from collections import deque, OrderedDict
+
+try:
+    from .optimized_task_queue import CancellationToken
+except ImportError:
+    from optimized_task_queue import CancellationToken
+
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_MAX_QUEUE = 16
+# 終了したセッションを表に残しておく件数
+KEEP_FINISHED = 200
+# 実行時間の平均を取る直近のセッション数（再試行までの秒数の見積もり用）
+STATS_WINDOW = 50
+
+QUEUED, RUNNING, DONE, CANCELLED, ERROR = "queued", "running", "done", "cancelled", "error"
+FINISHED_STATES = (DONE, CANCELLED, ERROR)
+
+
+class SessionRejected(Exception):
+    """待ち行列が上限に達したため受け付けなかった"""
+
+    def __init__(self, retry_after, queue_depth):
+        super().__init__(f"session queue is full ({queue_depth} waiting)")
+        self.retry_after = retry_after
+        self.queue_depth = queue_depth
+
+
+class Session:
+    def __init__(self, session_id, client_id, mode, func):
+        self.id = session_id
+        self.client_id = client_id
+        self.mode = mode
+        self.func = func
+        self.state = QUEUED
+        self.error = None
+        self.created_at = time.time()
+        self._enqueued = time.perf_counter()
+        self.queue_ms = None
+        self.run_ms = None
+        # LLM 呼び出し・検索・読み上げまで渡す協調キャンセルのトークン
+        self.token = CancellationToken()
+        self._done = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self.token.cancelled
+
+    def cancel(self, reason="cancelled"):
+        self.token.cancel(reason)
+
+    def getter(self):
+        """main() の session_getter 用。中断されるまで自分の ID を返す"""
+        return None if self.token.cancelled else self.id
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def to_dict(self):
+        return {"session_id": self.id, "client_id": self.client_id, "mode": self.mode, "state": self.state,
+                "cancel_reason": self.token.reason,
+                "queue_ms": self.queue_ms, "run_ms": self.run_ms, "error": self.error,
+                "created_at": round(self.created_at, 3)}
+
+
+class SessionManager:
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, max_queue=DEFAULT_MAX_QUEUE, error_logger=None):
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self.error_logger = error_logger
+        self._sessions = OrderedDict()      # session_id -> Session（作成順）
+        self._waiting = deque()
+        self._cond = threading.Condition()
+        self._workers = []
+        self._running = 0
+        self._closed = False
+        self._run_times = deque(maxlen=STATS_WINDOW)
+        self._queue_times = deque(maxlen=STATS_WINDOW)
+        self.counts = {"accepted": 0, "rejected": 0, "preempted": 0, "completed": 0, "cancelled": 0, "errors": 0}
+
+    # --- 受付 ---
+    def submit(self, func, session_id=None, client_id="default", mode=None, preempt=True):
+        """
+        func(session) をワーカーで実行するセッションを作る
+        preempt: 同じ client_id の待機中・実行中のセッションを中断する
+        Raises: SessionRejected（待ち行列が上限に達している）
+        """
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("session manager is shut down")
+            if preempt:
+                self._cancel_locked(lambda s: s.client_id == client_id, preempted=True)
+            if len(self._waiting) >= self.max_queue and self._running >= self.max_workers:
+                self.counts["rejected"] += 1
+                raise SessionRejected(self._retry_after_locked(), len(self._waiting))
+            session = Session(session_id or str(uuid.uuid4()), client_id, mode, func)
+            old = self._sessions.pop(session.id, None)
+            if old is not None and old.state not in FINISHED_STATES:
+                old.cancel("replaced")
+            self._sessions[session.id] = session
+            self._waiting.append(session)
+            self.counts["accepted"] += 1
+            self._trim_locked()
+            self._ensure_workers_locked()
+            self._cond.notify()
+            return session
+
+    def _retry_after_locked(self):
+        """待ち行列が1つ空くまでの見積もり秒数（平均実行時間 × 待ち件数 / ワーカー数）"""
+        avg_s = (sum(self._run_times) / len(self._run_times) / 1000) if self._run_times else 1.0
+        return max(1, math.ceil(avg_s * (len(self._waiting) + 1) / self.max_workers))
+
+    # --- 停止 ---
+    def cancel(self, session_id=None, client_id=None):
+        """
+        session_id / client_id に一致するセッションを中断する（どちらも省略時はすべて）
+        Returns: 中断したセッション数
+        """
+        with self._cond:
+            return self._cancel_locked(lambda s: (session_id is None or s.id == session_id)
+                                       and (client_id is None or s.client_id == client_id))
+
+    def _cancel_locked(self, match, preempted=False):
+        count = 0
+        for session in list(self._sessions.values()):
+            if session.state in FINISHED_STATES or session.cancelled or not match(session):
+                continue
+            session.cancel("preempted" if preempted else "cancelled")
+            count += 1
+            if session.state == QUEUED:
+                # まだ始まっていないものはその場で取り除く
+                try:
+                    self._waiting.remove(session)
+                except ValueError:
+                    pass
+                self._finish_locked(session, CANCELLED)
+        if preempted:
+            self.counts["preempted"] += count
+        return count
+
+    # --- 参照 ---
+    def get(self, session_id):
+        with self._cond:
+            return self._sessions.get(session_id)
+
+    def active_sessions(self):
+        with self._cond:
+            return [s for s in self._sessions.values() if s.state in (QUEUED, RUNNING) and not s.cancelled]
+
+    def latest_active_id(self):
+        """直近に受け付けた、まだ終わっていないセッションの ID（/api/status の互換用）"""
+        active = self.active_sessions()
+        return active[-1].id if active else None
+
+    def get_metrics(self):
+        with self._cond:
+            run = list(self._run_times)
+            queued = list(self._queue_times)
+            return {
+                **self.counts,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queue_depth": len(self._waiting),
+                "avg_run_ms": round(sum(run) / len(run), 1) if run else None,
+                "avg_queue_ms": round(sum(queued) / len(queued), 1) if queued else None,
+                "max_queue_ms": max(queued) if queued else None,
+            }
+
+    def list_sessions(self, limit=50):
+        with self._cond:
+            return [s.to_dict() for s in list(self._sessions.values())[-limit:]]
+
+    def shutdown(self, timeout=2.0):
+        with self._cond:
+            self._closed = True
+            self._cancel_locked(lambda s: True)
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join(timeout)
+
+    # --- ワーカー ---
+    def _ensure_workers_locked(self):
+        self._workers = [w for w in self._workers if w.is_alive()]
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(target=self._worker, name=f"session-worker-{len(self._workers)}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _finish_locked(self, session, state, error=None):
+        session.state = state
+        session.error = error
+        session.func = None
+        self.counts[{DONE: "completed", CANCELLED: "cancelled", ERROR: "errors"}[state]] += 1
+        session._done.set()
+
+    def _trim_locked(self):
+        finished = [sid for sid, s in self._sessions.items() if s.state in FINISHED_STATES]
+        for sid in finished[:max(0, len(finished) - KEEP_FINISHED)]:
+            del self._sessions[sid]
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._waiting and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                session = self._waiting.popleft()
+                session.state = RUNNING
+                session.queue_ms = round((time.perf_counter() - session._enqueued) * 1000, 1)
+                self._queue_times.append(session.queue_ms)
+                self._running += 1
+                func = session.func
+            started = time.perf_counter()
+            state, error = DONE, None
+            try:
+                func(session)
+            except Exception as e:
+                state, error = ERROR, str(e)
+                if self.error_logger:
+                    self.error_logger(f"Session Error ({session.id}): {e}", is_error=True)
+            run_ms = round((time.perf_counter() - started) * 1000, 1)
+            with self._cond:
+                self._running -= 1
+                session.run_ms = run_ms
+                self._run_times.append(run_ms)
+                if state == DONE and session.cancelled:
+                    state = CANCELLED
+                self._finish_locked(session, state, error)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_session_manager(max_workers=DEFAULT_MAX_WORKERS, max_queue=DEFAULT_MAX_QUEUE, error_logger=None):
+    """プロセス全体で共有するセッション管理（引数は初回作成時のみ有効）"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = SessionManager(max_workers, max_queue, error_logger)
+        return _manager
@@ -0,0 +1,134 @@
+# ===== 起動時間の計測 (--profile-startup) =====
+# game_ai.py を --profile-startup 付きで起動した時に使用
+#   python scripts/game_ai.py voice --profile-startup
+#   python scripts/game_ai.py server --profile-startup
+# - import 文ごとの所要時間（その中で読み込まれた依存モジュールを含む）を記録する
+# - 設定の読み込み・AIクライアントの作成など、初期化の段階ごとの所要時間を記録する
+# - 各モードが入力を受け付けられる状態になった時点 (ready) で結果を表示し、
+#   data/startup_profile.jsonl に1行追記する（変更前後の比較用）
+
+import os
+import sys
+import json
+import time
+import builtins
+import threading
+import contextlib
+from datetime import datetime
+
+# 表示する import の件数（遅い順）
+REPORT_TOP = 15
+# これより速い import は記録しない（既に読み込み済みのモジュールなど）
+MIN_IMPORT_MS = 1.0
+
+
+class StartupProfiler:
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.imports = []       # {"name", "ms", "step"}
+        self.steps = []         # {"name", "ms", "at_ms"}
+        self._step = None
+        self._local = threading.local()
+        self._orig_import = None
+
+    def elapsed_ms(self):
+        return round((time.perf_counter() - self.started_at) * 1000, 1)
+
+    # --- import の計測 ---
+    def install(self):
+        """builtins.__import__ を差し替え、最も外側の import だけを計測する"""
+        if self._orig_import is not None:
+            return
+        self._orig_import = builtins.__import__
+        orig = self._orig_import
+
+        def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+            depth = getattr(self._local, "depth", 0)
+            if depth or (level == 0 and name in sys.modules):
+                return orig(name, globals, locals, fromlist, level)
+            self._local.depth = depth + 1
+            t0 = time.perf_counter()
+            try:
+                return orig(name, globals, locals, fromlist, level)
+            finally:
+                self._local.depth = depth
+                ms = (time.perf_counter() - t0) * 1000
+                if ms >= MIN_IMPORT_MS:
+                    label = f"{'.' * level}{name}" if name else "." * level
+                    self.imports.append({"name": label, "ms": round(ms, 1), "step": self._step})
+
+        builtins.__import__ = _timed_import
+
+    def uninstall(self):
+        if self._orig_import is not None:
+            builtins.__import__ = self._orig_import
+            self._orig_import = None
+
+    # --- 初期化段階の計測 ---
+    @contextlib.contextmanager
+    def step(self, name):
+        prev, self._step = self._step, name
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._step = prev
+            self.steps.append({"name": name, "ms": round((time.perf_counter() - t0) * 1000, 1),
+                               "at_ms": self.elapsed_ms()})
+
+    # --- 結果 ---
+    def report(self, mode, root=None):
+        """ready までの内訳を表示し、data/startup_profile.jsonl に追記する"""
+        self.uninstall()
+        ready_ms = self.elapsed_ms()
+        module_imports = [i for i in self.imports if i["step"] is None]
+        result = {
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "mode": mode,
+            "ready_ms": ready_ms,
+            "import_ms": round(sum(i["ms"] for i in module_imports), 1),
+            "steps": self.steps,
+            "imports": sorted(self.imports, key=lambda i: -i["ms"])[:REPORT_TOP],
+        }
+
+        print(f"=== startup profile: {mode} ===")
+        print(f"ready: {ready_ms:.1f} ms (module imports {result['import_ms']:.1f} ms)")
+        print("-- init steps --")
+        for s in self.steps:
+            print(f"  {s['ms']:8.1f} ms  {s['name']}")
+        print(f"-- slowest imports (top {REPORT_TOP}) --")
+        for i in result["imports"]:
+            where = f"  [{i['step']}]" if i["step"] else ""
+            print(f"  {i['ms']:8.1f} ms  {i['name']}{where}")
+
+        if root:
+            try:
+                path = os.path.join(root, "data", "startup_profile.jsonl")
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(result, ensure_ascii=False) + "\n")
+            except OSError:
+                pass
+        return result
+
+
+_profiler = None
+
+
+def enable():
+    """計測を開始する（game_ai.py の先頭、重い import より前に呼ぶ）"""
+    global _profiler
+    if _profiler is None:
+        _profiler = StartupProfiler()
+        _profiler.install()
+    return _profiler
+
+
+def get_profiler():
+    """計測中なら StartupProfiler、そうでなければ None"""
+    return _profiler
+
+
+def startup_step(name):
+    """初期化段階を計測する（計測中でなければ何もしない）"""
+    return _profiler.step(name) if _profiler else contextlib.nullcontext()
@@ -0,0 +1,288 @@
+# ===== LLMストリーミング応答の文単位読み上げ =====
+# game_ai.py の chat_with_ai / speak_stream で使用
+# - LLM から届くトークン断片を文末（。！？改行 など）で区切り、完成した文から順に TTS へ渡す
+# - [SEARCH: ...] タグは文に含めず、タグの途中で文を区切らないよう閉じ括弧まで保留する
+# - 1ターンの「入力確定 → 最初のトークン → 最初の文 → 最初の音声再生」までの時間を計測する
+#   （計測中のターンはスレッドごとに持ち、常駐サーバーで同時に実行される対話どうしで混ざらないようにする。
+#    別スレッドで続く処理には carry_turn(func) で引き継ぐ）
+
+import re
+import time
+import queue
+import threading
+from collections import deque
+from functools import wraps
+
+try:
+    from .turn_tracer import mark as trace_mark
+except ImportError:
+    try:
+        from turn_tracer import mark as trace_mark
+    except ImportError:
+        trace_mark = None
+
+# 全角の文末記号と改行は即座に文の区切りとする
+SENTENCE_END = "。！？\n"
+# 半角の文末記号は直後が空白の時のみ区切る（"3.14" や "v1.2" を分割しないため）
+ASCII_SENTENCE_END = ".!?"
+# 文末記号の直後に続く閉じ括弧・記号は同じ文に含める
+TRAILING_CHARS = "」』）)】\"'！？!?。"
+# これより短い文（「はい。」など）は次の文とまとめて送る
+MIN_SENTENCE_CHARS = 4
+
+_SEARCH_TAG = re.compile(r'\[SEARCH:.*?\]', re.DOTALL)
+_SEARCH_TAG_OPEN = re.compile(r'\[SEARCH:.*$', re.DOTALL)
+
+
+def clean_sentence(text):
+    """読み上げ・表示用に検索タグとハッシュ記号を除去する"""
+    text = _SEARCH_TAG.sub('', text)
+    return text.replace('#', '').replace('＃', '').strip()
+
+
+class SentenceChunker:
+    """
+    トークン断片を受け取り、完成した文を返す
+
+    使用例:
+        chunker = SentenceChunker()
+        for delta in token_stream:
+            for sentence in chunker.feed(delta):
+                speak(sentence)
+        for sentence in chunker.flush():
+            speak(sentence)
+    """
+
+    def __init__(self, min_chars=MIN_SENTENCE_CHARS):
+        self.min_chars = min_chars
+        self._buf = ""
+
+    def feed(self, delta):
+        if not delta:
+            return []
+        self._buf += delta
+        return self._split(final=False)
+
+    def flush(self):
+        """ストリーム終了時に残りを1文として返す"""
+        sentences = self._split(final=True)
+        rest = clean_sentence(_SEARCH_TAG_OPEN.sub('', self._buf))
+        self._buf = ""
+        if rest:
+            sentences.append(rest)
+        return sentences
+
+    def _split(self, final):
+        buf = self._buf
+        sentences = []
+        cut = 0
+        in_tag = False
+        i = 0
+        n = len(buf)
+        while i < n:
+            ch = buf[i]
+            if ch == "[":
+                in_tag = True
+            elif ch == "]":
+                in_tag = False
+            elif not in_tag and (ch in SENTENCE_END or ch in ASCII_SENTENCE_END):
+                j = i + 1
+                while j < n and buf[j] in TRAILING_CHARS:
+                    j += 1
+                if j == n and not final:
+                    # 後続の閉じ括弧や空白がまだ届いていない可能性があるため保留
+                    break
+                if ch in ASCII_SENTENCE_END and j < n and not buf[j].isspace():
+                    i = j
+                    continue
+                sentence = clean_sentence(buf[cut:j])
+                if len(sentence) >= self.min_chars:
+                    sentences.append(sentence)
+                    cut = j
+                i = j
+                continue
+            i += 1
+        self._buf = buf[cut:]
+        return sentences
+
+
+def split_sentences(text):
+    """完成済みの文章を文単位に分割する（キャッシュヒット時などストリームでない応答用）"""
+    chunker = SentenceChunker()
+    return chunker.feed(text or "") + chunker.flush()
+
+
+def join_sentences(sentences):
+    """文を表示用に連結する（英語などは文の間に空白を入れる）"""
+    out = ""
+    for s in sentences:
+        if out and out[-1].isascii() and not out[-1].isspace():
+            out += " "
+        out += s
+    return out
+
+
+class SentenceStream:
+    """チャット処理（生産側）と読み上げ処理（消費側）をつなぐ文キュー"""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self.sentences = []
+        self.closed = False
+        self.cancelled = False
+
+    def put(self, sentence):
+        if self.closed or not sentence:
+            return
+        self.sentences.append(sentence)
+        if len(self.sentences) == 1:
+            mark_turn_event("first_sentence")
+        self._queue.put(sentence)
+
+    def put_text(self, text):
+        for sentence in split_sentences(text):
+            self.put(sentence)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._queue.put(None)
+
+    def cancel(self):
+        """読み上げ側の中断（おしゃべり停止）を生産側に伝える"""
+        self.cancelled = True
+        self.close()
+
+    @property
+    def text(self):
+        return join_sentences(self.sentences)
+
+    def __iter__(self):
+        while True:
+            sentence = self._queue.get()
+            if sentence is None or self.cancelled:
+                return
+            yield sentence
+
+
+def feed_stream(deltas, sentence_stream, stop_event=None):
+    """
+    LLM のトークン断片のイテレーターを消費して文ごとに sentence_stream へ送り、全文を返す
+    stop_event がセットされるか、読み上げ側が中断されたら読み込みをやめる
+    """
+    chunker = SentenceChunker()
+    parts = []
+    for delta in deltas:
+        if (stop_event and stop_event.is_set()) or sentence_stream.cancelled:
+            break
+        if not delta:
+            continue
+        if not parts:
+            mark_turn_event("first_token")
+        parts.append(delta)
+        for sentence in chunker.feed(delta):
+            sentence_stream.put(sentence)
+    for sentence in chunker.flush():
+        sentence_stream.put(sentence)
+    return "".join(parts)
+
+
+# --- ターンごとの応答遅延計測 ---
+class TurnLatency:
+    def __init__(self, mode):
+        self.mode = mode
+        self.started_at = time.perf_counter()
+        self.marks = {}
+        self.ended = False
+
+    def mark(self, name):
+        if not self.ended and name not in self.marks:
+            self.marks[name] = round((time.perf_counter() - self.started_at) * 1000, 1)
+
+    def summary(self):
+        return {"mode": self.mode, **self.marks}
+
+
+_local = threading.local()
+_turn_lock = threading.Lock()
+_active_turns = []
+_turn_history = deque(maxlen=50)
+
+
+def begin_turn(mode):
+    """入力が確定した時点で計測を開始し、このスレッドの計測先にする (mode: "streaming" / "blocking")"""
+    turn = TurnLatency(mode)
+    with _turn_lock:
+        _active_turns.append(turn)
+    _local.turn = turn
+    return turn
+
+
+def current_turn():
+    """
+    このスレッドの計測中のターン
+    引き継いでいないスレッドでは、計測中のターンが1つだけならそれを返す（複数あれば区別できないので None）
+    """
+    turn = getattr(_local, "turn", None)
+    if turn is not None:
+        return turn
+    with _turn_lock:
+        return _active_turns[0] if len(_active_turns) == 1 else None
+
+
+def carry_turn(func):
+    """
+    呼び出し元スレッドの計測中のターンを、func を実行する別スレッドに引き継ぐ
+    （他のセッションのターンを引き継がないよう、current_turn の「1つだけならそれ」は使わない）
+    """
+    turn = getattr(_local, "turn", None)
+    if turn is None:
+        return func
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        prev = getattr(_local, "turn", None)
+        _local.turn = turn
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.turn = prev
+    return wrapper
+
+
+def mark_turn_event(name, turn=None):
+    """計測中のターンに時刻を記録する（同名の2回目以降は無視）。区間計測 (turn_tracer) にも同じ時点を残す"""
+    turn = turn or current_turn()
+    if turn is not None:
+        with _turn_lock:
+            turn.mark(name)
+    if trace_mark:
+        trace_mark(name)
+
+
+def end_turn(turn=None):
+    """計測を終了し、結果を履歴に残す（/api/metrics の latency で参照する）"""
+    turn = turn or current_turn()
+    if getattr(_local, "turn", None) is turn:
+        _local.turn = None
+    with _turn_lock:
+        if turn is None or turn.ended:
+            return None
+        turn.ended = True
+        if turn in _active_turns:
+            _active_turns.remove(turn)
+        summary = turn.summary()
+        _turn_history.append(summary)
+    return summary
+
+
+def get_latency_history():
+    """直近ターンの計測結果とモード別の平均 time-to-first-audio"""
+    with _turn_lock:
+        turns = list(_turn_history)
+    averages = {}
+    for mode in ("streaming", "blocking"):
+        values = [t["first_audio"] for t in turns if t["mode"] == mode and "first_audio" in t]
+        if values:
+            averages[mode] = round(sum(values) / len(values), 1)
+    return {"recent": turns[-10:], "avg_first_audio_ms": averages}
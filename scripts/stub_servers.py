@@ -0,0 +1,237 @@
+# ===== 負荷試験・ベンチマーク用のスタブサーバー =====
+# load_test_server.py・benchmark_turns.py から使用（単体でも起動できる）
+# 実際の LLM・VOICEVOX・Tavily・Hub の代わりに、決まった遅延で決まった応答を返す（標準ライブラリのみ）
+# - LLM  : OpenAI 互換 (/v1/chat/completions・ストリーミング対応, /v1/models) と Ollama (/api/chat, /api/tags)
+#          chunk_chars を指定すると、文単位ではなくその文字数ずつ（token_delay 間隔で）ストリーミングする
+# - VOICEVOX: /version, /speakers, /audio_query, /synthesis（短い無音の WAV）
+# - Tavily: /search（search_delay 後に固定の検索結果。TAVILY_API_URL に指定して使う）
+# - Hub  : /api/log, /api/overlay（受け取った件数を数えるだけ）
+#
+# 使用例:
+#   python scripts/stub_servers.py --llm-delay 0.5
+#   stubs = start_stub_servers(llm_delay=0.5); ...; stubs.stop()
+
+import io
+import sys
+import json
+import time
+import wave
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LLM_PORT = 11435
+VOICEVOX_PORT = 50021
+HUB_PORT = 5000
+TAVILY_PORT = 11436
+
+STUB_ANSWER = "了解しました。スタブの応答です。負荷試験のための固定の文章を返しています。"
+STUB_SEARCH_RESULTS = [
+    {"url": "https://example.com/stub-1", "content": "スタブの検索結果です。ベンチマーク用の固定の本文を返しています。"},
+    {"url": "https://example.com/stub-2", "content": "二件目のスタブの検索結果です。要約処理の入力として使われます。"},
+]
+
+
+def silent_wav(seconds=0.1, rate=24000):
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(b"\x00\x00" * int(rate * seconds))
+    return buf.getvalue()
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "SecreAIStub/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            return json.loads(raw.decode("utf-8")) if raw else {}
+        except ValueError:
+            return {}
+
+    def _send(self, status, body, content_type="application/json"):
+        if not isinstance(body, bytes):
+            body = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _count(self):
+        with self.server.lock:
+            self.server.counts[self.path.split("?")[0]] = self.server.counts.get(self.path.split("?")[0], 0) + 1
+
+
+class LLMStubHandler(_StubHandler):
+    def do_GET(self):
+        self._count()
+        if self.path.startswith("/v1/models"):
+            return self._send(200, {"data": [{"id": "stub-model"}]})
+        if self.path.startswith("/api/tags"):
+            return self._send(200, {"models": [{"name": "stub-model"}]})
+        self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        self._count()
+        body = self._body()
+        cfg = self.server.config
+        if self.path.startswith("/api/chat"):
+            # Ollama ネイティブ（検索ゲートキーパー・要約）。JSON モードでは search_necessary に従って答える
+            time.sleep(cfg["llm_delay"])
+            if body.get("format") == "json":
+                content = json.dumps({"necessary": cfg["search_necessary"], "reason": "stub"})
+            else:
+                content = STUB_ANSWER
+            return self._send(200, {"message": {"role": "assistant", "content": content}, "done": True})
+        if not self.path.startswith("/v1/chat/completions"):
+            return self._send(404, {"error": "not found"})
+
+        time.sleep(cfg["llm_delay"])
+        if not body.get("stream"):
+            return self._send(200, {"choices": [{"message": {"role": "assistant", "content": STUB_ANSWER}}]})
+        # SSE（Content-Length なしで送り切ったら接続を閉じる）
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        n = cfg.get("chunk_chars")
+        pieces = [STUB_ANSWER[i:i + n] for i in range(0, len(STUB_ANSWER), n)] if n else \
+            STUB_ANSWER.replace("。", "。\n").split("\n")
+        for piece in pieces:
+            if not piece:
+                continue
+            chunk = {"choices": [{"delta": {"content": piece}}]}
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(cfg["token_delay"])
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+class VoicevoxStubHandler(_StubHandler):
+    def do_GET(self):
+        self._count()
+        if self.path.startswith("/version"):
+            return self._send(200, b'"0.0.0-stub"')
+        if self.path.startswith("/speakers"):
+            return self._send(200, [{"name": "ずんだもん", "styles": [{"id": 3}]}])
+        self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        self._count()
+        self._body()
+        if self.path.startswith("/audio_query"):
+            return self._send(200, {"speedScale": 1.0, "volumeScale": 1.0, "accent_phrases": []})
+        if self.path.startswith("/synthesis"):
+            time.sleep(self.server.config["tts_delay"])
+            return self._send(200, self.server.config["wav"], "audio/wav")
+        self._send(404, {"error": "not found"})
+
+
+class TavilyStubHandler(_StubHandler):
+    def do_POST(self):
+        self._count()
+        body = self._body()
+        if not self.path.startswith("/search"):
+            return self._send(404, {"error": "not found"})
+        time.sleep(self.server.config["search_delay"])
+        self._send(200, {"query": body.get("query", ""), "results": STUB_SEARCH_RESULTS[:body.get("max_results", 3)]})
+
+
+class HubStubHandler(_StubHandler):
+    def do_POST(self):
+        self._count()
+        self._body()
+        self._send(200, {"status": "ok"})
+
+    def do_GET(self):
+        self._count()
+        self._send(200, {"status": "ok"})
+
+
+class StubServers:
+    def __init__(self):
+        self.servers = {}
+
+    def add(self, name, handler, port, config):
+        server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        server.daemon_threads = True
+        server.config = config
+        server.counts = {}
+        server.lock = threading.Lock()
+        threading.Thread(target=server.serve_forever, name=f"stub-{name}", daemon=True).start()
+        self.servers[name] = server
+        return server
+
+    def url(self, name):
+        host, port = self.servers[name].server_address[:2]
+        return f"http://{host}:{port}"
+
+    def counts(self):
+        return {name: dict(server.counts) for name, server in self.servers.items()}
+
+    def stop(self):
+        for server in self.servers.values():
+            server.shutdown()
+            server.server_close()
+
+
+def start_stub_servers(llm_delay=0.5, token_delay=0.05, tts_delay=0.02, llm_port=LLM_PORT,
+                       voicevox_port=VOICEVOX_PORT, hub_port=HUB_PORT, with_hub=True, chunk_chars=None,
+                       search_necessary=False, search_delay=0.3, tavily_port=TAVILY_PORT, with_tavily=False):
+    """
+    スタブを起動して StubServers を返す（ポートが使用中なら OSError）
+    llm_delay: 応答を返し始めるまでの秒数 / token_delay: ストリーミングの断片ごとの間隔
+    chunk_chars: 断片の文字数（None なら文ごと） / search_necessary: ゲートキーパーの判定
+    """
+    config = {"llm_delay": llm_delay, "token_delay": token_delay, "tts_delay": tts_delay, "wav": silent_wav(),
+              "chunk_chars": chunk_chars, "search_necessary": search_necessary, "search_delay": search_delay}
+    stubs = StubServers()
+    try:
+        stubs.add("llm", LLMStubHandler, llm_port, config)
+        stubs.add("voicevox", VoicevoxStubHandler, voicevox_port, config)
+        if with_hub:
+            stubs.add("hub", HubStubHandler, hub_port, config)
+        if with_tavily:
+            stubs.add("tavily", TavilyStubHandler, tavily_port, config)
+    except OSError:
+        stubs.stop()
+        raise
+    return stubs
+
+
+def _main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description="LLM・VOICEVOX・Hub のスタブサーバー")
+    parser.add_argument("--llm-delay", type=float, default=0.5)
+    parser.add_argument("--token-delay", type=float, default=0.05)
+    parser.add_argument("--llm-port", type=int, default=LLM_PORT)
+    parser.add_argument("--voicevox-port", type=int, default=VOICEVOX_PORT)
+    parser.add_argument("--hub-port", type=int, default=HUB_PORT)
+    parser.add_argument("--no-hub", action="store_true")
+    parser.add_argument("--tavily", action="store_true", help="Tavily のスタブも起動する")
+    args = parser.parse_args(argv)
+    stubs = start_stub_servers(args.llm_delay, args.token_delay, llm_port=args.llm_port,
+                               voicevox_port=args.voicevox_port, hub_port=args.hub_port, with_hub=not args.no_hub,
+                               with_tavily=args.tavily)
+    print("Stub servers: " + ", ".join(f"{name}={stubs.url(name)}" for name in stubs.servers))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stubs.stop()
+
+
+if __name__ == "__main__":
+    _main(sys.argv[1:])
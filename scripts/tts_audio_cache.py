@@ -0,0 +1,194 @@
+# ===== 合成音声のフレーズキャッシュ =====
+# game_ai.py の VOICEVOX / Edge-TTS 読み上げ、voicevox_pipeline.py で使用
+# 挨拶・相づち・エラーメッセージなど繰り返し読み上げる文の合成結果を保存し、再合成を省く
+# - キーは (エンジン, 話者, 速度・音量などの合成パラメータ, 正規化した文) の SHA-256
+# - WAV (無圧縮PCM) は zlib で圧縮して保存し、MP3 など圧縮済みの形式はそのまま保存
+# - 合計サイズの上限を超えたら最終利用が古いものから削除 (LRU)。利用順はファイルの mtime で保持
+# - 起動時に定型フレーズを先行合成しておく prewarm を持つ
+
+import os
+import re
+import json
+import zlib
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+DEFAULT_MAX_MB = 64
+
+_HEADER_ZLIB = b"Z"
+_HEADER_RAW = b"R"
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sentence(text):
+    """全角・半角の揺れと空白の違いを吸収する（句読点はイントネーションに影響するため残す）"""
+    text = unicodedata.normalize("NFKC", text or "")
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def make_cache_key(engine, text, params):
+    key_data = json.dumps([engine, params, normalize_sentence(text)], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(key_data.encode("utf-8")).hexdigest()
+
+
+class TTSAudioCache:
+    """
+    使用例:
+        cache = get_tts_cache(os.path.join(root, "data", "tts_cache"))
+        audio = cache.get("voicevox", text, params)
+        if audio is None:
+            audio = synthesize(text)
+            cache.put("voicevox", text, params, audio, compress=True)
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()    # key -> 保存サイズ（古い順）
+        self._total = 0
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_entries()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.bin")
+
+    def _load_entries(self):
+        """既存ファイルを最終利用時刻 (mtime) 順に読み込み、LRU の順序を復元する"""
+        found = []
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.is_file() and entry.name.endswith(".bin"):
+                        st = entry.stat()
+                        found.append((st.st_mtime, entry.name[:-4], st.st_size))
+        except OSError:
+            pass
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total += size
+        self._evict_locked()
+
+    def _evict_locked(self):
+        while self._total > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total -= size
+            self.stats["evictions"] += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def get(self, engine, text, params):
+        key = make_cache_key(engine, text, params)
+        with self._lock:
+            if key not in self._entries:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)   # LRU の利用順を更新
+            audio = zlib.decompress(data[1:]) if data[:1] == _HEADER_ZLIB else data[1:]
+        except (OSError, zlib.error):
+            with self._lock:
+                size = self._entries.pop(key, None)
+                if size:
+                    self._total -= size
+                self.stats["misses"] += 1
+            return None
+        with self._lock:
+            self.stats["hits"] += 1
+        return audio
+
+    def put(self, engine, text, params, audio, compress=True):
+        """
+        合成結果を保存する
+        compress: WAV など無圧縮の音声は True、MP3 など圧縮済みは False
+        """
+        if not audio:
+            return
+        key = make_cache_key(engine, text, params)
+        data = (_HEADER_ZLIB + zlib.compress(audio, 6)) if compress else (_HEADER_RAW + audio)
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        tmp = path + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self._total -= old
+            self._entries[key] = len(data)
+            self._total += len(data)
+            self.stats["stores"] += 1
+            self._evict_locked()
+
+    def prewarm(self, phrases, engine, params, synth_func, compress=True):
+        """
+        未キャッシュの定型フレーズを合成して保存する（起動時にバックグラウンドで呼ぶ想定）
+        Returns: 新たに合成した件数
+        """
+        created = 0
+        for phrase in phrases:
+            if not normalize_sentence(phrase):
+                continue
+            key = make_cache_key(engine, phrase, params)
+            with self._lock:
+                if key in self._entries:
+                    continue
+            try:
+                audio = synth_func(phrase)
+            except Exception as e:
+                print(f"TTS cache prewarm error ({phrase}): {e}")
+                continue
+            self.put(engine, phrase, params, audio, compress=compress)
+            created += 1
+        return created
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+            self._entries.clear()
+            self._total = 0
+
+    def get_stats(self):
+        with self._lock:
+            total_req = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "size_mb": round(self._total / (1024 * 1024), 2),
+                "max_mb": round(self.max_bytes / (1024 * 1024), 2),
+                "hit_rate": round(self.stats["hits"] / total_req, 3) if total_req else 0.0,
+            }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_tts_cache(cache_dir, max_mb=DEFAULT_MAX_MB):
+    """キャッシュフォルダごとのインスタンス（プロセス内で共有）"""
+    key = os.path.abspath(cache_dir)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = TTSAudioCache(key, max_bytes=int(max_mb * 1024 * 1024))
+        else:
+            cache.max_bytes = int(max_mb * 1024 * 1024)
+        return cache
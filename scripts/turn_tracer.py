@@ -0,0 +1,287 @@
+# ===== 対話ターンの区間計測 (turn tracer) =====
+# game_ai.py の main で使用し、memory_viewer.py の「応答遅延 (Latency)」タブで表示する
+# 1回の対話（ターン）の時間が、どの段階（音声認識・日時解析・記憶検索・ゲートキーパー・Web検索・
+# LLM・読み上げの合成と再生）にかかったかを記録する
+# - span("memory_search") のコンテキストマネージャー、@traced("name") のデコレーターで区間を記録する
+#   （with で囲めない区間は start_span("llm") で始めて end() で記録する）
+# - mark("first_token") で時点を記録する（LLM の最初のトークン・最初の音声など）
+# - 記録先のターンはスレッドごとに持つ。別スレッドで続く処理（読み上げ・追加検索）は carry_trace(func) で
+#   ターンを引き継ぎ、引き継いだ処理がすべて終わった時点でターンを閉じて data/turn_traces.jsonl に1行追記する
+# - ファイルが MAX_FILE_BYTES を超えたら .1 に退避して新しく書き始める（直近分だけを残す）
+#
+# 使用例:
+#   trace = begin_trace("voice", root)
+#   with span("stt"):
+#       text = listen()
+#   threading.Thread(target=carry_trace(speak), args=(text,)).start()
+#   end_trace(trace)
+
+import os
+import json
+import time
+import threading
+import contextlib
+from collections import deque
+from datetime import datetime
+from functools import wraps
+
+TRACE_FILE = "turn_traces.jsonl"
+# これを超えたら .1 に退避する（2ファイル分を保持）
+MAX_FILE_BYTES = 1024 * 1024
+# /api/metrics 用にメモリに残すターン数
+RECENT_TURNS = 50
+# 引き継いだ処理が実行されずに残ったターンは、この秒数を過ぎたら閉じる
+STALE_SECONDS = 600
+
+_local = threading.local()
+_lock = threading.Lock()
+_file_lock = threading.Lock()
+_open_traces = []
+_recent = deque(maxlen=RECENT_TURNS)
+
+
+class TurnTrace:
+    def __init__(self, mode, root=None, session_id=None):
+        self.mode = mode
+        self.root = root
+        self.session_id = session_id
+        self.started_at = time.perf_counter()
+        self.timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.spans = []         # {"name", "start_ms", "ms", "thread"}
+        self.marks = {}         # 時点の名前 -> 開始からの ms
+        self.turn_ms = None     # main() が終わるまでの時間（追加検索などは含まない）
+        self._holds = 1
+        self._lock = threading.Lock()
+
+    def elapsed_ms(self):
+        return round((time.perf_counter() - self.started_at) * 1000, 1)
+
+    @contextlib.contextmanager
+    def span(self, name):
+        s = Span(self, name)
+        try:
+            yield s
+        finally:
+            s.end()
+
+    def add_span(self, entry):
+        with self._lock:
+            self.spans.append(entry)
+
+    def mark(self, name):
+        """時点を記録する（同名の2回目以降は無視）"""
+        with self._lock:
+            if name not in self.marks:
+                self.marks[name] = self.elapsed_ms()
+
+    def hold(self):
+        with self._lock:
+            self._holds += 1
+
+    def release(self):
+        """引き継いだ処理の終了。最後の1つが終わったらターンを閉じる"""
+        with self._lock:
+            self._holds -= 1
+            closing = self._holds == 0
+        if closing:
+            _close(self)
+
+    def to_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start_ms"])
+            marks = dict(self.marks)
+        return {"timestamp": self.timestamp, "mode": self.mode, "session_id": self.session_id,
+                "turn_ms": self.turn_ms, "total_ms": self.elapsed_ms(), "marks": marks, "spans": spans}
+
+
+class Span:
+    """開始済みの区間。end() で記録する（2回目以降の end() は無視）"""
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+        self.start_ms = trace.elapsed_ms()
+        self._ended = False
+
+    def end(self):
+        if self._ended:
+            return
+        self._ended = True
+        self.trace.add_span({"name": self.name, "start_ms": self.start_ms,
+                             "ms": round(self.trace.elapsed_ms() - self.start_ms, 1),
+                             "thread": threading.current_thread().name})
+
+
+class _NullSpan:
+    def end(self):
+        pass
+
+
+def begin_trace(mode, root=None, session_id=None):
+    """ターンの計測を始め、このスレッドの記録先にする"""
+    trace = TurnTrace(mode, root, session_id)
+    with _lock:
+        stale = [t for t in _open_traces if t.elapsed_ms() > STALE_SECONDS * 1000]
+        _open_traces.append(trace)
+    for t in stale:
+        _close(t)
+    _local.trace = trace
+    return trace
+
+
+def end_trace(trace=None):
+    """main() 側の計測を終える（引き継いだ処理が残っていれば、それが終わった時点で閉じる）"""
+    trace = trace or current_trace()
+    if trace is None:
+        return
+    trace.turn_ms = trace.elapsed_ms()
+    if getattr(_local, "trace", None) is trace:
+        _local.trace = None
+    trace.release()
+
+
+def current_trace():
+    """
+    このスレッドの記録先のターン
+    引き継いでいないスレッドでは、計測中のターンが1つだけならそれを返す（複数あれば区別できないので None）
+    """
+    trace = getattr(_local, "trace", None)
+    if trace is not None:
+        return trace
+    with _lock:
+        return _open_traces[0] if len(_open_traces) == 1 else None
+
+
+def span(name, trace=None):
+    """区間を記録する（計測中のターンがなければ何もしない）"""
+    trace = trace or current_trace()
+    return trace.span(name) if trace is not None else contextlib.nullcontext()
+
+
+def start_span(name, trace=None):
+    """
+    with で囲めない区間を始める（戻り値の end() で記録する）
+    計測中のターンがなければ何もしない Span を返す
+    """
+    trace = trace or current_trace()
+    return Span(trace, name) if trace is not None else _NullSpan()
+
+
+def mark(name, trace=None):
+    trace = trace or current_trace()
+    if trace is not None:
+        trace.mark(name)
+
+
+def traced(name):
+    """関数全体を区間として記録するデコレーター"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def carry_trace(func):
+    """
+    呼び出し時点のターンを、func を実行する別スレッドに引き継ぐ
+    func が終わるまでターンは閉じない
+    """
+    trace = current_trace()
+    if trace is None:
+        return func
+    trace.hold()
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        prev = getattr(_local, "trace", None)
+        _local.trace = trace
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.trace = prev
+            trace.release()
+    return wrapper
+
+
+def _close(trace):
+    with _lock:
+        if trace in _open_traces:
+            _open_traces.remove(trace)
+    record = trace.to_dict()
+    _recent.append(record)
+    if trace.root:
+        _append(trace.root, record)
+
+
+def _append(root, record):
+    path = os.path.join(root, "data", TRACE_FILE)
+    with _file_lock:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.exists(path) and os.path.getsize(path) > MAX_FILE_BYTES:
+                os.replace(path, path + ".1")
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError:
+            pass
+
+
+# --- 集計（メモリービューアー・/api/metrics 用） ---
+def load_traces(root, limit=200):
+    """data/turn_traces.jsonl（と退避した .1）から直近 limit 件を古い順に返す"""
+    path = os.path.join(root, "data", TRACE_FILE)
+    records = []
+    for p in (path + ".1", path):
+        if not os.path.exists(p):
+            continue
+        with open(p, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    return records[-limit:] if limit else records
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, round(p / 100 * (len(values) - 1))))
+    return round(values[k], 1)
+
+
+def summarize_traces(records):
+    """
+    段階ごとの p50 / p95（同じターンで複数回あれば合計）と、時点 (marks) の p50 / p95
+    Returns: {"turns": n, "stages": {name: {"count", "p50", "p95", "avg"}}, "marks": {...}}
+    """
+    per_stage, per_mark = {}, {}
+    for r in records:
+        totals = {}
+        for s in r.get("spans", []):
+            totals[s["name"]] = totals.get(s["name"], 0) + s["ms"]
+        for name, ms in totals.items():
+            per_stage.setdefault(name, []).append(ms)
+        for name, ms in (r.get("marks") or {}).items():
+            per_mark.setdefault(name, []).append(ms)
+        if r.get("turn_ms") is not None:
+            per_mark.setdefault("turn_end", []).append(r["turn_ms"])
+
+    def stats(values):
+        return {"count": len(values), "p50": percentile(values, 50), "p95": percentile(values, 95),
+                "avg": round(sum(values) / len(values), 1)}
+    return {"turns": len(records),
+            "stages": {name: stats(v) for name, v in per_stage.items()},
+            "marks": {name: stats(v) for name, v in per_mark.items()}}
+
+
+def get_trace_stats():
+    """このプロセスで記録した直近ターンの集計と、最新ターンの内訳"""
+    records = list(_recent)
+    summary = summarize_traces(records)
+    summary["latest"] = records[-1] if records else None
+    return summary
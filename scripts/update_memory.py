@@ -73,6 +73,31 @@ except ImportError:
     except ImportError:
         get_chroma_collection = None
 
+# 追記型チャット履歴ストア
+try:
+    from .history_store import get_history_store
+except ImportError:
+    try:
+        from history_store import get_history_store
+    except ImportError:
+        get_history_store = None
+
+# LLMクライアント・HTTP接続プールの共有レジストリ（無い環境では呼び出しごとに生成）
+try:
+    from .client_registry import gemini_client, openai_client, http_client
+except ImportError:
+    try:
+        from client_registry import gemini_client, openai_client, http_client
+    except ImportError:
+        def gemini_client(api_key):
+            return genai.Client(api_key=api_key)
+
+        def openai_client(api_key):
+            return OpenAI(api_key=api_key)
+
+        def http_client():
+            return requests
+
 # === 1. パス解決・ログ・言語管理 ===
 def get_app_root():
     if getattr(sys, 'frozen', False):
@@ -175,15 +200,25 @@ def main(base_path=None):
         ttl_hours = config.get("API_CACHE_TTL_HOURS", 24)
         api_cache = APICache(cache_dir, ttl_hours=ttl_hours)
 
-    if not os.path.exists(history_file): return
-    try:
-        with open(history_file, "r", encoding="utf-8") as f:
-            history = json.load(f)
-    except:
-        return
+    if get_history_store:
+        history_store = get_history_store(history_file)
+        try:
+            # 履歴が16件以上ある場合に実行（10件を圧縮し、6件を直近の文脈として残す）
+            if history_store.count() < 16: return
+            history = history_store.head(10)
+        except:
+            return
+    else:
+        history_store = None
+        if not os.path.exists(history_file): return
+        try:
+            with open(history_file, "r", encoding="utf-8") as f:
+                history = json.load(f)
+        except:
+            return
 
-    # 履歴が16件以上ある場合に実行（10件を圧縮し、6件を直近の文脈として残す）
-    if len(history) < 16: return
+        # 履歴が16件以上ある場合に実行（10件を圧縮し、6件を直近の文脈として残す）
+        if len(history) < 16: return
 
     try:
         send_log_to_hub(lang_data["log_messages"]["memory_update_start"])
@@ -218,7 +253,7 @@ def main(base_path=None):
             local_db_model_id, level = parse_model_name(db_model_id)
 
             if db_provider == "openai":
-                client_oa = OpenAI(api_key=config.get("OPENAI_API_KEY"))
+                client_oa = openai_client(config.get("OPENAI_API_KEY"))
                 openai_kwargs = {
                     "model": local_db_model_id,
                     "messages": [{"role": "user", "content": prompt}]
@@ -244,7 +279,7 @@ def main(base_path=None):
                     else:
                         post_data["temperature"] = 0.3
                         
-                    res = requests.post(
+                    res = http_client().post(
                         f"{url.rstrip('/')}/chat/completions",
                         json=post_data,
                         timeout=180
@@ -258,7 +293,7 @@ def main(base_path=None):
                     cached = api_cache.get(prompt, provider=db_provider, model=local_db_model_id)
                     if cached: return cached
 
-                client_ge = genai.Client(api_key=config.get("GEMINI_API_KEY"))
+                client_ge = gemini_client(config.get("GEMINI_API_KEY"))
 
                 gemini_config_obj = {}
                 if level is None:
@@ -292,7 +327,7 @@ def main(base_path=None):
             local_db_model_id, level = parse_model_name(db_model_id)
 
             if db_provider == "openai":
-                client_oa = OpenAI(api_key=config.get("OPENAI_API_KEY"))
+                client_oa = openai_client(config.get("OPENAI_API_KEY"))
                 openai_kwargs = {
                     "model": local_db_model_id,
                     "messages": [{"role": "user", "content": prompt}]
@@ -318,7 +353,7 @@ def main(base_path=None):
                     else:
                         post_data["temperature"] = 0.3
                         
-                    res = requests.post(
+                    res = http_client().post(
                         f"{url.rstrip('/')}/chat/completions",
                         json=post_data,
                         timeout=180
@@ -332,7 +367,7 @@ def main(base_path=None):
                     cached = api_cache.get(prompt, provider=db_provider, model=local_db_model_id)
                     if cached: return cached
 
-                client_ge = genai.Client(api_key=config.get("GEMINI_API_KEY"))
+                client_ge = gemini_client(config.get("GEMINI_API_KEY"))
 
                 gemini_config_obj = {}
                 if level is None:
@@ -470,14 +505,18 @@ def main(base_path=None):
 
         # --- 6. 履歴ファイルの更新（古い10件を消し、新しい履歴を受け継ぐ） ---
         # [SEARCH:] タグをクリーンアップして保存
-        cleaned_history = []
-        for entry in remaining_history:
+        def clean_entry(entry):
             if isinstance(entry, str):
                 entry = re.sub(r'\n\n\[SEARCH:.*?\]', '', entry, flags=re.DOTALL).strip()
-            cleaned_history.append(entry)
+            return entry
 
-        with open(history_file, "w", encoding="utf-8") as f:
-            json.dump(cleaned_history, f, ensure_ascii=False, indent=2)
+        if history_store:
+            # 要約中に追記された発言も含めて、先頭10件だけを原子的に切り詰める
+            history_store.consume(len(processing_target), transform=clean_entry)
+        else:
+            cleaned_history = [clean_entry(entry) for entry in remaining_history]
+            with open(history_file, "w", encoding="utf-8") as f:
+                json.dump(cleaned_history, f, ensure_ascii=False, indent=2)
         
         send_log_to_hub(lang_data["log_messages"]["memory_update_done"])
         threading.Thread(target=play_sound, args=("down",), daemon=True).start()
@@ -0,0 +1,463 @@
+# ===== 音声入力の発話区間検出 (VAD endpointing) =====
+# game_ai.py の get_voice_input で使用
+# 毎回 0.8 秒の環境ノイズ測定 (adjust_for_ambient_noise) と、1.2 秒の無音で終わる固定の pause_threshold による
+# 1発話あたり約 2 秒の待ち時間を減らす
+# - 環境ノイズ: マイクごとの測定値を data/voice_calibration.json に保存して使い回す。入力中の無音フレームで
+#   少しずつ更新し（バックグラウンドで保存）、VAD_CALIBRATION_MAX_AGE_SEC を過ぎた時だけ入力前に短く測り直す
+# - 発話判定: フレーム (30ms) ごとの音量 (RMS) とゼロ交差率による判定 (EnergyVAD)。webrtcvad があれば
+#   VAD_ENGINE = "webrtc" で WebRTC VAD も使える
+# - 終端判定: 発話が VAD_HANGOVER_MS 途切れたら入力を終える (Endpointer)。発話開始の直前 (PREROLL_MS) も含めて返す
+# - オフライン評価: WAV と正解ラベル（同名の .json: {"speech": [[開始秒, 終了秒], ...]}。1ファイル1発話）から、
+#   発話終了から入力終了までの遅延と、言葉の間で切れてしまった件数（途中切れ）を hangover ごとに集計する
+#
+# 使用例（オフライン評価）:
+#   python scripts/voice_endpointing.py synthesize --out data/vad_fixtures
+#   python scripts/voice_endpointing.py evaluate --fixtures data/vad_fixtures --hangover 300,450,600,800,1200
+#   python scripts/voice_endpointing.py evaluate --fixtures my_recordings --engine webrtc
+
+import os
+import sys
+import json
+import math
+import time
+import wave
+import threading
+from collections import deque
+
+import numpy as np
+
+try:
+    import webrtcvad
+except ImportError:
+    webrtcvad = None
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+FRAME_MS = 30
+DEFAULT_HANGOVER_MS = 800
+# 発話開始とみなす連続した発話フレームの長さと、返す音声に含める開始前の長さ
+ONSET_MS = 90
+PREROLL_MS = 300
+# これより短い発話（物音など）は発話とみなさず待機に戻る
+MIN_SPEECH_MS = 150
+
+# 発話開始は「ノイズ × ON_RATIO」、発話中は「ノイズ × OFF_RATIO」を超えれば発話とみなす（ヒステリシス）
+ON_RATIO = 3.0
+OFF_RATIO = 1.8
+# ゼロ交差率がこれ以上のフレームは摩擦音（サ行など）とみなし、OFF_RATIO で判定する
+FRICATIVE_ZCR = 0.3
+# 無音とみなす RMS の下限（16bit）。無音に近いデバイスでわずかなノイズを発話と誤判定しないため
+MIN_NOISE_RMS = 30.0
+# 入力中の無音フレームで環境ノイズを更新する割合
+NOISE_ADAPT_RATE = 0.05
+
+CALIBRATION_FILE = "voice_calibration.json"
+DEFAULT_CALIBRATION_MAX_AGE = 1800
+# キャッシュがない・古い時に入力前に測る秒数（従来は毎回 0.8 秒）
+QUICK_CALIBRATION_SEC = 0.25
+
+
+def frame_features(frame, sample_width=SAMPLE_WIDTH):
+    """フレームの (RMS, ゼロ交差率)"""
+    samples = pcm_to_array(frame, sample_width)
+    if samples.size == 0:
+        return 0.0, 0.0
+    rms = float(np.sqrt(np.mean(samples * samples)))
+    zcr = float(np.count_nonzero(np.diff(np.signbit(samples)))) / max(1, samples.size - 1)
+    return rms, zcr
+
+
+def pcm_to_array(data, sample_width=SAMPLE_WIDTH):
+    """PCM のバイト列を 16bit 相当の float 配列にする"""
+    if sample_width == 2:
+        return np.frombuffer(data, dtype="<i2").astype(np.float64)
+    if sample_width == 1:
+        return (np.frombuffer(data, dtype=np.uint8).astype(np.float64) - 128) * 256
+    if sample_width == 4:
+        return np.frombuffer(data, dtype="<i4").astype(np.float64) / 65536
+    raise ValueError(f"unsupported sample width: {sample_width}")
+
+
+class EnergyVAD:
+    """音量とゼロ交差率による発話判定。環境ノイズ (noise_rms) は無音フレームで少しずつ更新する"""
+
+    def __init__(self, noise_rms=None, on_ratio=ON_RATIO, off_ratio=OFF_RATIO):
+        self.noise_rms = max(MIN_NOISE_RMS, noise_rms or MIN_NOISE_RMS)
+        self.on_ratio = on_ratio
+        self.off_ratio = off_ratio
+
+    def is_speech(self, frame, in_speech=False, sample_rate=SAMPLE_RATE, sample_width=SAMPLE_WIDTH):
+        rms, zcr = frame_features(frame, sample_width)
+        weak = rms > self.noise_rms * self.off_ratio
+        speech = rms > self.noise_rms * self.on_ratio or (weak and (in_speech or zcr >= FRICATIVE_ZCR))
+        if not weak:
+            self.observe_noise(rms)
+        return speech
+
+    def observe_noise(self, rms):
+        self.noise_rms = max(MIN_NOISE_RMS, self.noise_rms + (rms - self.noise_rms) * NOISE_ADAPT_RATE)
+
+
+class WebRTCVAD(EnergyVAD):
+    """WebRTC VAD による判定（8/16/32/48kHz・10/20/30ms のフレームのみ）。環境ノイズの推定は EnergyVAD と共通"""
+
+    def __init__(self, noise_rms=None, aggressiveness=2):
+        super().__init__(noise_rms)
+        self.vad = webrtcvad.Vad(int(aggressiveness))
+
+    def is_speech(self, frame, in_speech=False, sample_rate=SAMPLE_RATE, sample_width=SAMPLE_WIDTH):
+        rms, _ = frame_features(frame, sample_width)
+        speech = self.vad.is_speech(frame, sample_rate)
+        if not speech and rms <= self.noise_rms * self.off_ratio:
+            self.observe_noise(rms)
+        return speech
+
+
+def create_vad(engine="energy", noise_rms=None, aggressiveness=2):
+    """engine: "energy" / "webrtc"（webrtcvad がなければ energy を使う）"""
+    if engine == "webrtc" and webrtcvad is not None:
+        return WebRTCVAD(noise_rms, aggressiveness)
+    return EnergyVAD(noise_rms)
+
+
+class Endpointer:
+    """
+    フレームを順に受け取り、発話の開始と終了を判定する
+    push(frame) は "start"（発話開始）/ "end"（入力終了）/ None を返す。時刻はすべて入力開始からの ms
+    """
+
+    def __init__(self, vad, sample_rate=SAMPLE_RATE, frame_ms=FRAME_MS, hangover_ms=DEFAULT_HANGOVER_MS,
+                 sample_width=SAMPLE_WIDTH):
+        self.vad = vad
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.frame_ms = frame_ms
+        self.hangover_ms = hangover_ms
+        self._onset_frames = max(1, round(ONSET_MS / frame_ms))
+        self._hangover_frames = max(1, round(hangover_ms / frame_ms))
+        self._preroll = deque(maxlen=max(self._onset_frames, round(PREROLL_MS / frame_ms)))
+        self._frames = []
+        self._run = 0           # 連続した発話フレーム数（開始判定用）
+        self._silence = 0       # 発話中に続いている無音フレーム数
+        self._voiced = 0        # 発話中の発話フレーム数
+        self._pos = 0
+        self.in_speech = False
+        self.ended = False
+        self.speech_start_ms = None
+        self.speech_end_ms = None   # 最後の発話フレームの終わり
+        self.decided_ms = None      # 入力終了を判定した時刻
+
+    def push(self, frame):
+        if self.ended:
+            return None
+        self._pos += 1
+        speech = self.vad.is_speech(frame, self.in_speech, self.sample_rate, self.sample_width)
+        now_ms = self._pos * self.frame_ms
+
+        if not self.in_speech:
+            self._preroll.append(frame)
+            self._run = self._run + 1 if speech else 0
+            if self._run < self._onset_frames:
+                return None
+            self.in_speech = True
+            self.speech_start_ms = now_ms - self._run * self.frame_ms
+            self.speech_end_ms = now_ms
+            self._frames = list(self._preroll)
+            self._voiced, self._silence = self._run, 0
+            return "start"
+
+        self._frames.append(frame)
+        if speech:
+            self._voiced += 1
+            self._silence = 0
+            self.speech_end_ms = now_ms
+            return None
+        self._silence += 1
+        if self._silence < self._hangover_frames:
+            return None
+        if self._voiced * self.frame_ms < MIN_SPEECH_MS:
+            # 物音だけで終わった: 待機に戻る
+            self.in_speech = False
+            self.speech_start_ms = self.speech_end_ms = None
+            self._frames, self._run = [], 0
+            self._preroll.clear()
+            return None
+        self.ended = True
+        self.decided_ms = now_ms
+        return "end"
+
+    @property
+    def elapsed_ms(self):
+        return self._pos * self.frame_ms
+
+    def audio_bytes(self):
+        return b"".join(self._frames)
+
+
+# --- 環境ノイズのキャッシュ ---
+class NoiseCalibration:
+    """マイクごとの環境ノイズ (RMS) を data/voice_calibration.json に保存して使い回す"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def get(self, device, max_age=DEFAULT_CALIBRATION_MAX_AGE):
+        """保存済みの値（なければ・max_age 秒より古ければ None）"""
+        with self._lock:
+            entry = self._entries.get(device)
+        if not entry or time.time() - entry.get("updated", 0) > max_age:
+            return None
+        return entry.get("noise_rms")
+
+    def update(self, device, noise_rms, measured=False):
+        """
+        値を更新してバックグラウンドで保存する
+        measured: 入力前に測った値（保存時刻を更新する）。入力中の推定値では時刻を進めず、定期的な測り直しを残す
+        """
+        with self._lock:
+            entry = self._entries.setdefault(device, {"updated": 0})
+            entry["noise_rms"] = round(float(noise_rms), 1)
+            if measured:
+                entry["updated"] = time.time()
+            snapshot = json.dumps(self._entries, ensure_ascii=False, indent=2)
+        # 1ターンで終わるプロセスでも書き終えるよう daemon にしない
+        threading.Thread(target=self._write, args=(snapshot,), name="voice-calibration-save").start()
+
+    def _write(self, snapshot):
+        tmp = self.path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(snapshot)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+
+_calibrations = {}
+_calibrations_lock = threading.Lock()
+
+
+def get_noise_calibration(root):
+    """アプリフォルダごとのインスタンス（プロセス内で共有）"""
+    path = os.path.join(root, "data", CALIBRATION_FILE)
+    with _calibrations_lock:
+        if path not in _calibrations:
+            _calibrations[path] = NoiseCalibration(path)
+        return _calibrations[path]
+
+
+# --- マイクからの入力 (speech_recognition の Microphone) ---
+def measure_noise(source, duration=QUICK_CALIBRATION_SEC):
+    """入力前に環境ノイズを測る（フレーム RMS の中央値）"""
+    frames = max(1, int(duration * source.SAMPLE_RATE / source.CHUNK))
+    values = [frame_features(source.stream.read(source.CHUNK), source.SAMPLE_WIDTH)[0] for _ in range(frames)]
+    return float(np.median(values))
+
+
+def listen_with_vad(source, endpointer, timeout=10, phrase_time_limit=20, should_stop=None, on_start=None):
+    """
+    発話が終わるまでマイクから読み、発話部分の PCM を返す
+    timeout 秒以内に話し始めなかった・phrase_time_limit 秒を超えた・should_stop() が真になった場合は
+    それまでの状態に応じて None（未発話・中断）または途中までの音声を返す
+    """
+    frame_ms = endpointer.frame_ms
+    while True:
+        if should_stop and should_stop():
+            return None
+        event = endpointer.push(source.stream.read(source.CHUNK))
+        if event == "start" and on_start:
+            on_start()
+        if event == "end":
+            return endpointer.audio_bytes()
+        if not endpointer.in_speech and endpointer.elapsed_ms >= timeout * 1000:
+            return None
+        if endpointer.in_speech and endpointer.elapsed_ms - endpointer.speech_start_ms >= phrase_time_limit * 1000 - frame_ms:
+            return endpointer.audio_bytes()
+
+
+# --- オフライン評価 ---
+def read_wav(path):
+    """Returns: (モノラル 16bit の PCM, サンプリングレート)"""
+    with wave.open(path, "rb") as w:
+        rate, width, channels = w.getframerate(), w.getsampwidth(), w.getnchannels()
+        samples = pcm_to_array(w.readframes(w.getnframes()), width)
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return np.clip(samples, -32768, 32767).astype("<i2").tobytes(), rate
+
+
+def run_endpointer_on_pcm(pcm, rate, hangover_ms, engine="energy", noise_rms=None, aggressiveness=2):
+    """PCM を先頭から流して Endpointer の判定結果を返す（音声がなくなったら終わる）"""
+    step = int(rate * FRAME_MS / 1000) * SAMPLE_WIDTH
+    endpointer = Endpointer(create_vad(engine, noise_rms, aggressiveness), rate, FRAME_MS, hangover_ms)
+    for i in range(0, len(pcm) - step + 1, step):
+        if endpointer.push(pcm[i:i + step]) == "end":
+            break
+    return endpointer
+
+
+def noise_from_labels(pcm, rate, segments):
+    """ラベルの発話区間外のフレーム RMS の中央値（キャッシュ済みの環境ノイズに相当）"""
+    step = int(rate * FRAME_MS / 1000)
+    samples = pcm_to_array(pcm)
+    values = []
+    for i in range(0, samples.size - step + 1, step):
+        t = i / rate
+        if all(not (s - 0.2 <= t <= e + 0.2) for s, e in segments):
+            chunk = samples[i:i + step]
+            values.append(math.sqrt(float(np.mean(chunk * chunk))))
+    return float(np.median(values)) if values else None
+
+
+def evaluate_fixture(wav_path, segments, hangover_ms, engine="energy", aggressiveness=2):
+    """
+    1ファイル分の評価
+    latency_ms: 正解の発話終了から入力終了までの時間 / truncated: 最後の発話より前に入力を終えた
+    """
+    pcm, rate = read_wav(wav_path)
+    ep = run_endpointer_on_pcm(pcm, rate, hangover_ms, engine, noise_from_labels(pcm, rate, segments), aggressiveness)
+    true_start, true_end = segments[0][0] * 1000, segments[-1][1] * 1000
+    result = {"file": os.path.basename(wav_path), "detected": ep.speech_start_ms is not None,
+              "onset_error_ms": None, "latency_ms": None, "truncated": False}
+    if ep.speech_start_ms is None:
+        return result
+    result["onset_error_ms"] = round(ep.speech_start_ms - true_start, 1)
+    if ep.decided_ms is None:
+        # 音声の終わりまで入力が終わらなかった
+        result["latency_ms"] = round(len(pcm) / SAMPLE_WIDTH / rate * 1000 - true_end, 1)
+        result["unterminated"] = True
+        return result
+    result["latency_ms"] = round(ep.decided_ms - true_end, 1)
+    result["truncated"] = ep.decided_ms < true_end
+    return result
+
+
+def load_fixtures(folder):
+    """folder 内の WAV と、同名の .json の発話区間 [[開始秒, 終了秒], ...] の組"""
+    fixtures = []
+    for name in sorted(os.listdir(folder)):
+        if not name.lower().endswith(".wav"):
+            continue
+        label = os.path.join(folder, os.path.splitext(name)[0] + ".json")
+        if not os.path.exists(label):
+            print(f"[voice_endpointing] skipping {name}: no label file")
+            continue
+        with open(label, "r", encoding="utf-8") as f:
+            segments = sorted(json.load(f)["speech"])
+        if segments:
+            fixtures.append((os.path.join(folder, name), segments))
+    return fixtures
+
+
+def evaluate(fixtures, hangovers, engine="energy", aggressiveness=2):
+    """hangover ごとの遅延 (p50 / p95)・途中切れ・未検出・終了せずの件数"""
+    report = []
+    for hangover in hangovers:
+        results = [evaluate_fixture(path, segs, hangover, engine, aggressiveness) for path, segs in fixtures]
+        complete = sorted(r["latency_ms"] for r in results if r["detected"] and not r["truncated"]
+                          and not r.get("unterminated"))
+
+        def pct(p):
+            return complete[min(len(complete) - 1, round(p / 100 * (len(complete) - 1)))] if complete else None
+        report.append({
+            "hangover_ms": hangover, "files": len(results),
+            "latency_p50_ms": pct(50), "latency_p95_ms": pct(95),
+            "truncated": sum(1 for r in results if r["truncated"]),
+            "missed": sum(1 for r in results if not r["detected"]),
+            "unterminated": sum(1 for r in results if r.get("unterminated")),
+            "truncated_files": [r["file"] for r in results if r["truncated"]],
+        })
+    return report
+
+
+def synthesize_fixtures(out_dir, count=24, seed=0, rate=SAMPLE_RATE):
+    """
+    評価用の合成 WAV（背景ノイズ + 声に似た調波音と摩擦音の単語 + 単語間の間）と正解ラベルを作る
+    実際の録音の代わりにはならないが、hangover を変えた時の遅延と途中切れの傾向を CI などで確認できる
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    for n in range(count):
+        noise_level = rng.uniform(50, 400)
+        t_cursor = rng.uniform(0.4, 1.2)
+        parts, segments = [], []
+        parts.append(rng.normal(0, noise_level, int(t_cursor * rate)))
+        for w in range(int(rng.integers(2, 6))):
+            dur = rng.uniform(0.25, 0.8)
+            t = np.arange(int(dur * rate)) / rate
+            f0 = rng.uniform(110, 260)
+            voiced = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 6))
+            # 4〜6Hz の音節の抑揚と、単語の立ち上がり・減衰
+            envelope = (0.55 + 0.45 * np.sin(2 * np.pi * rng.uniform(4, 6) * t)) * np.minimum(1, np.minimum(t, dur - t) / 0.04)
+            word = voiced * envelope * rng.uniform(2500, 6000)
+            if rng.random() < 0.4:
+                # 語尾の摩擦音（弱く、ゼロ交差の多い音）
+                tail = np.diff(rng.normal(0, 1, int(0.12 * rate) + 1)) * noise_level * rng.uniform(1.5, 2.5)
+                word = np.concatenate([word, tail])
+            word = word + rng.normal(0, noise_level, word.size)
+            parts.append(word)
+            segments.append([round(t_cursor, 3), round(t_cursor + word.size / rate, 3)])
+            t_cursor += word.size / rate
+            # 単語間の間（時々、考えながら話す長めの間）
+            gap = rng.uniform(0.08, 0.3) if rng.random() < 0.75 else rng.uniform(0.35, 0.7)
+            parts.append(rng.normal(0, noise_level, int(gap * rate)))
+            t_cursor += gap
+        parts.append(rng.normal(0, noise_level, int(2.5 * rate)))
+        pcm = np.clip(np.concatenate(parts), -32768, 32767).astype("<i2").tobytes()
+        name = os.path.join(out_dir, f"synthetic_{n:02d}")
+        with wave.open(name + ".wav", "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(SAMPLE_WIDTH)
+            w.setframerate(rate)
+            w.writeframes(pcm)
+        with open(name + ".json", "w", encoding="utf-8") as f:
+            json.dump({"speech": segments, "synthetic": True}, f)
+    return count
+
+
+def _main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description="音声入力の発話区間検出のオフライン評価")
+    sub = parser.add_subparsers(dest="command", required=True)
+    syn = sub.add_parser("synthesize", help="合成した評価用 WAV と正解ラベルを作る")
+    syn.add_argument("--out", required=True)
+    syn.add_argument("--count", type=int, default=24)
+    syn.add_argument("--seed", type=int, default=0)
+    ev = sub.add_parser("evaluate", help="WAV と正解ラベルで遅延と途中切れを集計する")
+    ev.add_argument("--fixtures", required=True, help="WAV と同名の .json（発話区間）を置いたフォルダ")
+    ev.add_argument("--hangover", default="300,450,600,800,1200", help="評価する hangover (ms) のカンマ区切り")
+    ev.add_argument("--engine", choices=["energy", "webrtc"], default="energy")
+    ev.add_argument("--aggressiveness", type=int, default=2, help="webrtc の判定の厳しさ (0-3)")
+    ev.add_argument("--json", action="store_true", help="結果を JSON で出力する")
+    args = parser.parse_args(argv)
+
+    if args.command == "synthesize":
+        print(f"wrote {synthesize_fixtures(args.out, args.count, args.seed)} fixtures to {args.out}")
+        return 0
+    if args.engine == "webrtc" and webrtcvad is None:
+        print("webrtcvad is not installed; falling back to the energy VAD")
+    fixtures = load_fixtures(args.fixtures)
+    if not fixtures:
+        print(f"no labelled WAV fixtures in {args.fixtures}")
+        return 1
+    report = evaluate(fixtures, [int(h) for h in args.hangover.split(",")], args.engine, args.aggressiveness)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0
+    print(f"{'hangover':>9} {'p50':>8} {'p95':>8} {'truncated':>10} {'missed':>7} {'no_end':>7}  (latency ms after speech end)")
+    for r in report:
+        print(f"{r['hangover_ms']:>9} {str(r['latency_p50_ms']):>8} {str(r['latency_p95_ms']):>8} "
+              f"{r['truncated']:>10} {r['missed']:>7} {r['unterminated']:>7}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv[1:]))
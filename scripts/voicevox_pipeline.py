@@ -0,0 +1,235 @@
+# ===== VOICEVOX 合成・再生パイプライン =====
+# game_ai.py の run_voicevox_speak で使用
+# - 次に読み上げる文の audio_query / synthesis を、設定した先行数まで並列に実行する
+# - 接続は client_registry の keep-alive セッションを使い回す
+# - 合成結果はメモリ上の WAV のまま再生側に渡す（一時ファイルを作らない）
+# - 再生が終わった瞬間に次の文を再生できるよう、固定ウェイトを置かずに先行合成しておく
+# - 文ごとの合成時間・待ち時間・再生時間を記録し、get_last_run_stats() で返す
+# - フレーズキャッシュ (tts_audio_cache) を渡すと、合成済みの文はエンジンに問い合わせない
+# - 中断されたら合成待ちの文を取り消し、再生しなかった文の数を last_reclaimed に残す
+
+import time
+import threading
+import queue
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import requests
+
+try:
+    from .client_registry import http_client
+except ImportError:
+    try:
+        from client_registry import http_client
+    except ImportError:
+        def http_client():
+            return requests
+
+VOICEVOX_URL = "http://127.0.0.1:50021"
+# 先行して合成する文の数（VOICEVOX の CPU 負荷とのバランスで調整）
+DEFAULT_PIPELINE_DEPTH = 2
+
+
+def get_voicevox_url(config=None):
+    url = (config or {}).get("VOICEVOX_URL") or VOICEVOX_URL
+    return url.rstrip("/").replace("localhost", "127.0.0.1")
+
+
+class VoicevoxPipeline:
+    """
+    使用例:
+        pipeline = VoicevoxPipeline(config)
+        pipeline.run(sentences, play_func=play_wav_bytes, should_stop=lambda: stopped)
+    """
+
+    def __init__(self, config, depth=None, cache=None):
+        self.config = config
+        self.cache = cache
+        self.base_url = get_voicevox_url(config)
+        self.depth = max(1, int(depth or config.get("VOICEVOX_PIPELINE_DEPTH", DEFAULT_PIPELINE_DEPTH)))
+        self.speaker_id = config.get("SPEAKER_ID", 3)
+        self.speed = config.get("VOICE_SPEED", 1.2)
+        self.volume = config.get("VOICE_VOLUME", 1.0)
+        # 合成結果に影響するパラメータ（キャッシュキーの一部）
+        self.cache_params = {"speaker": self.speaker_id, "speed": self.speed,
+                             "volume": self.volume, "post_phoneme": 0.1}
+        # 直前の run() で中断により再生しなかった文の数（うち合成を始める前に取り消せた数）
+        self.last_reclaimed = {"sentences": 0, "synth_cancelled": 0}
+
+    def synthesize(self, text):
+        """1文を合成して (WAVバイト列, 合成にかかった秒数, キャッシュ利用の有無) を返す"""
+        t0 = time.perf_counter()
+        if self.cache:
+            audio = self.cache.get("voicevox", text, self.cache_params)
+            if audio is not None:
+                return audio, time.perf_counter() - t0, True
+        audio = self.synthesize_remote(text)
+        if self.cache:
+            self.cache.put("voicevox", text, self.cache_params, audio, compress=True)
+        return audio, time.perf_counter() - t0, False
+
+    def synthesize_remote(self, text):
+        """VOICEVOX エンジンで1文を合成して WAV バイト列を返す（キャッシュを使わない）"""
+        client = http_client()
+        query = client.post(
+            f"{self.base_url}/audio_query",
+            params={"text": text, "speaker": self.speaker_id},
+            timeout=10
+        )
+        query.raise_for_status()
+        body = query.json()
+        body["speedScale"] = self.speed
+        body["volumeScale"] = self.volume
+        body["postPhonemeLength"] = 0.1
+        res = client.post(
+            f"{self.base_url}/synthesis",
+            params={"speaker": self.speaker_id},
+            json=body,
+            timeout=30
+        )
+        res.raise_for_status()
+        return res.content
+
+    def run(self, sentences, play_func, should_stop=None, on_error=None, span=None):
+        """
+        sentences を先行合成しながら順番に再生する
+
+        Args:
+            sentences: 文のイテレーター（ストリーミング応答のように途中で待つものでもよい）
+            play_func: WAVバイト列を受け取って再生し、最後まで再生したら True、中断されたら False を返す
+            should_stop: 中断判定（True で残りを破棄）
+            on_error: 合成エラー時に呼ぶ callback(exception)
+            span: 区間計測のコンテキストマネージャーを返す span(name)。文ごとの合成 ("tts_synth") と
+                  再生 ("tts_play") を記録する
+        Returns:
+            文ごとの計測結果のリスト
+        """
+        should_stop = should_stop or (lambda: False)
+        span = span or (lambda name: contextlib.nullcontext())
+
+        def synthesize(text):
+            with span("tts_synth"):
+                return self.synthesize(text)
+        # 再生待ちの合成ジョブ（順序を保つ）。先行数は slots で制限する
+        pending = queue.Queue()
+        slots = threading.Semaphore(self.depth)
+        stats = []
+        stopped = threading.Event()
+
+        executor = ThreadPoolExecutor(max_workers=self.depth, thread_name_prefix="voicevox")
+
+        def feeder():
+            try:
+                for idx, text in enumerate(sentences):
+                    while not slots.acquire(timeout=0.1):
+                        if stopped.is_set():
+                            return
+                    if stopped.is_set() or should_stop():
+                        return
+                    pending.put((idx, text, time.perf_counter(), executor.submit(synthesize, text)))
+            finally:
+                pending.put(None)
+
+        feeder_thread = threading.Thread(target=feeder, daemon=True)
+        feeder_thread.start()
+
+        def next_item():
+            # 中断されたら、次の文の到着（LLM の生成待ちなど）を待たずに抜ける
+            while not should_stop():
+                try:
+                    return pending.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            return None
+
+        def wait_result(future):
+            while not should_stop():
+                try:
+                    return future.result(timeout=0.1)
+                except FutureTimeoutError:
+                    pass
+            return None
+
+        last_play_end = None
+        item = None
+        try:
+            while True:
+                item = next_item()
+                if item is None:
+                    break
+                idx, text, submitted_at, future = item
+                wait_start = time.perf_counter()
+                try:
+                    result = wait_result(future)
+                except Exception as e:
+                    slots.release()
+                    if on_error:
+                        on_error(e)
+                    continue
+                if result is None:
+                    break
+                audio, synth_sec, cached = result
+                play_start = time.perf_counter()
+                # 再生を始めた文の枠を空け、次の文の合成を開始させる
+                slots.release()
+                if should_stop():
+                    break
+                item = None
+                with span("tts_play"):
+                    completed = play_func(audio)
+                play_end = time.perf_counter()
+                stats.append({
+                    "index": idx,
+                    "chars": len(text),
+                    "synth_ms": round(synth_sec * 1000, 1),
+                    "cached": cached,
+                    "wait_ms": round((play_start - wait_start) * 1000, 1),
+                    "play_ms": round((play_end - play_start) * 1000, 1),
+                    # 前の文の再生終了から次の文の再生開始までの無音時間
+                    "gap_ms": round((play_start - last_play_end) * 1000, 1) if last_play_end else None,
+                })
+                last_play_end = play_end
+                if not completed:
+                    break
+        finally:
+            stopped.set()
+            self.last_reclaimed = self._drain(pending, item)
+            executor.shutdown(wait=False, cancel_futures=True)
+            _record_run(stats, self.depth)
+        return stats
+
+    @staticmethod
+    def _drain(pending, current):
+        """再生せずに終わった文を取り消して数える"""
+        items = [current] if current is not None else []
+        while True:
+            try:
+                item = pending.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                items.append(item)
+        cancelled = sum(1 for _, _, _, future in items if future.cancel())
+        return {"sentences": len(items), "synth_cancelled": cancelled}
+
+
+_stats_lock = threading.Lock()
+_last_run = {}
+
+
+def _record_run(stats, depth):
+    global _last_run
+    gaps = [s["gap_ms"] for s in stats if s["gap_ms"] is not None]
+    summary = {
+        "depth": depth,
+        "sentences": stats,
+        "avg_synth_ms": round(sum(s["synth_ms"] for s in stats) / len(stats), 1) if stats else None,
+        "avg_gap_ms": round(sum(gaps) / len(gaps), 1) if gaps else None,
+    }
+    with _stats_lock:
+        _last_run = summary
+
+
+def get_last_run_stats():
+    with _stats_lock:
+        return dict(_last_run)